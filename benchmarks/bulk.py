@@ -0,0 +1,256 @@
+"""Benchmarks of full-collection operations on a large synthetic dataset.
+
+Requires a MongoDB server. For each dataset size, the database is filled
+with `benchmarks.dataset`, and each operation is run once in a fresh process,
+which reports:
+
+- wall time
+- round trips: number of commands sent to the database (including `getMore`)
+- peak RSS of the process, and its RSS before the operation started
+
+Operations:
+
+- `diagnose_grade_consistency`: `SubmissionStatusDiagnoser`
+- `recalculate_weighted_mean`: recalculating grades on the settings page
+- `swap_active_grade`: enabling weighted mean grades on the settings page
+- `task_list`: the `task_list_item` and `task_menu` hooks for every task of
+  a course, for a sample of students
+
+Usage (from the repository root):
+
+    python -m benchmarks.bulk --sizes 10000,100000 --output bulk.json
+"""
+
+import argparse
+import resource
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from fnmatch import fnmatch
+from multiprocessing import get_context
+from typing import Any, Callable, Dict, List
+
+from bson import ObjectId
+from inginious.frontend import plugin_manager as inginious_plugin_manager
+from inginious.frontend import user_manager as inginious_user_manager
+from inginious.frontend.template_helper import TemplateHelper
+from pymongo import MongoClient, monitoring
+from pymongo.database import Database
+
+import inginious_coding_style
+from inginious_coding_style import TEMPLATES_PATH, task_list_item, task_menu
+from inginious_coding_style.config import (PluginConfig, TemplateSettings,
+                                           get_config)
+from inginious_coding_style.logger import get_logger
+from inginious_coding_style.mixins import SubmissionMixin
+from inginious_coding_style.pages.plugin_settings import \
+    SubmissionStatusDiagnoser
+from inginious_coding_style.rendering import init_renderer
+
+from .common import Result, finish, format_result, get_argument_parser
+from .dataset import (DatasetSpec, add_database_arguments, add_spec_arguments,
+                      generate_dataset, get_spec)
+
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000]
+
+# Students whose task list is loaded in the `task_list` benchmark
+TASK_LIST_STUDENTS = 50
+
+
+class CommandCounter(monitoring.CommandListener):
+    """Counts the commands sent to the database."""
+
+    def __init__(self) -> None:
+        self.count = 0
+
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        self.count += 1
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        pass
+
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        pass
+
+
+class DatabaseSubmissionManager:
+    """Retrieves submissions with the same query as
+    `WebAppSubmissionManager.get_submission()`, without a user check."""
+
+    def __init__(self, database: Database) -> None:
+        self._database = database
+
+    def get_submission(self, submissionid: Any, user_check: bool = True) -> Any:
+        return self._database.submissions.find_one({"_id": ObjectId(submissionid)})
+
+
+class MaintenanceRunner(SubmissionMixin):
+    """Runs the maintenance operations of the plugin's pages outside of a request."""
+
+    _logger = get_logger()
+
+    diagnose_grade_consistency = SubmissionStatusDiagnoser.diagnose_grade_consistency
+
+    def __init__(self, database: Database, config: PluginConfig) -> None:
+        super().__init__()
+        self._database = database
+        self._submission_manager = DatabaseSubmissionManager(database)
+        self.config = config
+
+    @property
+    def database(self) -> Database:  # type: ignore
+        return self._database
+
+    @property
+    def submission_manager(self) -> Any:
+        return self._submission_manager
+
+
+class SessionUserManager:
+    """User manager of a logged in student. Used by `get_best_submission()`."""
+
+    def __init__(self, username: str) -> None:
+        self.username = username
+
+    def session_logged_in(self) -> bool:
+        return True
+
+    def session_username(self) -> str:
+        return self.username
+
+
+class StudentPluginManager:
+    def __init__(self, database: Database, username: str) -> None:
+        self._database = database
+        self._user_manager = SessionUserManager(username)
+
+    def get_database(self) -> Database:
+        return self._database
+
+    def get_user_manager(self) -> SessionUserManager:
+        return self._user_manager
+
+
+class StudentTask:
+    """The parts of `Task` used by the task list hooks."""
+
+    def __init__(self, courseid: str, taskid: str, plugin_manager: Any) -> None:
+        self._courseid = courseid
+        self._taskid = taskid
+        self._plugin_manager = plugin_manager
+
+    def get_id(self) -> str:
+        return self._taskid
+
+    def get_course_id(self) -> str:
+        return self._courseid
+
+
+def _load_task_lists(
+    database: Database, config: PluginConfig, spec: DatasetSpec
+) -> None:
+    template_helper = TemplateHelper(
+        inginious_plugin_manager.PluginManager(),
+        inginious_user_manager.UserManager(database=database, superadmins=[]),
+    )
+    init_renderer(
+        template_helper,
+        TEMPLATES_PATH,
+        TemplateSettings(precompile=True, bytecode_cache=False),
+    )
+    inginious_coding_style.PLUGIN_CONFIG = config
+
+    step = max(1, spec.students // TASK_LIST_STUDENTS)
+    for s in range(0, spec.students, step):
+        plugin_manager = StudentPluginManager(database, f"student{s}")
+        for t in range(spec.tasks):
+            task = StudentTask("course0", f"task{t}", plugin_manager)
+            task_list_item(None, task, None, template_helper)  # type: ignore
+            task_menu(None, task, template_helper)  # type: ignore
+
+
+OPERATIONS: Dict[str, Callable[[Database, PluginConfig, DatasetSpec], Any]] = {
+    "diagnose_grade_consistency": lambda db, config, spec: MaintenanceRunner(
+        db, config
+    ).diagnose_grade_consistency(),
+    "recalculate_weighted_mean": lambda db, config, spec: MaintenanceRunner(
+        db, config
+    ).recalculate_weighted_mean(),
+    "swap_active_grade": lambda db, config, spec: MaintenanceRunner(
+        db, config
+    ).swap_active_grade(to_mean=True),
+    "task_list": _load_task_lists,
+}
+
+
+def get_rss_bytes() -> int:
+    """Peak resident set size of the current process."""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == "darwin" else rss * 1024  # KiB on Linux
+
+
+def run_operation(
+    mongo_uri: str, database_name: str, operation: str, spec: DatasetSpec
+) -> Result:
+    """Runs an operation. Called in a fresh process, so that peak RSS
+    only includes the operation and imports."""
+    counter = CommandCounter()
+    client: MongoClient = MongoClient(mongo_uri, event_listeners=[counter])
+    database = client[database_name]
+    config = get_config({"weighted_mean": {"enabled": True}})
+    database.command("ping")  # connect before measuring
+
+    rss_before = get_rss_bytes()
+    counter.count = 0
+    start = time.perf_counter()
+    OPERATIONS[operation](database, config, spec)
+    wall = time.perf_counter() - start
+    return Result.from_wall_time(
+        wall,
+        round_trips=counter.count,
+        peak_rss_mib=round(get_rss_bytes() / 2**20, 1),
+        rss_before_mib=round(rss_before / 2**20, 1),
+    )
+
+
+def parse_sizes(value: str) -> List[int]:
+    return [int(size) for size in value.split(",")]
+
+
+def main() -> int:
+    parser = get_argument_parser(__doc__.splitlines()[0])
+    add_database_arguments(parser)
+    add_spec_arguments(parser)
+    parser.add_argument(
+        "--sizes",
+        type=parse_sizes,
+        default=DEFAULT_SIZES,
+        help=(
+            "Comma-separated numbers of submissions to benchmark with "
+            f"(default: {','.join(str(s) for s in DEFAULT_SIZES)})."
+        ),
+    )
+    args: argparse.Namespace = parser.parse_args()
+
+    results: Dict[str, Result] = {}
+    for size in args.sizes:
+        spec = get_spec(args, size)
+        print(f"Generating {spec.n_submissions} submissions...", flush=True)
+        generate_dataset(MongoClient(args.mongo_uri)[args.database], spec)
+
+        for operation in OPERATIONS:
+            name = f"{operation}[submissions={spec.n_submissions}]"
+            if not fnmatch(name, args.filter):
+                continue
+            with ProcessPoolExecutor(1, mp_context=get_context("spawn")) as pool:
+                future = pool.submit(
+                    run_operation, args.mongo_uri, args.database, operation, spec
+                )
+                results[name] = future.result()
+            print(format_result(name, results[name]), flush=True)
+
+    return finish(args, results)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
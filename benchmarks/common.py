@@ -0,0 +1,246 @@
+"""Shared runner, result format and baseline comparison for benchmarks.
+
+Results are stored as JSON:
+
+```json
+{
+    "meta": {"python": "3.8.10", "platform": "...", "created": "..."},
+    "benchmarks": {
+        "get_submission[categories=4]": {"median": 2.1e-05, "min": ..., ...}
+    }
+}
+```
+
+All timings are in seconds per operation. When a baseline file is given,
+results are compared by their fastest repeat, which is the least affected
+by noise from other processes, and the run fails if any benchmark is
+slower than the baseline by more than the threshold. Scripts can compare
+by another measurement, such as a latency percentile in `extra`.
+"""
+
+import argparse
+import json
+import platform
+import statistics
+import sys
+import timeit
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from fnmatch import fnmatch
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Tuple
+
+# Fail if a benchmark is more than 20% slower than the baseline
+DEFAULT_THRESHOLD = 0.2
+
+
+@dataclass
+class Result:
+    """Timings of a single benchmark, in seconds per operation."""
+
+    median: float
+    min: float
+    mean: float
+    stdev: float
+    loops: int  # operations per repeat
+    repeat: int
+    # Other measurements, such as the number of database round trips
+    extra: Dict[str, float] = field(default_factory=dict)
+
+    @classmethod
+    def from_timings(cls, timings: List[float], loops: int) -> "Result":
+        per_op = [t / loops for t in timings]
+        return cls(
+            median=statistics.median(per_op),
+            min=min(per_op),
+            mean=statistics.mean(per_op),
+            stdev=statistics.stdev(per_op) if len(per_op) > 1 else 0.0,
+            loops=loops,
+            repeat=len(per_op),
+        )
+
+    @classmethod
+    def from_wall_time(cls, seconds: float, **extra: float) -> "Result":
+        """Result of a single run of a long-running operation."""
+        return cls(
+            median=seconds,
+            min=seconds,
+            mean=seconds,
+            stdev=0.0,
+            loops=1,
+            repeat=1,
+            extra=extra,
+        )
+
+    def get_metric(self, metric: str) -> float:
+        """Returns a timing, or a measurement from `extra`."""
+        if metric in self.extra:
+            return self.extra[metric]
+        return getattr(self, metric)
+
+
+@dataclass
+class Regression:
+    name: str
+    baseline: float
+    current: float
+
+    @property
+    def change(self) -> float:
+        return self.current / self.baseline - 1
+
+
+def measure(func: Callable[[], Any], repeat: int = 5) -> Result:
+    """Times a function.
+
+    The number of loops per repeat is calibrated with `Timer.autorange()`,
+    so that each repeat takes at least 0.2 seconds."""
+    timer = timeit.Timer(func)
+    loops, _ = timer.autorange()
+    return Result.from_timings(timer.repeat(repeat=repeat, number=loops), loops)
+
+
+def run_benchmarks(
+    benchmarks: Iterable[Tuple[str, Callable[[], Any]]],
+    pattern: str = "*",
+    repeat: int = 5,
+) -> Dict[str, Result]:
+    results: Dict[str, Result] = {}
+    for name, func in benchmarks:
+        if not fnmatch(name, pattern):
+            continue
+        results[name] = measure(func, repeat=repeat)
+        print(format_result(name, results[name]), flush=True)
+    return results
+
+
+def format_time(seconds: float) -> str:
+    for unit, scale in [("s", 1.0), ("ms", 1e-3)]:
+        if seconds >= scale:
+            return f"{seconds / scale:.2f} {unit}"
+    return f"{seconds * 1e6:.2f} us"
+
+
+def format_result(name: str, result: Result) -> str:
+    line = f"{name:<55} {format_time(result.median):>12}"
+    if result.repeat > 1:
+        line += (
+            f" (min {format_time(result.min)}, stdev {format_time(result.stdev)})"
+        )
+    for key, value in result.extra.items():
+        line += f", {key}: {value:g}"
+    return line
+
+
+def get_metadata() -> Dict[str, str]:
+    meta = {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "created": datetime.now().isoformat(timespec="seconds"),
+    }
+    try:
+        import pydantic
+
+        meta["pydantic"] = str(pydantic.VERSION)
+    except ImportError:
+        pass
+    return meta
+
+
+def save_results(path: Path, results: Dict[str, Result]) -> None:
+    data = {
+        "meta": get_metadata(),
+        "benchmarks": {name: asdict(result) for name, result in results.items()},
+    }
+    path.write_text(json.dumps(data, indent=4))
+
+
+def load_results(path: Path) -> Dict[str, Result]:
+    data = json.loads(path.read_text())
+    return {name: Result(**result) for name, result in data["benchmarks"].items()}
+
+
+def compare_results(
+    baseline: Dict[str, Result],
+    current: Dict[str, Result],
+    threshold: float = DEFAULT_THRESHOLD,
+    metric: str = "min",
+) -> List[Regression]:
+    """Returns benchmarks whose `metric` (by default the fastest repeat) is slower
+    than the baseline by more than `threshold`. Benchmarks missing from either
+    set of results are ignored."""
+    regressions = []
+    for name, result in current.items():
+        if name not in baseline:
+            continue
+        regression = Regression(
+            name, baseline[name].get_metric(metric), result.get_metric(metric)
+        )
+        if regression.change > threshold:
+            regressions.append(regression)
+    return regressions
+
+
+def get_argument_parser(description: str) -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument(
+        "-o",
+        "--output",
+        type=Path,
+        help="Write results to this JSON file.",
+    )
+    parser.add_argument(
+        "-b",
+        "--baseline",
+        type=Path,
+        help="Compare results to this JSON file, and fail on regressions.",
+    )
+    parser.add_argument(
+        "-t",
+        "--threshold",
+        type=float,
+        default=DEFAULT_THRESHOLD,
+        help=(
+            "Maximum allowed slowdown relative to the baseline "
+            f"(default: {DEFAULT_THRESHOLD}, i.e. {DEFAULT_THRESHOLD:.0%})."
+        ),
+    )
+    parser.add_argument(
+        "-k",
+        "--filter",
+        default="*",
+        help="Only run benchmarks whose name matches this glob pattern.",
+    )
+    return parser
+
+
+def finish(
+    args: argparse.Namespace, results: Dict[str, Result], metric: str = "min"
+) -> int:
+    """Saves results and compares them to the baseline by `metric`.
+    Returns the exit code."""
+    if args.output:
+        save_results(args.output, results)
+        print(f"Results written to {args.output}")
+
+    if args.baseline is None:
+        return 0
+    regressions = compare_results(
+        load_results(args.baseline), results, args.threshold, metric
+    )
+    for r in regressions:
+        print(
+            f"REGRESSION {r.name}: {format_time(r.baseline)} -> "
+            f"{format_time(r.current)} ({r.change:+.1%})",
+            file=sys.stderr,
+        )
+    if regressions:
+        print(
+            f"{len(regressions)} benchmark(s) regressed by more than "
+            f"{args.threshold:.0%} compared to {args.baseline}.",
+            file=sys.stderr,
+        )
+        return 1
+    print(f"No regressions compared to {args.baseline}.")
+    return 0
@@ -0,0 +1,322 @@
+"""Generates a synthetic INGInious dataset in a local MongoDB database.
+
+Fills the `submissions`, `user_tasks` and `users` collections with documents
+shaped like the ones written by INGInious and the plugin. Each student makes
+a fixed number of attempts at every task, and a share of the best submissions
+are graded with the plugin's default categories.
+
+Usage (from the repository root):
+
+    python -m benchmarks.dataset --database bench --submissions 100000
+"""
+
+import argparse
+import random
+import string
+import sys
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import gridfs
+from bson import ObjectId
+from pymongo import MongoClient
+from pymongo.database import Database
+
+from inginious_coding_style.config import PluginConfig, get_config
+from inginious_coding_style.database import (GRADED_AT_FIELD, GRADED_FIELD,
+                                             MEAN_FIELD, ensure_indexes)
+
+# Documents sent to the database per `insert_many()`
+INSERT_BATCH_SIZE = 1000
+
+START_DATE = datetime(2021, 8, 16, 8)
+
+# Collections written by `generate_dataset()`
+DATASET_COLLECTIONS = ["submissions", "user_tasks", "users", "fs.files", "fs.chunks"]
+
+
+@dataclass
+class DatasetSpec:
+    courses: int = 1
+    tasks: int = 10  # per course
+    students: int = 200  # enrolled in every course
+    attempts: int = 5  # submissions per student per task
+    graded_share: float = 0.5  # share of best submissions with coding style grades
+    input_size: int = 2000  # characters of code per submission
+    feedback_size: int = 500  # characters of feedback per category
+    archive_size: int = 0  # bytes stored in GridFS per submission, 0 for no archives
+    seed: int = 0
+
+    @property
+    def n_submissions(self) -> int:
+        return self.courses * self.tasks * self.students * self.attempts
+
+    @property
+    def n_user_tasks(self) -> int:
+        return self.courses * self.tasks * self.students
+
+    @classmethod
+    def for_size(cls, n_submissions: int, **kwargs: Any) -> "DatasetSpec":
+        """Creates a spec with enough students to produce `n_submissions`."""
+        spec = cls(**kwargs)
+        per_student = spec.courses * spec.tasks * spec.attempts
+        spec.students = max(1, n_submissions // per_student)
+        return spec
+
+
+class DatasetGenerator:
+    """Generates the documents of a dataset.
+
+    Submissions are generated with the grading status fields and `user_tasks`
+    grades that the plugin writes when grading a submission."""
+
+    def __init__(self, spec: DatasetSpec, config: Optional[PluginConfig] = None):
+        self.spec = spec
+        self.config = config or get_config({})
+        self.random = random.Random(spec.seed)
+        self.code = self._random_text(spec.input_size)
+        self.feedback = self._random_text(spec.feedback_size)
+
+    def _random_text(self, size: int) -> str:
+        alphabet = string.ascii_letters + string.digits + " \n"
+        return "".join(self.random.choices(alphabet, k=size))
+
+    def _random_bytes(self, size: int) -> bytes:
+        return self.random.getrandbits(size * 8).to_bytes(size, "little")
+
+    def users(self) -> Iterator[Dict[str, Any]]:
+        for s in range(self.spec.students):
+            yield {
+                "username": f"student{s}",
+                "realname": f"Student {s}",
+                "email": f"student{s}@example.com",
+            }
+
+    def submissions(
+        self, archives: Optional[gridfs.GridFS] = None
+    ) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """Yields `(collection, document)` pairs. The `user_tasks` document of
+        a student's task is yielded after all of its submissions."""
+        for c in range(self.spec.courses):
+            for t in range(self.spec.tasks):
+                for s in range(self.spec.students):
+                    yield from self._task_submissions(
+                        f"course{c}", f"task{t}", f"student{s}", archives
+                    )
+
+    def _task_submissions(
+        self,
+        courseid: str,
+        taskid: str,
+        username: str,
+        archives: Optional[gridfs.GridFS],
+    ) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        docs = [
+            self._submission(courseid, taskid, username, i, archives)
+            for i in range(self.spec.attempts)
+        ]
+        # Best grade wins, newest submission wins ties
+        best = max(docs, key=lambda d: (d["grade"], d["submitted_on"]))
+        user_task = {
+            "_id": ObjectId(),
+            "courseid": courseid,
+            "taskid": taskid,
+            "username": username,
+            "tried": len(docs),
+            "succeeded": best["result"] == "success",
+            "grade": best["grade"],
+            "submissionid": best["_id"],
+            "state": "",
+        }
+        if self.random.random() < self.spec.graded_share:
+            self._grade(best, user_task)
+        for doc in docs:
+            yield "submissions", doc
+        yield "user_tasks", user_task
+
+    def _submission(
+        self,
+        courseid: str,
+        taskid: str,
+        username: str,
+        attempt: int,
+        archives: Optional[gridfs.GridFS],
+    ) -> Dict[str, Any]:
+        # Roughly a third of all submissions pass every test
+        grade = 100.0 if self.random.random() < 0.3 else self.random.uniform(0, 100)
+        grade = round(grade, 2)
+        archive = None
+        if archives is not None and self.spec.archive_size:
+            archive = archives.put(self._random_bytes(self.spec.archive_size))
+        return {
+            "_id": ObjectId(),
+            "courseid": courseid,
+            "taskid": taskid,
+            "status": "done",
+            "submitted_on": START_DATE + timedelta(hours=attempt),
+            "username": [username],
+            "response_type": "rst",
+            "input": {"@lang": "en", "code": self.code},
+            "archive": archive,
+            "custom": {},
+            "grade": grade,
+            "problems": {"code": ["success" if grade == 100 else "failed", ""]},
+            "result": "success" if grade == 100 else "failed",
+            "state": "",
+            "stderr": "",
+            "stdout": "",
+            "text": "",
+            "tests": {},
+            "user_ip": "127.0.0.1",
+        }
+
+    def _grade(self, submission: Dict[str, Any], user_task: Dict[str, Any]) -> None:
+        """Adds coding style grades like `CodingStyleGradingPage` does."""
+        grades = {
+            category.id: {
+                "id": category.id,
+                "name": category.name,
+                "description": category.description,
+                "grade": self.random.randint(0, 100),
+                "feedback": self.feedback,
+            }
+            for category in self.config.enabled.values()
+        }
+        style_mean = sum(g["grade"] for g in grades.values()) / len(grades)
+        submission["custom"] = {
+            "coding_style_grades": grades,
+            "graded_by": ["tutor"],
+        }
+        submission[GRADED_FIELD] = True
+        submission[MEAN_FIELD] = round(style_mean, 2)
+        submission[GRADED_AT_FIELD] = submission["submitted_on"] + timedelta(days=1)
+
+        # See: `Submission.get_weighted_mean()`
+        weighting = self.config.weighted_mean.weighting
+        grade_mean = submission["grade"] * (1 - weighting) + style_mean * weighting
+        if self.config.weighted_mean.round:
+            grade_mean = round(grade_mean, self.config.weighted_mean.round_digits)
+        user_task["grade_base"] = submission["grade"]
+        user_task["grade_mean"] = grade_mean
+        if self.config.weighted_mean.enabled:
+            user_task["grade"] = grade_mean
+
+
+def generate_dataset(
+    database: Database,
+    spec: DatasetSpec,
+    config: Optional[PluginConfig] = None,
+    drop: bool = True,
+) -> None:
+    """Inserts a dataset into a database, optionally dropping existing data."""
+    if drop:
+        for collection in DATASET_COLLECTIONS:
+            database.drop_collection(collection)
+
+    generator = DatasetGenerator(spec, config)
+    archives = gridfs.GridFS(database) if spec.archive_size else None
+    database.users.insert_many(list(generator.users()), ordered=False)
+
+    batches: Dict[str, List[Dict[str, Any]]] = {"submissions": [], "user_tasks": []}
+    for collection, doc in generator.submissions(archives):
+        batch = batches[collection]
+        batch.append(doc)
+        if len(batch) >= INSERT_BATCH_SIZE:
+            database[collection].insert_many(batch, ordered=False)
+            batch.clear()
+    for collection, batch in batches.items():
+        if batch:
+            database[collection].insert_many(batch, ordered=False)
+
+    # Indexes created by INGInious, and by the plugin on startup
+    database.submissions.create_index(
+        [("username", 1), ("courseid", 1), ("taskid", 1)]
+    )
+    database.submissions.create_index([("submitted_on", -1)])
+    database.user_tasks.create_index(
+        [("username", 1), ("courseid", 1), ("taskid", 1)], unique=True
+    )
+    database.user_tasks.create_index([("submissionid", 1)])
+    database.users.create_index("username", unique=True)
+    ensure_indexes(database)
+
+
+def add_database_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--mongo-uri",
+        default="mongodb://localhost:27017",
+        help="MongoDB connection URI (default: mongodb://localhost:27017).",
+    )
+    parser.add_argument(
+        "--database",
+        default="inginious_coding_style_bench",
+        help="Database to fill. Existing data in it is dropped.",
+    )
+
+
+def add_spec_arguments(parser: argparse.ArgumentParser) -> None:
+    defaults = DatasetSpec()
+    for name, help in [
+        ("courses", "Number of courses."),
+        ("tasks", "Number of tasks per course."),
+        ("attempts", "Number of submissions per student per task."),
+        ("input-size", "Characters of code per submission."),
+        ("feedback-size", "Characters of feedback per grading category."),
+        ("archive-size", "Bytes of archive per submission stored in GridFS."),
+        ("seed", "Random seed."),
+    ]:
+        default = getattr(defaults, name.replace("-", "_"))
+        parser.add_argument(
+            f"--{name}", type=int, default=default, help=f"{help} (default: {default})"
+        )
+    parser.add_argument(
+        "--graded-share",
+        type=float,
+        default=defaults.graded_share,
+        help=(
+            "Share of best submissions with coding style grades "
+            f"(default: {defaults.graded_share})."
+        ),
+    )
+
+
+def get_spec(args: argparse.Namespace, n_submissions: int) -> DatasetSpec:
+    return DatasetSpec.for_size(
+        n_submissions,
+        courses=args.courses,
+        tasks=args.tasks,
+        attempts=args.attempts,
+        graded_share=args.graded_share,
+        input_size=args.input_size,
+        feedback_size=args.feedback_size,
+        archive_size=args.archive_size,
+        seed=args.seed,
+    )
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    add_database_arguments(parser)
+    add_spec_arguments(parser)
+    parser.add_argument(
+        "--submissions",
+        type=int,
+        default=10_000,
+        help="Approximate number of submissions to generate (default: 10000).",
+    )
+    args = parser.parse_args()
+
+    spec = get_spec(args, args.submissions)
+    client: MongoClient = MongoClient(args.mongo_uri)
+    start = datetime.now()
+    generate_dataset(client[args.database], spec)
+    print(
+        f"Generated {spec.n_submissions} submissions and {spec.n_user_tasks} "
+        f"user tasks for {spec.students} students in {datetime.now() - start}."
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
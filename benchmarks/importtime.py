@@ -0,0 +1,125 @@
+"""Benchmarks of the plugin's import time, measured with `python -X importtime`.
+
+Each repeat runs a fresh interpreter that first imports the modules already
+imported by the webapp when it loads plugins (`--preload`), and then imports:
+
+- `inginious_coding_style`: imported by every webapp worker on startup
+- `inginious_coding_style.pages`: imported by `init()`'s lazily built views
+  on the first request to a plugin page
+
+Only the modules imported for the first time by each step are timed, and
+steps that do not import anything are skipped. Each result also reports the
+number of modules the step imported.
+
+Usage (from the repository root):
+
+    python -m benchmarks.importtime --output importtime.json
+    python -m benchmarks.importtime --top 20
+"""
+
+import re
+import subprocess
+import sys
+from dataclasses import dataclass
+from fnmatch import fnmatch
+from typing import Dict, List
+
+from .common import (Result, finish, format_result, format_time,
+                     get_argument_parser)
+
+# Imported by `inginious-webapp` before plugins are loaded
+DEFAULT_PRELOAD = "inginious.frontend.app"
+
+STEPS = ["inginious_coding_style", "inginious_coding_style.pages"]
+
+_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)$")
+
+
+@dataclass
+class ImportTime:
+    module: str
+    self_us: int
+    cumulative_us: int
+    depth: int
+
+
+def parse_importtime(output: str) -> Dict[str, List[ImportTime]]:
+    """Groups the output of `-X importtime` by top-level import.
+
+    A module is listed after the modules it imports, so a top-level import
+    is preceded by every module first imported by it. Returns the modules
+    of each top-level import, ending with the top-level module itself."""
+    groups: Dict[str, List[ImportTime]] = {}
+    current: List[ImportTime] = []
+    for line in output.splitlines():
+        match = _LINE.match(line)
+        if match is None:
+            continue
+        self_us, cumulative_us, indent, module = match.groups()
+        entry = ImportTime(module, int(self_us), int(cumulative_us), len(indent) // 2)
+        current.append(entry)
+        if entry.depth == 0:
+            groups[module] = current
+            current = []
+    return groups
+
+
+def run_once(preload: List[str]) -> Dict[str, List[ImportTime]]:
+    code = "; ".join(f"import {module}" for module in preload + STEPS)
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return parse_importtime(proc.stderr)
+
+
+def format_slowest(entries: List[ImportTime], n: int) -> str:
+    slowest = sorted(entries, key=lambda e: e.self_us, reverse=True)[:n]
+    return "\n".join(
+        f"    {format_time(e.self_us / 1e6):>12}  {e.module}" for e in slowest
+    )
+
+
+def main() -> int:
+    parser = get_argument_parser(__doc__.splitlines()[0])
+    parser.add_argument(
+        "-r", "--repeat", type=int, default=10, help="Interpreters to start."
+    )
+    parser.add_argument(
+        "--preload",
+        default=DEFAULT_PRELOAD,
+        help=(
+            "Comma-separated modules imported before the plugin, "
+            f"and not timed (default: {DEFAULT_PRELOAD})."
+        ),
+    )
+    parser.add_argument(
+        "--top",
+        type=int,
+        default=0,
+        help="List the modules with the highest self time of each step.",
+    )
+    args = parser.parse_args()
+
+    preload = [module for module in args.preload.split(",") if module]
+    runs = [run_once(preload) for _ in range(args.repeat)]
+
+    results: Dict[str, Result] = {}
+    for step in STEPS:
+        name = f"import[{step}]"
+        if not fnmatch(name, args.filter) or any(step not in run for run in runs):
+            continue
+        timings = [run[step][-1].cumulative_us / 1e6 for run in runs]
+        results[name] = Result.from_timings(timings, loops=1)
+        results[name].extra["modules"] = len(runs[-1][step])
+        print(format_result(name, results[name]), flush=True)
+        if args.top:
+            print(format_slowest(runs[-1][step], args.top))
+
+    return finish(args, results)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
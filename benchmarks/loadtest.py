@@ -0,0 +1,509 @@
+"""Load test of the grading page and course task lists with concurrent users.
+
+Requires a MongoDB server and INGInious. A synthetic dataset is generated with
+`benchmarks.dataset`, and `inginious-webapp` is started with the plugin in a
+temporary directory. Then, for a fixed duration:
+
+- every tutor grades random submissions in a loop: `GET` of
+  `CodingStyleGradingPage`, `POST` of the grading form, and `GET` of the page
+  it redirects to
+- every student loads the task list of a course in a loop
+
+Each virtual user runs in its own thread with its own session. No backend is
+started, as none of the pages submit jobs.
+
+Reported per endpoint: p50/p95/p99 latency, throughput (requests per second)
+and error rate (responses with status 400 or above, failed grading and
+connection errors).
+
+Usage (from the repository root):
+
+    python -m benchmarks.loadtest --tutors 20 --students 200 --duration 60
+"""
+
+import argparse
+import hashlib
+import math
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from fnmatch import fnmatch
+from http.cookiejar import CookieJar
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from inginious import DB_VERSION
+from inginious.common.base import write_json_or_yaml
+from pymongo import MongoClient
+from pymongo.database import Database
+
+from inginious_coding_style.config import PluginConfig, get_config
+
+from .common import Result, finish, format_time, get_argument_parser
+from .dataset import (DatasetSpec, add_database_arguments, add_spec_arguments,
+                      generate_dataset, get_spec)
+
+# Password of every virtual user
+PASSWORD = "loadtest"
+
+# Endpoints reported by the load test
+GRADING_GET = "grading_page[GET]"
+GRADING_POST = "grading_page[POST]"
+GRADING_REDIRECT = "grading_page[redirect]"
+TASK_LIST = "task_list[GET]"
+
+# Seconds to wait for the webapp to start
+STARTUP_TIMEOUT = 60
+
+# Compare load test runs by their 95th percentile latency
+COMPARE_METRIC = "p95"
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Returns the `q`th percentile (0-100) of sorted values, using the
+    nearest-rank method."""
+    if not values:
+        raise ValueError("Cannot compute percentile of no values")
+    rank = math.ceil(q / 100 * len(values))
+    return values[max(rank, 1) - 1]
+
+
+@dataclass
+class EndpointStats:
+    latencies: List[float] = field(default_factory=list)  # of successful requests
+    errors: int = 0
+
+    @property
+    def requests(self) -> int:
+        return len(self.latencies) + self.errors
+
+    def get_result(self, duration: float) -> Result:
+        """Summarizes the requests made during a run of `duration` seconds."""
+        latencies = sorted(self.latencies) or [0.0]
+        return Result(
+            median=percentile(latencies, 50),
+            min=latencies[0],
+            mean=statistics.mean(latencies),
+            stdev=statistics.stdev(latencies) if len(latencies) > 1 else 0.0,
+            loops=self.requests,
+            repeat=1,
+            extra={
+                "p95": percentile(latencies, 95),
+                "p99": percentile(latencies, 99),
+                "throughput": round(self.requests / duration, 2),
+                "error_rate": round(self.errors / max(self.requests, 1), 4),
+            },
+        )
+
+
+class Recorder:
+    """Collects request latencies of all virtual users."""
+
+    def __init__(self) -> None:
+        self.endpoints: Dict[str, EndpointStats] = {}
+        self._lock = threading.Lock()
+
+    def record(self, endpoint: str, seconds: float, ok: bool) -> None:
+        with self._lock:
+            stats = self.endpoints.setdefault(endpoint, EndpointStats())
+            if ok:
+                stats.latencies.append(seconds)
+            else:
+                stats.errors += 1
+
+    def get_results(self, duration: float) -> Dict[str, Result]:
+        with self._lock:
+            return {
+                endpoint: stats.get_result(duration)
+                for endpoint, stats in sorted(self.endpoints.items())
+            }
+
+
+class NoRedirectHandler(urllib.request.HTTPRedirectHandler):
+    """Returns redirects as responses, so that they are timed separately."""
+
+    def redirect_request(self, *args: Any, **kwargs: Any) -> None:
+        return None
+
+
+@dataclass
+class Response:
+    status: int
+    location: str = ""
+    body: bytes = b""
+
+
+def is_ok(response: Response) -> bool:
+    return response.status < 400
+
+
+def is_graded(response: Response) -> bool:
+    """Checks that the grading form was saved. Failed grading, and expired
+    sessions, are not redirected to the page with `success=1`."""
+    query = urllib.parse.urlsplit(response.location).query
+    return response.status == 302 and "success=1" in query
+
+
+class VirtualUser:
+    """A logged in user with its own session cookie."""
+
+    def __init__(self, base_url: str, username: str, recorder: Recorder) -> None:
+        self.base_url = base_url
+        self.username = username
+        self.recorder = recorder
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(CookieJar()), NoRedirectHandler()
+        )
+
+    def _send(self, path: str, data: Optional[Dict[str, str]] = None) -> Response:
+        body = urllib.parse.urlencode(data).encode() if data is not None else None
+        try:
+            with self.opener.open(self.base_url + path, data=body, timeout=60) as r:
+                return Response(r.status, body=r.read())
+        except urllib.error.HTTPError as e:  # also raised for redirects
+            return Response(e.code, location=e.headers.get("Location", ""))
+
+    def request(
+        self,
+        endpoint: str,
+        path: str,
+        data: Optional[Dict[str, str]] = None,
+        check: Callable[[Response], bool] = is_ok,
+    ) -> Optional[Response]:
+        """Sends a request, and records its latency.
+        Returns `None` if the request failed, or its response fails `check`."""
+        start = time.perf_counter()
+        try:
+            response: Optional[Response] = self._send(path, data)
+        except (OSError, urllib.error.URLError):
+            response = None
+        ok = response is not None and check(response)
+        self.recorder.record(endpoint, time.perf_counter() - start, ok)
+        return response if ok else None
+
+    def login(self) -> None:
+        response = self._send("/signin", {"login": self.username, "password": PASSWORD})
+        if response.status != 302:
+            raise RuntimeError(f"Failed to log in as {self.username}")
+
+
+def get_grading_form(config: PluginConfig, rng: random.Random) -> Dict[str, str]:
+    """Form submitted from the grading page."""
+    form = {}
+    for category in config.enabled.values():
+        form[f"{category.id}_grade"] = str(rng.randint(0, 100))
+        form[f"{category.id}_feedback"] = "Consider splitting this function up."
+    return form
+
+
+def run_tutor(
+    user: VirtualUser,
+    submissionids: List[str],
+    config: PluginConfig,
+    deadline: float,
+    seed: int,
+) -> None:
+    rng = random.Random(seed)
+    user.login()
+    while time.perf_counter() < deadline:
+        path = f"/admin/codingstyle/submission/{rng.choice(submissionids)}"
+        if user.request(GRADING_GET, path) is None:
+            continue
+        response = user.request(
+            GRADING_POST, path, get_grading_form(config, rng), check=is_graded
+        )
+        if response is None:
+            continue
+        location = urllib.parse.urlsplit(response.location)
+        user.request(GRADING_REDIRECT, f"{location.path}?{location.query}")
+
+
+def run_student(
+    user: VirtualUser, courseids: List[str], deadline: float, seed: int
+) -> None:
+    rng = random.Random(seed)
+    user.login()
+    while time.perf_counter() < deadline:
+        user.request(TASK_LIST, f"/course/{rng.choice(courseids)}")
+
+
+def get_tutors(n: int) -> List[str]:
+    return [f"tutor{i}" for i in range(n)]
+
+
+def setup_instance(
+    directory: Path,
+    spec: DatasetSpec,
+    tutors: List[str],
+    mongo_uri: str,
+    database_name: str,
+    plugin_config: Dict[str, Any],
+) -> Path:
+    """Creates the courses, tasks and configuration of an INGInious instance.
+    Returns the path of its configuration file."""
+    tasks_directory = directory / "tasks"
+    for c in range(spec.courses):
+        course_directory = tasks_directory / f"course{c}"
+        course_directory.mkdir(parents=True)
+        write_json_or_yaml(
+            str(course_directory / "course.yaml"),
+            {
+                "name": f"Course {c}",
+                "admins": tutors,
+                "accessible": True,
+                "registration": True,
+            },
+        )
+        for t in range(spec.tasks):
+            task_directory = course_directory / f"task{t}"
+            task_directory.mkdir()
+            write_json_or_yaml(
+                str(task_directory / "task.yaml"),
+                {
+                    "name": f"Task {t}",
+                    "author": "Load test",
+                    "accessible": True,
+                    "environment_type": "docker",
+                    "environment_id": "default",
+                    "environment_parameters": {"limits": {"time": 30, "memory": 100}},
+                    "problems": {
+                        "code": {
+                            "type": "code",
+                            "language": "python",
+                            "name": "Code",
+                            "header": "",
+                        }
+                    },
+                },
+            )
+
+    config_path = directory / "configuration.yaml"
+    write_json_or_yaml(
+        str(config_path),
+        {
+            # Never connected to, as no jobs are submitted
+            "backend": "tcp://127.0.0.1:2001",
+            "mongo_opt": {"host": mongo_uri, "database": database_name},
+            "tasks_directory": str(tasks_directory),
+            "use_minified_js": True,
+            "web_debug": False,
+            "plugins": [
+                {"plugin_module": "inginious_coding_style", **plugin_config}
+            ],
+        },
+    )
+    return config_path
+
+
+def prepare_database(database: Database, spec: DatasetSpec, tutors: List[str]) -> None:
+    """Adds the users, passwords and course registrations that are not part of
+    the synthetic dataset."""
+    password = hashlib.sha512(PASSWORD.encode("utf-8")).hexdigest()
+    database.users.insert_many(
+        [
+            {
+                "username": tutor,
+                "realname": tutor.capitalize(),
+                "email": f"{tutor}@example.com",
+            }
+            for tutor in tutors
+        ]
+    )
+    database.users.update_many(
+        {}, {"$set": {"password": password, "language": "en", "bindings": {}}}
+    )
+    students = [f"student{s}" for s in range(spec.students)]
+    database.courses.drop()
+    database.courses.insert_many(
+        [{"_id": f"course{c}", "students": students} for c in range(spec.courses)]
+    )
+    database.sessions.drop()
+    database.db_version.replace_one({}, {"db_version": DB_VERSION}, upsert=True)
+
+
+def get_submissionids(database: Database, limit: int) -> List[str]:
+    """Best submissions of students, which are the ones graded by tutors."""
+    return [
+        str(doc["submissionid"])
+        for doc in database.user_tasks.find({}, {"submissionid": 1}).limit(limit)
+    ]
+
+
+def get_free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_webapp(config_path: Path, port: int, log_path: Path) -> subprocess.Popen:
+    with log_path.open("wb") as log:
+        process = subprocess.Popen(
+            [
+                "inginious-webapp",
+                "--config",
+                str(config_path),
+                "--host",
+                "127.0.0.1",
+                "--port",
+                str(port),
+            ],
+            stdout=log,
+            stderr=subprocess.STDOUT,
+        )
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"inginious-webapp exited, see {log_path}")
+        try:
+            urllib.request.urlopen(base_url + "/", timeout=1).close()
+            return process
+        except urllib.error.HTTPError:
+            return process  # up, but the page itself failed
+        except OSError:
+            time.sleep(0.5)
+    process.terminate()
+    raise RuntimeError(f"inginious-webapp did not start in {STARTUP_TIMEOUT} s")
+
+
+def run_load(
+    base_url: str,
+    tutors: List[str],
+    students: List[str],
+    submissionids: List[str],
+    courseids: List[str],
+    config: PluginConfig,
+    duration: float,
+) -> Tuple[Dict[str, Result], float]:
+    """Runs all virtual users until `duration` has passed.
+    Returns the results per endpoint and the actual duration of the run."""
+    recorder = Recorder()
+    deadline = time.perf_counter() + duration
+    start = time.perf_counter()
+    with ThreadPoolExecutor(len(tutors) + len(students)) as pool:
+        futures = [
+            pool.submit(
+                run_tutor,
+                VirtualUser(base_url, tutor, recorder),
+                submissionids,
+                config,
+                deadline,
+                i,
+            )
+            for i, tutor in enumerate(tutors)
+        ]
+        futures += [
+            pool.submit(
+                run_student,
+                VirtualUser(base_url, student, recorder),
+                courseids,
+                deadline,
+                i,
+            )
+            for i, student in enumerate(students)
+        ]
+        for future in futures:
+            future.result()
+    elapsed = time.perf_counter() - start
+    return recorder.get_results(elapsed), elapsed
+
+
+def format_endpoint(name: str, result: Result) -> str:
+    extra = result.extra
+    return (
+        f"{name:<25} {result.loops:>8} req {extra['throughput']:>8.1f} req/s "
+        f"p50 {format_time(result.median):>10} p95 {format_time(extra['p95']):>10} "
+        f"p99 {format_time(extra['p99']):>10} errors {extra['error_rate']:.2%}"
+    )
+
+
+def main() -> int:
+    parser = get_argument_parser(__doc__.splitlines()[0])
+    add_database_arguments(parser)
+    add_spec_arguments(parser)
+    parser.add_argument(
+        "--submissions",
+        type=int,
+        default=10_000,
+        help="Approximate number of submissions to generate (default: 10000).",
+    )
+    parser.add_argument(
+        "--tutors", type=int, default=20, help="Concurrent tutors (default: 20)."
+    )
+    parser.add_argument(
+        "--students", type=int, default=100, help="Concurrent students (default: 100)."
+    )
+    parser.add_argument(
+        "--duration",
+        type=float,
+        default=60,
+        help="Seconds to run the load test for (default: 60).",
+    )
+    parser.add_argument(
+        "--port",
+        type=int,
+        default=None,
+        help="Port of the webapp (default: a free port).",
+    )
+    args: argparse.Namespace = parser.parse_args()
+
+    spec = get_spec(args, args.submissions)
+    if args.students > spec.students:
+        parser.error(f"--students must be at most {spec.students} for this dataset")
+    plugin_config: Dict[str, Any] = {"weighted_mean": {"enabled": True}}
+    config = get_config(plugin_config)
+    tutors = get_tutors(args.tutors)
+
+    database = MongoClient(args.mongo_uri)[args.database]
+    print(f"Generating {spec.n_submissions} submissions...", flush=True)
+    generate_dataset(database, spec, config)
+    prepare_database(database, spec, tutors)
+    submissionids = get_submissionids(database, limit=10_000)
+    courseids = [f"course{c}" for c in range(spec.courses)]
+
+    with tempfile.TemporaryDirectory(prefix="inginious-coding-style-") as tmp:
+        directory = Path(tmp)
+        config_path = setup_instance(
+            directory, spec, tutors, args.mongo_uri, args.database, plugin_config
+        )
+        port = args.port or get_free_port()
+        process = start_webapp(config_path, port, directory / "webapp.log")
+        try:
+            print(
+                f"Running {args.tutors} tutors and {args.students} students "
+                f"for {args.duration:g} s...",
+                flush=True,
+            )
+            results, elapsed = run_load(
+                f"http://127.0.0.1:{port}",
+                tutors,
+                [f"student{s}" for s in range(args.students)],
+                submissionids,
+                courseids,
+                config,
+                args.duration,
+            )
+        finally:
+            process.terminate()
+            process.wait()
+
+    results = {name: r for name, r in results.items() if fnmatch(name, args.filter)}
+    for name, result in results.items():
+        print(format_endpoint(name, result))
+    total = sum(r.loops for r in results.values())
+    print(f"{total} requests in {elapsed:.1f} s ({total / elapsed:.1f} req/s)")
+    return finish(args, results, metric=COMPARE_METRIC)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
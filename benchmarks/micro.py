@@ -0,0 +1,179 @@
+"""Micro-benchmarks of the grade model and the helpers called on every page.
+
+Runs without any services. Each benchmark is run with 4, 10 and 30 grading
+categories, each with 5000 characters of feedback (the maximum allowed).
+
+Usage (from the repository root):
+
+    python -m benchmarks.micro --output results.json
+    python -m benchmarks.micro --baseline results.json --threshold 0.2
+"""
+
+import sys
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, List, Tuple
+
+from bson import ObjectId
+from werkzeug.datastructures import ImmutableMultiDict
+
+from inginious_coding_style.config import PluginConfig, get_config
+from inginious_coding_style.database import GRADED_FIELD
+from inginious_coding_style.grades import get_grades
+from inginious_coding_style.pages.plugin_settings import FormParser
+from inginious_coding_style.submission import Submission, get_submission
+from inginious_coding_style.utils import (has_coding_style_grades,
+                                          parse_form_data)
+
+from .common import finish, get_argument_parser, run_benchmarks
+
+CATEGORY_COUNTS = (4, 10, 30)
+
+# Maximum length of feedback. See: `GradingCategory.feedback`
+FEEDBACK_LENGTH = 5000
+
+
+def make_config(n_categories: int) -> PluginConfig:
+    categories = [
+        {
+            "id": f"category{i}",
+            "name": f"Category {i}",
+            "description": f"Description of category {i}.",
+        }
+        for i in range(n_categories)
+    ]
+    return get_config(
+        {
+            "enabled": [c["id"] for c in categories],
+            "categories": categories,
+            "weighted_mean": {"enabled": True, "weighting": 0.25},
+        }
+    )
+
+
+def make_grades(config: PluginConfig) -> Dict[str, Dict[str, Any]]:
+    feedback = ("Consider splitting this function up. " * 200)[:FEEDBACK_LENGTH]
+    return {
+        category.id: {
+            "id": category.id,
+            "name": category.name,
+            "description": category.description,
+            "grade": (i * 7) % 101,
+            "feedback": feedback,
+        }
+        for i, category in enumerate(config.enabled.values())
+    }
+
+
+def make_submission(grades: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    """A graded submission as stored in the database."""
+    return {
+        "_id": ObjectId("123456789abc123456789abc"),
+        "courseid": "tdt4100",
+        "taskid": "oving1",
+        "status": "done",
+        "submitted_on": datetime(2021, 8, 4, 12),
+        "username": ["student"],
+        "response_type": "rst",
+        "input": {"@lang": "en", "code": "print('Hello, world!')" * 100},
+        "archive": ObjectId("123456789abc123456789abd"),
+        "custom": {"coding_style_grades": grades, "graded_by": ["tutor"]},
+        "grade": 80.0,
+        "problems": {"code": ["success", ""]},
+        "result": "success",
+        "state": "",
+        "stderr": "",
+        "stdout": "",
+        "text": "",
+    }
+
+
+def make_grading_form(grades: Dict[str, Dict[str, Any]]) -> ImmutableMultiDict:
+    """Form submitted from the grading page."""
+    form: List[Tuple[str, str]] = []
+    for category in grades.values():
+        form.append((f"{category['id']}_grade", str(category["grade"])))
+        form.append((f"{category['id']}_feedback", category["feedback"]))
+    return ImmutableMultiDict(form)
+
+
+def make_settings_form(config: PluginConfig) -> ImmutableMultiDict:
+    """Form submitted from the plugin settings page."""
+    form = {
+        "config_path": "/var/www/INGInious/configuration.yaml",
+        "weighting": "0.25",
+        "weighted_mean": "on",
+        "bar_label_style_grade": "Style",
+        "bar_enabled_style_grade": "on",
+        "bar_label_total_grade": "Total",
+        "bar_enabled_total_grade": "on",
+        "bar_label_base_grade": "Base",
+        "bar_enabled_base_grade": "on",
+        "show_graders": "on",
+        "submissionquery_header": "CSG",
+        "submissionquery_button": "on",
+        "submissionquery_priority": "3000",
+    }
+    for category in config.enabled.values():
+        form[f"category_name_{category.id}"] = category.name
+        form[f"category_description_{category.id}"] = category.description
+    return ImmutableMultiDict(form)
+
+
+def get_benchmarks() -> Iterator[Tuple[str, Callable[[], Any]]]:
+    doc_ungraded = make_submission({})
+    yield "get_submission[ungraded]", lambda d=doc_ungraded: get_submission(d)
+
+    for n in CATEGORY_COUNTS:
+        config = make_config(n)
+        grades = make_grades(config)
+        doc = make_submission(grades)
+        doc_status = {**doc, GRADED_FIELD: True}
+        submission = get_submission(doc)
+        style_grades = get_grades(grades)
+        grading_form = make_grading_form(grades)
+        settings_form = make_settings_form(config)
+        suffix = f"[categories={n}]"
+
+        yield f"get_submission{suffix}", lambda doc=doc: get_submission(doc)
+        yield (
+            f"Submission.parse_obj{suffix}",
+            lambda doc=doc: Submission.parse_obj(doc),
+        )
+        yield (
+            f"CodingStyleGrades.get_mean{suffix}",
+            lambda g=style_grades, c=config: g.get_mean(c),
+        )
+        yield (
+            f"Submission.get_weighted_mean{suffix}",
+            lambda s=submission, c=config: s.get_weighted_mean(c),
+        )
+        yield (
+            f"parse_form_data{suffix}",
+            lambda f=grading_form: parse_form_data(f),
+        )
+        yield (
+            f"FormParser.parse{suffix}",
+            lambda f=settings_form, c=config: FormParser(f, c).parse(),
+        )
+        yield (
+            f"has_coding_style_grades{suffix}",
+            lambda d=doc: has_coding_style_grades(d),
+        )
+        yield (
+            f"has_coding_style_grades[status_field]{suffix}",
+            lambda d=doc_status: has_coding_style_grades(d),
+        )
+
+
+def main() -> int:
+    parser = get_argument_parser(__doc__.splitlines()[0])
+    parser.add_argument(
+        "-r", "--repeat", type=int, default=5, help="Repeats per benchmark."
+    )
+    args = parser.parse_args()
+    results = run_benchmarks(get_benchmarks(), pattern=args.filter, repeat=args.repeat)
+    return finish(args, results)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,6 +1,7 @@
 from pathlib import Path
 from typing import Any, List, OrderedDict, Tuple, Union
 
+from flask import g
 from inginious.client.client import Client
 from inginious.frontend.course_factory import CourseFactory
 from inginious.frontend.courses import Course
@@ -10,11 +11,16 @@ from inginious.frontend.template_helper import TemplateHelper
 
 from ._types import INGIniousSubmission
 from .config import PluginConfig, get_config
-from .pages import (CodingStyleGradingPage, FixConfigPermissionsEndpoint,
-                    NewCategoryEndpoint, PluginSettingsPage,
-                    StudentSubmissionCodingStylePage,
-                    SubmissionStatusDiagnoser)
+from .courses import init_course_cache, on_task_editor_submit
+from .database import ensure_indexes, migrate_grading_status
+from .instrumentation import init_instrumentation
+from .logger import init_logging
+from .metrics import instrument
+from .profiling import init_profiler
+from .rendering import get_renderer, init_renderer
+from .users import init_realname_cache
 from .utils import get_best_submission, has_coding_style_grades
+from .views import lazy_view
 
 __version__ = "1.5.3"
 
@@ -25,15 +31,27 @@ TEMPLATES_PATH = PLUGIN_PATH / "templates"
 PLUGIN_CONFIG: PluginConfig = None  # type: ignore
 
 
+def render(template_helper: TemplateHelper, path: str, **tpl_kwargs: Any) -> str:
+    """Renders a plugin template using the plugin's precompiled templates.
+    Falls back on the INGInious template helper if the plugin's renderer
+    has not been initialized."""
+    renderer = get_renderer()
+    if renderer is None:
+        return template_helper.render(
+            path, template_folder=TEMPLATES_PATH, **tpl_kwargs
+        )
+    return renderer.render(path, **tpl_kwargs)
+
+
 def submission_admin_menu(
     course: Course,
     task: Task,
     submission: INGIniousSubmission,
     template_helper: TemplateHelper,
 ) -> str:
-    return template_helper.render(
+    return render(
+        template_helper,
         "submission_admin_menu.html",
-        template_folder=TEMPLATES_PATH,
         submission=submission,
     )
 
@@ -45,10 +63,10 @@ def submission_query_header(
     course: Course,
     template_helper: TemplateHelper,
 ) -> str:
-    return template_helper.render(
+    return render(
+        template_helper,
         "submission_query_header.html",
         config=PLUGIN_CONFIG,
-        template_folder=TEMPLATES_PATH,
     )
 
 
@@ -57,11 +75,11 @@ def submission_query_cell(
     submission: INGIniousSubmission,
     template_helper: TemplateHelper,
 ) -> str:
-    return template_helper.render(
+    return render(
+        template_helper,
         "submission_query_cell.html",
         has_grades=has_coding_style_grades(submission),
         submission=submission,
-        template_folder=TEMPLATES_PATH,
     )
 
 
@@ -74,11 +92,11 @@ def submission_query_button(
     # so that we don't have to do twice the amount of work for two hooks.
     if not PLUGIN_CONFIG.submission_query.button:
         return ""
-    return template_helper.render(
+    return render(
+        template_helper,
         "submission_query_button.html",
         has_grades=has_coding_style_grades(submission),
         submission=submission,
-        template_folder=TEMPLATES_PATH,
     )
 
 
@@ -90,20 +108,42 @@ def task_list_item(
 ) -> str:
     """Displays a progress bar denoting the current coding style grade
     for a given task."""
-    # TODO: optimize. Cache best submission?
+    if PLUGIN_CONFIG.task_list_bars.lazy:
+        return task_list_placeholder(course, task, template_helper)
+
     submission = get_best_submission(task)
     if not submission or not submission.custom.coding_style_grades:
         return ""
 
-    return template_helper.render(
+    return render(
+        template_helper,
         "task_list_item.html",
-        template_folder=TEMPLATES_PATH,
         style_grade=submission.custom.coding_style_grades.get_mean(PLUGIN_CONFIG),
         submission=submission,
         config=PLUGIN_CONFIG,
     )
 
 
+def task_list_placeholder(
+    course: Course, task: Task, template_helper: TemplateHelper
+) -> str:
+    """Displays an empty placeholder for the progress bars of a task.
+    The first placeholder of the task list loads the bars of every task in
+    a single request once the page is displayed. See: `TaskListBarsEndpoint`"""
+    # See: `get_best_submission()`
+    if not task._plugin_manager.get_user_manager().session_logged_in():
+        return ""
+    load = not g.get("coding_style_bars_loading", False)
+    g.coding_style_bars_loading = True
+    return render(
+        template_helper,
+        "task_list_placeholder.html",
+        course=course,
+        task=task,
+        load=load,
+    )
+
+
 def task_list_bar_label(course: Course, template_helper: TemplateHelper) -> str:
     """Modifies the label for the default INGInious grade progress bar."""
     if not PLUGIN_CONFIG.task_list_bars.total_grade.enabled:
@@ -117,9 +157,9 @@ def task_menu(course: Course, task: Task, template_helper: TemplateHelper) -> st
     if best_submission is None or not best_submission.custom.coding_style_grades:
         return ""
 
-    return template_helper.render(
+    return render(
+        template_helper,
         "task_menu.html",
-        template_folder=TEMPLATES_PATH,
         submission=best_submission,
     )
 
@@ -148,6 +188,46 @@ def init(
     global PLUGIN_CONFIG
     PLUGIN_CONFIG = config
 
+    # Create a dedicated Jinja environment for the plugin's templates
+    # and compile them before they are first requested.
+    # NOTE: INGInious creates its template helper before loading plugins
+    init_renderer(
+        plugin_manager._flask_app.template_helper,
+        TEMPLATES_PATH,
+        config.templates,
+    )
+
+    # Create indexes used to query submissions by coding style grading status
+    ensure_indexes(plugin_manager.get_database())
+
+    # Add grading status to submissions graded by earlier versions of the plugin
+    migrate_grading_status(plugin_manager.get_database(), config)
+
+    # Write log records in a background thread, and rate limit repeated errors
+    init_logging(config.logging)
+
+    # Cache real names of submission authors and graders in this worker
+    init_realname_cache(config.cache)
+
+    # Cache courses and tasks until their descriptors are modified
+    init_course_cache(config.cache)
+
+    # Record database operations issued by the plugin
+    init_instrumentation(config.metrics)
+
+    # Profile requests to plugin pages on demand
+    init_profiler(config.profiling)
+
+    # Run linters on submissions in a pool of worker processes
+    if config.analysis.enabled:
+        from .analysis import init_analyzer, precompute_analysis
+
+        init_analyzer(config.analysis)
+
+    def hook(func: Any) -> Any:
+        """Records metrics of calls to a hook function if metrics are enabled."""
+        return instrument("hook")(func) if config.metrics.enabled else func
+
     #############################
     #                           #
     #           HOOKS           #
@@ -155,62 +235,191 @@ def init(
     #############################
 
     # Add label to default INGInious grade progress bars
-    plugin_manager.add_hook("task_list_bar_label", task_list_bar_label)
+    plugin_manager.add_hook("task_list_bar_label", hook(task_list_bar_label))
 
     # Display coding style grades in list of tasks for a course
-    plugin_manager.add_hook("task_list_item", task_list_item)
+    plugin_manager.add_hook("task_list_item", hook(task_list_item))
 
     # Show button to navigate to detailed coding style grades for a submission
-    plugin_manager.add_hook("task_menu", task_menu)
+    plugin_manager.add_hook("task_menu", hook(task_menu))
 
     # Show button to navigate to coding style grading page for admins
-    plugin_manager.add_hook("submission_admin_menu", submission_admin_menu)
+    plugin_manager.add_hook("submission_admin_menu", hook(submission_admin_menu))
 
     # Show button to navigate to coding style grading page for admins
-    plugin_manager.add_hook("course_admin_menu", course_admin_menu)
+    plugin_manager.add_hook("course_admin_menu", hook(course_admin_menu))
 
     # Add header to submission query table
     plugin_manager.add_hook(
         "submission_query_header",
-        submission_query_header,
+        hook(submission_query_header),
         prio=config.submission_query.priority,
     )
 
     # Add column to submission query table
     plugin_manager.add_hook(
         "submission_query_cell",
-        submission_query_cell,
+        hook(submission_query_cell),
         prio=config.submission_query.priority,
     )
 
     # Add button to submission query table row
     plugin_manager.add_hook(
         "submission_query_button",
-        submission_query_button,
+        hook(submission_query_button),
         prio=config.submission_query.priority,
     )
 
+    # Invalidate cached tasks when they are edited
+    plugin_manager.add_hook("task_editor_submit", hook(on_task_editor_submit))
+
+    # Analyze submissions as soon as they are done
+    if config.analysis.enabled and config.analysis.precompute:
+
+        def submission_done(submission: INGIniousSubmission, **kwargs: Any) -> None:
+            precompute_analysis(plugin_manager, course_factory, submission)
+
+        plugin_manager.add_hook("submission_done", hook(submission_done))
+
+    # Index submissions for clustering as soon as they are done
+    if config.clustering.enabled and config.clustering.index_on_submit:
+        from .clustering import index_submission
+
+        def index_done_submission(
+            submission: INGIniousSubmission, **kwargs: Any
+        ) -> None:
+            index_submission(plugin_manager, course_factory, config, submission)
+
+        plugin_manager.add_hook("submission_done", hook(index_done_submission))
+
     #############################
     #                           #
     #           PAGES           #
     #                           #
     #############################
 
+    # Page classes are imported and their views built on first request
+
+    # Hook and page metrics for monitoring
+    if config.metrics.enabled:
+        plugin_manager.add_page(
+            "/admin/codingstyle/metrics",
+            lazy_view(
+                "codingstyle_metrics",
+                "MetricsEndpoint",
+                config,
+                TEMPLATES_PATH,
+            ),
+        )
+
+    # On-demand profiling of plugin pages for superadmins
+    if config.profiling.enabled:
+        plugin_manager.add_page(
+            "/admin/codingstyle/profiles",
+            lazy_view(
+                "codingstyle_profiles",
+                "ProfilesPage",
+                config,
+                TEMPLATES_PATH,
+            ),
+        )
+        plugin_manager.add_page(
+            "/admin/codingstyle/profiles/<name>",
+            lazy_view(
+                "codingstyle_profile_download",
+                "ProfileDownloadEndpoint",
+                config,
+                TEMPLATES_PATH,
+            ),
+        )
+
     # Grading interface for admins
     plugin_manager.add_page(
         "/admin/codingstyle/submission/<submissionid>",
-        CodingStyleGradingPage.as_view(
+        lazy_view(
             "codingstyle_grading",
+            "CodingStyleGradingPage",
             config,
             TEMPLATES_PATH,
         ),
     )
 
+    # Grading of many submissions in a single request (JSON API)
+    plugin_manager.add_page(
+        "/admin/codingstyle/submissions",
+        lazy_view(
+            "codingstyle_bulk_grading",
+            "BulkGradingEndpoint",
+            config,
+            TEMPLATES_PATH,
+        ),
+    )
+
+    # Next ungraded submission of a task for admins
+    plugin_manager.add_page(
+        "/admin/codingstyle/queue/<courseid>/<taskid>",
+        lazy_view(
+            "codingstyle_grading_queue",
+            "GradingQueuePage",
+            config,
+            TEMPLATES_PATH,
+        ),
+    )
+
+    # Code metrics of the best submissions of a task, for triage before grading
+    if config.code_metrics.enabled:
+        plugin_manager.add_page(
+            "/admin/codingstyle/triage/<courseid>/<taskid>",
+            lazy_view(
+                "codingstyle_code_metrics",
+                "CodeMetricsPage",
+                config,
+                TEMPLATES_PATH,
+            ),
+        )
+
+    # Clusters of similar submissions of a task, graded in a single request
+    if config.clustering.enabled:
+        plugin_manager.add_page(
+            "/admin/codingstyle/clusters/<courseid>/<taskid>",
+            lazy_view(
+                "codingstyle_clusters",
+                "SubmissionClustersPage",
+                config,
+                TEMPLATES_PATH,
+            ),
+        )
+
+    # Static analysis of a submission, loaded by the grading interface
+    if config.analysis.enabled:
+        plugin_manager.add_page(
+            "/admin/codingstyle/submission/<submissionid>/analysis",
+            lazy_view(
+                "codingstyle_analysis",
+                "SubmissionAnalysisEndpoint",
+                config,
+                TEMPLATES_PATH,
+            ),
+        )
+
+    # Coding style bars of all tasks in a course's task list
+    if config.task_list_bars.lazy:
+        plugin_manager.add_page(
+            "/course/<courseid>/codingstyle/bars",
+            lazy_view(
+                "codingstyle_task_list_bars",
+                "TaskListBarsEndpoint",
+                config,
+                TEMPLATES_PATH,
+            ),
+        )
+
     # Coding Style Grade view for a specific user submission
     plugin_manager.add_page(
         "/submission/<submissionid>/codingstyle",
-        StudentSubmissionCodingStylePage.as_view(
+        lazy_view(
             "codingstyle_submission",
+            "StudentSubmissionCodingStylePage",
             config,
             TEMPLATES_PATH,
         ),
@@ -219,8 +428,9 @@ def init(
     # Plugin configuration
     plugin_manager.add_page(
         "/admin/<courseid>/settings/codingstyle",
-        PluginSettingsPage.as_view(
+        lazy_view(
             "codingstyle_settings",
+            "PluginSettingsPage",
             config,
             TEMPLATES_PATH,
         ),
@@ -228,8 +438,39 @@ def init(
 
     plugin_manager.add_page(
         "/admin/<courseid>/settings/codingstyle/diagnose",
-        SubmissionStatusDiagnoser.as_view(
+        lazy_view(
             "submission_status_diagnoser",
+            "SubmissionStatusDiagnoser",
+            config,
+            TEMPLATES_PATH,
+        ),
+    )
+
+    plugin_manager.add_page(
+        "/admin/<courseid>/settings/codingstyle/status",
+        lazy_view(
+            "grading_status_endpoint",
+            "GradingStatusEndpoint",
+            config,
+            TEMPLATES_PATH,
+        ),
+    )
+
+    plugin_manager.add_page(
+        "/admin/<courseid>/settings/codingstyle/export",
+        lazy_view(
+            "grade_export_endpoint",
+            "GradeExportEndpoint",
+            config,
+            TEMPLATES_PATH,
+        ),
+    )
+
+    plugin_manager.add_page(
+        "/admin/<courseid>/settings/codingstyle/import",
+        lazy_view(
+            "grade_import_endpoint",
+            "GradeImportEndpoint",
             config,
             TEMPLATES_PATH,
         ),
@@ -237,8 +478,9 @@ def init(
 
     plugin_manager.add_page(
         "/admin/<courseid>/settings/codingstyle/category",
-        NewCategoryEndpoint.as_view(
+        lazy_view(
             "new_category_endpoint",
+            "NewCategoryEndpoint",
             config,
             TEMPLATES_PATH,
         ),
@@ -246,8 +488,9 @@ def init(
 
     plugin_manager.add_page(
         "/admin/<courseid>/settings/codingstyle/fixconfig",
-        FixConfigPermissionsEndpoint.as_view(
+        lazy_view(
             "fix_config_permissions_endpoint",
+            "FixConfigPermissionsEndpoint",
             config,
             TEMPLATES_PATH,
         ),
@@ -0,0 +1,413 @@
+"""Module for static analysis of submissions.
+
+Configured linters (`analysis.linters`) are run on the code of a submission,
+so that tutors have findings to go on when grading it, along with grades
+suggested from the findings for the categories the linters map them to.
+
+Linters are external commands, run on one file at a time by a bounded pool
+of worker processes with a timeout and memory limit per file. Resource limits
+are applied in the child process between fork and exec, which is only safe
+in a single-threaded process, so commands are not started by webapp threads.
+
+Results are cached in the `coding_style_analysis` collection, keyed by the
+linter and a hash of the normalized source code, so duplicate or resubmitted
+code is never analyzed twice.
+"""
+
+import hashlib
+import json
+import multiprocessing
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, wait
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from pymongo import UpdateOne
+from pymongo.database import Database
+
+from .config import AnalysisSettings, LinterSettings, PluginConfig
+from .database import bulk_write
+from .logger import get_log_fields, get_logger
+from .sources import SourceFile, get_sources, get_submission_input
+
+ANALYSIS_COLLECTION = "coding_style_analysis"
+
+# Max number of findings stored per file and linter
+MAX_FINDINGS = 500
+
+# Added to the time a request waits for the linters it started
+WAIT_GRACE_PERIOD = 5  # seconds
+
+
+@dataclass
+class Finding:
+    line: int
+    col: Optional[int]
+    code: Optional[str]
+    message: str
+
+
+@dataclass
+class LintResult:
+    """Findings of a linter for a single file."""
+
+    findings: List[Finding] = field(default_factory=list)
+    error: Optional[str] = None  # results with errors are not cached
+
+    @classmethod
+    def from_doc(cls, doc: Dict[str, Any]) -> "LintResult":
+        return cls([Finding(**f) for f in doc["findings"]])
+
+
+@dataclass
+class FileAnalysis:
+    name: str
+    linter: str
+    result: LintResult
+    # Grading category of each finding
+    categories: List[Optional[str]] = field(default_factory=list)
+
+
+@dataclass
+class Suggestion:
+    grade: int
+    findings: int
+
+
+@dataclass
+class SubmissionAnalysis:
+    files: List[FileAnalysis] = field(default_factory=list)
+    # Suggested grades of the enabled categories that linters map findings to
+    suggestions: Dict[str, Suggestion] = field(default_factory=dict)
+    pending: int = 0  # linters that did not finish in time
+
+    @property
+    def n_findings(self) -> int:
+        return sum(len(f.result.findings) for f in self.files)
+
+
+def get_linter_fingerprint(linter: LinterSettings) -> str:
+    """Identifies the output of a linter: results are re-computed when the
+    command or the pattern used to parse its output changes."""
+    data = json.dumps([linter.command, linter.pattern]).encode("utf-8")
+    return hashlib.sha256(data).hexdigest()[:16]
+
+
+def get_cache_key(linter: LinterSettings, content_hash: str) -> str:
+    return f"{linter.name}:{get_linter_fingerprint(linter)}:{content_hash}"
+
+
+def get_linters(
+    source: SourceFile, linters: List[LinterSettings]
+) -> List[LinterSettings]:
+    """Returns the linters that apply to a source file."""
+    applicable = []
+    suffix = Path(source.name).suffix
+    for linter in linters:
+        if suffix and suffix in linter.extensions:
+            applicable.append(linter)
+        elif not suffix and source.language and linter.extensions:
+            # Code problems: match the language against the extensions,
+            # e.g. "python" or "python3" against ".py"
+            language = source.language.lower()
+            if any(language.startswith(e.lstrip(".")) for e in linter.extensions):
+                applicable.append(linter)
+    return applicable
+
+
+def get_category(code: Optional[str], linter: LinterSettings) -> Optional[str]:
+    """Maps a finding to a grading category by the longest matching code prefix."""
+    if code:
+        prefixes = [p for p in linter.categories if code.startswith(p)]
+        if prefixes:
+            return linter.categories[max(prefixes, key=len)]
+    return linter.default_category
+
+
+def parse_output(output: str, pattern: str, max_findings: int) -> List[Finding]:
+    regex = re.compile(pattern)
+    findings = []
+    for line in output.splitlines():
+        match = regex.match(line)
+        if match is None:
+            continue
+        groups = match.groupdict()
+        col = groups.get("col")
+        findings.append(
+            Finding(
+                line=int(groups.get("line") or 0),
+                col=int(col) if col else None,
+                code=groups.get("code"),
+                message=(groups.get("message") or line).strip(),
+            )
+        )
+        if len(findings) >= max_findings:
+            break
+    return findings
+
+
+def _limit_resources(memory_limit: int, timeout: float) -> None:
+    """Applies resource limits to a linter process (called before exec)."""
+    import resource
+
+    if memory_limit:
+        limit = memory_limit * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    cpu = int(timeout) + 1
+    resource.setrlimit(resource.RLIMIT_CPU, (cpu, cpu))
+
+
+def run_linter(
+    command: List[str],
+    pattern: str,
+    filename: str,
+    source: str,
+    timeout: float,
+    memory_limit: int,
+) -> LintResult:
+    """Runs a linter on a single file. Called in the worker processes."""
+    with tempfile.TemporaryDirectory(prefix="inginious-coding-style-") as tmpdir:
+        path = os.path.join(tmpdir, os.path.basename(filename))
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(source)
+        args = [arg.replace("{path}", path) for arg in command]
+        preexec_fn = None
+        if sys.platform != "win32":
+            preexec_fn = lambda: _limit_resources(memory_limit, timeout)
+        try:
+            proc = subprocess.run(
+                args,
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                timeout=timeout,
+                cwd=tmpdir,
+                preexec_fn=preexec_fn,
+            )
+        except FileNotFoundError:
+            return LintResult(error=f"Command not found: {args[0]}")
+        except subprocess.TimeoutExpired:
+            return LintResult(error=f"Timed out after {timeout} seconds")
+        if proc.returncode < 0:  # killed by a signal, e.g. the CPU time limit
+            return LintResult(error=f"Killed by signal {-proc.returncode}")
+        output = proc.stdout.decode("utf-8", errors="replace")
+        return LintResult(parse_output(output, pattern, MAX_FINDINGS))
+
+
+def suggest_grades(
+    files: List[FileAnalysis],
+    linters: List[LinterSettings],
+    config: PluginConfig,
+) -> Dict[str, Suggestion]:
+    """Suggests a grade for each enabled category that linters map findings
+    to, by subtracting `analysis.penalty` points per finding."""
+    mapped = set()
+    for linter in linters:
+        mapped.update(linter.categories.values())
+        if linter.default_category:
+            mapped.add(linter.default_category)
+    counts = {c: 0 for c in config.enabled if c in mapped}
+    for f in files:
+        for category in f.categories:
+            if category in counts:
+                counts[category] += 1
+    penalty = config.analysis.penalty
+    return {
+        category: Suggestion(grade=max(0, 100 - penalty * n), findings=n)
+        for category, n in counts.items()
+    }
+
+
+def _get_result(future: "Future[Any]") -> LintResult:
+    try:
+        return future.result()
+    except Exception as e:  # e.g. a worker process died
+        return LintResult(error=f"Analysis failed: {e!r}")
+
+
+class Analyzer:
+    """Runs linters in a pool of worker processes, and caches their results."""
+
+    def __init__(
+        self, settings: AnalysisSettings, executor: Optional[Executor] = None
+    ) -> None:
+        self.settings = settings
+        self._executor = executor
+        self._lock = threading.Lock()
+
+    @property
+    def executor(self) -> Executor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    # Worker processes are spawned rather than forked from
+                    # the multi-threaded webapp
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.settings.workers,
+                        mp_context=multiprocessing.get_context("spawn"),
+                    )
+        return self._executor
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+
+    def _jobs(
+        self, sources: List[SourceFile]
+    ) -> List[Tuple[SourceFile, LinterSettings, str]]:
+        return [
+            (source, linter, get_cache_key(linter, source.content_hash))
+            for source in sources
+            for linter in get_linters(source, self.settings.linters)
+        ]
+
+    def _submit(self, source: SourceFile, linter: LinterSettings) -> "Future[Any]":
+        filename = source.name
+        if not Path(filename).suffix and linter.extensions:
+            filename += linter.extensions[0]
+        return self.executor.submit(
+            run_linter,
+            linter.command,
+            linter.pattern,
+            filename,
+            source.source,
+            self.settings.timeout,
+            self.settings.memory_limit,
+        )
+
+    def _store(self, database: Database, results: Dict[str, LintResult]) -> None:
+        """Caches results. Results stored concurrently by another worker win."""
+        ops = [
+            UpdateOne(
+                {"_id": key},
+                {"$setOnInsert": {"findings": [asdict(f) for f in r.findings]}},
+                upsert=True,
+            )
+            for key, r in results.items()
+            if r.error is None
+        ]
+        if ops:
+            bulk_write(database[ANALYSIS_COLLECTION], ops)
+
+    def _get_cached(
+        self, database: Database, keys: List[str]
+    ) -> Dict[str, LintResult]:
+        if not keys:
+            return {}
+        return {
+            doc["_id"]: LintResult.from_doc(doc)
+            for doc in database[ANALYSIS_COLLECTION].find({"_id": {"$in": keys}})
+        }
+
+    def analyze(
+        self, database: Database, sources: List[SourceFile], config: PluginConfig
+    ) -> SubmissionAnalysis:
+        """Analyzes the source files of a submission, using cached results
+        where possible. Waits for the linters it starts for at most the
+        time it takes the pool to run them all with their timeout."""
+        jobs = self._jobs(sources)
+        results = self._get_cached(database, list({key for _, _, key in jobs}))
+
+        futures: Dict[str, "Future[Any]"] = {}
+        for source, linter, key in jobs:
+            if key not in results and key not in futures:
+                futures[key] = self._submit(source, linter)
+        if futures:
+            rounds = -(-len(futures) // self.settings.workers)  # ceil
+            wait(
+                futures.values(),
+                timeout=rounds * self.settings.timeout + WAIT_GRACE_PERIOD,
+            )
+            new = {k: _get_result(f) for k, f in futures.items() if f.done()}
+            self._store(database, new)
+            results.update(new)
+
+        analysis = SubmissionAnalysis()
+        for source, linter, key in jobs:
+            result = results.get(key)
+            if result is None:
+                analysis.pending += 1
+                continue
+            categories = [get_category(f.code, linter) for f in result.findings]
+            analysis.files.append(
+                FileAnalysis(source.name, linter.name, result, categories)
+            )
+        analysis.suggestions = suggest_grades(
+            analysis.files, self.settings.linters, config
+        )
+        return analysis
+
+    def precompute(self, database: Database, sources: List[SourceFile]) -> int:
+        """Starts analyzing source files in the background, and caches the
+        results once done. Returns the number of linters started."""
+        jobs = self._jobs(sources)
+        cached = self._get_cached(database, list({key for _, _, key in jobs}))
+        started = set()
+        for source, linter, key in jobs:
+            if key in cached or key in started:
+                continue
+            future = self._submit(source, linter)
+            future.add_done_callback(
+                lambda f, key=key: self._on_done(database, key, f)  # type: ignore
+            )
+            started.add(key)
+        return len(started)
+
+    def _on_done(self, database: Database, key: str, future: "Future[Any]") -> None:
+        try:
+            self._store(database, {key: _get_result(future)})
+        except Exception as e:
+            get_logger().error("Failed to store analysis results", exc_info=e)
+
+
+ANALYZER: Optional[Analyzer] = None
+
+
+def init_analyzer(settings: AnalysisSettings) -> Optional[Analyzer]:
+    """Creates the analyzer of this webapp worker. Worker processes
+    are started when the first file is analyzed."""
+    global ANALYZER
+    if ANALYZER is not None:
+        ANALYZER.shutdown()
+    ANALYZER = Analyzer(settings) if settings.enabled else None
+    return ANALYZER
+
+
+def get_analyzer() -> Optional[Analyzer]:
+    return ANALYZER
+
+
+def precompute_analysis(
+    plugin_manager: Any, course_factory: Any, submission: Dict[str, Any]
+) -> None:
+    """Starts analyzing a submission that is done (`submission_done` hook).
+    Never raises, as INGInious calls the hook when storing the job's result."""
+    from .courses import get_course, get_task
+    from .instrumentation import instrument_database
+
+    analyzer = get_analyzer()
+    if analyzer is None:
+        return
+    try:
+        course = get_course(course_factory, submission["courseid"])
+        task = get_task(course_factory, course, submission["taskid"])
+        inputdata = get_submission_input(
+            plugin_manager.get_submission_manager(), submission["input"]
+        )
+        sources = get_sources(task, inputdata, analyzer.settings.max_file_size)
+        database = instrument_database(plugin_manager.get_database())
+        analyzer.precompute(database, sources)
+    except Exception as e:
+        get_logger().error(
+            "Failed to start analysis of submission",
+            exc_info=e,
+            extra=get_log_fields(submission),
+        )
@@ -0,0 +1,79 @@
+"""Module for in-process caches.
+
+Caches live in the memory of each webapp worker, and are not shared
+between workers. Entries therefore expire after a short amount of time,
+so that changes made through other workers are eventually picked up.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Generic, Hashable, Iterable, Optional, Tuple, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class TTLCache(Generic[K, V]):
+    """Thread-safe least-recently-used cache whose entries expire after `ttl` seconds.
+
+    Parameters
+    ----------
+    maxsize : `int`
+        Max number of entries. The least recently used entry is evicted
+        when the cache is full.
+    ttl : `float`
+        Number of seconds an entry is valid for. 0 disables the cache.
+    """
+
+    def __init__(self, maxsize: int, ttl: float) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[K, Tuple[float, V]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get_many(self, keys: Iterable[K]) -> Dict[K, V]:
+        """Returns the cached values of the given keys.
+        Keys that are missing or expired are not included."""
+        now = time.monotonic()
+        found: Dict[K, V] = {}
+        with self._lock:
+            for key in keys:
+                entry = self._data.get(key)
+                if entry is None:
+                    continue
+                expires, value = entry
+                if expires <= now:
+                    del self._data[key]
+                    continue
+                self._data.move_to_end(key)
+                found[key] = value
+        return found
+
+    def get(self, key: K, default: Optional[V] = None) -> Optional[V]:
+        return self.get_many([key]).get(key, default)
+
+    def set_many(self, items: Dict[K, V]) -> None:
+        if self.ttl <= 0 or self.maxsize <= 0:
+            return
+        expires = time.monotonic() + self.ttl
+        with self._lock:
+            for key, value in items.items():
+                self._data[key] = (expires, value)
+                self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def set(self, key: K, value: V) -> None:
+        self.set_many({key: value})
+
+    def invalidate(self, key: K) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
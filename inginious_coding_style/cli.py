@@ -0,0 +1,256 @@
+"""Command line interface for plugin maintenance tasks.
+
+The commands operate directly on the INGInious database, and read database
+connection details and plugin configuration from the INGInious configuration file.
+
+Usage:
+```
+python -m inginious_coding_style <command> --help
+```
+"""
+
+import argparse
+import sys
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from inginious.common.base import load_json_or_yaml
+from pymongo import MongoClient
+from pymongo.database import Database
+
+from .code_metrics import METRICS_FORMATS, CodeMetricsJob
+from .config import PluginConfig, get_config
+from .fs import get_config_path
+from .grade_export import EXPORT_FORMATS, GradeExporter
+from .grade_import import (IMPORT_FORMATS, GradeImporter, ImportReport,
+                           get_import_format, read_rows)
+from .snapshot import (SnapshotError, SnapshotSummary, restore_snapshot,
+                       write_snapshot)
+
+
+def load_inginious_config(path: Optional[str]) -> Dict[str, Any]:
+    """Loads the INGInious configuration file.
+    Attempts to locate the file if no path is given."""
+    config_path = Path(path) if path else get_config_path()
+    if config_path is None or not config_path.exists():
+        raise SystemExit(
+            "Unable to locate INGInious configuration file. Specify it with --config."
+        )
+    return load_json_or_yaml(str(config_path))
+
+
+def get_plugin_config(inginious_config: Dict[str, Any]) -> PluginConfig:
+    """Retrieves the plugin config from the INGInious configuration."""
+    for plugin in inginious_config.get("plugins") or []:
+        if plugin.get("plugin_module") == "inginious_coding_style":
+            return get_config(plugin)
+    raise SystemExit("Unable to find Coding Style plugin configuration.")
+
+
+def get_database(inginious_config: Dict[str, Any]) -> Database:
+    """Connects to the INGInious database the same way inginious-webapp does."""
+    mongo_opt = inginious_config.get("mongo_opt", {})
+    client = MongoClient(host=mongo_opt.get("host", "localhost"))
+    return client[mongo_opt.get("database", "INGInious")]
+
+
+def print_import_report(report: ImportReport) -> None:
+    prefix = "[DRY RUN] " if report.dry_run else ""
+    print(
+        f"{prefix}Rows: {report.rows}, applied: {report.applied}, "
+        f"submissions updated: {report.submissions}, errors: {report.n_errors}"
+    )
+    for error in report.errors:
+        print(f"  line {error.line}: {error.message}", file=sys.stderr)
+    if report.n_errors > len(report.errors):
+        print(
+            f"  ... {report.n_errors - len(report.errors)} more errors",
+            file=sys.stderr,
+        )
+
+
+def import_grades(args: argparse.Namespace) -> int:
+    inginious_config = load_inginious_config(args.config)
+    importer = GradeImporter(
+        get_database(inginious_config),
+        get_plugin_config(inginious_config),
+        args.course,
+        grader=args.grader,
+        dry_run=args.dry_run,
+        batch_size=args.batch_size,
+    )
+    fmt = args.format or get_import_format(args.file)
+    with open(args.file, encoding="utf-8", newline="") as f:
+        report = importer.run(read_rows(f, fmt))
+    print_import_report(report)
+    return 1 if report.n_errors else 0
+
+
+def export_grades(args: argparse.Namespace) -> int:
+    inginious_config = load_inginious_config(args.config)
+    exporter = GradeExporter(
+        get_database(inginious_config),
+        get_plugin_config(inginious_config),
+        args.course,
+        batch_size=args.batch_size,
+    )
+    if args.output:
+        with open(args.output, "w", encoding="utf-8", newline="") as f:
+            f.writelines(exporter.stream(args.format))
+    else:
+        sys.stdout.writelines(exporter.stream(args.format))
+    return 0
+
+
+def export_code_metrics(args: argparse.Namespace) -> int:
+    from gridfs import GridFS
+    from inginious.frontend.submission_manager import WebAppSubmissionManager
+
+    inginious_config = load_inginious_config(args.config)
+    database = get_database(inginious_config)
+    config = get_plugin_config(inginious_config)
+    if args.batch_size:
+        config.code_metrics.batch_size = args.batch_size
+    # Only used to read submission input from GridFS
+    submission_manager = WebAppSubmissionManager(
+        None, None, database, GridFS(database), None, None
+    )
+    job = CodeMetricsJob(database, submission_manager, config, args.course, args.task)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8", newline="") as f:
+            f.writelines(job.stream(args.format))
+    else:
+        sys.stdout.writelines(job.stream(args.format))
+    return 0
+
+
+def print_snapshot_summary(summary: SnapshotSummary, dry_run: bool = False) -> None:
+    prefix = "[DRY RUN] " if dry_run else ""
+    print(
+        f"{prefix}Courses: {len(summary.courses)}, submissions: {summary.submissions}, "
+        f"user tasks: {summary.user_tasks}, records: {summary.records}"
+    )
+    if summary.cleared:
+        print(f"{prefix}Cleared {summary.cleared} documents not in the snapshot")
+    if summary.failed:
+        print(f"  {summary.failed} writes failed", file=sys.stderr)
+
+
+def snapshot(args: argparse.Namespace) -> int:
+    inginious_config = load_inginious_config(args.config)
+    database = get_database(inginious_config)
+    with open(args.file, "wb") as f:
+        summary = write_snapshot(
+            database, f, courseids=args.course, batch_size=args.batch_size
+        )
+    print_snapshot_summary(summary)
+    return 0
+
+
+def restore(args: argparse.Namespace) -> int:
+    inginious_config = load_inginious_config(args.config)
+    try:
+        summary = restore_snapshot(
+            get_database(inginious_config),
+            args.file,
+            courseids=args.course,
+            dry_run=args.dry_run,
+        )
+    except SnapshotError as e:
+        print(f"Failed to restore snapshot: {e}", file=sys.stderr)
+        return 1
+    print_snapshot_summary(summary, dry_run=args.dry_run)
+    return 1 if summary.failed else 0
+
+
+def get_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="inginious-coding-style",
+        description="Maintenance tasks for the INGInious Coding Style plugin.",
+    )
+    parser.add_argument(
+        "--config",
+        help="Path to INGInious configuration file. Detected automatically if omitted.",
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    p_import = subparsers.add_parser(
+        "import", help="Import coding style grades from a CSV or JSONL file."
+    )
+    p_import.add_argument("file", help="File to import.")
+    p_import.add_argument("--course", required=True, help="ID of the course.")
+    p_import.add_argument(
+        "--format",
+        choices=IMPORT_FORMATS,
+        help="Format of the file. Determined by file extension if omitted.",
+    )
+    p_import.add_argument(
+        "--grader", help="Username to add to the graders of each updated submission."
+    )
+    p_import.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Validate the file and report what would be imported without writing anything.",
+    )
+    p_import.add_argument("--batch-size", type=int, default=500)
+    p_import.set_defaults(func=import_grades)
+
+    p_export = subparsers.add_parser(
+        "export", help="Export the coding style grades of a course."
+    )
+    p_export.add_argument("--course", required=True, help="ID of the course.")
+    p_export.add_argument("--format", choices=EXPORT_FORMATS, default="csv")
+    p_export.add_argument(
+        "-o", "--output", help="File to write to. Writes to stdout if omitted."
+    )
+    p_export.add_argument("--batch-size", type=int, default=1000)
+    p_export.set_defaults(func=export_grades)
+
+    p_metrics = subparsers.add_parser(
+        "metrics",
+        help="Export the code metrics of the best submission of each user for a task.",
+    )
+    p_metrics.add_argument("--course", required=True, help="ID of the course.")
+    p_metrics.add_argument("--task", required=True, help="ID of the task.")
+    p_metrics.add_argument("--format", choices=METRICS_FORMATS, default="csv")
+    p_metrics.add_argument(
+        "-o", "--output", help="File to write to. Writes to stdout if omitted."
+    )
+    p_metrics.add_argument("--batch-size", type=int)
+    p_metrics.set_defaults(func=export_code_metrics)
+
+    p_snapshot = subparsers.add_parser(
+        "snapshot",
+        help="Write coding style grades and grading status to a snapshot file.",
+    )
+    p_snapshot.add_argument("file", help="File to write the snapshot to.")
+    p_snapshot.add_argument(
+        "--course",
+        action="append",
+        help="Only snapshot this course. Can be specified multiple times.",
+    )
+    p_snapshot.add_argument("--batch-size", type=int, default=500)
+    p_snapshot.set_defaults(func=snapshot)
+
+    p_restore = subparsers.add_parser(
+        "restore", help="Restore coding style grades from a snapshot file."
+    )
+    p_restore.add_argument("file", help="Snapshot file to restore.")
+    p_restore.add_argument(
+        "--course",
+        action="append",
+        help="Only restore this course. Can be specified multiple times.",
+    )
+    p_restore.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Read the snapshot and report what would be restored without writing anything.",
+    )
+    p_restore.set_defaults(func=restore)
+
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = get_parser().parse_args(argv)
+    return args.func(args)
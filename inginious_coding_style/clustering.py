@@ -0,0 +1,464 @@
+"""Module for clustering similar submissions of a task.
+
+Each submission is summarized by a MinHash signature of the shingles
+(runs of consecutive tokens) of its code. Tokens are normalized first:
+identifiers, strings and numbers are replaced by placeholders and comments
+are dropped, so renaming variables does not make code look different.
+
+Signatures are computed with one permutation hashing: each shingle is hashed
+once and assigned to one of `NUM_BINS` bins, which keeps its smallest hash.
+Empty bins borrow the value of the next non-empty bin. The share of bins two
+signatures agree on estimates the Jaccard similarity of their shingles.
+
+Signatures are split into `BANDS` bands for locality-sensitive hashing:
+only submissions that are identical in at least one band are compared, and
+a submission joins the cluster of a submission it is at least
+`clustering.threshold` similar to.
+
+Signatures are stored in the `coding_style_signatures` collection, keyed by
+submission ID. The index is built incrementally: submissions are indexed
+when they are done, and submissions missing from the index are indexed
+when their task is clustered.
+"""
+
+import builtins
+import io
+import keyword
+import re
+import tokenize
+import zlib
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Set, Tuple
+
+from inginious.frontend.tasks import Task
+from pymongo import UpdateOne
+from pymongo.database import Database
+
+from .code_metrics import is_python
+from .config import ClusteringSettings, PluginConfig
+from .database import GRADED_FIELD, MEAN_FIELD, VERSION_FIELD, bulk_write
+from .grades import CodingStyleGrades, get_grades
+from .logger import get_log_fields, get_logger
+from .sources import SourceFile, get_sources, get_submission_input
+
+SIGNATURES_COLLECTION = "coding_style_signatures"
+
+# Stored with each signature. Bump when signatures are computed differently
+SIGNATURE_VERSION = 1
+
+NUM_BINS = 64
+BANDS = 8
+ROWS = NUM_BINS // BANDS  # bins per band
+# Max number of clusters of an LSH bucket each signature is compared to
+MAX_BUCKET_CANDIDATES = 32
+
+# Submission fields required to cluster and index submissions
+CLUSTER_PROJECTION = {
+    "username": 1,
+    "input": 1,
+    "custom.coding_style_grades": 1,
+    GRADED_FIELD: 1,
+    MEAN_FIELD: 1,
+    VERSION_FIELD: 1,
+}
+
+# A 64 bit shingle hash is split into a 6 bit bin and a 52 bit value.
+# Borrowed values are offset by a multiple of 2^52 (see `get_signature()`),
+# so that every value of a signature fits in a 64 bit BSON integer.
+_VALUE_BITS = 52
+_VALUE_MASK = (1 << _VALUE_BITS) - 1
+_BIN_SHIFT = 64 - 6
+_EMPTY = -1
+_MULTIPLIER = 0x9E3779B97F4A7C15  # Fibonacci hashing
+_MASK64 = (1 << 64) - 1
+
+# Names that are not replaced by a placeholder
+_KEPT_NAMES = frozenset(keyword.kwlist) | frozenset(dir(builtins))
+_SKIPPED_TOKENS = {
+    tokenize.COMMENT,
+    tokenize.NL,
+    tokenize.ENCODING,
+    tokenize.ENDMARKER,
+}
+# f-strings are tokenized into several tokens from Python 3.12
+_STRING_TOKENS = {
+    getattr(tokenize, name)
+    for name in ["STRING", "FSTRING_START", "FSTRING_MIDDLE", "FSTRING_END"]
+    if hasattr(tokenize, name)
+}
+_STRUCTURE_TOKENS = {tokenize.INDENT: ">", tokenize.DEDENT: "<", tokenize.NEWLINE: ";"}
+_WORD_RE = re.compile(r"\w+|[^\w\s]")
+
+
+def _python_tokens(code: str) -> List[str]:
+    tokens = []
+    for token in tokenize.generate_tokens(io.StringIO(code).readline):
+        if token.type in _SKIPPED_TOKENS:
+            continue
+        if token.type == tokenize.NAME:
+            tokens.append(token.string if token.string in _KEPT_NAMES else "N")
+        elif token.type == tokenize.NUMBER:
+            tokens.append("0")
+        elif token.type in _STRING_TOKENS:
+            tokens.append("S")
+        else:
+            tokens.append(_STRUCTURE_TOKENS.get(token.type, token.string))
+    return tokens
+
+
+def get_tokens(source: SourceFile) -> List[str]:
+    """Returns the normalized tokens of a source file.
+
+    Code that is not Python, or cannot be tokenized as Python,
+    is split into words and punctuation instead."""
+    if is_python(source):
+        try:
+            return _python_tokens(source.source)
+        except (tokenize.TokenError, SyntaxError):
+            pass
+    return _WORD_RE.findall(source.source)
+
+
+def get_shingles(tokens: Sequence[str], size: int) -> Set[int]:
+    """Hashes each run of `size` consecutive tokens."""
+    if not tokens:
+        return set()
+    size = min(size, len(tokens))
+    return {
+        zlib.crc32("\x1f".join(tokens[i : i + size]).encode("utf-8"))
+        for i in range(len(tokens) - size + 1)
+    }
+
+
+def get_signature(shingles: Set[int]) -> Optional[List[int]]:
+    """Returns the MinHash signature of a set of shingles,
+    or `None` if there are no shingles."""
+    if not shingles:
+        return None
+    bins = [_EMPTY] * NUM_BINS
+    for shingle in shingles:
+        h = (shingle * _MULTIPLIER) & _MASK64
+        i = h >> _BIN_SHIFT
+        value = (h >> 6) & _VALUE_MASK
+        if bins[i] == _EMPTY or value < bins[i]:
+            bins[i] = value
+    # Densification: empty bins borrow the value of the next non-empty bin,
+    # offset by their distance to it
+    signature = list(bins)
+    for i in range(NUM_BINS):
+        distance = 0
+        while bins[(i + distance) % NUM_BINS] == _EMPTY:
+            distance += 1
+        signature[i] = bins[(i + distance) % NUM_BINS] + (distance << _VALUE_BITS)
+    return signature
+
+
+def get_submission_signature(
+    sources: List[SourceFile], shingle_size: int
+) -> Optional[List[int]]:
+    """Returns the signature of the code of a submission, or `None` if
+    the submission has no code."""
+    tokens: List[str] = []
+    for source in sorted(sources, key=lambda s: s.name):
+        tokens.extend(get_tokens(source))
+    return get_signature(get_shingles(tokens, shingle_size))
+
+
+def estimate_similarity(a: Sequence[int], b: Sequence[int]) -> float:
+    """Estimates the Jaccard similarity of two submissions' shingles."""
+    return sum(1 for x, y in zip(a, b) if x == y) / NUM_BINS
+
+
+def find_clusters(
+    signatures: Dict[Any, Sequence[int]], threshold: float
+) -> List[List[Any]]:
+    """Groups keys of similar signatures.
+
+    Only signatures that are identical in at least one band are compared, and
+    each signature is compared to at most `MAX_BUCKET_CANDIDATES` clusters of
+    a band, so that the number of comparisons grows linearly with the number
+    of signatures. A signature joins the cluster of a signature it is compared to if it is
+    at least `threshold` similar to the first signature of that cluster, so
+    that clusters do not chain together submissions that are not alike.
+
+    Clusters are sorted by size, and only contain keys with a similar key.
+    The first key of a cluster is the one the others were compared to."""
+    # Identical signatures (e.g. copies) are compared once
+    groups: Dict[Tuple[int, ...], List[Any]] = defaultdict(list)
+    for key, signature in signatures.items():
+        groups[tuple(signature)].append(key)
+    unique = list(groups)
+
+    buckets: Dict[Tuple[int, ...], List[int]] = defaultdict(list)
+    for i, signature in enumerate(unique):
+        for band in range(BANDS):
+            start = band * ROWS
+            buckets[(band, *signature[start : start + ROWS])].append(i)
+
+    leader = list(range(len(unique)))  # first signature of each cluster
+    size = [1] * len(unique)
+    compared: Set[Tuple[int, int]] = set()
+
+    def join(a: int, b: int) -> bool:
+        """Adds the single signature `b` to the cluster of `a` if they are similar."""
+        if a == b or (a, b) in compared:
+            return False
+        compared.add((a, b))
+        if estimate_similarity(unique[a], unique[b]) >= threshold:
+            leader[b] = a
+            size[a] += 1
+            return True
+        return False
+
+    for members in buckets.values():
+        # Clusters and single signatures seen so far in the bucket, which the
+        # following signatures are compared to. Bounded, so that a bucket shared
+        # by most submissions of a task (e.g. template code) is not compared
+        # pairwise. Similar signatures still join the first clusters.
+        candidates: List[int] = []
+        for i in members:
+            a = leader[i]
+            if size[a] == 1:
+                # Only single signatures join a cluster, clusters are not merged
+                if not any(join(leader[c], a) for c in candidates):
+                    if len(candidates) < MAX_BUCKET_CANDIDATES:
+                        candidates.append(a)
+                continue
+            for c in candidates:
+                if size[leader[c]] == 1:
+                    join(a, leader[c])
+            if a not in candidates and len(candidates) < MAX_BUCKET_CANDIDATES:
+                candidates.append(a)
+
+    clusters: Dict[int, List[Any]] = {}
+    for i, signature in enumerate(unique):
+        if size[leader[i]] > 1 or len(groups[signature]) > 1:
+            clusters.setdefault(leader[i], list(groups[unique[leader[i]]]))
+            if i != leader[i]:
+                clusters[leader[i]].extend(groups[signature])
+    return sorted(clusters.values(), key=len, reverse=True)
+
+
+@dataclass
+class ClusterMember:
+    submissionid: str
+    username: List[str]
+    graded: bool
+    style_mean: Optional[float]
+    grades: Optional[CodingStyleGrades] = None
+    similarity: float = 1.0  # to the first member of the cluster
+    version: int = 0  # of the coding style grades, see `get_version()`
+
+
+@dataclass
+class Cluster:
+    members: List[ClusterMember] = field(default_factory=list)
+
+    @property
+    def graded(self) -> int:
+        return sum(1 for m in self.members if m.graded)
+
+    @property
+    def grades(self) -> Optional[CodingStyleGrades]:
+        """Grades of the first graded member, used as the cluster's default grades."""
+        for member in self.members:
+            if member.grades:
+                return member.grades
+        return None
+
+
+@dataclass
+class TaskClusters:
+    clusters: List[Cluster]
+    submissions: int  # best submissions of the task
+    indexed: int  # signatures computed for this request
+
+
+def get_signature_update(
+    submission: Dict[str, Any], signature: Optional[List[int]]
+) -> Dict[str, Any]:
+    return {
+        "$set": {
+            "courseid": submission.get("courseid"),
+            "taskid": submission.get("taskid"),
+            "version": SIGNATURE_VERSION,
+            "signature": signature,
+        }
+    }
+
+
+def _get_member(doc: Dict[str, Any]) -> ClusterMember:
+    grades = None
+    try:
+        raw = doc.get("custom", {}).get("coding_style_grades")
+        grades = get_grades(raw) if raw else None
+    except Exception:
+        pass  # clusters are displayed without default grades
+    return ClusterMember(
+        submissionid=str(doc["_id"]),
+        username=doc.get("username", []),
+        graded=bool(doc.get(GRADED_FIELD)),
+        style_mean=doc.get(MEAN_FIELD),
+        grades=grades,
+        version=doc.get(VERSION_FIELD) or 0,
+    )
+
+
+class SignatureIndex:
+    """Clusters the best submission of each user for a task, computing and
+    storing the signatures of submissions that are not indexed yet.
+
+    Parameters
+    ----------
+    database : `Database`
+        The INGInious database.
+    submission_manager : `Any`
+        INGInious submission manager, used to read submission input from GridFS.
+    config : `PluginConfig`
+        The plugin config.
+    courseid : `str`
+        ID of the course.
+    taskid : `str`
+        ID of the task.
+    task : `Optional[Task]`, optional
+        The task, used to find the language of code problems.
+    """
+
+    def __init__(
+        self,
+        database: Database,
+        submission_manager: Any,
+        config: PluginConfig,
+        courseid: str,
+        taskid: str,
+        task: Optional[Task] = None,
+    ) -> None:
+        self.database = database
+        self.submission_manager = submission_manager
+        self.settings: ClusteringSettings = config.clustering
+        self.courseid = courseid
+        self.taskid = taskid
+        self.task = task
+
+    def _batches(self) -> Iterator[List[Any]]:
+        cursor = self.database.user_tasks.find(
+            {"courseid": self.courseid, "taskid": self.taskid, "tried": {"$gt": 0}},
+            {"submissionid": 1},
+            batch_size=self.settings.batch_size,
+        )
+        batch: List[Any] = []
+        for user_task in cursor:
+            if user_task.get("submissionid") is None:
+                continue
+            batch.append(user_task["submissionid"])
+            if len(batch) >= self.settings.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def compute_signature(self, doc: Dict[str, Any]) -> Optional[List[int]]:
+        inputdata = get_submission_input(self.submission_manager, doc["input"])
+        sources = get_sources(self.task, inputdata, self.settings.max_file_size)
+        return get_submission_signature(sources, self.settings.shingle_size)
+
+    def _index(
+        self, submission_ids: List[Any]
+    ) -> Tuple[List[Dict[str, Any]], Dict[Any, Optional[List[int]]], int]:
+        """Retrieves the submissions and signatures of a batch of submissions,
+        and indexes submissions that are not indexed yet."""
+        docs = list(
+            self.database.submissions.find(
+                {"_id": {"$in": submission_ids}}, CLUSTER_PROJECTION
+            )
+        )
+        signatures = {
+            doc["_id"]: doc.get("signature")
+            for doc in self.database[SIGNATURES_COLLECTION].find(
+                {"_id": {"$in": submission_ids}, "version": SIGNATURE_VERSION}
+            )
+        }
+        ops = []
+        for doc in docs:
+            if doc["_id"] in signatures:
+                continue
+            try:
+                signature = self.compute_signature(doc)
+            except Exception as e:
+                get_logger().warning(
+                    "Failed to index submission", exc_info=e, extra=get_log_fields(doc)
+                )
+                continue
+            signatures[doc["_id"]] = signature
+            doc = {**doc, "courseid": self.courseid, "taskid": self.taskid}
+            ops.append(
+                UpdateOne(
+                    {"_id": doc["_id"]},
+                    get_signature_update(doc, signature),
+                    upsert=True,
+                )
+            )
+        if ops:
+            bulk_write(self.database[SIGNATURES_COLLECTION], ops)
+        return docs, signatures, len(ops)
+
+    def clusters(self) -> TaskClusters:
+        members: Dict[Any, ClusterMember] = {}
+        signatures: Dict[Any, List[int]] = {}
+        indexed = 0
+        for batch in self._batches():
+            docs, batch_signatures, n = self._index(batch)
+            indexed += n
+            for doc in docs:
+                signature = batch_signatures.get(doc["_id"])
+                if signature is not None:
+                    members[doc["_id"]] = _get_member(doc)
+                    signatures[doc["_id"]] = signature
+
+        clusters = []
+        for keys in find_clusters(signatures, self.settings.threshold):
+            first = signatures[keys[0]]
+            cluster = Cluster()
+            for key in keys:
+                member = members[key]
+                member.similarity = estimate_similarity(first, signatures[key])
+                cluster.members.append(member)
+            clusters.append(cluster)
+        return TaskClusters(clusters, submissions=len(members), indexed=indexed)
+
+
+def index_submission(
+    plugin_manager: Any,
+    course_factory: Any,
+    config: PluginConfig,
+    submission: Dict[str, Any],
+) -> None:
+    """Adds a submission that is done to the index (`submission_done` hook).
+    Never raises, as INGInious calls the hook when storing the job's result."""
+    from .courses import get_course, get_task
+    from .instrumentation import instrument_database
+
+    try:
+        course = get_course(course_factory, submission["courseid"])
+        task = get_task(course_factory, course, submission["taskid"])
+        database = instrument_database(plugin_manager.get_database())
+        index = SignatureIndex(
+            database,
+            plugin_manager.get_submission_manager(),
+            config,
+            submission["courseid"],
+            submission["taskid"],
+            task,
+        )
+        database[SIGNATURES_COLLECTION].update_one(
+            {"_id": submission["_id"]},
+            get_signature_update(submission, index.compute_signature(submission)),
+            upsert=True,
+        )
+    except Exception as e:
+        get_logger().error(
+            "Failed to index submission",
+            exc_info=e,
+            extra=get_log_fields(submission),
+        )
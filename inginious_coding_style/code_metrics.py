@@ -0,0 +1,580 @@
+"""Module for code metrics of Python submissions.
+
+Submissions are parsed with `ast` and `tokenize` to compute the signals
+behind the default grading categories:
+
+- comments: comment density and docstring coverage
+- modularity: number of functions and classes, and function length
+- structure: maximum nesting depth and identifier length
+- idiomaticity: comprehensions, `enumerate()` and `range(len(...))` loops
+
+Metrics of the best submissions of a task are computed by `CodeMetricsJob`,
+one batch of submissions at a time, so that instructors can sort and triage
+submissions before grading them. Metrics are cached per file in the
+`coding_style_code_metrics` collection, keyed by a hash of the normalized
+source code, so identical files are only parsed once. The combined metrics of
+each submission are stored in the `coding_style_submission_metrics` collection,
+so that the triage page can sort and paginate submissions in the database.
+"""
+
+import ast
+import csv
+import hashlib
+import io
+import json
+import tokenize
+from dataclasses import asdict, dataclass, fields
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from inginious.frontend.tasks import Task
+from pymongo import ASCENDING, DESCENDING, UpdateOne
+from pymongo.database import Database
+
+from .config import PluginConfig
+from .database import (GRADED_FIELD, MEAN_FIELD, bulk_write,
+                       get_best_submission_ids)
+from .logger import get_log_fields, get_logger
+from .sources import SourceFile, get_sources, get_submission_input
+
+CODE_METRICS_COLLECTION = "coding_style_code_metrics"
+# Metrics of each submission, keyed by submission ID. See `get_summary_update()`
+SUBMISSION_METRICS_COLLECTION = "coding_style_submission_metrics"
+
+# Part of the cache key. Bump when metrics are added or computed differently
+ENGINE_VERSION = 1
+
+METRICS_FORMATS = ["csv", "jsonl"]
+
+# Submission fields required to compute the metrics of a submission
+METRICS_PROJECTION = {"username": 1, "input": 1, GRADED_FIELD: 1, MEAN_FIELD: 1}
+
+# Statements that increase the nesting depth of the statements in their body
+_BLOCK_NAMES = ["If", "For", "AsyncFor", "While", "With", "AsyncWith", "Try"]
+# Statements added in later Python versions
+_BLOCK_NAMES += ["TryStar", "Match"]
+_BLOCKS = tuple(getattr(ast, name) for name in _BLOCK_NAMES if hasattr(ast, name))
+
+
+@dataclass
+class CodeMetrics:
+    """Metrics of one or more source files. All fields can be summed
+    across files, except for maxima (see `combine_metrics()`)."""
+
+    files: int = 0
+    lines: int = 0  # non-blank lines
+    comment_lines: int = 0
+    functions: int = 0
+    classes: int = 0
+    docstrings: int = 0  # functions and classes with a docstring
+    function_lines: int = 0
+    max_function_length: int = 0
+    max_nesting: int = 0
+    identifiers: int = 0  # unique names bound in each file
+    identifier_chars: int = 0
+    short_identifiers: int = 0  # single character, except "_"
+    comprehensions: int = 0
+    enumerate_calls: int = 0
+    range_len_loops: int = 0  # for i in range(len(...))
+    syntax_errors: int = 0  # files that could not be parsed
+
+    @property
+    def comment_density(self) -> Optional[float]:
+        """Comment lines per non-blank line."""
+        return _ratio(self.comment_lines, self.lines)
+
+    @property
+    def docstring_coverage(self) -> Optional[float]:
+        """Share of functions and classes with a docstring."""
+        return _ratio(self.docstrings, self.functions + self.classes)
+
+    @property
+    def mean_function_length(self) -> Optional[float]:
+        return _ratio(self.function_lines, self.functions)
+
+    @property
+    def mean_identifier_length(self) -> Optional[float]:
+        return _ratio(self.identifier_chars, self.identifiers)
+
+    @classmethod
+    def from_doc(cls, doc: Dict[str, Any]) -> "CodeMetrics":
+        return cls(**{f.name: doc.get(f.name, 0) for f in fields(cls)})
+
+
+# Displayed metrics of each default category
+CATEGORY_METRICS: Dict[str, Dict[str, str]] = {
+    "comments": {
+        "comment_density": "Comment density",
+        "docstring_coverage": "Docstring coverage",
+    },
+    "modularity": {
+        "functions": "Functions",
+        "classes": "Classes",
+        "mean_function_length": "Mean function length",
+        "max_function_length": "Max function length",
+    },
+    "structure": {
+        "max_nesting": "Max nesting",
+        "mean_identifier_length": "Mean identifier length",
+        "short_identifiers": "Short identifiers",
+    },
+    "idiomaticity": {
+        "comprehensions": "Comprehensions",
+        "enumerate_calls": "enumerate()",
+        "range_len_loops": "range(len())",
+    },
+}
+
+# Metrics submissions can be sorted by
+SORT_KEYS = ["lines", *(m for metrics in CATEGORY_METRICS.values() for m in metrics)]
+
+_MAX_FIELDS = {"max_function_length", "max_nesting"}
+
+
+def _ratio(n: int, total: int) -> Optional[float]:
+    return n / total if total else None
+
+
+def combine_metrics(metrics: Iterable[CodeMetrics]) -> CodeMetrics:
+    """Combines the metrics of the files of a submission."""
+    combined = CodeMetrics()
+    for m in metrics:
+        for f in fields(CodeMetrics):
+            a, b = getattr(combined, f.name), getattr(m, f.name)
+            setattr(combined, f.name, max(a, b) if f.name in _MAX_FIELDS else a + b)
+    return combined
+
+
+class _MetricsVisitor(ast.NodeVisitor):
+    def __init__(self, metrics: CodeMetrics) -> None:
+        self.metrics = metrics
+        self.depth = 0
+        self.names: Set[str] = set()
+        self._elifs: Set[int] = set()
+
+    def generic_visit(self, node: ast.AST) -> None:
+        # elif branches are represented as an If in the else branch of an If,
+        # but are not nested any deeper than the If
+        if not isinstance(node, _BLOCKS) or id(node) in self._elifs:
+            super().generic_visit(node)
+            return
+        if isinstance(node, ast.If) and len(node.orelse) == 1:
+            if isinstance(node.orelse[0], ast.If):
+                self._elifs.add(id(node.orelse[0]))
+        self.depth += 1
+        self.metrics.max_nesting = max(self.metrics.max_nesting, self.depth)
+        super().generic_visit(node)
+        self.depth -= 1
+
+    def _visit_function(self, node: Any) -> None:
+        length = (node.end_lineno or node.lineno) - node.lineno + 1
+        self.metrics.functions += 1
+        self.metrics.function_lines += length
+        self.metrics.max_function_length = max(self.metrics.max_function_length, length)
+        if ast.get_docstring(node, clean=False):
+            self.metrics.docstrings += 1
+        self.names.add(node.name)
+        self.generic_visit(node)
+
+    visit_FunctionDef = visit_AsyncFunctionDef = _visit_function
+
+    def visit_ClassDef(self, node: ast.ClassDef) -> None:
+        self.metrics.classes += 1
+        if ast.get_docstring(node, clean=False):
+            self.metrics.docstrings += 1
+        self.names.add(node.name)
+        self.generic_visit(node)
+
+    def visit_arg(self, node: ast.arg) -> None:
+        if node.arg not in ("self", "cls"):
+            self.names.add(node.arg)
+
+    def visit_Name(self, node: ast.Name) -> None:
+        if isinstance(node.ctx, ast.Store):
+            self.names.add(node.id)
+
+    def visit_Call(self, node: ast.Call) -> None:
+        if isinstance(node.func, ast.Name) and node.func.id == "enumerate":
+            self.metrics.enumerate_calls += 1
+        self.generic_visit(node)
+
+    def visit_For(self, node: ast.For) -> None:
+        if _is_range_len(node.iter):
+            self.metrics.range_len_loops += 1
+        self.generic_visit(node)
+
+    def _visit_comprehension(self, node: ast.AST) -> None:
+        self.metrics.comprehensions += 1
+        self.generic_visit(node)
+
+    visit_ListComp = visit_SetComp = visit_DictComp = _visit_comprehension
+    visit_GeneratorExp = _visit_comprehension
+
+
+def _is_range_len(node: ast.expr) -> bool:
+    return (
+        isinstance(node, ast.Call)
+        and isinstance(node.func, ast.Name)
+        and node.func.id == "range"
+        and len(node.args) == 1
+        and isinstance(node.args[0], ast.Call)
+        and isinstance(node.args[0].func, ast.Name)
+        and node.args[0].func.id == "len"
+    )
+
+
+def _count_comment_lines(source: str) -> int:
+    lines = set()
+    readline = io.StringIO(source).readline
+    try:
+        for token in tokenize.generate_tokens(readline):
+            if token.type == tokenize.COMMENT:
+                lines.add(token.start[0])
+    except (tokenize.TokenError, SyntaxError):
+        pass  # comments up to the error are counted
+    return len(lines)
+
+
+def compute_metrics(source: str) -> CodeMetrics:
+    """Computes the metrics of a single Python source file."""
+    metrics = CodeMetrics(files=1)
+    metrics.lines = sum(1 for line in source.splitlines() if line.strip())
+    metrics.comment_lines = _count_comment_lines(source)
+    try:
+        tree = ast.parse(source)
+    except (SyntaxError, ValueError, RecursionError, MemoryError):
+        metrics.syntax_errors = 1
+        return metrics
+    visitor = _MetricsVisitor(metrics)
+    try:
+        visitor.visit(tree)
+    except RecursionError:  # deeply nested expressions
+        metrics.syntax_errors = 1
+    names = [name for name in visitor.names if name != "_"]
+    metrics.identifiers = len(names)
+    metrics.identifier_chars = sum(len(name) for name in names)
+    metrics.short_identifiers = sum(1 for name in names if len(name) == 1)
+    return metrics
+
+
+def is_python(source: SourceFile) -> bool:
+    suffix = Path(source.name).suffix
+    if suffix:
+        return suffix == ".py"
+    return bool(source.language) and source.language.lower().startswith("python")
+
+
+def get_cache_key(content_hash: str) -> str:
+    return f"{ENGINE_VERSION}:{content_hash}"
+
+
+@dataclass
+class SubmissionMetrics:
+    """Code metrics of the Python files of a submission."""
+
+    submissionid: str
+    username: List[str]
+    graded: bool
+    style_mean: Optional[float]
+    metrics: CodeMetrics
+    # Hash of the submission's files. Identical submissions share a hash
+    content_hash: Optional[str] = None
+    error: Optional[str] = None
+
+    def get_value(self, key: str) -> Any:
+        return getattr(self.metrics, key)
+
+    def to_row(self) -> Dict[str, Any]:
+        m = self.metrics
+        return {
+            "submissionid": self.submissionid,
+            "username": ";".join(self.username),
+            "graded": self.graded,
+            "style_mean": self.style_mean,
+            "content_hash": self.content_hash,
+            "files": m.files,
+            "lines": m.lines,
+            **{key: getattr(m, key) for key in SORT_KEYS if key != "lines"},
+            "syntax_errors": m.syntax_errors,
+        }
+
+
+def get_summary_update(row: SubmissionMetrics) -> Dict[str, Any]:
+    """Returns the update document that stores the metrics of a submission in
+    the `SUBMISSION_METRICS_COLLECTION` collection. Derived metrics are stored
+    along with the counts, so that submissions can be sorted by any of
+    `SORT_KEYS` in the database."""
+    return {
+        "$set": {
+            "version": ENGINE_VERSION,
+            "username": row.username,
+            "content_hash": row.content_hash,
+            "error": row.error,
+            **asdict(row.metrics),
+            **{key: row.get_value(key) for key in SORT_KEYS},
+        }
+    }
+
+
+def get_summary_metrics(
+    doc: Dict[str, Any], status: Dict[str, Any]
+) -> SubmissionMetrics:
+    """Creates the metrics of a submission from its document in the
+    `SUBMISSION_METRICS_COLLECTION` collection, and its grading status."""
+    return SubmissionMetrics(
+        submissionid=str(doc["_id"]),
+        username=doc.get("username", []),
+        graded=bool(status.get(GRADED_FIELD)),
+        style_mean=status.get(MEAN_FIELD),
+        metrics=CodeMetrics.from_doc(doc),
+        content_hash=doc.get("content_hash"),
+        error=doc.get("error"),
+    )
+
+
+def sort_metrics(
+    rows: List[SubmissionMetrics], key: str, descending: bool = False
+) -> List[SubmissionMetrics]:
+    """Sorts submissions by a metric. Submissions without a value
+    (e.g. no functions for the mean function length) are sorted last."""
+    if key not in SORT_KEYS:
+        raise ValueError(f"Unable to sort by '{key}'.")
+    missing = [r for r in rows if r.get_value(key) is None]
+    present = [r for r in rows if r.get_value(key) is not None]
+    present.sort(key=lambda r: r.get_value(key), reverse=descending)
+    return present + missing
+
+
+class CodeMetricsJob:
+    """Computes the code metrics of the best submission of each user for a task.
+
+    Parameters
+    ----------
+    database : `Database`
+        The INGInious database.
+    submission_manager : `Any`
+        INGInious submission manager, used to read submission input from GridFS.
+    config : `PluginConfig`
+        The plugin config.
+    courseid : `str`
+        ID of the course.
+    taskid : `str`
+        ID of the task.
+    task : `Optional[Task]`, optional
+        The task, used to find the language of code problems.
+    """
+
+    def __init__(
+        self,
+        database: Database,
+        submission_manager: Any,
+        config: PluginConfig,
+        courseid: str,
+        taskid: str,
+        task: Optional[Task] = None,
+    ) -> None:
+        self.database = database
+        self.submission_manager = submission_manager
+        self.settings = config.code_metrics
+        self.courseid = courseid
+        self.taskid = taskid
+        self.task = task
+
+    def rows(self) -> Iterator[SubmissionMetrics]:
+        """Yields the metrics of each best submission, one batch at a time."""
+        cursor = self.database.user_tasks.find(
+            {"courseid": self.courseid, "taskid": self.taskid, "tried": {"$gt": 0}},
+            {"submissionid": 1},
+            batch_size=self.settings.batch_size,
+        )
+        batch: List[Any] = []
+        for user_task in cursor:
+            if user_task.get("submissionid") is None:
+                continue
+            batch.append(user_task["submissionid"])
+            if len(batch) >= self.settings.batch_size:
+                yield from self._process(batch)
+                batch = []
+        if batch:
+            yield from self._process(batch)
+
+    def index(self, submission_ids: List[Any]) -> int:
+        """Stores the metrics of the submissions that are not stored yet, one
+        batch at a time. Submissions whose input could not be read are
+        analyzed again.
+
+        Returns
+        -------
+        `int`
+            Number of submissions that were analyzed.
+        """
+        stored = {
+            doc["_id"]
+            for doc in self.database[SUBMISSION_METRICS_COLLECTION].find(
+                {
+                    "_id": {"$in": submission_ids},
+                    "version": ENGINE_VERSION,
+                    "error": None,
+                },
+                {"_id": 1},
+            )
+        }
+        missing = [i for i in submission_ids if i not in stored]
+        for start in range(0, len(missing), self.settings.batch_size):
+            end = start + self.settings.batch_size
+            batch = {str(i): i for i in missing[start:end]}
+            ops = [
+                UpdateOne(
+                    {"_id": batch[row.submissionid]},
+                    get_summary_update(row),
+                    upsert=True,
+                )
+                for row in self._process(list(batch.values()))
+            ]
+            if ops:
+                bulk_write(self.database[SUBMISSION_METRICS_COLLECTION], ops)
+        return len(missing)
+
+    def page(
+        self, sort: str, descending: bool, offset: int, limit: int
+    ) -> Tuple[int, List[SubmissionMetrics]]:
+        """Retrieves the metrics of best submissions sorted by a metric, one
+        page at a time. Submissions are sorted and paginated in the database.
+        Submissions without a value are sorted last, like `sort_metrics()` does.
+
+        Returns
+        -------
+        `Tuple[int, List[SubmissionMetrics]]`
+            Number of best submissions of the task, and the metrics of at most
+            `limit` submissions, starting at `offset`.
+        """
+        if sort not in SORT_KEYS:
+            raise ValueError(f"Unable to sort by '{sort}'.")
+        submission_ids = get_best_submission_ids(
+            self.database, self.courseid, self.taskid
+        )
+        if not submission_ids:
+            return 0, []
+        self.index(submission_ids)
+        missing = {"$in": [{"$type": f"${sort}"}, ["missing", "null"]]}
+        pipeline = [
+            {"$match": {"_id": {"$in": submission_ids}, "version": ENGINE_VERSION}},
+            {"$addFields": {"missing": missing}},
+            # Sorted with a bounded amount of memory, as it is followed by a limit
+            {
+                "$sort": {
+                    "missing": ASCENDING,
+                    sort: DESCENDING if descending else ASCENDING,
+                    "_id": ASCENDING,  # stable across pages
+                }
+            },
+            {"$skip": offset},
+            {"$limit": limit},
+        ]
+        docs = list(self.database[SUBMISSION_METRICS_COLLECTION].aggregate(pipeline))
+        # The grading status changes as submissions are graded, so it is not stored
+        status = {
+            doc["_id"]: doc
+            for doc in self.database.submissions.find(
+                {"_id": {"$in": [doc["_id"] for doc in docs]}},
+                {GRADED_FIELD: 1, MEAN_FIELD: 1},
+            )
+        }
+        rows = [get_summary_metrics(doc, status.get(doc["_id"], {})) for doc in docs]
+        return len(submission_ids), rows
+
+    def _get_sources(self, doc: Dict[str, Any]) -> List[SourceFile]:
+        inputdata = get_submission_input(self.submission_manager, doc["input"])
+        sources = get_sources(self.task, inputdata, self.settings.max_file_size)
+        return [s for s in sources if is_python(s)]
+
+    def _process(self, submission_ids: List[Any]) -> Iterator[SubmissionMetrics]:
+        docs = list(
+            self.database.submissions.find(
+                {"_id": {"$in": submission_ids}}, METRICS_PROJECTION
+            )
+        )
+        sources: Dict[Any, List[SourceFile]] = {}
+        errors: Dict[Any, str] = {}
+        for doc in docs:
+            try:
+                sources[doc["_id"]] = self._get_sources(doc)
+            except Exception as e:
+                errors[doc["_id"]] = "Unable to read submission input."
+                get_logger().warning(
+                    "Failed to read submission input",
+                    exc_info=e,
+                    extra=get_log_fields(doc),
+                )
+
+        by_hash = {s.content_hash: s for files in sources.values() for s in files}
+        metrics = self._get_cached(list(by_hash))
+        new = {
+            h: compute_metrics(s.source) for h, s in by_hash.items() if h not in metrics
+        }
+        self._store(new)
+        metrics.update(new)
+
+        for doc in docs:
+            files = sources.get(doc["_id"], [])
+            hashes = sorted(s.content_hash for s in files)
+            yield SubmissionMetrics(
+                submissionid=str(doc["_id"]),
+                username=doc.get("username", []),
+                graded=bool(doc.get(GRADED_FIELD)),
+                style_mean=doc.get(MEAN_FIELD),
+                metrics=combine_metrics(metrics[h] for h in hashes),
+                content_hash=_combine_hashes(hashes) if hashes else None,
+                error=errors.get(doc["_id"]),
+            )
+
+    def _get_cached(self, hashes: List[str]) -> Dict[str, CodeMetrics]:
+        if not hashes:
+            return {}
+        keys = {get_cache_key(h): h for h in hashes}
+        cursor = self.database[CODE_METRICS_COLLECTION].find({"_id": {"$in": list(keys)}})
+        return {keys[doc["_id"]]: CodeMetrics.from_doc(doc) for doc in cursor}
+
+    def _store(self, metrics: Dict[str, CodeMetrics]) -> None:
+        ops = [
+            UpdateOne({"_id": get_cache_key(h)}, {"$setOnInsert": asdict(m)}, upsert=True)
+            for h, m in metrics.items()
+        ]
+        if ops:
+            bulk_write(self.database[CODE_METRICS_COLLECTION], ops)
+
+    def stream(self, fmt: str) -> Iterator[str]:
+        """Serializes the metrics of each submission in the given format.
+
+        Yields one chunk of text per batch of submissions."""
+        if fmt not in METRICS_FORMATS:
+            raise ValueError(f"Unsupported format '{fmt}'.")
+        batch: List[SubmissionMetrics] = []
+        if fmt == "csv":
+            yield self._serialize_csv(batch, header=True)
+        serialize = self._serialize_csv if fmt == "csv" else self._serialize_jsonl
+        for row in self.rows():
+            batch.append(row)
+            if len(batch) >= self.settings.batch_size:
+                yield serialize(batch)
+                batch = []
+        if batch:
+            yield serialize(batch)
+
+    def _serialize_csv(
+        self, rows: List[SubmissionMetrics], header: bool = False
+    ) -> str:
+        buf = io.StringIO()
+        fieldnames = list(SubmissionMetrics("", [], False, None, CodeMetrics()).to_row())
+        writer = csv.DictWriter(buf, fieldnames=fieldnames)
+        if header:
+            writer.writeheader()
+        writer.writerows(row.to_row() for row in rows)
+        return buf.getvalue()
+
+    def _serialize_jsonl(self, rows: List[SubmissionMetrics]) -> str:
+        return "".join(json.dumps(row.to_row()) + "\n" for row in rows)
+
+
+def _combine_hashes(hashes: List[str]) -> str:
+    return hashlib.sha256(":".join(hashes).encode("utf-8")).hexdigest()
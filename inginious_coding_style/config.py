@@ -1,3 +1,4 @@
+from pathlib import Path
 from typing import Any, Dict, List, Optional
 
 from pydantic import BaseModel, Field, validator
@@ -81,6 +82,139 @@ class TaskListBars(BaseModel):
     total_grade: TotalGradeBar = Field(default_factory=TotalGradeBar)
     base_grade: BaseGradeBar = Field(default_factory=BaseGradeBar)
     style_grade: StyleGradeBar = Field(default_factory=StyleGradeBar)
+    # Load the bars of all tasks in a single request after the task list is displayed
+    lazy: bool = False
+
+
+class GradingQueueSettings(BaseModel):
+    claim_timeout: int = Field(ge=0, default=600)  # seconds
+
+
+class TemplateSettings(BaseModel):
+    precompile: bool = True  # compile all templates on plugin startup
+    background: bool = False  # compile templates in a background thread
+    bytecode_cache: bool = True
+    cache_dir: Optional[Path] = None  # defaults to a private directory in the system's temp dir
+
+
+class CacheSettings(BaseModel):
+    realnames_ttl: int = Field(ge=0, default=300)  # seconds, 0 disables the cache
+    realnames_size: int = Field(ge=0, default=4096)
+    courses_ttl: int = Field(ge=0, default=3600)  # seconds, 0 disables the cache
+    courses_size: int = Field(ge=0, default=64)
+    tasks_size: int = Field(ge=0, default=1024)
+
+
+class MetricsSettings(BaseModel):
+    enabled: bool = False
+    # Lets scrapers access the metrics endpoint with an "Authorization: Bearer <token>" header
+    token: Optional[str] = None
+    # Database operations slower than this are logged
+    slow_operation_ms: int = Field(ge=0, default=100)
+    # Explain slow find operations to find the number of documents they examined
+    explain_slow: bool = False
+
+
+class ProfilingSettings(BaseModel):
+    enabled: bool = False
+    directory: Optional[Path] = None  # defaults to a private temp dir per worker
+    max_profiles: int = Field(ge=1, default=50)  # oldest profiles are deleted
+    max_requests: int = Field(ge=1, default=100)  # per arming of an endpoint
+    sampling_interval_ms: int = Field(ge=1, default=5)
+
+
+class LoggingSettings(BaseModel):
+    # Format and write log records in a background thread
+    queue: bool = True
+    # Records logged per message key and interval. 0 disables rate limiting
+    rate_limit: int = Field(ge=0, default=10)
+    # Length of a rate limiting interval (seconds)
+    rate_limit_interval: int = Field(ge=1, default=60)
+    # Pass records on to the handlers of the INGInious logger
+    propagate: bool = False
+
+
+# Matches lines such as "path/to/file.py:12:5: E225 missing whitespace around operator"
+# Column and code are optional (pyflakes does not output codes)
+DEFAULT_LINTER_PATTERN = (
+    r"^[^:]*:(?P<line>\d+):(?:(?P<col>\d+):)? (?:(?P<code>[A-Z]+\d+) )?(?P<message>.*)$"
+)
+
+
+class LinterSettings(BaseModel):
+    name: str
+    # Command run for each file. "{path}" is replaced by the path of the file
+    command: List[str]
+    # Regex matching a finding in the output of the command
+    pattern: str = DEFAULT_LINTER_PATTERN
+    # Only files with these extensions are analyzed
+    extensions: List[str] = [".py"]
+    # Grading category of findings, by finding code prefix (longest prefix wins)
+    categories: Dict[str, str] = {}
+    # Grading category of findings whose code does not match any prefix
+    default_category: Optional[str] = None
+
+
+DEFAULT_LINTERS = [
+    LinterSettings(
+        name="pycodestyle",
+        command=["pycodestyle", "{path}"],
+        categories={
+            "E26": "comments",  # inline and block comments
+            "E1": "structure",  # indentation
+            "E2": "structure",  # whitespace
+            "E3": "structure",  # blank lines
+            "E4": "structure",  # imports
+            "E5": "structure",  # line length
+            "E7": "idiomaticity",  # statements
+            "E9": "structure",  # syntax and I/O errors
+            "W6": "idiomaticity",  # deprecated features
+        },
+        default_category="structure",
+    ),
+    LinterSettings(
+        name="pyflakes",
+        command=["pyflakes", "{path}"],
+        default_category="idiomaticity",
+    ),
+]
+
+
+class AnalysisSettings(BaseModel):
+    enabled: bool = False
+    linters: List[LinterSettings] = Field(default_factory=lambda: DEFAULT_LINTERS)
+    # Max number of linters running at the same time in each webapp worker
+    workers: int = Field(ge=1, default=2)
+    # Per file and linter
+    timeout: float = Field(gt=0, default=10)  # seconds
+    memory_limit: int = Field(ge=0, default=512)  # MiB, 0 disables the limit
+    max_file_size: int = Field(ge=0, default=262144)  # bytes, larger files are skipped
+    # Analyze submissions as soon as they are done, instead of when first graded
+    precompute: bool = True
+    # Grade points subtracted from a suggested grade per finding
+    penalty: int = Field(ge=0, le=100, default=5)
+
+
+class CodeMetricsSettings(BaseModel):
+    enabled: bool = True
+    # Number of submissions read from the database and analyzed at a time
+    batch_size: int = Field(ge=1, default=100)
+    max_file_size: int = Field(ge=0, default=262144)  # bytes, larger files are skipped
+    # Number of submissions displayed per page of the triage page
+    page_size: int = Field(ge=1, default=100)
+
+
+class ClusteringSettings(BaseModel):
+    enabled: bool = False
+    # Estimated Jaccard similarity to the first submission of a cluster
+    threshold: float = Field(ge=0.0, le=1.0, default=0.8)
+    # Number of consecutive tokens per shingle
+    shingle_size: int = Field(ge=1, default=5)
+    # Index submissions as soon as they are done, instead of when first clustered
+    index_on_submit: bool = True
+    # Number of submissions read from the database and indexed at a time
+    batch_size: int = Field(ge=1, default=200)
+    max_file_size: int = Field(ge=0, default=262144)  # bytes, larger files are skipped
 
 
 class PluginConfigIn(BaseModel):
@@ -109,6 +243,33 @@ class PluginConfigIn(BaseModel):
     # Show/hide "graded by" on student coding style grades page.
     show_graders: bool = False
 
+    # Template compilation and caching settings
+    templates: TemplateSettings = Field(default_factory=TemplateSettings)
+
+    # Tutor grading queue settings
+    grading_queue: GradingQueueSettings = Field(default_factory=GradingQueueSettings)
+
+    # In-process cache settings
+    cache: CacheSettings = Field(default_factory=CacheSettings)
+
+    # Hook and page metrics settings
+    metrics: MetricsSettings = Field(default_factory=MetricsSettings)
+
+    # On-demand profiling settings
+    profiling: ProfilingSettings = Field(default_factory=ProfilingSettings)
+
+    # Logging settings
+    logging: LoggingSettings = Field(default_factory=LoggingSettings)
+
+    # Static analysis settings
+    analysis: AnalysisSettings = Field(default_factory=AnalysisSettings)
+
+    # Code metrics and triage page settings
+    code_metrics: CodeMetricsSettings = Field(default_factory=CodeMetricsSettings)
+
+    # Similar submission clustering settings
+    clustering: ClusteringSettings = Field(default_factory=ClusteringSettings)
+
     # validators
     # Reusing validators: https://pydantic-docs.helpmanual.io/usage/validators/#reuse-validators
     # "*" validator: https://pydantic-docs.helpmanual.io/usage/validators/#pre-and-per-item-validators
@@ -132,6 +293,15 @@ class PluginConfig(BaseModel):
     weighted_mean: WeightedMeanSettings
     task_list_bars: TaskListBars
     show_graders: bool
+    templates: TemplateSettings
+    grading_queue: GradingQueueSettings
+    cache: CacheSettings
+    metrics: MetricsSettings
+    profiling: ProfilingSettings
+    logging: LoggingSettings
+    analysis: AnalysisSettings
+    code_metrics: CodeMetricsSettings
+    clustering: ClusteringSettings
 
     class Config:
         extras = "ignore"
@@ -0,0 +1,133 @@
+"""Module for cached retrieval of courses and tasks.
+
+`CourseFactory.get_course()` and `TaskFactory.get_task()` look up the
+descriptor file of a course or task, and check the modification times of
+the descriptor and any translation files on every call. We instead remember
+the paths of each descriptor and translation file, and only check their
+modification times.
+
+Cached entries are invalidated when the modification time of their
+descriptor changes, when the translation files of a course are added,
+removed or modified, and explicitly when a task is edited in the task
+editor (see `on_task_editor_submit()`).
+"""
+
+from typing import Any, List, Optional, Tuple
+
+from inginious.frontend.course_factory import CourseFactory
+from inginious.frontend.courses import Course
+from inginious.frontend.tasks import Task
+
+from .cache import TTLCache
+from .config import CacheSettings
+
+# (course, paths, mtimes) keyed by course ID, where `paths` are the descriptor
+# and translation files of the course (see `_get_course_paths()`).
+# Caching is disabled until `init_course_cache()` is called.
+COURSE_CACHE: TTLCache[
+    str, Tuple[Course, List[str], List[Optional[float]]]
+] = TTLCache(maxsize=0, ttl=0)
+
+# (task, course, descriptor path, descriptor mtime) keyed by (course ID, task ID).
+TASK_CACHE: TTLCache[Tuple[str, str], Tuple[Task, Course, str, float]] = TTLCache(
+    maxsize=0, ttl=0
+)
+
+
+def init_course_cache(settings: CacheSettings) -> None:
+    global COURSE_CACHE, TASK_CACHE
+    COURSE_CACHE = TTLCache(maxsize=settings.courses_size, ttl=settings.courses_ttl)
+    TASK_CACHE = TTLCache(maxsize=settings.tasks_size, ttl=settings.courses_ttl)
+
+
+def _get_mtime(fs: Any, path: str) -> Optional[float]:
+    try:
+        return fs.get_last_modification_time(path)
+    except Exception:
+        return None  # descriptor was moved or deleted
+
+
+def _get_course_paths(
+    course_factory: CourseFactory, courseid: str, descriptor: str
+) -> List[str]:
+    """Returns the paths of the files a course is loaded from: its descriptor,
+    its translations folder and the translation files in that folder.
+
+    The modification time of the folder changes when translation files
+    are added or removed."""
+    translations = f"{courseid}/$i18n"
+    paths = [descriptor, translations]
+    translations_fs = course_factory.get_course_fs(courseid).from_subfolder("$i18n")
+    if translations_fs.exists():
+        for f in translations_fs.list(folders=False, files=True, recursive=False):
+            if f.endswith(".mo"):
+                paths.append(f"{translations}/{f}")
+    return paths
+
+
+def get_course(course_factory: CourseFactory, courseid: str) -> Course:
+    """Cached version of `CourseFactory.get_course()`.
+
+    Raises the same exceptions as `CourseFactory.get_course()`."""
+    fs = course_factory.get_fs()
+    entry = COURSE_CACHE.get(courseid)
+    if entry is not None:
+        course, paths, mtimes = entry
+        if [_get_mtime(fs, path) for path in paths] == mtimes:
+            return course
+        COURSE_CACHE.invalidate(courseid)
+
+    # Read the mtimes before loading the course, so that an edit made while
+    # loading results in a stale mtime rather than a stale course.
+    try:
+        descriptor = course_factory._get_course_descriptor_path(courseid)
+        paths = _get_course_paths(course_factory, courseid, descriptor)
+        mtimes = [_get_mtime(fs, path) for path in paths]
+    except Exception:
+        paths, mtimes = [], [None]
+    course = course_factory.get_course(courseid)
+    if mtimes[0] is not None:
+        COURSE_CACHE.set(courseid, (course, paths, mtimes))
+    return course
+
+
+def get_task(course_factory: CourseFactory, course: Course, taskid: str) -> Task:
+    """Cached version of `Course.get_task()`.
+
+    Raises the same exceptions as `Course.get_task()`."""
+    task_factory = course_factory.get_task_factory()
+    key = (course.get_id(), taskid)
+    entry = TASK_CACHE.get(key)
+    if entry is not None:
+        task, task_course, path, mtime = entry
+        # Tasks hold a reference to their course, and are reloaded with it
+        if task_course is course and _get_mtime(
+            task_factory.get_task_fs(*key), path
+        ) == mtime:
+            return task
+        TASK_CACHE.invalidate(key)
+
+    try:
+        path, _ = task_factory._get_task_descriptor_info(*key)
+        mtime = _get_mtime(task_factory.get_task_fs(*key), path)
+    except Exception:
+        path, mtime = "", None
+    task = course.get_task(taskid)
+    if mtime is not None:
+        TASK_CACHE.set(key, (task, course, path, mtime))
+    return task
+
+
+def invalidate_course(courseid: str) -> None:
+    """Removes a course from the cache."""
+    COURSE_CACHE.invalidate(courseid)
+
+
+def invalidate_task(courseid: str, taskid: str) -> None:
+    """Removes a task from the cache."""
+    TASK_CACHE.invalidate((courseid, taskid))
+
+
+def on_task_editor_submit(course: Course, taskid: str, **kwargs: Any) -> None:
+    """Hook called by INGInious when a task is saved in the task editor."""
+    invalidate_task(course.get_id(), taskid)
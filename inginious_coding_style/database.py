@@ -0,0 +1,561 @@
+"""Module for the plugin's database indexes and queries.
+
+Whether or not a submission has coding style grades is denormalized into
+top-level fields on each document in the `submissions` collection. This lets
+us filter, sort and count submissions by their coding style grading status
+through an index, instead of fetching every submission and inspecting
+`custom.coding_style_grades`.
+"""
+
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from bson import ObjectId
+from pydantic import ValidationError
+from pymongo import ASCENDING, DESCENDING, UpdateOne
+from pymongo.collection import Collection
+from pymongo.database import Database
+from pymongo.errors import BulkWriteError
+
+from .config import PluginConfig
+from .logger import get_logger
+from .submission import Submission, get_submission
+
+# Top-level submission fields denoting coding style grading status.
+# Maintained by `SubmissionMixin.update_submission()`.
+GRADED_FIELD = "coding_style_graded"
+MEAN_FIELD = "coding_style_mean"
+GRADED_AT_FIELD = "coding_style_graded_at"
+
+# Top-level submission fields denoting a soft-claim by a tutor in the grading queue
+CLAIMED_BY_FIELD = "coding_style_claimed_by"
+CLAIM_EXPIRES_FIELD = "coding_style_claim_expires"
+# Time a submission was last skipped in the grading queue. Skipped submissions
+# are handed out after submissions that have not been skipped.
+SKIPPED_AT_FIELD = "coding_style_skipped_at"
+
+# Top-level submission field counting the writes of its coding style grades.
+# Writes made by tutors are conditional on the version they graded
+# (see `versioned_filter()`), so that concurrent grading is detected.
+VERSION_FIELD = "coding_style_version"
+# Top-level submission field holding the ID of the last bulk write of its
+# coding style grades (see `bulk_write_versioned()`)
+WRITE_ID_FIELD = "coding_style_write_id"
+
+STATUS_INDEX_NAME = "coding_style_status"
+
+# Collection recording the data migrations applied by the plugin.
+# See `migrate_grading_status()`
+MIGRATIONS_COLLECTION = "coding_style_migrations"
+
+# Max number of operations sent to the database in a single bulk write
+BULK_WRITE_BATCH_SIZE = 500
+
+# Submission fields required to read and update coding style grades.
+# Submissions retrieved with this projection must be updated with `get_grades_update()`.
+GRADES_PROJECTION = {
+    "courseid": 1,
+    "taskid": 1,
+    "username": 1,
+    "grade": 1,
+    "submitted_on": 1,
+    "custom.coding_style_grades": 1,
+    "custom.graded_by": 1,
+    VERSION_FIELD: 1,
+}
+
+
+class WriteConflict(Exception):
+    """Raised when the coding style grades of a submission were modified
+    after the version a write was based on."""
+
+    def __init__(self, submissionid: Any, version: int) -> None:
+        self.submissionid = submissionid
+        self.version = version
+        super().__init__(
+            f"Coding style grades of submission {submissionid} "
+            f"were modified after version {version}."
+        )
+
+
+@dataclass
+class TaskGradingStatus:
+    """Number of graded and ungraded best submissions for a task."""
+
+    taskid: str
+    graded: int = 0
+    ungraded: int = 0
+
+    @property
+    def total(self) -> int:
+        return self.graded + self.ungraded
+
+
+def ensure_indexes(database: Database) -> None:
+    """Creates the indexes used by the plugin's queries.
+    Does nothing if the indexes already exist."""
+    try:
+        database.submissions.create_index(
+            [
+                ("courseid", ASCENDING),
+                ("taskid", ASCENDING),
+                (GRADED_FIELD, ASCENDING),
+                (MEAN_FIELD, DESCENDING),
+            ],
+            name=STATUS_INDEX_NAME,
+        )
+    except Exception as e:
+        get_logger().error("Failed to create database indexes.", exc_info=e)
+
+
+def get_status_update_pipeline(config: PluginConfig) -> List[Dict[str, Any]]:
+    """Returns an update pipeline that sets the grading status fields of
+    graded submissions from their stored grades, like `get_status_fields()`.
+    The time of grading is unknown, and is set to `None`."""
+    enabled = list(config.enabled)
+    grades = {
+        "$filter": {
+            "input": {"$objectToArray": "$custom.coding_style_grades"},
+            "as": "category",
+            "cond": {"$in": ["$$category.k", enabled]},
+        }
+    }
+    mean = {"$avg": {"$map": {"input": grades, "as": "c", "in": "$$c.v.grade"}}}
+    return [
+        {
+            "$set": {
+                GRADED_FIELD: True,
+                # The mean of no enabled categories is 0, see `get_mean()`
+                MEAN_FIELD: {"$round": [{"$ifNull": [mean, 0]}, 2]},
+                GRADED_AT_FIELD: None,
+            }
+        }
+    ]
+
+
+def migrate_grading_status(database: Database, config: PluginConfig) -> None:
+    """Adds the grading status fields to the graded submissions that are
+    missing them, i.e. submissions graded by a version of the plugin that
+    did not maintain these fields. Without them, these submissions are
+    counted as ungraded and handed out by the grading queue.
+
+    Runs once per database: the migration is recorded in the
+    `MIGRATIONS_COLLECTION` collection, so that later calls only cost a
+    lookup by `_id`. `SubmissionMixin.sync_grading_status()` repairs
+    submissions written by an older plugin after the migration."""
+    migration = {"_id": "grading_status"}
+    try:
+        if database[MIGRATIONS_COLLECTION].find_one(migration) is not None:
+            return
+        result = database.submissions.update_many(
+            {
+                GRADED_FIELD: {"$exists": False},
+                "custom.coding_style_grades": {"$exists": True, "$ne": {}},
+            },
+            get_status_update_pipeline(config),
+        )
+        database[MIGRATIONS_COLLECTION].update_one(
+            migration, {"$set": {"applied_at": datetime.now()}}, upsert=True
+        )
+        get_logger().info(
+            f"Added grading status to {result.modified_count} submissions."
+        )
+    except Exception as e:
+        get_logger().error("Failed to add grading status to submissions.", exc_info=e)
+
+
+def get_status_fields(
+    submission: Submission,
+    config: PluginConfig,
+    graded_at: Optional[datetime] = None,
+) -> Dict[str, Any]:
+    """Returns the top-level grading status fields of a submission.
+
+    Parameters
+    ----------
+    submission : `Submission`
+        The submission to get grading status fields for.
+    config : `PluginConfig`
+        Plugin config specifying enabled categories.
+    graded_at : `Optional[datetime]`, optional
+        Time of grading, by default the current time.
+
+    Returns
+    -------
+    `Dict[str, Any]`
+        Fields that can be passed to a `$set` update operator.
+    """
+    grades = submission.custom.coding_style_grades
+    if not grades:
+        return {GRADED_FIELD: False, MEAN_FIELD: None, GRADED_AT_FIELD: None}
+    return {
+        GRADED_FIELD: True,
+        MEAN_FIELD: grades.get_mean(config),
+        GRADED_AT_FIELD: graded_at or datetime.now(),
+    }
+
+
+def get_version(submission: Submission) -> int:
+    """Returns the version of a submission's coding style grades.
+    Submissions that have never been written by the plugin are at version 0."""
+    return getattr(submission, VERSION_FIELD, None) or 0
+
+
+def set_version(submission: Submission, version: int) -> None:
+    setattr(submission, VERSION_FIELD, version)
+
+
+def versioned_filter(submissionid: Any, version: int) -> Dict[str, Any]:
+    """Returns a query filter matching a submission only if its coding
+    style grades are at `version`.
+
+    Used with update documents that increment the version, this makes
+    the update a compare-and-swap: it matches no document if the grades
+    were written since they were read, without locks or transactions."""
+    # `None` matches submissions without the field, i.e. version 0
+    return {"_id": submissionid, VERSION_FIELD: version or None}
+
+
+def get_version_update() -> Dict[str, Any]:
+    """Returns the update operator that increments the version of a
+    submission's coding style grades. Included in every update document
+    that writes coding style grades."""
+    return {"$inc": {VERSION_FIELD: 1}}
+
+
+def get_release_fields() -> Dict[str, Any]:
+    """Returns fields that release a submission's claim when passed to `$set`."""
+    return {CLAIMED_BY_FIELD: None, CLAIM_EXPIRES_FIELD: None}
+
+
+def get_grades_update(submission: Submission, config: PluginConfig) -> Dict[str, Any]:
+    """Returns an update document that only writes the coding style grades,
+    graders and grading status of a submission.
+
+    Unlike `SubmissionMixin.get_submission_update()`, this can be used with
+    submissions retrieved with a projection."""
+    return {
+        "$set": {
+            "custom.coding_style_grades": submission.custom.coding_style_grades.dict(),
+            "custom.graded_by": submission.custom.graded_by,
+            **get_status_fields(submission, config),
+            **get_release_fields(),
+        },
+        **get_version_update(),
+    }
+
+
+def get_category_update(
+    submission: Submission,
+    category_id: str,
+    config: PluginConfig,
+    grader: Optional[str] = None,
+) -> Dict[str, Any]:
+    """Returns an update document that only writes a single grading category
+    of a submission, along with its grader and grading status.
+
+    The submission must already be stored with coding style grades. Its
+    grading status is computed from the grades of `submission`, which must
+    otherwise match the stored grades."""
+    if "." in category_id or category_id.startswith("$"):
+        raise ValueError(f"Invalid grading category ID: {category_id!r}")
+    grade = submission.custom.coding_style_grades[category_id]
+    update: Dict[str, Any] = {
+        "$set": {
+            f"custom.coding_style_grades.{category_id}": grade.dict(),
+            **get_status_fields(submission, config),
+        },
+        **get_version_update(),
+    }
+    if grader:
+        update["$addToSet"] = {"custom.graded_by": grader}
+    return update
+
+
+def get_user_tasks_mean_update(
+    submission: Submission, config: PluginConfig
+) -> Dict[str, Any]:
+    """Returns an update document that only writes the grade fields of
+    a submission in the `user_tasks` collection that depend on its coding
+    style grades. Its base grade is left as is."""
+    grade_mean = submission.get_weighted_mean(config)
+    fields = {"grade_mean": grade_mean}
+    if config.weighted_mean.enabled:
+        fields["grade"] = grade_mean  # the active grade
+    return {"$set": fields}
+
+
+def get_user_tasks_update(
+    submission: Submission, config: PluginConfig
+) -> Dict[str, Any]:
+    """Returns the update document used to store a submission's
+    grades in the `user_tasks` collection.
+    See `SubmissionMixin.set_user_tasks_grades()`."""
+    grade_base = submission.grade
+    grade_mean = submission.get_weighted_mean(config)
+    grade = grade_mean if config.weighted_mean.enabled else grade_base
+    return {
+        "$set": {
+            "grade": grade,  # the active grade
+            "grade_mean": grade_mean,
+            "grade_base": grade_base,
+        }
+    }
+
+
+def graded_filter(graded: bool) -> Dict[str, Any]:
+    """Returns a query filter matching graded or ungraded submissions.
+
+    Submissions that have never been modified by the plugin do not have
+    the grading status field, and are treated as ungraded. Ungraded
+    submissions are matched with `$in` rather than `$ne`, so that the
+    filter can be used as an equality bound on the status index."""
+    if graded:
+        return {GRADED_FIELD: True}
+    return {GRADED_FIELD: {"$in": [False, None]}}
+
+
+def status_filter(courseid: str, taskid: str, graded: bool) -> Dict[str, Any]:
+    """Returns a query filter on the fields of the status index
+    (`STATUS_INDEX_NAME`), matching graded or ungraded submissions of a task."""
+    return {"courseid": courseid, "taskid": taskid, **graded_filter(graded)}
+
+
+def get_best_submission_ids(
+    database: Database, courseid: str, taskid: Optional[str] = None
+) -> List[Any]:
+    """Retrieves the IDs of the best submission of each user for a course or task."""
+    query: Dict[str, Any] = {"courseid": courseid, "tried": {"$gt": 0}}
+    if taskid is not None:
+        query["taskid"] = taskid
+    return [
+        user_task["submissionid"]
+        for user_task in database.user_tasks.find(query, {"submissionid": 1})
+        if user_task.get("submissionid") is not None
+    ]
+
+
+def get_graded_best_submissions(
+    database: Database, courseid: str, username: str
+) -> Dict[str, Submission]:
+    """Retrieves the best submission of a user for every task in a course
+    in a single query, and returns those that have coding style grades.
+
+    The best submission of a task is chosen like `get_best_submission()` does.
+
+    Returns
+    -------
+    `Dict[str, Submission]`
+        Best submissions retrieved with `GRADES_PROJECTION`, keyed by task ID.
+    """
+    pipeline = [
+        {"$match": {"courseid": courseid, "username": username}},
+        {"$project": GRADES_PROJECTION},
+        {
+            "$sort": {
+                "taskid": ASCENDING,
+                "grade": DESCENDING,
+                "submitted_on": DESCENDING,
+            }
+        },
+        {"$group": {"_id": "$taskid", "submission": {"$first": "$$ROOT"}}},
+        {
+            "$match": {
+                "submission.custom.coding_style_grades": {"$exists": True, "$ne": {}}
+            }
+        },
+    ]
+    submissions: Dict[str, Submission] = {}
+    for res in database.submissions.aggregate(pipeline):
+        try:
+            submission = get_submission(res["submission"])
+        except ValidationError:
+            continue  # logged by `get_submission()`
+        if submission.custom.coding_style_grades:
+            submissions[res["_id"]] = submission
+    return submissions
+
+
+def count_ungraded(database: Database, courseid: str, taskid: str) -> int:
+    """Counts the best submissions for a task that have no coding style grades.
+
+    Graded best submissions are counted through the status index, as graded
+    submissions are usually far fewer than the IDs of the best submissions."""
+    submission_ids = get_best_submission_ids(database, courseid, taskid)
+    if not submission_ids:
+        return 0
+    graded = database.submissions.count_documents(
+        {**status_filter(courseid, taskid, True), "_id": {"$in": submission_ids}},
+        hint=STATUS_INDEX_NAME,
+    )
+    return len(submission_ids) - graded
+
+
+def get_grading_status(
+    database: Database, courseid: str
+) -> Dict[str, TaskGradingStatus]:
+    """Counts graded and ungraded best submissions for every task in a course
+    in a single round trip to the database.
+
+    Returns
+    -------
+    `Dict[str, TaskGradingStatus]`
+        Grading status of each task, keyed by task ID.
+    """
+    pipeline = [
+        {"$match": {"courseid": courseid, "tried": {"$gt": 0}}},
+        {"$project": {"taskid": 1, "submissionid": 1}},
+        {
+            "$lookup": {
+                "from": "submissions",
+                "let": {"submissionid": "$submissionid"},
+                "pipeline": [
+                    {"$match": {"$expr": {"$eq": ["$_id", "$$submissionid"]}}},
+                    {"$project": {GRADED_FIELD: 1}},
+                ],
+                "as": "submission",
+            }
+        },
+        {
+            "$group": {
+                "_id": "$taskid",
+                "graded": {
+                    "$sum": {
+                        "$cond": [
+                            {"$in": [True, f"$submission.{GRADED_FIELD}"]},
+                            1,
+                            0,
+                        ]
+                    }
+                },
+                "total": {"$sum": 1},
+            }
+        },
+    ]
+    status: Dict[str, TaskGradingStatus] = {}
+    for res in database.user_tasks.aggregate(pipeline):
+        status[res["_id"]] = TaskGradingStatus(
+            taskid=res["_id"],
+            graded=res["graded"],
+            ungraded=res["total"] - res["graded"],
+        )
+    return status
+
+
+def _bulk_write(
+    collection: Collection, operations: List[Any], batch_size: int
+) -> Tuple[Set[int], int]:
+    """Performs unordered bulk writes of operations in batches.
+    Returns the indices of operations that failed, and the number of
+    documents matched by the other operations."""
+    failed: Set[int] = set()
+    matched = 0
+    for start in range(0, len(operations), batch_size):
+        batch = operations[start : start + batch_size]
+        try:
+            result = collection.bulk_write(batch, ordered=False)
+        except BulkWriteError as e:
+            for error in e.details.get("writeErrors", []):
+                failed.add(start + error["index"])
+            matched += e.details.get("nMatched", 0)
+            get_logger().error(
+                f"{len(e.details.get('writeErrors', []))} operation(s) "
+                f"failed in bulk write to '{collection.name}'."
+            )
+        except Exception as e:
+            failed.update(range(start, start + len(batch)))
+            get_logger().error(
+                f"Bulk write to '{collection.name}' failed.", exc_info=e
+            )
+        else:
+            matched += result.matched_count
+    return failed, matched
+
+
+def bulk_write(
+    collection: Collection,
+    operations: List[Any],
+    batch_size: int = BULK_WRITE_BATCH_SIZE,
+) -> Set[int]:
+    """Performs unordered bulk writes of operations in batches.
+
+    Parameters
+    ----------
+    collection : `Collection`
+        Collection to write to.
+    operations : `List[Any]`
+        Write operations, e.g. `pymongo.UpdateOne`.
+    batch_size : `int`, optional
+        Max number of operations per bulk write.
+
+    Returns
+    -------
+    `Set[int]`
+        Indices of operations that failed.
+    """
+    failed, _ = _bulk_write(collection, operations, batch_size)
+    return failed
+
+
+def bulk_write_versioned(
+    collection: Collection,
+    writes: List[Tuple[Any, int, Dict[str, Any]]],
+    batch_size: int = BULK_WRITE_BATCH_SIZE,
+) -> Tuple[Set[int], Set[int]]:
+    """Performs compare-and-swap writes of coding style grades (see
+    `versioned_filter()`) using unordered bulk writes.
+
+    Bulk writes only report how many documents were matched in total, so
+    every write also stores an ID shared by all writes of the call. If some
+    writes did not match their submission, the IDs are read back to find out
+    which. A write followed by another write to the same submission before
+    the IDs are read back is reported as a conflict, even though it was applied.
+
+    Parameters
+    ----------
+    collection : `Collection`
+        The `submissions` collection.
+    writes : `List[Tuple[Any, int, Dict[str, Any]]]`
+        Submission ID, version the write is based on, and update document
+        of each write. Update documents must increment the version
+        (see `get_version_update()`).
+    batch_size : `int`, optional
+        Max number of operations per bulk write.
+
+    Returns
+    -------
+    `Tuple[Set[int], Set[int]]`
+        Indices of writes that failed, and of writes that were not applied
+        because their submission was modified after their version (or
+        no longer exists).
+    """
+    write_id = ObjectId()
+    operations = []
+    for submissionid, version, update in writes:
+        fields = {**update.get("$set", {}), WRITE_ID_FIELD: write_id}
+        operations.append(
+            UpdateOne(
+                versioned_filter(submissionid, version), {**update, "$set": fields}
+            )
+        )
+    failed, matched = _bulk_write(collection, operations, batch_size)
+    conflicts: Set[int] = set()
+    written = [i for i in range(len(writes)) if i not in failed]
+    if matched >= len(written):
+        return failed, conflicts
+
+    applied: Set[Any] = set()
+    for start in range(0, len(written), batch_size):
+        ids = [writes[i][0] for i in written[start : start + batch_size]]
+        for doc in collection.find({"_id": {"$in": ids}}, {WRITE_ID_FIELD: 1}):
+            if doc.get(WRITE_ID_FIELD) == write_id:
+                applied.add(doc["_id"])
+    for i in written:
+        submissionid = writes[i][0]
+        if submissionid in applied:
+            # Only one of several writes to the same submission can be applied
+            applied.remove(submissionid)
+        else:
+            conflicts.add(i)
+    return failed, conflicts
@@ -0,0 +1,170 @@
+"""Module for exporting the coding style grades of a course to CSV and JSONL.
+
+Exports contain one row per user and task, and are read from a single
+aggregation cursor over `user_tasks` joined to each user's best submission.
+Rows are serialized one batch at a time, so memory usage stays constant
+regardless of the number of rows in an export.
+
+Example CSV export:
+```
+username,taskid,submissionid,grade_base,style_mean,weighted_mean,comments,modularity,graded_by
+student1,helloworld,61b8b1f5d4c1b3f1c4e0e0a1,100.0,70.0,85.0,80,60,tutor1
+student2,helloworld,61b8b1f5d4c1b3f1c4e0e0a2,50.0,,50.0,,,
+```
+"""
+
+import csv
+import io
+import json
+from typing import Any, Dict, Iterator, List, Optional
+
+from pymongo import ASCENDING
+from pymongo.database import Database
+
+from .config import PluginConfig
+from .database import GRADES_PROJECTION
+from .logger import get_logger
+from .submission import get_submission
+
+EXPORT_FORMATS = ["csv", "jsonl"]
+EXPORT_MIMETYPES = {"csv": "text/csv", "jsonl": "application/x-ndjson"}
+
+# Number of rows fetched from the database and serialized at a time
+EXPORT_BATCH_SIZE = 1000
+
+
+def get_export_pipeline(courseid: str) -> List[Dict[str, Any]]:
+    """Aggregation pipeline joining each user task in a course
+    to the projected grades of its best submission."""
+    return [
+        {"$match": {"courseid": courseid, "tried": {"$gt": 0}}},
+        # sort is covered by the (courseid, taskid) index on user_tasks
+        {"$sort": {"taskid": ASCENDING}},
+        {"$project": {"_id": 0, "username": 1, "taskid": 1, "submissionid": 1}},
+        {
+            "$lookup": {
+                "from": "submissions",
+                "let": {"submissionid": "$submissionid"},
+                "pipeline": [
+                    {"$match": {"$expr": {"$eq": ["$_id", "$$submissionid"]}}},
+                    {"$project": GRADES_PROJECTION},
+                ],
+                "as": "submission",
+            }
+        },
+        {"$unwind": "$submission"},
+    ]
+
+
+class GradeExporter:
+    """Streams the coding style grades of a course.
+
+    Parameters
+    ----------
+    database : `Database`
+        The INGInious database.
+    config : `PluginConfig`
+        The plugin config. Grades are exported for enabled categories.
+    courseid : `str`
+        ID of the course to export grades for.
+    batch_size : `int`, optional
+        Number of rows serialized per chunk.
+    """
+
+    def __init__(
+        self,
+        database: Database,
+        config: PluginConfig,
+        courseid: str,
+        batch_size: int = EXPORT_BATCH_SIZE,
+    ) -> None:
+        self.database = database
+        self.config = config
+        self.courseid = courseid
+        self.batch_size = batch_size
+
+    @property
+    def categories(self) -> List[str]:
+        return list(self.config.enabled)
+
+    @property
+    def fieldnames(self) -> List[str]:
+        return [
+            "username",
+            "taskid",
+            "submissionid",
+            "grade_base",
+            "style_mean",
+            "weighted_mean",
+            *self.categories,
+            "graded_by",
+        ]
+
+    def rows(self) -> Iterator[Dict[str, Any]]:
+        """Yields the export row of each user task in the course."""
+        cursor = self.database.user_tasks.aggregate(
+            get_export_pipeline(self.courseid), batchSize=self.batch_size
+        )
+        for doc in cursor:
+            row = self._get_row(doc)
+            if row is not None:
+                yield row
+
+    def _get_row(self, doc: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        try:
+            submission = get_submission(doc["submission"])
+        except Exception:
+            # get_submission() logs the submission ID
+            return None
+        grades = submission.custom.coding_style_grades
+        return {
+            "username": doc["username"],
+            "taskid": doc["taskid"],
+            "submissionid": str(doc["submissionid"]),
+            "grade_base": submission.grade,
+            "style_mean": grades.get_mean(self.config) if grades else None,
+            "weighted_mean": submission.get_weighted_mean(self.config),
+            "grades": {
+                category: grades.grades[category].grade
+                for category in self.categories
+                if category in grades
+            },
+            "graded_by": submission.custom.graded_by,
+        }
+
+    def stream(self, fmt: str) -> Iterator[str]:
+        """Serializes the export in the given format.
+
+        Yields one chunk of text per batch of rows."""
+        if fmt not in EXPORT_FORMATS:
+            raise ValueError(f"Unsupported export format '{fmt}'.")
+        serialize = self._serialize_csv if fmt == "csv" else self._serialize_jsonl
+
+        if fmt == "csv":
+            yield self._serialize_csv([], header=True)
+        batch: List[Dict[str, Any]] = []
+        n_rows = 0
+        for row in self.rows():
+            batch.append(row)
+            if len(batch) >= self.batch_size:
+                yield serialize(batch)
+                n_rows += len(batch)
+                batch = []
+        if batch:
+            yield serialize(batch)
+            n_rows += len(batch)
+        get_logger().info(f"Exported {n_rows} rows for course {self.courseid}.")
+
+    def _serialize_csv(self, rows: List[Dict[str, Any]], header: bool = False) -> str:
+        buf = io.StringIO()
+        writer = csv.DictWriter(buf, fieldnames=self.fieldnames)
+        if header:
+            writer.writeheader()
+        for row in rows:
+            grades = row.pop("grades")
+            row["graded_by"] = ";".join(row["graded_by"])
+            writer.writerow({**row, **grades})
+        return buf.getvalue()
+
+    def _serialize_jsonl(self, rows: List[Dict[str, Any]]) -> str:
+        return "".join(json.dumps(row) + "\n" for row in rows)
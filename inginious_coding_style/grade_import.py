@@ -0,0 +1,389 @@
+"""Module for importing coding style grades from CSV and JSONL files.
+
+Files are parsed as a stream and applied in batches, so memory usage stays
+constant regardless of the number of rows in a file.
+
+Each row contains the grade and/or feedback of a single category for a single
+submission, and must identify the submission by either `submissionid`, or
+`username` and `taskid`. Rows identified by username are applied to the
+user's best submission for the task.
+
+Only the categories in a file are written. Other categories of a submission
+keep their grades, and are left out of the grades of an ungraded submission.
+
+Example CSV file:
+```
+submissionid,username,taskid,category,grade,feedback
+,student1,helloworld,comments,80,Good use of comments.
+61b8b1f5d4c1b3f1c4e0e0a1,,,modularity,60,
+```
+"""
+
+import csv
+import json
+from dataclasses import dataclass, field
+from itertools import islice
+from typing import (Any, Dict, Iterable, Iterator, List, Optional, Set, TextIO,
+                    Tuple, Union)
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from pydantic import BaseModel, ValidationError, root_validator, validator
+from pymongo import UpdateOne
+from pymongo.database import Database
+
+from .config import PluginConfig
+from .database import (BULK_WRITE_BATCH_SIZE, GRADES_PROJECTION, bulk_write,
+                       bulk_write_versioned, get_grades_update,
+                       get_user_tasks_update, get_version)
+from .grades import GradingCategory
+from .metrics import record_validation_failure
+from .submission import Submission, get_submission
+
+IMPORT_FORMATS = ["csv", "jsonl"]
+IMPORT_FIELDS = ["submissionid", "username", "taskid", "category", "grade", "feedback"]
+
+# Max number of row errors included in an import report
+MAX_REPORTED_ERRORS = 100
+
+
+class GradeRow(BaseModel):
+    """Represents a single row of an import file."""
+
+    line: int
+    submissionid: Optional[str] = None
+    username: Optional[str] = None
+    taskid: Optional[str] = None
+    category: str
+    grade: Optional[int] = None  # validated by GradingCategory
+    feedback: Optional[str] = None
+
+    @validator("*", pre=True)
+    def empty_is_none(cls, value: Any) -> Any:
+        """Treats empty CSV cells as missing values."""
+        if isinstance(value, str) and not value.strip():
+            return None
+        return value
+
+    @root_validator(skip_on_failure=True)
+    def check_identifier(cls, values: Dict[str, Any]) -> Dict[str, Any]:
+        if not values.get("submissionid") and not (
+            values.get("username") and values.get("taskid")
+        ):
+            raise ValueError(
+                "Row must specify either 'submissionid' or 'username' and 'taskid'."
+            )
+        return values
+
+
+@dataclass
+class RowError:
+    line: int
+    message: str
+
+
+@dataclass
+class ImportReport:
+    """Summary of an import."""
+
+    dry_run: bool = False
+    rows: int = 0
+    applied: int = 0
+    submissions: int = 0  # number of submission updates
+    n_errors: int = 0
+    errors: List[RowError] = field(default_factory=list)
+
+    def add_error(self, line: int, message: str) -> None:
+        self.n_errors += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(RowError(line, message))
+
+
+def get_import_format(filename: str, default: str = "csv") -> str:
+    """Determines the format of an import file from its file extension."""
+    suffix = filename.rsplit(".", 1)[-1].lower() if "." in filename else ""
+    if suffix in ("jsonl", "ndjson"):
+        return "jsonl"
+    if suffix == "csv":
+        return "csv"
+    return default
+
+
+def read_rows(stream: TextIO, fmt: str) -> Iterator[Union[GradeRow, RowError]]:
+    """Lazily parses rows from a CSV or JSONL stream.
+
+    Yields a `GradeRow` for each valid row, and a `RowError` for each row
+    that cannot be parsed."""
+    if fmt not in IMPORT_FORMATS:
+        raise ValueError(f"Unsupported import format '{fmt}'.")
+
+    if fmt == "csv":
+        reader = csv.DictReader(stream)
+        # Line 1 is the header
+        records: Iterable[Tuple[int, Any]] = enumerate(reader, start=2)
+    else:
+        records = ((n, line) for n, line in enumerate(stream, start=1) if line.strip())
+
+    for line, record in records:
+        if fmt == "jsonl":
+            try:
+                record = json.loads(record)
+            except json.JSONDecodeError as e:
+                yield RowError(line, f"Invalid JSON: {e}")
+                continue
+            if not isinstance(record, dict):
+                yield RowError(line, "Row must be a JSON object.")
+                continue
+        try:
+            yield GradeRow(
+                line=line, **{k: record.get(k) for k in IMPORT_FIELDS}
+            )
+        except ValidationError as e:
+            yield RowError(line, _format_validation_error(e))
+
+
+def _format_validation_error(exc: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(l) for l in err['loc'])}: {err['msg']}" for err in exc.errors()
+    )
+
+
+class GradeImporter:
+    """Applies rows of coding style grades to submissions in a course.
+
+    Parameters
+    ----------
+    database : `Database`
+        The INGInious database.
+    config : `PluginConfig`
+        The plugin config. Grades can only be imported for enabled categories.
+    courseid : `str`
+        ID of the course to import grades for.
+    grader : `Optional[str]`, optional
+        Username added to the `graded_by` list of each updated submission.
+    dry_run : `bool`, optional
+        Validate and resolve all rows without writing to the database.
+    batch_size : `int`, optional
+        Number of rows applied per batch.
+    """
+
+    def __init__(
+        self,
+        database: Database,
+        config: PluginConfig,
+        courseid: str,
+        grader: Optional[str] = None,
+        dry_run: bool = False,
+        batch_size: int = BULK_WRITE_BATCH_SIZE,
+    ) -> None:
+        self.database = database
+        self.config = config
+        self.courseid = courseid
+        self.grader = grader
+        self.dry_run = dry_run
+        self.batch_size = batch_size
+
+    def run(self, rows: Iterable[Union[GradeRow, RowError]]) -> ImportReport:
+        """Imports grades from parsed rows (see `read_rows()`)."""
+        report = ImportReport(dry_run=self.dry_run)
+        it = iter(rows)
+        while batch := list(islice(it, self.batch_size)):
+            self._apply_batch(batch, report)
+        return report
+
+    def _apply_batch(
+        self, batch: List[Union[GradeRow, RowError]], report: ImportReport
+    ) -> None:
+        rows: List[GradeRow] = []
+        for row in batch:
+            report.rows += 1
+            if isinstance(row, RowError):
+                report.add_error(row.line, row.message)
+            else:
+                rows.append(row)
+
+        resolved = self._resolve_submission_ids(rows, report)
+        submissions, invalid = self._fetch_submissions(set(resolved.values()))
+
+        modified: Dict[ObjectId, Submission] = {}
+        # Lines of the rows applied to each modified submission
+        lines: Dict[ObjectId, List[int]] = {}
+        for row in rows:
+            submissionid = resolved.get(row.line)
+            if submissionid is None:
+                continue  # already reported
+            if submissionid in invalid:
+                report.add_error(
+                    row.line, f"Stored grades of submission {submissionid} are invalid."
+                )
+                continue
+            submission = submissions.get(submissionid)
+            if submission is None:
+                report.add_error(row.line, f"Submission {submissionid} not found.")
+                continue
+            if submission.courseid != self.courseid:
+                report.add_error(
+                    row.line,
+                    f"Submission {submissionid} does not belong to course {self.courseid}.",
+                )
+                continue
+            try:
+                self._apply_row(submission, row)
+            except (KeyError, ValidationError) as e:
+                msg = (
+                    _format_validation_error(e)
+                    if isinstance(e, ValidationError)
+                    else f"Category {e} is not enabled."
+                )
+                report.add_error(row.line, msg)
+                continue
+            modified[submissionid] = submission
+            lines.setdefault(submissionid, []).append(row.line)
+
+        if self.dry_run or not modified:
+            report.submissions += len(modified)
+            report.applied += sum(len(l) for l in lines.values())
+            return
+
+        updated = list(modified.values())
+        failed, conflicts = bulk_write_versioned(
+            self.database.submissions,
+            [
+                (s._id, get_version(s), get_grades_update(s, self.config))
+                for s in updated
+            ],
+        )
+        succeeded = [
+            s for i, s in enumerate(updated) if i not in failed and i not in conflicts
+        ]
+        failed_user_tasks = bulk_write(
+            self.database.user_tasks,
+            [
+                UpdateOne(
+                    {"submissionid": s._id}, get_user_tasks_update(s, self.config)
+                )
+                for s in succeeded
+            ],
+        )
+        # Errors are reported for each row of the submission, in file order
+        errors: List[Tuple[int, str]] = []
+        for i in failed:
+            errors.extend(
+                (line, f"Failed to update submission {updated[i]._id}.")
+                for line in lines[updated[i]._id]
+            )
+        for i in conflicts:
+            errors.extend(
+                (
+                    line,
+                    f"Grades of submission {updated[i]._id} were modified during the import.",
+                )
+                for line in lines[updated[i]._id]
+            )
+        for i in failed_user_tasks:
+            # The grades were written, so the rows are still applied
+            errors.extend(
+                (
+                    line,
+                    f"Failed to update grading status of submission {succeeded[i]._id}.",
+                )
+                for line in lines[succeeded[i]._id]
+            )
+        for line, message in sorted(errors):
+            report.add_error(line, message)
+        report.applied += sum(len(lines[s._id]) for s in succeeded)
+        report.submissions += len(succeeded) - len(failed_user_tasks)
+
+    def _resolve_submission_ids(
+        self, rows: List[GradeRow], report: ImportReport
+    ) -> Dict[int, ObjectId]:
+        """Resolves the submission ID of each row. Rows identified by username
+        are resolved to the user's best submission with a single indexed query.
+
+        Returns
+        -------
+        `Dict[int, ObjectId]`
+            Submission IDs keyed by line number.
+        """
+        resolved: Dict[int, ObjectId] = {}
+        by_user: List[GradeRow] = []
+        for row in rows:
+            if row.submissionid:
+                try:
+                    resolved[row.line] = ObjectId(row.submissionid)
+                except InvalidId:
+                    report.add_error(row.line, "Invalid submission ID.")
+            else:
+                by_user.append(row)
+
+        if not by_user:
+            return resolved
+
+        best: Dict[Tuple[str, str], ObjectId] = {}
+        for user_task in self.database.user_tasks.find(
+            {
+                "courseid": self.courseid,
+                "username": {"$in": list({r.username for r in by_user})},
+                "taskid": {"$in": list({r.taskid for r in by_user})},
+            },
+            {"username": 1, "taskid": 1, "submissionid": 1},
+        ):
+            if user_task.get("submissionid") is not None:
+                best[(user_task["username"], user_task["taskid"])] = user_task[
+                    "submissionid"
+                ]
+
+        for row in by_user:
+            submissionid = best.get((row.username, row.taskid))  # type: ignore
+            if submissionid is None:
+                report.add_error(
+                    row.line,
+                    f"No submission found for user '{row.username}' and task '{row.taskid}'.",
+                )
+            else:
+                resolved[row.line] = submissionid
+        return resolved
+
+    def _fetch_submissions(
+        self, ids: Iterable[ObjectId]
+    ) -> Tuple[Dict[ObjectId, Submission], Set[ObjectId]]:
+        """Retrieves submissions by ID.
+
+        Returns
+        -------
+        `Tuple[Dict[ObjectId, Submission], Set[ObjectId]]`
+            Submissions keyed by ID, and IDs of submissions whose stored
+            grades are invalid.
+        """
+        ids = list(ids)
+        submissions: Dict[ObjectId, Submission] = {}
+        invalid: Set[ObjectId] = set()
+        if not ids:
+            return submissions, invalid
+        for doc in self.database.submissions.find(
+            {"_id": {"$in": ids}}, GRADES_PROJECTION
+        ):
+            try:
+                submissions[doc["_id"]] = get_submission(doc)
+            except ValidationError:
+                record_validation_failure()
+                invalid.add(doc["_id"])
+        return submissions, invalid
+
+    def _apply_row(self, submission: Submission, row: GradeRow) -> None:
+        """Updates a single category of a submission's grades.
+
+        Raises `KeyError` if the category is not enabled, and
+        `ValidationError` if the new grade is invalid."""
+        enabled = self.config.enabled[row.category]
+        grades = submission.custom.coding_style_grades
+
+        category = grades.grades.get(row.category, enabled).dict()
+        if row.grade is not None:
+            category["grade"] = row.grade
+        if row.feedback is not None:
+            category["feedback"] = row.feedback
+        grades.add_category(GradingCategory(**category))
+
+        if self.grader and self.grader not in submission.custom.graded_by:
+            submission.custom.graded_by.append(self.grader)
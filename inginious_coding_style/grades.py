@@ -146,6 +146,90 @@ def get_grades(
     return CodingStyleGrades.parse_obj(grades)
 
 
+def merge_grades(grades_data: GradesIn, config: PluginConfig) -> CodingStyleGrades:
+    """Creates a `CodingStyleGrades` object from the enabled categories
+    of the config, updated with grade data from the grading form (or API).
+
+    Grade data for disabled categories is ignored, as are attributes
+    other than `GRADED_ATTRIBUTES`.
+
+    Raises
+    ------
+    `ValidationError`
+        Unable to validate new grades.
+    """
+    # NOTE:
+    # This is by far the worst side-effect of using Pydantic with a dynamic
+    # model, and having to do partial updates to a variable number of items.
+    #
+    # We by necessity have to copy the grading categories from the plugin config
+    # and then convert them to a dict, so we can then use dict.update()
+    # with the new grades we receive from the webapp form. After updating the
+    # dict, we convert it back to a CodingStyleGrades object.
+    #
+    # This is clunky, but it still executes very quickly though.
+    #
+    # We end up doing the following:
+    #   * Retrieve a copy of the currently enabled categories from
+    #     the config (config.dict()["enabled"])
+    #   * Iterate through the grade data from the webapp form (grades_data)
+    #   * Update each enabled grade with data from the webapp form
+    #   * Validate the new grades for each category
+    conf = config.dict()
+    grades = conf["enabled"]  # type: Dict[str, dict]
+    for category, data in grades_data.items():
+        if category not in grades:
+            continue  # skip disabled grades
+        # Only grades and feedback are set, the rest is taken from the config
+        grades[category].update(
+            {attr: v for attr, v in data.items() if attr in GRADED_ATTRIBUTES}
+        )
+    return get_grades(grades)
+
+
+def merge_grades_data(grades_data: GradesIn, overrides: GradesIn) -> GradesIn:
+    """Returns a copy of grade data where the attributes of each
+    category are updated with the attributes in `overrides`."""
+    merged = {category: dict(data) for category, data in grades_data.items()}
+    for category, data in overrides.items():
+        merged.setdefault(category, {}).update(data)
+    return merged
+
+
+# Attributes of a grading category that can be set by tutors
+GRADED_ATTRIBUTES = ("grade", "feedback")
+
+
+def merge_category(
+    category_id: str,
+    category_data: Dict[str, str],
+    config: PluginConfig,
+    grades: Optional[CodingStyleGrades] = None,
+) -> GradingCategory:
+    """Creates a `GradingCategory` for a single enabled category of the config,
+    updated with grade data from the grading form (or API).
+
+    Attributes missing from the grade data are kept from the category's
+    existing grade in `grades`, if any. Only the grade and feedback of a
+    category can be set (see `GRADED_ATTRIBUTES`).
+
+    Raises
+    ------
+    `KeyError`
+        The category is not enabled.
+    `ValidationError`
+        Unable to validate the new grade.
+    """
+    category = config.enabled[category_id].dict()
+    if grades is not None and category_id in grades:
+        existing = grades[category_id]
+        category.update({attr: getattr(existing, attr) for attr in GRADED_ATTRIBUTES})
+    for attr in GRADED_ATTRIBUTES:
+        if attr in category_data:
+            category[attr] = category_data[attr]
+    return GradingCategory.parse_obj(category)
+
+
 def add_config_categories(
     grades: CodingStyleGrades, config: PluginConfig
 ) -> CodingStyleGrades:
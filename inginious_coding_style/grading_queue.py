@@ -0,0 +1,131 @@
+"""Module for the tutor grading queue.
+
+The grading queue hands out ungraded best submissions for a task one at a time.
+A submission handed out to a tutor is soft-claimed for a limited amount of time,
+so that other tutors working through the same queue are handed different
+submissions. Claims are not enforced; they only affect which submission the
+queue hands out next.
+"""
+
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from pymongo import ASCENDING, ReturnDocument
+from pymongo.database import Database
+
+from .database import (CLAIM_EXPIRES_FIELD, CLAIMED_BY_FIELD, SKIPPED_AT_FIELD,
+                       get_best_submission_ids, get_release_fields,
+                       status_filter)
+
+# Submissions that were never skipped (missing field) are handed out first
+QUEUE_SORT = [(SKIPPED_AT_FIELD, ASCENDING), ("submitted_on", ASCENDING)]
+
+
+def _available_query(
+    courseid: str,
+    taskid: str,
+    submission_ids: List[Any],
+    exclude: Optional[List[Any]],
+) -> Dict[str, Any]:
+    """Query matching ungraded submissions that are not claimed.
+
+    Submissions claimed by the tutor themselves are not matched either, so that
+    a tutor skipping submissions is not handed a submission they skipped
+    earlier (skipped submissions are released, see `skip_submission()`).
+
+    Submissions graded by earlier versions of the plugin have no grading status
+    until they are migrated (see `migrate_grading_status()`). They are
+    excluded by their grades, so that tutors are not handed graded submissions
+    and do not overwrite their grades in queue mode."""
+    ids: Dict[str, Any] = {"$in": submission_ids}
+    if exclude:
+        ids["$nin"] = exclude
+    return {
+        # Bounds the status index to the ungraded submissions of the task
+        **status_filter(courseid, taskid, False),
+        "_id": ids,
+        # Applied to the ungraded submissions of the task found through the index
+        "custom.coding_style_grades": {"$in": [None, {}]},
+        "$or": [
+            {CLAIM_EXPIRES_FIELD: None},  # also matches missing field
+            {CLAIM_EXPIRES_FIELD: {"$lt": datetime.now()}},
+        ],
+    }
+
+
+def claim_next_submission(
+    database: Database,
+    courseid: str,
+    taskid: str,
+    username: str,
+    timeout: int,
+    exclude: Optional[List[Any]] = None,
+) -> Optional[Any]:
+    """Claims the next ungraded best submission for a task.
+
+    Parameters
+    ----------
+    database : `Database`
+        The INGInious database.
+    courseid : `str`
+        ID of the course.
+    taskid : `str`
+        ID of the task.
+    username : `str`
+        Username of the tutor claiming the submission.
+    timeout : `int`
+        Number of seconds the claim is held.
+    exclude : `Optional[List[Any]]`, optional
+        IDs of submissions that should not be claimed, e.g. skipped submissions.
+
+    Returns
+    -------
+    `Optional[ObjectId]`
+        ID of the claimed submission, or `None` if the queue is empty.
+    """
+    submission_ids = get_best_submission_ids(database, courseid, taskid)
+    if not submission_ids:
+        return None
+    # find_one_and_update is atomic, so two tutors can never claim
+    # the same submission at the same time.
+    doc = database.submissions.find_one_and_update(
+        _available_query(courseid, taskid, submission_ids, exclude),
+        {
+            "$set": {
+                CLAIMED_BY_FIELD: username,
+                CLAIM_EXPIRES_FIELD: datetime.now() + timedelta(seconds=timeout),
+            }
+        },
+        projection={"_id": 1},
+        sort=QUEUE_SORT,
+        return_document=ReturnDocument.AFTER,
+    )
+    return doc["_id"] if doc else None
+
+
+def peek_next_submission(
+    database: Database,
+    courseid: str,
+    taskid: str,
+    exclude: Optional[List[Any]] = None,
+) -> Optional[Any]:
+    """Finds the submission that is likely to be claimed next, without claiming it."""
+    submission_ids = get_best_submission_ids(database, courseid, taskid)
+    if not submission_ids:
+        return None
+    doc = database.submissions.find_one(
+        _available_query(courseid, taskid, submission_ids, exclude),
+        projection={"_id": 1},
+        sort=QUEUE_SORT,
+    )
+    return doc["_id"] if doc else None
+
+
+def skip_submission(database: Database, submissionid: Any, username: str) -> None:
+    """Releases a tutor's claim on a submission they skip, so that it can be
+    handed out to other tutors, and moves it to the back of the queue.
+    Claims held by other tutors are not released."""
+    database.submissions.update_one(
+        {"_id": submissionid, CLAIMED_BY_FIELD: username},
+        {"$set": {**get_release_fields(), SKIPPED_AT_FIELD: datetime.now()}},
+    )
@@ -0,0 +1,286 @@
+"""Module for instrumenting the plugin's database access.
+
+The plugin accesses the database through `InstrumentedDatabase`, a thin
+proxy around `pymongo.database.Database`. Each operation issued through it
+is recorded in the metrics of the current hook or page call, along with its
+duration, the number of documents it returned and the function that issued it.
+
+Operations slower than the configured threshold are logged with the shape
+of their filter (the filter with all values replaced by their types), and can
+optionally be explained to find the number of documents they examined.
+
+Only operations issued by the plugin are instrumented. The proxy does not
+affect the database used by INGInious itself.
+"""
+
+import sys
+import time
+from typing import Any, Callable, Dict, Iterator, Optional, Union
+
+from pymongo.collection import Collection
+from pymongo.database import Database
+
+from .config import MetricsSettings
+from .logger import get_logger
+from .metrics import REGISTRY, record_db_operation
+
+# Collection methods that send a command to the database
+COLLECTION_OPERATIONS = frozenset(
+    [
+        "aggregate",
+        "bulk_write",
+        "count_documents",
+        "create_index",
+        "create_indexes",
+        "delete_many",
+        "delete_one",
+        "distinct",
+        "estimated_document_count",
+        "find",
+        "find_one",
+        "find_one_and_delete",
+        "find_one_and_replace",
+        "find_one_and_update",
+        "insert_many",
+        "insert_one",
+        "replace_one",
+        "update_many",
+        "update_one",
+    ]
+)
+
+# Operations that return a cursor. These are complete once the cursor is exhausted.
+CURSOR_OPERATIONS = frozenset(["aggregate", "find"])
+
+# Operations that can be explained to find the number of documents examined
+EXPLAINABLE_OPERATIONS = frozenset(["find", "find_one"])
+
+# Set by `init_instrumentation()`
+SETTINGS = MetricsSettings()
+
+
+def init_instrumentation(settings: MetricsSettings) -> None:
+    global SETTINGS
+    SETTINGS = settings
+
+
+def get_filter_shape(value: Any) -> Any:
+    """Replaces all values of a query filter or pipeline with their type names.
+
+    Example:
+    >>> get_filter_shape({"courseid": "tdt4100", "_id": {"$in": [1, 2, 3]}})
+    {"courseid": "str", "_id": {"$in": "list[int]"}}
+    """
+    if isinstance(value, dict):
+        return {k: get_filter_shape(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        # Lists of documents ($and, $or, pipelines) keep their structure
+        if value and all(isinstance(v, dict) for v in value):
+            return [get_filter_shape(v) for v in value]
+        item_type = type(value[0]).__name__ if value else ""
+        return f"list[{item_type}]"
+    return type(value).__name__
+
+
+def _get_caller() -> str:
+    """Returns the name of the first function on the stack outside of this module."""
+    frame = sys._getframe(1)
+    while frame is not None and frame.f_globals.get("__name__") == __name__:
+        frame = frame.f_back  # type: ignore
+    if frame is None:
+        return "unknown"
+    return f"{frame.f_globals.get('__name__')}.{frame.f_code.co_name}"
+
+
+def _get_filter(operation: str, args: Any, kwargs: Dict[str, Any]) -> Any:
+    if operation == "aggregate":
+        return args[0] if args else kwargs.get("pipeline")
+    if operation in ("bulk_write", "insert_many"):
+        requests = args[0] if args else kwargs.get("requests", kwargs.get("documents"))
+        return f"<{len(requests)} operations>" if requests is not None else None
+    return args[0] if args else kwargs.get("filter")
+
+
+def _count_returned(result: Any) -> int:
+    """Number of documents returned by a non-cursor operation."""
+    if result is None:
+        return 0
+    if isinstance(result, (dict, int)):
+        return 1
+    if isinstance(result, list):
+        return len(result)
+    return 0  # write results
+
+
+class Operation:
+    """A database operation issued through an `InstrumentedCollection`."""
+
+    def __init__(
+        self,
+        collection: Collection,
+        operation: str,
+        args: Any,
+        kwargs: Dict[str, Any],
+    ) -> None:
+        self.collection = collection
+        self.operation = operation
+        self.args = args
+        self.kwargs = kwargs
+        self.caller = _get_caller()
+        self.start = time.perf_counter()
+        self.done = False
+
+    def finish(self, returned: int) -> None:
+        if self.done:
+            return
+        self.done = True
+        duration = time.perf_counter() - self.start
+        slow = duration * 1000 >= SETTINGS.slow_operation_ms
+        examined = self._explain() if slow else 0
+        REGISTRY.record_db_stats(
+            self.collection.name,
+            self.operation,
+            self.caller,
+            duration,
+            returned,
+            examined=examined,
+            slow=slow,
+        )
+        if slow:
+            call = REGISTRY.current_call()
+            shape = get_filter_shape(
+                _get_filter(self.operation, self.args, self.kwargs)
+            )
+            get_logger().warning(
+                f"Slow database operation ({duration * 1000:.0f} ms): "
+                f"{self.collection.name}.{self.operation} "
+                f"from {self.caller} ({call[1] if call else 'no endpoint'}), "
+                f"returned: {returned}, examined: {examined or 'unknown'}, "
+                f"filter: {shape}"
+            )
+
+    def _explain(self) -> int:
+        """Explains the operation, and returns the number of documents it examined.
+        Re-runs the query, so it is only done if enabled in the config."""
+        if not SETTINGS.explain_slow or self.operation not in EXPLAINABLE_OPERATIONS:
+            return 0
+        try:
+            query = _get_filter(self.operation, self.args, self.kwargs) or {}
+            explanation = self.collection.find(query).explain()
+            return explanation["executionStats"]["totalDocsExamined"]
+        except Exception as e:
+            get_logger().debug(f"Failed to explain slow operation: {e}")
+            return 0
+
+
+class InstrumentedCursor:
+    """Proxy around a cursor that counts returned documents.
+    The operation is complete once the cursor is exhausted or closed."""
+
+    def __init__(self, cursor: Any, operation: Operation) -> None:
+        self._cursor = cursor
+        self._operation = operation
+        self._returned = 0
+        self._iterator: Optional[Iterator[Any]] = None
+
+    def __iter__(self) -> Iterator[Any]:
+        return self
+
+    def __next__(self) -> Any:
+        if self._iterator is None:
+            self._iterator = iter(self._cursor)
+        try:
+            doc = next(self._iterator)
+        except StopIteration:
+            self._operation.finish(self._returned)
+            raise
+        self._returned += 1
+        return doc
+
+    def __getattr__(self, name: str) -> Any:
+        attr = getattr(self._cursor, name)
+        if not callable(attr):
+            return attr
+
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            result = attr(*args, **kwargs)
+            # Chained cursor methods (sort(), limit(), etc.) return the cursor itself
+            return self if result is self._cursor else result
+
+        return wrapper
+
+    def __getitem__(self, index: Any) -> Any:
+        return self._cursor[index]
+
+    def close(self) -> None:
+        self._cursor.close()
+        self._operation.finish(self._returned)
+
+    def __enter__(self) -> "InstrumentedCursor":
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+    def __del__(self) -> None:
+        # Record cursors that were abandoned before being exhausted
+        operation = self.__dict__.get("_operation")
+        if operation is not None:
+            operation.finish(self._returned)
+
+
+class InstrumentedCollection:
+    """Proxy around a `Collection` that records database operations."""
+
+    def __init__(self, collection: Collection) -> None:
+        self._collection = collection
+
+    def __getattr__(self, name: str) -> Any:
+        attr = getattr(self._collection, name)
+        if name in COLLECTION_OPERATIONS:
+            return self._wrap(name, attr)
+        return attr
+
+    def __getitem__(self, name: str) -> "InstrumentedCollection":
+        return InstrumentedCollection(self._collection[name])
+
+    def _wrap(self, name: str, method: Callable[..., Any]) -> Callable[..., Any]:
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            record_db_operation()
+            operation = Operation(self._collection, name, args, kwargs)
+            result = method(*args, **kwargs)
+            if name in CURSOR_OPERATIONS:
+                return InstrumentedCursor(result, operation)
+            operation.finish(_count_returned(result))
+            return result
+
+        return wrapper
+
+
+class InstrumentedDatabase:
+    """Proxy around a `Database` whose collections record database operations."""
+
+    def __init__(self, database: Database) -> None:
+        self._database = database
+
+    def __getattr__(self, name: str) -> Any:
+        # Like `Database`, treat unknown attributes as collection names
+        if name.startswith("_") or hasattr(Database, name):
+            return getattr(self._database, name)
+        return InstrumentedCollection(self._database[name])
+
+    def __getitem__(self, name: str) -> InstrumentedCollection:
+        return InstrumentedCollection(self._database[name])
+
+    @property
+    def unwrapped(self) -> Database:
+        return self._database
+
+
+def instrument_database(
+    database: Union[Database, InstrumentedDatabase]
+) -> Union[Database, InstrumentedDatabase]:
+    """Wraps a database in an `InstrumentedDatabase` if metrics are enabled."""
+    if not SETTINGS.enabled or isinstance(database, InstrumentedDatabase):
+        return database
+    return InstrumentedDatabase(database)
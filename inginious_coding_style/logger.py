@@ -1,17 +1,343 @@
+"""Module for the plugin's logger.
+
+Log records are put on a queue by the thread that logs them, and are formatted
+and written by a background thread. Formatting a traceback therefore does not
+hold up a request, even when a maintenance operation logs thousands of errors.
+
+Records can carry structured fields (see `STRUCTURED_FIELDS`), either passed
+with `extra` or set for a block of code with `log_context()`. They are appended
+to the message:
+
+    2021-11-23 12:00:00,000 - inginious.plugins.inginious_coding_style - ERROR -
+    Failed to modify submission [operation=swap_active_grade submissionid=61b8...]
+
+Records can also be passed on to the handlers of the INGInious logger with
+`LoggingSettings.propagate`. The plugin logger itself never propagates its
+records: they are passed on by the plugin's handler once rate limited, in the
+background thread when the queue is used.
+
+Records are rate limited per key. The key is `extra={"key": ...}` if given,
+otherwise the line that logged the record. Records above the limit within an
+interval are dropped, and summarized once the interval is over (or when
+`flush_suppressed()` is called) as "12,345 similar errors suppressed".
+"""
+
+import atexit
 import logging
-from functools import lru_cache
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from functools import lru_cache, wraps
+from logging.handlers import QueueHandler, QueueListener
+from typing import (TYPE_CHECKING, Any, Callable, Dict, Iterator, List,
+                    Optional, TypeVar, cast)
+
+if TYPE_CHECKING:
+    from .config import LoggingSettings
+
+LOGGER_NAME = "inginious.plugins.inginious_coding_style"
+
+# Same format as INGInious
+LOG_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+# Fields appended to log messages, in this order
+STRUCTURED_FIELDS = ("operation", "courseid", "taskid", "submissionid", "username")
+
+# Defaults used until `init_logging()` is called. See: `LoggingSettings`
+DEFAULT_RATE_LIMIT = 10
+DEFAULT_RATE_LIMIT_INTERVAL = 60
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+_CONTEXT: ContextVar[Dict[str, Any]] = ContextVar("log_context", default={})
+
+
+@contextmanager
+def log_context(**fields: Any) -> Iterator[None]:
+    """Adds structured fields to all records logged within the block."""
+    token = _CONTEXT.set({**_CONTEXT.get(), **fields})
+    try:
+        yield
+    finally:
+        _CONTEXT.reset(token)
+
+
+def get_log_fields(doc: Dict[str, Any]) -> Dict[str, Any]:
+    """Returns the structured fields of a document from the `submissions`
+    or `user_tasks` collection, to be passed as `extra` to a logging call."""
+    # Submissions are keyed by `_id` and list their authors, while user tasks
+    # refer to a submission by `submissionid` and have a single user
+    submissionid = doc["submissionid"] if "submissionid" in doc else doc.get("_id")
+    username = doc.get("username")
+    if isinstance(username, list):
+        username = ",".join(username)
+    return {
+        "courseid": doc.get("courseid"),
+        "taskid": doc.get("taskid"),
+        "submissionid": submissionid,
+        "username": username,
+    }
+
+
+class StructuredFormatter(logging.Formatter):
+    """Appends the structured fields of a record to its message."""
+
+    def formatMessage(self, record: logging.LogRecord) -> str:
+        message = super().formatMessage(record)
+        fields = " ".join(
+            f"{name}={getattr(record, name)}"
+            for name in STRUCTURED_FIELDS
+            if getattr(record, name, None) is not None
+        )
+        return f"{message} [{fields}]" if fields else message
+
+
+@dataclass
+class _Window:
+    start: float
+    logged: int = 0
+    suppressed: int = 0
+    levelname: str = "ERROR"
+
+
+class RateLimiter:
+    """Allows at most `limit` records per key per `interval` seconds."""
+
+    def __init__(self, limit: int, interval: float) -> None:
+        self.limit = limit
+        self.interval = interval
+        self._windows: Dict[str, _Window] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def get_key(record: logging.LogRecord) -> str:
+        return getattr(record, "key", None) or f"{record.pathname}:{record.lineno}"
+
+    def check(self, record: logging.LogRecord) -> List[logging.LogRecord]:
+        """Returns the records to log in place of `record`: the record itself
+        if it is allowed, preceded by a summary of the records suppressed in the
+        previous interval."""
+        if not self.limit:
+            return [record]
+        key = self.get_key(record)
+        now = time.monotonic()
+        out = []
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or now - window.start >= self.interval:
+                if window is not None and window.suppressed:
+                    out.append(self._summarize(key, window))
+                window = self._windows[key] = _Window(start=now)
+            if window.logged < self.limit:
+                window.logged += 1
+                out.append(record)
+            else:
+                window.suppressed += 1
+                window.levelname = record.levelname
+        return out
+
+    def flush(self) -> List[logging.LogRecord]:
+        """Returns summaries of all suppressed records, and resets their counts."""
+        with self._lock:
+            summaries = [
+                self._summarize(key, window)
+                for key, window in self._windows.items()
+                if window.suppressed
+            ]
+            for window in self._windows.values():
+                window.suppressed = 0
+        return summaries
+
+    def _summarize(self, key: str, window: _Window) -> logging.LogRecord:
+        kind = {"ERROR": "errors", "WARNING": "warnings"}.get(
+            window.levelname, "messages"
+        )
+        return logging.makeLogRecord(
+            {
+                "name": LOGGER_NAME,
+                "levelno": logging.getLevelName(window.levelname),
+                "levelname": window.levelname,
+                "msg": f"{window.suppressed:,} similar {kind} suppressed ({key})",
+                "key": key,
+            }
+        )
+
+
+class RateLimitedHandlerMixin:
+    """Rate limits records before they are handled."""
+
+    rate_limiter: RateLimiter
+
+    def handle(self, record: logging.LogRecord) -> bool:
+        handled = False
+        for r in self.rate_limiter.check(record):
+            handled = super().handle(r) or handled  # type: ignore
+        return handled
+
+    def flush(self) -> None:
+        for summary in self.rate_limiter.flush():
+            super().handle(summary)  # type: ignore
+        super().flush()  # type: ignore
+
+
+class PluginQueueHandler(RateLimitedHandlerMixin, QueueHandler):
+    """Puts records on a queue that is consumed by a `QueueListener`."""
+
+    def __init__(self, q: "queue.Queue[Any]", rate_limiter: RateLimiter) -> None:
+        super().__init__(q)
+        self.rate_limiter = rate_limiter
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Merge the message and its arguments, which may be modified once this
+        # method returns, but leave formatting (and tracebacks) to the listener.
+        # Unlike `QueueHandler.prepare()`, the record is not made picklable,
+        # as it never leaves the process.
+        for name, value in _CONTEXT.get().items():
+            if getattr(record, name, None) is None:
+                setattr(record, name, value)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+class ParentHandler(logging.Handler):
+    """Passes records on to the handlers of the ancestors of a logger,
+    like `Logger.callHandlers()` does for a logger that propagates."""
+
+    def __init__(self, logger: logging.Logger) -> None:
+        super().__init__()
+        self.logger = logger
+
+    def emit(self, record: logging.LogRecord) -> None:
+        parent = self.logger.parent
+        while parent is not None:
+            for handler in parent.handlers:
+                if record.levelno >= handler.level:
+                    handler.handle(record)
+            if not parent.propagate:
+                break
+            parent = parent.parent
+
+
+class PluginStreamHandler(RateLimitedHandlerMixin, logging.StreamHandler):
+    """Formats and writes records in the thread that logs them."""
+
+    def __init__(
+        self, rate_limiter: RateLimiter, parent: Optional[ParentHandler] = None
+    ) -> None:
+        super().__init__()
+        self.rate_limiter = rate_limiter
+        self.parent = parent
+
+    def handle(self, record: logging.LogRecord) -> bool:
+        for name, value in _CONTEXT.get().items():
+            if getattr(record, name, None) is None:
+                setattr(record, name, value)
+        return super().handle(record)
+
+    def emit(self, record: logging.LogRecord) -> None:
+        super().emit(record)
+        if self.parent is not None:
+            self.parent.handle(record)
+
+
+def _setup_handler(handler: logging.Handler) -> logging.Handler:
+    handler.setLevel(logging.INFO)
+    handler.setFormatter(StructuredFormatter(LOG_FORMAT))
+    return handler
+
+
+# Handler of the plugin logger and its listener, replaced by `init_logging()`
+_HANDLER: Optional[logging.Handler] = None
+_LISTENER: Optional[QueueListener] = None
+
+
+def _configure(
+    logger: logging.Logger,
+    use_queue: bool,
+    rate_limit: int,
+    interval: float,
+    propagate: bool = False,
+) -> None:
+    global _HANDLER, _LISTENER
+    _stop()
+    # Records are passed on to the INGInious logger by the plugin's handler,
+    # so that they are rate limited and, with the queue, handled off-thread
+    logger.propagate = False
+    parent = ParentHandler(logger) if propagate else None
+    rate_limiter = RateLimiter(rate_limit, interval)
+    if use_queue:
+        q: "queue.Queue[Any]" = queue.Queue(-1)
+        # Records below the level of the handler are not counted by the rate limiter
+        _HANDLER = PluginQueueHandler(q, rate_limiter)
+        _HANDLER.setLevel(logging.INFO)
+        handlers = [_setup_handler(logging.StreamHandler())]
+        if parent is not None:
+            handlers.append(parent)
+        _LISTENER = QueueListener(q, *handlers, respect_handler_level=True)
+        _LISTENER.start()
+    else:
+        _HANDLER = _setup_handler(PluginStreamHandler(rate_limiter, parent))
+    logger.addHandler(_HANDLER)
+
+
+def _stop() -> None:
+    """Removes the handler of the plugin logger, and writes all queued records."""
+    global _HANDLER, _LISTENER
+    if _HANDLER is not None:
+        _HANDLER.flush()
+        logging.getLogger(LOGGER_NAME).removeHandler(_HANDLER)
+        _HANDLER = None
+    if _LISTENER is not None:
+        _LISTENER.stop()
+        _LISTENER = None
+
+
+atexit.register(_stop)
 
 
 @lru_cache(None)
 def get_logger() -> logging.Logger:
-    # We just copy the logging style of INGInious here, because
-    # plugins are loaded before the INGInious logger is configured.
-    formatter = logging.Formatter(
-        "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
-    )
-    ch = logging.StreamHandler()
-    ch.setLevel(logging.INFO)
-    ch.setFormatter(formatter)
-    logger = logging.getLogger("inginious.plugins.inginious_coding_style")
-    logger.addHandler(ch)
+    # We copy the logging style of INGInious here, because plugins can be
+    # loaded before the INGInious logger is configured.
+    logger = logging.getLogger(LOGGER_NAME)
+    _configure(logger, True, DEFAULT_RATE_LIMIT, DEFAULT_RATE_LIMIT_INTERVAL)
     return logger
+
+
+def init_logging(settings: "LoggingSettings") -> None:
+    _configure(
+        get_logger(),
+        settings.queue,
+        settings.rate_limit,
+        settings.rate_limit_interval,
+        settings.propagate,
+    )
+
+
+def flush_suppressed() -> None:
+    """Logs summaries of all records suppressed by rate limiting so far.
+    Called at the end of operations that may log many similar errors."""
+    get_logger()  # configures the handler
+    if _HANDLER is not None:
+        _HANDLER.flush()
+
+
+def logged_operation(func: F) -> F:
+    """Decorator for operations that may log many similar errors, such as
+    maintenance operations over a whole collection. Records logged by the
+    operation carry its name as `operation`, and the records suppressed
+    by rate limiting are summarized once it returns."""
+
+    @wraps(func)
+    def wrapper(*args: Any, **kwargs: Any) -> Any:
+        try:
+            with log_context(operation=func.__name__):
+                return func(*args, **kwargs)
+        finally:
+            flush_suppressed()
+
+    return cast(F, wrapper)
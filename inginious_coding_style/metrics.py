@@ -0,0 +1,402 @@
+"""Module for collecting metrics about the plugin's hooks and pages.
+
+Every hook and page call records its duration, the number of database
+operations it issued and the number of validation failures it encountered.
+
+Metrics are recorded in counters owned by the calling thread, so recording
+a call never takes a lock. The counters of all threads are merged when the
+metrics are scraped, and rendered in the Prometheus text exposition format.
+"""
+
+import threading
+import time
+import weakref
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+from functools import wraps
+from typing import (Any, Callable, DefaultDict, Dict, Iterator, List, Optional,
+                    Tuple, TypeVar)
+
+from pydantic import ValidationError
+
+# Upper bounds (in seconds) of the call duration histogram buckets
+DURATION_BUCKETS = (
+    0.001,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+)
+
+# (kind, name), where kind is "hook" or "page"
+Key = Tuple[str, str]
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+
+class CallStats:
+    """Statistics of the calls to a single hook or page."""
+
+    __slots__ = (
+        "calls",
+        "errors",
+        "db_operations",
+        "validation_failures",
+        "sum",
+        "buckets",
+    )
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.errors = 0
+        self.db_operations = 0
+        self.validation_failures = 0
+        self.sum = 0.0
+        # Non-cumulative count per bucket. Last bucket is +Inf.
+        self.buckets = [0] * (len(DURATION_BUCKETS) + 1)
+
+    def merge(self, other: "CallStats") -> None:
+        self.calls += other.calls
+        self.errors += other.errors
+        self.db_operations += other.db_operations
+        self.validation_failures += other.validation_failures
+        self.sum += other.sum
+        for i, n in enumerate(other.buckets):
+            self.buckets[i] += n
+
+
+# (kind, name, collection, operation, caller)
+DbKey = Tuple[str, str, str, str, str]
+
+
+class DbStats:
+    """Statistics of the database operations issued by a single function
+    during calls to a single hook or page."""
+
+    __slots__ = ("operations", "slow", "sum", "returned", "examined")
+
+    def __init__(self) -> None:
+        self.operations = 0
+        self.slow = 0
+        self.sum = 0.0
+        self.returned = 0
+        self.examined = 0  # only known for explained slow operations
+
+    def merge(self, other: "DbStats") -> None:
+        self.operations += other.operations
+        self.slow += other.slow
+        self.sum += other.sum
+        self.returned += other.returned
+        self.examined += other.examined
+
+
+class ThreadMetrics:
+    """Metrics recorded by a single thread. Only the owning thread writes to it."""
+
+    def __init__(self, thread: threading.Thread) -> None:
+        self.thread = weakref.ref(thread)
+        self.stats: DefaultDict[Key, CallStats] = defaultdict(CallStats)
+        self.db: DefaultDict[DbKey, DbStats] = defaultdict(DbStats)
+        # Keys of the calls currently in progress in this thread
+        self.active: List[Key] = []
+
+    @property
+    def alive(self) -> bool:
+        thread = self.thread()
+        return thread is not None and thread.is_alive()
+
+
+class MetricsRegistry:
+    """Keeps track of the metrics recorded by every thread."""
+
+    def __init__(self) -> None:
+        self._local = threading.local()
+        self._lock = threading.Lock()  # only taken on thread registration and scrape
+        self._threads: List[ThreadMetrics] = []
+        # Metrics of threads that have exited
+        self._retired: DefaultDict[Key, CallStats] = defaultdict(CallStats)
+        self._retired_db: DefaultDict[DbKey, DbStats] = defaultdict(DbStats)
+
+    def _get_thread_metrics(self) -> ThreadMetrics:
+        try:
+            return self._local.metrics
+        except AttributeError:
+            metrics = ThreadMetrics(threading.current_thread())
+            self._local.metrics = metrics
+            with self._lock:
+                self._retire_dead_threads()
+                self._threads.append(metrics)
+            return metrics
+
+    def _retire_dead_threads(self) -> None:
+        """Folds metrics of exited threads into the retired metrics.
+        Must be called with the lock held."""
+        alive = []
+        for metrics in self._threads:
+            if metrics.alive:
+                alive.append(metrics)
+            else:
+                for key, stats in metrics.stats.items():
+                    self._retired[key].merge(stats)
+                for db_key, db_stats in metrics.db.items():
+                    self._retired_db[db_key].merge(db_stats)
+        self._threads = alive
+
+    @contextmanager
+    def track(self, kind: str, name: str) -> Iterator[None]:
+        """Records a call to a hook or page."""
+        metrics = self._get_thread_metrics()
+        key = (kind, name)
+        stats = metrics.stats[key]
+        metrics.active.append(key)
+        start = time.perf_counter()
+        try:
+            yield
+        except ValidationError:
+            stats.validation_failures += 1
+            stats.errors += 1
+            raise
+        except Exception:
+            stats.errors += 1
+            raise
+        finally:
+            duration = time.perf_counter() - start
+            metrics.active.pop()
+            stats.calls += 1
+            stats.sum += duration
+            stats.buckets[bisect_left(DURATION_BUCKETS, duration)] += 1
+
+    def call(
+        self, key: Key, func: Callable[..., Any], *args: Any, **kwargs: Any
+    ) -> Any:
+        """Calls a function and records the call.
+
+        Equivalent to calling the function inside `track()`, without the
+        overhead of a context manager. Used for hooks, which are called
+        many times per page."""
+        metrics = self._get_thread_metrics()
+        stats = metrics.stats[key]
+        metrics.active.append(key)
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        except ValidationError:
+            stats.validation_failures += 1
+            stats.errors += 1
+            raise
+        except Exception:
+            stats.errors += 1
+            raise
+        finally:
+            duration = time.perf_counter() - start
+            metrics.active.pop()
+            stats.calls += 1
+            stats.sum += duration
+            stats.buckets[bisect_left(DURATION_BUCKETS, duration)] += 1
+
+    def _record(self, attr: str, n: int) -> None:
+        metrics = self._get_thread_metrics()
+        if metrics.active:
+            stats = metrics.stats[metrics.active[-1]]
+            setattr(stats, attr, getattr(stats, attr) + n)
+
+    def current_call(self) -> Optional[Key]:
+        """Returns the hook or page call in progress in the current thread."""
+        metrics = self._get_thread_metrics()
+        return metrics.active[-1] if metrics.active else None
+
+    def record_db_stats(
+        self,
+        collection: str,
+        operation: str,
+        caller: str,
+        duration: float,
+        returned: int,
+        examined: int = 0,
+        slow: bool = False,
+    ) -> None:
+        """Records a completed database operation for the current hook or page call."""
+        metrics = self._get_thread_metrics()
+        kind, name = metrics.active[-1] if metrics.active else ("none", "none")
+        stats = metrics.db[(kind, name, collection, operation, caller)]
+        stats.operations += 1
+        stats.sum += duration
+        stats.returned += returned
+        stats.examined += examined
+        stats.slow += slow
+
+    def record_db_operation(self, n: int = 1) -> None:
+        """Records database operations issued by the current hook or page call."""
+        self._record("db_operations", n)
+
+    def record_validation_failure(self, n: int = 1) -> None:
+        """Records validation failures handled by the current hook or page call."""
+        self._record("validation_failures", n)
+
+    def collect(self) -> Dict[Key, CallStats]:
+        """Merges the metrics of all threads."""
+        merged: DefaultDict[Key, CallStats] = defaultdict(CallStats)
+        with self._lock:
+            self._retire_dead_threads()
+            for key, stats in self._retired.items():
+                merged[key].merge(stats)
+            for metrics in self._threads:
+                # dict.copy() is atomic, so this is safe while the thread is writing
+                for key, stats in metrics.stats.copy().items():
+                    merged[key].merge(stats)
+        return dict(merged)
+
+    def collect_db(self) -> Dict[DbKey, DbStats]:
+        """Merges the database operation metrics of all threads."""
+        merged: DefaultDict[DbKey, DbStats] = defaultdict(DbStats)
+        with self._lock:
+            self._retire_dead_threads()
+            for key, stats in self._retired_db.items():
+                merged[key].merge(stats)
+            for metrics in self._threads:
+                for key, stats in metrics.db.copy().items():
+                    merged[key].merge(stats)
+        return dict(merged)
+
+    def reset(self) -> None:
+        with self._lock:
+            for metrics in self._threads:
+                metrics.stats.clear()
+                metrics.db.clear()
+            self._retired.clear()
+            self._retired_db.clear()
+
+
+REGISTRY = MetricsRegistry()
+
+
+def instrument(kind: str, name: Optional[str] = None) -> Callable[[F], F]:
+    """Decorator that records calls to a hook or page function."""
+
+    def decorator(func: F) -> F:
+        key = (kind, name or func.__name__)
+
+        @wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            return REGISTRY.call(key, func, *args, **kwargs)
+
+        return wrapper  # type: ignore
+
+    return decorator
+
+
+def record_db_operation(n: int = 1) -> None:
+    REGISTRY.record_db_operation(n)
+
+
+def record_validation_failure(n: int = 1) -> None:
+    REGISTRY.record_validation_failure(n)
+
+
+def _escape(value: str) -> str:
+    """Escapes a label value as required by the text exposition format."""
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(key: Key, **extra: str) -> str:
+    labels = {"kind": key[0], "name": key[1], **extra}
+    return ",".join(f'{k}="{_escape(str(v))}"' for k, v in labels.items())
+
+
+def _db_labels(key: DbKey) -> str:
+    kind, name, collection, operation, caller = key
+    return _labels(
+        (kind, name), collection=collection, operation=operation, caller=caller
+    )
+
+
+def render_metrics(
+    stats: Optional[Dict[Key, CallStats]] = None,
+    db_stats: Optional[Dict[DbKey, DbStats]] = None,
+) -> str:
+    """Renders metrics in the Prometheus text exposition format."""
+    if stats is None:
+        stats = REGISTRY.collect()
+    if db_stats is None:
+        db_stats = REGISTRY.collect_db()
+    keys = sorted(stats)
+    lines: List[str] = []
+
+    counters = [
+        ("coding_style_calls_total", "Number of hook and page calls.", "calls"),
+        (
+            "coding_style_errors_total",
+            "Number of calls that raised an exception.",
+            "errors",
+        ),
+        (
+            "coding_style_db_operations_total",
+            "Number of database operations issued by the plugin.",
+            "db_operations",
+        ),
+        (
+            "coding_style_validation_failures_total",
+            "Number of grades and configurations that failed validation.",
+            "validation_failures",
+        ),
+    ]
+    for metric, description, attr in counters:
+        lines.append(f"# HELP {metric} {description}")
+        lines.append(f"# TYPE {metric} counter")
+        for key in keys:
+            lines.append(f"{metric}{{{_labels(key)}}} {getattr(stats[key], attr)}")
+
+    metric = "coding_style_call_duration_seconds"
+    lines.append(f"# HELP {metric} Duration of hook and page calls.")
+    lines.append(f"# TYPE {metric} histogram")
+    for key in keys:
+        s = stats[key]
+        cumulative = 0
+        for bound, n in zip((*DURATION_BUCKETS, "+Inf"), s.buckets):
+            cumulative += n
+            labels = _labels(key, le=str(bound))
+            lines.append(f"{metric}_bucket{{{labels}}} {cumulative}")
+        lines.append(f"{metric}_sum{{{_labels(key)}}} {s.sum}")
+        lines.append(f"{metric}_count{{{_labels(key)}}} {s.calls}")
+
+    db_keys = sorted(db_stats)
+    metric = "coding_style_db_operation_duration_seconds"
+    lines.append(f"# HELP {metric} Duration of plugin database operations.")
+    lines.append(f"# TYPE {metric} summary")
+    for db_key in db_keys:
+        labels = _db_labels(db_key)
+        lines.append(f"{metric}_sum{{{labels}}} {db_stats[db_key].sum}")
+        lines.append(f"{metric}_count{{{labels}}} {db_stats[db_key].operations}")
+
+    db_counters = [
+        (
+            "coding_style_db_slow_operations_total",
+            "Number of database operations slower than the configured threshold.",
+            "slow",
+        ),
+        (
+            "coding_style_db_documents_returned_total",
+            "Number of documents returned by database operations.",
+            "returned",
+        ),
+        (
+            "coding_style_db_documents_examined_total",
+            "Number of documents examined by explained slow database operations.",
+            "examined",
+        ),
+    ]
+    for metric, description, attr in db_counters:
+        lines.append(f"# HELP {metric} {description}")
+        lines.append(f"# TYPE {metric} counter")
+        for db_key in db_keys:
+            value = getattr(db_stats[db_key], attr)
+            lines.append(f"{metric}{{{_db_labels(db_key)}}} {value}")
+
+    return "\n".join(lines) + "\n"
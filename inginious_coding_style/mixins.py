@@ -1,16 +1,28 @@
 from dataclasses import dataclass
-from typing import Any, Dict, List, Tuple, cast
+from typing import Any, Dict, List, Optional, Set, Tuple, cast
 
 from bson.errors import InvalidId
 from inginious.frontend.courses import Course
 from inginious.frontend.pages.utils import INGIniousPage
 from inginious.frontend.tasks import Task
+from pymongo import UpdateOne
 from werkzeug.exceptions import Forbidden, InternalServerError, NotFound
 
-from ._types import GradesIn, INGIniousUserTask, PluginUserTask
+from ._types import (GradesIn, INGIniousSubmission, INGIniousUserTask,
+                     PluginUserTask)
 from .config import PluginConfig
-from .grades import get_grades
+from .courses import get_course, get_task
+from .database import (GRADED_AT_FIELD, GRADED_FIELD, VERSION_FIELD,
+                       WriteConflict, bulk_write, bulk_write_versioned,
+                       get_category_update, get_grades_update,
+                       get_release_fields, get_status_fields,
+                       get_user_tasks_mean_update, get_user_tasks_update,
+                       get_version, get_version_update, set_version,
+                       versioned_filter)
+from .grades import merge_category, merge_grades
+from .logger import get_log_fields, logged_operation
 from .submission import Submission, get_submission
+from .users import get_realnames
 
 
 @dataclass
@@ -52,11 +64,18 @@ class SubmissionMixin(BaseMixin):
         task = self._fetch_task(submission, course)
         return course, task, submission
 
-    def get_user_realnames(self, usernames: List[str]) -> List[str]:
-        """Retrieves a list of the real names from a list of INGInious usernames."""
+    def get_user_realnames(
+        self,
+        usernames: List[str],
+        realnames: Optional[Dict[str, Optional[str]]] = None,
+    ) -> List[str]:
+        """Retrieves a list of the real names from a list of INGInious usernames.
+        Names are looked up in `realnames` if given (see `get_realnames()`)."""
+        if realnames is None:
+            realnames = get_realnames(self.user_manager, usernames)
         names = []
         for username in usernames:
-            realname = self.user_manager.get_user_realname(username)
+            realname = realnames.get(username)
             if realname is not None:
                 names.append(realname)
             else:
@@ -65,18 +84,27 @@ class SubmissionMixin(BaseMixin):
         return names
 
     def get_submission_authors_realname(
-        self, submission: Submission, default: str = "Unknown"
+        self,
+        submission: Submission,
+        default: str = "Unknown",
+        realnames: Optional[Dict[str, Optional[str]]] = None,
     ) -> List[str]:
         """Wrapper around get_user_realnames() that falls back on a
         default username if submission has no authors associated with it."""
-        return self.get_user_realnames(submission.username) or [default]
+        return self.get_user_realnames(submission.username, realnames) or [default]
 
     def get_submission_metadata(self, submission: Submission) -> SubmissionMetadata:
         """Creates a datastructure containing submission metadata formatted
         to be human-readable."""
+        # Resolve authors and graders with a single query
+        realnames = get_realnames(
+            self.user_manager, [*submission.username, *submission.custom.graded_by]
+        )
         return SubmissionMetadata(
-            authors=self.get_submission_authors_realname(submission),
-            graded_by=self.get_user_realnames(submission.custom.graded_by),
+            authors=self.get_submission_authors_realname(
+                submission, realnames=realnames
+            ),
+            graded_by=self.get_user_realnames(submission.custom.graded_by, realnames),
             submitted_on=submission.get_timestamp(),
         )
 
@@ -103,7 +131,7 @@ class SubmissionMixin(BaseMixin):
     ) -> Course:
         """Retrieves a course for a given submission."""
         try:
-            course = self.course_factory.get_course(submission.courseid)
+            course = get_course(self.course_factory, submission.courseid)
         except Exception as e:
             if not submission.courseid:
                 msg = (
@@ -122,7 +150,7 @@ class SubmissionMixin(BaseMixin):
     def _fetch_task(self, submission: Submission, course: Course) -> Task:
         """Retrieves a task for a given submission and course."""
         try:
-            task = course.get_task(submission.taskid)
+            task = get_task(self.course_factory, course, submission.taskid)
         except Exception as e:
             if not submission.taskid:  # 2021-11-23: I think this should be NOT
                 msg = (
@@ -138,6 +166,7 @@ class SubmissionMixin(BaseMixin):
             raise InternalServerError("Unable to display submission.")
         return task
 
+    @logged_operation
     def swap_active_grade(self, to_mean: bool) -> List[INGIniousUserTask]:
         """Enables/disables weighted grades for all top submissions by
         modifying the `grade` key of each submission stored in the
@@ -175,12 +204,14 @@ class SubmissionMixin(BaseMixin):
                 )
             except Exception as e:
                 self._logger.error(
-                    f"Failed to modify submission {task.get('submissionid')}",
+                    "Failed to modify submission",
                     exc_info=e,
+                    extra=get_log_fields(user_task),
                 )
                 failed.append(user_task)
         return failed
 
+    @logged_operation
     def recalculate_weighted_mean(self) -> List[INGIniousUserTask]:
         """Recalculates weighted mean grades for all documents in the
         `user_tasks` collection.
@@ -203,12 +234,46 @@ class SubmissionMixin(BaseMixin):
                 self.set_user_tasks_grades(submission)
             except Exception as e:
                 self._logger.error(
-                    f"Failed to modify submission {user_task.get('submissionid')}",
+                    "Failed to modify submission",
                     exc_info=e,
+                    extra=get_log_fields(user_task),
                 )
                 failed.append(user_task)
         return failed
 
+    @logged_operation
+    def sync_grading_status(self) -> List[INGIniousSubmission]:
+        """Adds the indexed grading status fields to all graded submissions
+        that are missing them, i.e. submissions graded by a version of the
+        plugin that did not maintain these fields.
+
+        Returns
+        -------
+        `List[dict]`
+            Submissions that could not be modified.
+        """
+        failed: List[INGIniousSubmission] = []
+        query = {
+            GRADED_FIELD: {"$exists": False},
+            "custom.coding_style_grades": {"$exists": True, "$ne": {}},
+        }
+        for doc in self.database.submissions.find(query):  # type: INGIniousSubmission
+            try:
+                submission = get_submission(doc)
+                fields = get_status_fields(submission, self.config)
+                fields[GRADED_AT_FIELD] = None  # time of grading is unknown
+                self.database.submissions.update_one(
+                    {"_id": submission._id}, {"$set": fields}
+                )
+            except Exception as e:
+                self._logger.error(
+                    "Failed to add grading status to submission",
+                    exc_info=e,
+                    extra=get_log_fields(doc),
+                )
+                failed.append(doc)
+        return failed
+
     def _check_and_fix_user_task(self, user_task: INGIniousUserTask) -> PluginUserTask:
         """Ensures a document from the `user_tasks` collection contains
         the keys required to modify its displayed grade on the frontend.
@@ -274,7 +339,10 @@ class SubmissionMixin(BaseMixin):
         self.update_submission(submission)
 
     def update_submission_grades(
-        self, submission: Submission, grades_data: GradesIn
+        self,
+        submission: Submission,
+        grades_data: GradesIn,
+        version: Optional[int] = None,
     ) -> None:
         """Attempts to update a submission with a new set of coding style grades.
 
@@ -286,6 +354,9 @@ class SubmissionMixin(BaseMixin):
             The submission to update grades of.
         grades_data : `GradesIn`
             Input from grading form on the WebApp.
+        version : `Optional[int]`, optional
+            Version of the grades the new grades are based on,
+            by default the version of `submission`.
 
         Returns
         -------
@@ -296,39 +367,87 @@ class SubmissionMixin(BaseMixin):
         -------
         `ValidationError`
             Unable to validate new grades.
+        `WriteConflict`
+            The grades were modified after `version`.
         """
-        # Add grade data to the submission
-        #
-        # NOTE:
-        # This is by far the worst side-effect of using Pydantic with a dynamic
-        # model, and having to do partial updates to a variable number of items.
-        #
-        # We by necessity have to copy the grading categories from the plugin config
-        # and then convert them to a dict, so we can then use dict.update()
-        # with the new grades we receive from the webapp form. After updating the
-        # dict, we convert it back to a CodingStyleGrades object.
-        #
-        # This is clunky, but it still executes very quickly though.
-        #
-        # We end up doing the following:
-        #   * Retrieve a copy of the currently enabled categories from
-        #     the config (self.config.dict()["enabled"])
-        #   * Iterate through the grade data from the webapp form (grades_data)
-        #   * Update each enabled grade with data from the webapp form
-        #   * Add the new grades to the submission for each category
-        #     (overwriting the old grades)
-        #   * Update the database with the new custom grades
-        conf = self.config.dict()
-        grades = conf["enabled"]  # type: Dict[str, dict]
-        for category in grades_data:
-            if category not in grades:
-                continue  # skip disabled grades
-            grades[category].update(grades_data[category])
         # Validate new grades and add them to the submission
         # If validation fails, ValidationError is raised
-        submission.custom.coding_style_grades = get_grades(grades)
+        submission.custom.coding_style_grades = merge_grades(grades_data, self.config)
+
+        self.add_grader(submission)
+        self.update_submission(submission, version)
+
+    def update_submission_category(
+        self,
+        submission: Submission,
+        category_id: str,
+        category_data: Dict[str, str],
+        version: Optional[int] = None,
+    ) -> None:
+        """Updates the grade and/or feedback of a single grading category
+        of a submission.
+
+        Only the category is validated, and only the category, graders and
+        grading status of the submission are written, along with the grade
+        fields of its `user_tasks` document that depend on its coding style
+        grades. Submissions without coding style grades are graded with the
+        default grades of the other enabled categories.
+
+        Parameters
+        ----------
+        submission : `Submission`
+            The submission to update.
+        category_id : `str`
+            ID of the enabled grading category to update.
+        category_data : `Dict[str, str]`
+            New grade and/or feedback of the category.
+        version : `Optional[int]`, optional
+            Version of the grades the new grade is based on,
+            by default the version of `submission`.
+
+        Raises
+        -------
+        `KeyError`
+            The category is not enabled.
+        `ValidationError`
+            Unable to validate the new grade.
+        `WriteConflict`
+            The grades were modified after `version`.
+        """
+        grades = submission.custom.coding_style_grades
+        category = merge_category(category_id, category_data, self.config, grades)
+        if not grades:
+            submission.custom.coding_style_grades = merge_grades({}, self.config)
+            submission.custom.coding_style_grades.add_category(category)
+            self.add_grader(submission)
+            self.update_submission(submission, version)
+            return
+
+        if version is None:
+            version = get_version(submission)
+        grades.add_category(category)
+        self.add_grader(submission)
+        # The grading status is computed from the other categories as they
+        # were read, so the write is conditional on them being unchanged
+        result = self.database.submissions.update_one(
+            versioned_filter(submission._id, version),
+            get_category_update(
+                submission,
+                category_id,
+                self.config,
+                grader=self.user_manager.session_username(),
+            ),
+        )
+        if not result.matched_count:
+            raise WriteConflict(submission._id, version)
+        set_version(submission, version + 1)
+        self.database.user_tasks.update_one(
+            {"submissionid": submission._id},
+            get_user_tasks_mean_update(submission, self.config),
+        )
 
-        # Add session username to submission's list of tutors who have graded it
+    def add_grader(self, submission: Submission) -> None:
+        """Adds session username to submission's list of tutors who have graded it."""
         username = self.user_manager.session_username()
         if not username:
             self._logger.warning(
@@ -338,16 +457,117 @@ class SubmissionMixin(BaseMixin):
         elif username and username not in submission.custom.graded_by:
             submission.custom.graded_by.append(username)
 
-        self.update_submission(submission)
-
-    def update_submission(self, submission: Submission) -> None:
-        """Finds an existing submission and updates it with new data."""
-        # TODO: Wrap these two operations in a transaction somehow?
+    def update_submission(
+        self, submission: Submission, version: Optional[int] = None
+    ) -> None:
+        """Finds an existing submission and updates it with new data.
+
+        The write is a compare-and-swap on the version of the submission's
+        coding style grades, and raises `WriteConflict` if the grades were
+        modified after `version` (by default the version of `submission`).
+        The `user_tasks` collection is only updated once the submission
+        has been written, so a conflict leaves both collections unchanged."""
+        if version is None:
+            version = get_version(submission)
+        result = self.database.submissions.update_one(
+            versioned_filter(submission._id, version),
+            self.get_submission_update(submission),
+        )
+        if not result.matched_count:
+            raise WriteConflict(submission._id, version)
+        set_version(submission, version + 1)
         self.set_user_tasks_grades(submission)
-        self.database.submissions.update_one(
-            {"_id": submission._id},
-            {"$set": submission.dict()},
+
+    def get_submission_update(self, submission: Submission) -> Dict[str, Any]:
+        """Returns the update document used to store a submission in
+        the `submissions` collection."""
+        fields = submission.dict()
+        fields.pop(VERSION_FIELD, None)  # incremented by `get_version_update()`
+        return {
+            "$set": {
+                **fields,
+                # Indexed grading status (see `inginious_coding_style.database`)
+                **get_status_fields(submission, self.config),
+                # Release the submission's claim in the grading queue
+                **get_release_fields(),
+            },
+            **get_version_update(),
+        }
+
+    def bulk_update_submissions(
+        self, submissions: List[Submission], versions: Optional[List[int]] = None
+    ) -> Tuple[Set[int], Set[int]]:
+        """Stores many submissions using unordered bulk writes.
+
+        Like `update_submission()`, each write is a compare-and-swap on the
+        version of the submission's coding style grades. The `user_tasks`
+        collection is only updated for submissions that were successfully
+        written to the `submissions` collection.
+
+        Parameters
+        ----------
+        submissions : `List[Submission]`
+            Submissions to store.
+        versions : `Optional[List[int]]`, optional
+            Version of the grades each submission's new grades are based on,
+            by default the versions of `submissions`.
+
+        Returns
+        -------
+        `Tuple[Set[int], Set[int]]`
+            Indices of submissions that could not be written, and of
+            submissions whose grades were modified after their version.
+        """
+        return self._bulk_write_submissions(
+            submissions, [self.get_submission_update(s) for s in submissions], versions
+        )
+
+    def bulk_update_grades(
+        self, submissions: List[Submission], versions: Optional[List[int]] = None
+    ) -> Tuple[Set[int], Set[int]]:
+        """Same as `bulk_update_submissions()`, but only writes the coding style
+        grades, graders and grading status of each submission (see
+        `get_grades_update()`). Can be used with submissions retrieved
+        with `GRADES_PROJECTION`."""
+        return self._bulk_write_submissions(
+            submissions,
+            [get_grades_update(s, self.config) for s in submissions],
+            versions,
+        )
+
+    def _bulk_write_submissions(
+        self,
+        submissions: List[Submission],
+        updates: List[Dict[str, Any]],
+        versions: Optional[List[int]],
+    ) -> Tuple[Set[int], Set[int]]:
+        if versions is None:
+            versions = [get_version(s) for s in submissions]
+        failed, conflicts = bulk_write_versioned(
+            self.database.submissions,
+            [
+                (s._id, version, update)
+                for s, version, update in zip(submissions, versions, updates)
+            ],
         )
+        succeeded = [
+            i for i in range(len(submissions)) if i not in failed and i not in conflicts
+        ]
+        for i in succeeded:
+            set_version(submissions[i], versions[i] + 1)
+        failed_user_tasks = bulk_write(
+            self.database.user_tasks,
+            [
+                UpdateOne(
+                    {"submissionid": submissions[i]._id},
+                    get_user_tasks_update(submissions[i], self.config),
+                )
+                for i in succeeded
+            ],
+        )
+        # Map indices of failed user_tasks operations back to submission indices
+        failed.update(succeeded[i] for i in failed_user_tasks)
+        return failed, conflicts
 
     def set_user_tasks_grades(self, submission: Submission) -> None:
         """
@@ -376,20 +596,10 @@ class SubmissionMixin(BaseMixin):
         Furthermore, it makes no sense to grade a submission that ISN'T
         the user's best submission, so that is also relevant!
         """
-        grade_base = submission.grade
-        grade_mean = submission.get_weighted_mean(self.config)
-        grade = grade_mean if self.config.weighted_mean.enabled else grade_base
-
         # Update the 'user_tasks' collection (where top submissions are stored)
         self.database.user_tasks.find_one_and_update(
             {"submissionid": submission._id},
-            {
-                "$set": {
-                    "grade": grade,  # the active grade
-                    "grade_mean": grade_mean,
-                    "grade_base": grade_base,
-                }
-            },
+            get_user_tasks_update(submission, self.config),
         )
 
 
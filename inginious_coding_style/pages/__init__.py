@@ -1,5 +1,15 @@
+from .analysis import SubmissionAnalysisEndpoint
+from .bulk_grading import BulkGradingEndpoint
+from .clusters import SubmissionClustersPage
+from .code_metrics import CodeMetricsPage
+from .grade_export import GradeExportEndpoint
+from .grade_import import GradeImportEndpoint
 from .grade_student import StudentSubmissionCodingStylePage
 from .grade_tutor import CodingStyleGradingPage
+from .grading_queue import GradingQueuePage
+from .metrics import MetricsEndpoint
 from .plugin_settings import (FixConfigPermissionsEndpoint,
-                              NewCategoryEndpoint, PluginSettingsPage,
-                              SubmissionStatusDiagnoser)
+                              GradingStatusEndpoint, NewCategoryEndpoint,
+                              PluginSettingsPage, SubmissionStatusDiagnoser)
+from .profiles import ProfileDownloadEndpoint, ProfilesPage
+from .task_list_bars import TaskListBarsEndpoint
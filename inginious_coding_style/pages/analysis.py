@@ -0,0 +1,29 @@
+from werkzeug.exceptions import NotFound
+
+from ..analysis import get_analyzer
+from ..mixins import AdminPageMixin, SubmissionMixin
+from ..sources import get_sources, get_submission_input
+from .base import BasePluginPage
+
+
+class SubmissionAnalysisEndpoint(BasePluginPage, SubmissionMixin, AdminPageMixin):
+    """Displays the findings of static analysis of a submission's code,
+    and the grades suggested from them.
+
+    Loaded by the grading page once it is displayed, as running linters
+    on code that has not been analyzed before can take a while."""
+
+    def GET_AUTH(self, submissionid: str, *args, **kwargs) -> str:
+        analyzer = get_analyzer()
+        if analyzer is None:
+            raise NotFound(description="Static analysis is not enabled.")
+        course, task, submission = self.get_submission(submissionid)
+        self.check_course_privileges(course)
+
+        inputdata = get_submission_input(self.submission_manager, submission.input)
+        sources = get_sources(task, inputdata, self.config.analysis.max_file_size)
+        return self.render(
+            "grading_analysis.html",
+            analysis=analyzer.analyze(self.database, sources, self.config),
+            config=self.config,
+        )
@@ -1,10 +1,17 @@
 from pathlib import Path
+from typing import Any, Union
 
+from flask import request
 from inginious.frontend.pages.utils import INGIniousAuthPage
+from pymongo.database import Database
 
 from ..config import PluginConfig
 from ..exceptions import init_exception_handlers
+from ..instrumentation import InstrumentedDatabase, instrument_database
 from ..logger import get_logger
+from ..metrics import REGISTRY
+from ..profiling import get_profiler
+from ..rendering import get_renderer
 
 
 class BasePluginPage(INGIniousAuthPage):
@@ -18,3 +25,31 @@ class BasePluginPage(INGIniousAuthPage):
         self.static_path = templates_path / ".." / "static"
         super().__init__(*args, **kwargs)
         init_exception_handlers(self)
+
+    @property
+    def database(self) -> Union[Database, InstrumentedDatabase]:
+        """The INGInious database. Operations are recorded in the page's metrics."""
+        return instrument_database(super().database)
+
+    def dispatch_request(self, *args: Any, **kwargs: Any) -> Any:
+        profiler = get_profiler()
+        if profiler.is_armed(type(self).__name__):
+            return profiler.run(
+                type(self).__name__, request.full_path, self._dispatch, *args, **kwargs
+            )
+        return self._dispatch(*args, **kwargs)
+
+    def _dispatch(self, *args: Any, **kwargs: Any) -> Any:
+        if not self.config.metrics.enabled:
+            return super().dispatch_request(*args, **kwargs)
+        with REGISTRY.track("page", type(self).__name__):
+            return super().dispatch_request(*args, **kwargs)
+
+    def render(self, path: str, **tpl_kwargs: Any) -> str:
+        """Renders a plugin template using the plugin's precompiled templates."""
+        renderer = get_renderer()
+        if renderer is None:  # plugin not initialized through `init()`
+            return self.template_helper.render(
+                path, template_folder=self.templates_path, **tpl_kwargs
+            )
+        return renderer.render(path, **tpl_kwargs)
@@ -0,0 +1,170 @@
+from typing import Any, Dict, List, Optional, Tuple
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from flask import jsonify, request
+from pydantic import ValidationError
+from werkzeug import Response
+from werkzeug.exceptions import BadRequest
+
+from .._types import GradesIn
+from ..courses import get_course
+from ..database import GRADES_PROJECTION
+from ..grades import merge_grades
+from ..metrics import record_validation_failure
+from ..mixins import AdminPageMixin, SubmissionMixin
+from ..submission import Submission, get_submission
+from .base import BasePluginPage
+
+# Max number of submissions that can be graded in a single request
+MAX_BULK_SUBMISSIONS = 1000
+
+
+def get_item_grades(item: Any) -> GradesIn:
+    """Returns the grade data of a submission in the request body.
+
+    Raises
+    ------
+    `ValueError`
+        The submission or its grades do not have the expected shape.
+    """
+    if not isinstance(item, dict):
+        raise ValueError("Submission must be a JSON object.")
+    grades = item.get("grades") or {}
+    if not isinstance(grades, dict):
+        raise ValueError("'grades' must be a JSON object.")
+    for category, data in grades.items():
+        if not isinstance(data, dict):
+            raise ValueError(f"Grades of category '{category}' must be a JSON object.")
+    return grades
+
+
+class BulkGradingEndpoint(BasePluginPage, SubmissionMixin, AdminPageMixin):
+    """JSON endpoint that lets administrators grade many submissions in a single request.
+
+    Request body:
+    ```json
+    {
+        "submissions": [
+            {
+                "submissionid": "61b8b1f5d4c1b3f1c4e0e0a1",
+                "grades": {
+                    "comments": {"grade": 80, "feedback": "Good!"},
+                    "modularity": {"grade": 60}
+                }
+            }
+        ]
+    }
+    ```
+
+    The response contains one result per submission, in the same order
+    as the request.
+    """
+
+    def POST_AUTH(self, *args, **kwargs) -> Response:
+        items = self._parse_request_body()
+        results: List[Dict[str, Any]] = [
+            {
+                "submissionid": str(
+                    item.get("submissionid") if isinstance(item, dict) else None
+                ),
+                "ok": False,
+            }
+            for item in items
+        ]
+
+        # Parse IDs and fetch all submissions with a single query
+        ids: List[Optional[ObjectId]] = []
+        grades_data: List[GradesIn] = []
+        for item, result in zip(items, results):
+            submissionid: Optional[ObjectId] = None
+            grades: GradesIn = {}
+            try:
+                grades = get_item_grades(item)
+                submissionid = ObjectId(item.get("submissionid"))
+            except ValueError as e:
+                result["error"] = str(e)
+            except (InvalidId, TypeError):
+                result["error"] = "Invalid submission ID."
+            ids.append(submissionid)
+            grades_data.append(grades)
+        docs = {
+            doc["_id"]: doc
+            for doc in self.database.submissions.find(
+                {"_id": {"$in": [i for i in ids if i is not None]}},
+                GRADES_PROJECTION,
+            )
+        }
+
+        # Validate grades of each submission
+        privileges: Dict[str, bool] = {}  # course privileges by course ID
+        to_update: List[Tuple[int, Submission]] = []
+        for idx, submissionid in enumerate(ids):
+            if submissionid is None:
+                continue
+            result = results[idx]
+            doc = docs.get(submissionid)
+            if doc is None:
+                result["error"] = "This submission doesn't exist."
+                continue
+            if not self._has_privileges(doc.get("courseid"), privileges):
+                result["error"] = "You don't have staff rights on this course."
+                continue
+            try:
+                submission = get_submission(doc)
+                submission.custom.coding_style_grades = merge_grades(
+                    grades_data[idx], self.config
+                )
+            except ValidationError as e:
+                record_validation_failure()
+                result["error"] = f"Failed to validate grades: {e}"
+                continue
+            self.add_grader(submission)
+            to_update.append((idx, submission))
+
+        # Write the grades of all valid submissions
+        failed, conflicts = self.bulk_update_grades([s for _, s in to_update])
+        for n, (idx, submission) in enumerate(to_update):
+            if n in failed:
+                results[idx]["error"] = "Failed to update submission."
+            elif n in conflicts:
+                results[idx]["error"] = (
+                    "The grades of this submission were modified by someone else."
+                )
+            else:
+                results[idx]["ok"] = True
+                results[idx]["mean"] = submission.custom.coding_style_grades.get_mean(
+                    self.config
+                )
+
+        return jsonify(
+            {
+                "updated": sum(1 for r in results if r["ok"]),
+                "failed": sum(1 for r in results if not r["ok"]),
+                "results": results,
+            }
+        )
+
+    def _parse_request_body(self) -> List[Any]:
+        body = request.get_json(silent=True)
+        if not isinstance(body, dict) or not isinstance(
+            items := body.get("submissions"), list
+        ):
+            raise BadRequest(
+                "Request body must be a JSON object with a list of 'submissions'."
+            )
+        if len(items) > MAX_BULK_SUBMISSIONS:
+            raise BadRequest(
+                f"Cannot grade more than {MAX_BULK_SUBMISSIONS} submissions per request."
+            )
+        return items
+
+    def _has_privileges(self, courseid: Optional[str], cache: Dict[str, bool]) -> bool:
+        """Checks staff privileges on a course. Results are cached per course ID."""
+        if courseid not in cache:
+            try:
+                course = get_course(self.course_factory, courseid)
+                cache[courseid] = self.user_manager.has_staff_rights_on_course(course)
+            except Exception:
+                cache[courseid] = False
+        return cache[courseid]
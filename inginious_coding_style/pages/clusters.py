@@ -0,0 +1,128 @@
+from typing import Any, List, Optional
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from flask import request
+from inginious.frontend.courses import Course
+from inginious.frontend.tasks import Task
+from pydantic import ValidationError
+from werkzeug.exceptions import BadRequest, NotFound
+
+from ..clustering import SignatureIndex
+from ..courses import get_course, get_task
+from ..database import GRADES_PROJECTION, get_version
+from ..grades import merge_grades, merge_grades_data
+from ..metrics import record_validation_failure
+from ..mixins import AdminPageMixin, SubmissionMixin
+from ..submission import Submission, get_submission
+from ..utils import parse_form_data, parse_override_form_data
+from .base import BasePluginPage
+from .bulk_grading import MAX_BULK_SUBMISSIONS
+
+
+class SubmissionClustersPage(BasePluginPage, SubmissionMixin, AdminPageMixin):
+    """Displays clusters of similar best submissions of a task, and lets
+    tutors grade all submissions of a cluster at once.
+
+    The grades of the form apply to every selected submission, and can be
+    overridden for a single submission with fields named
+    `<submissionid>:<category>_<attribute>`. Each submission is only written
+    if its grades were not modified since the version in the field named
+    `<submissionid>:version`."""
+
+    def GET_AUTH(self, courseid: str, taskid: str) -> str:
+        course, task = self._fetch_course_and_task(courseid, taskid)
+        return self._render(course, task)
+
+    def POST_AUTH(self, courseid: str, taskid: str) -> str:
+        """Grades the selected submissions of a cluster in a single write."""
+        course, task = self._fetch_course_and_task(courseid, taskid)
+
+        ids = self._parse_submission_ids()
+        common = parse_form_data(request.form)
+        overrides = parse_override_form_data(request.form)
+
+        # Only submissions of this task can be graded from its clusters
+        docs = self.database.submissions.find(
+            {"_id": {"$in": ids}, "courseid": courseid, "taskid": taskid},
+            GRADES_PROJECTION,
+        )
+        submissions: List[Submission] = []
+        versions: List[int] = []
+        for doc in docs:
+            submissionid = str(doc["_id"])
+            grades_data = merge_grades_data(common, overrides.get(submissionid, {}))
+            try:
+                submission = get_submission(doc)
+                submission.custom.coding_style_grades = merge_grades(
+                    grades_data, self.config
+                )
+            except ValidationError:
+                record_validation_failure()
+                continue
+            # Grades displayed when the page was rendered
+            version = request.form.get(f"{submissionid}:version", type=int)
+            versions.append(get_version(submission) if version is None else version)
+            self.add_grader(submission)
+            submissions.append(submission)
+        failed, conflicts = self.bulk_update_grades(submissions, versions)
+        updated = len(submissions) - len(failed) - len(conflicts)
+
+        message = f"Graded {updated} of {len(ids)} submissions."
+        if conflicts:
+            message += (
+                f" {len(conflicts)} were graded by someone else in the meantime,"
+                " and were left unchanged."
+            )
+        return self._render(course, task, message=message, success=updated == len(ids))
+
+    def _parse_submission_ids(self) -> List[ObjectId]:
+        ids = request.form.getlist("submissions")
+        if not ids:
+            raise BadRequest("No submissions selected.")
+        if len(ids) > MAX_BULK_SUBMISSIONS:
+            raise BadRequest(
+                f"Cannot grade more than {MAX_BULK_SUBMISSIONS} submissions per request."
+            )
+        try:
+            return [ObjectId(i) for i in ids]
+        except InvalidId:
+            raise BadRequest("Invalid ObjectId.")
+
+    def _render(
+        self,
+        course: Course,
+        task: Task,
+        message: Optional[str] = None,
+        success: bool = True,
+    ) -> str:
+        index = SignatureIndex(
+            self.database,
+            self.submission_manager,
+            self.config,
+            course.get_id(),
+            task.get_id(),
+            task,
+        )
+        return self.render(
+            "submission_clusters.html",
+            course=course,
+            task=task,
+            result=index.clusters(),
+            message=message,
+            success=success,
+            config=self.config,
+            user_manager=self.user_manager,
+        )
+
+    def _fetch_course_and_task(self, courseid: str, taskid: str) -> Any:
+        try:
+            course = get_course(self.course_factory, courseid)
+        except Exception:
+            raise NotFound(description=_("Course not found."))
+        self.check_course_privileges(course)
+        try:
+            task = get_task(self.course_factory, course, taskid)
+        except Exception:
+            raise NotFound(description=_("Task not found."))
+        return course, task
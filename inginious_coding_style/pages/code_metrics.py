@@ -0,0 +1,71 @@
+from typing import Union
+
+from flask import Response, request, stream_with_context
+from werkzeug.exceptions import BadRequest, NotFound
+
+from ..code_metrics import (CATEGORY_METRICS, METRICS_FORMATS, SORT_KEYS,
+                            CodeMetricsJob)
+from ..courses import get_course, get_task
+from ..mixins import AdminPageMixin
+from .base import BasePluginPage
+
+
+class CodeMetricsPage(BasePluginPage, AdminPageMixin):
+    """Displays the code metrics of the best submission of each user for a task,
+    sortable by any metric, so that submissions can be triaged before grading.
+    Submissions are sorted and paginated in the database (`?page=2`).
+
+    The metrics can also be downloaded as CSV or JSONL (`?format=csv`)."""
+
+    def GET_AUTH(self, courseid: str, taskid: str) -> Union[str, Response]:
+        try:
+            course = get_course(self.course_factory, courseid)
+        except Exception:
+            raise NotFound(description=_("Course not found."))
+        self.check_course_privileges(course)
+        try:
+            task = get_task(self.course_factory, course, taskid)
+        except Exception:
+            raise NotFound(description=_("Task not found."))
+
+        job = CodeMetricsJob(
+            self.database, self.submission_manager, self.config, courseid, taskid, task
+        )
+        fmt = request.args.get("format")
+        if fmt is not None:
+            if fmt not in METRICS_FORMATS:
+                raise BadRequest(f"Unsupported format '{fmt}'.")
+            filename = f"{courseid}_{taskid}_code_metrics.{fmt}"
+            return Response(
+                stream_with_context(chunk.encode("utf-8") for chunk in job.stream(fmt)),
+                mimetype="text/csv" if fmt == "csv" else "application/x-ndjson",
+                headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+            )
+
+        sort = request.args.get("sort", "lines")
+        if sort not in SORT_KEYS:
+            raise BadRequest(f"Unable to sort by '{sort}'.")
+        descending = request.args.get("order", "desc") == "desc"
+        page = request.args.get("page", 1, type=int)
+        if page < 1:
+            raise BadRequest("Page must be a positive number.")
+        page_size = self.config.code_metrics.page_size
+        total, rows = job.page(sort, descending, (page - 1) * page_size, page_size)
+        return self.render(
+            "code_metrics.html",
+            course=course,
+            task=task,
+            rows=rows,
+            total=total,
+            page=page,
+            pages=max(1, -(-total // page_size)),  # rounded up
+            categories={
+                category_id: metrics
+                for category_id, metrics in CATEGORY_METRICS.items()
+                if category_id in self.config.enabled
+            },
+            sort=sort,
+            descending=descending,
+            config=self.config,
+            user_manager=self.user_manager,
+        )
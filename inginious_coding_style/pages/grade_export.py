@@ -0,0 +1,27 @@
+from flask import Response, request, stream_with_context
+from inginious.frontend.pages.course_admin.utils import INGIniousAdminPage
+from werkzeug.exceptions import BadRequest
+
+from ..grade_export import EXPORT_FORMATS, EXPORT_MIMETYPES, GradeExporter
+from .base import BasePluginPage
+
+
+class GradeExportEndpoint(INGIniousAdminPage, BasePluginPage):
+    """Streams the coding style grades of a course as a CSV or JSONL file."""
+
+    def GET_AUTH(self, courseid: str, *args, **kwargs) -> Response:
+        self.get_course_and_check_rights(courseid)
+
+        fmt = request.args.get("format", "csv")
+        if fmt not in EXPORT_FORMATS:
+            raise BadRequest(f"Unsupported export format '{fmt}'.")
+
+        exporter = GradeExporter(self.database, self.config, courseid)
+        # No Content-Length is set, so the response is sent with chunked
+        # transfer encoding and the download starts with the first batch.
+        filename = f"{courseid}_coding_style.{fmt}"
+        return Response(
+            stream_with_context(chunk.encode("utf-8") for chunk in exporter.stream(fmt)),
+            mimetype=EXPORT_MIMETYPES[fmt],
+            headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+        )
@@ -0,0 +1,44 @@
+import io
+
+from flask import request
+from inginious.frontend.pages.course_admin.utils import INGIniousAdminPage
+from werkzeug.exceptions import BadRequest
+
+from ..grade_import import (IMPORT_FORMATS, GradeImporter, get_import_format,
+                            read_rows)
+from ..metrics import record_validation_failure
+from .base import BasePluginPage
+
+
+class GradeImportEndpoint(INGIniousAdminPage, BasePluginPage):
+    """Imports coding style grades for a course from an uploaded CSV or JSONL file."""
+
+    def POST_AUTH(self, courseid: str, *args, **kwargs) -> str:
+        self.get_course_and_check_rights(courseid)
+
+        file = request.files.get("file")
+        if file is None or not file.filename:
+            raise BadRequest("Request must contain a file with the key 'file'.")
+        fmt = request.form.get("format") or get_import_format(file.filename)
+        if fmt not in IMPORT_FORMATS:
+            raise BadRequest(f"Unsupported import format '{fmt}'.")
+
+        importer = GradeImporter(
+            self.database,
+            self.config,
+            courseid,
+            grader=self.user_manager.session_username(),
+            dry_run=bool(request.form.get("dry_run")),
+        )
+        # Wrap the upload stream so that rows are parsed as they are read
+        stream = io.TextIOWrapper(file.stream, encoding="utf-8", newline="")
+        try:
+            report = importer.run(read_rows(stream, fmt))
+        except UnicodeDecodeError as e:
+            self._logger.error("Failed to decode grade import file.", exc_info=e)
+            return self.render(
+                "alert.html",
+                message="Failed to import grades. The file must be UTF-8 encoded.",
+            )
+        record_validation_failure(report.n_errors)
+        return self.render("import_report.html", report=report)
@@ -17,9 +17,8 @@ class StudentSubmissionCodingStylePage(BasePluginPage, SubmissionMixin):
 
         metadata = self.get_submission_metadata(submission)
 
-        return self.template_helper.render(
+        return self.render(
             "stylegrade.html",
-            template_folder=self.templates_path,
             metadata=metadata,
             user_manager=self.user_manager,
             course=course,
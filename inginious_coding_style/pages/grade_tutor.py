@@ -1,14 +1,31 @@
-from typing import Union
+from typing import Any, Dict, Optional, Tuple, Union
 
 from flask import redirect, request
+from inginious.frontend.courses import Course
+from inginious.frontend.tasks import Task
+from pydantic import ValidationError
 from werkzeug import Response
 from werkzeug.exceptions import BadRequest
 
-from ..grades import add_config_categories, get_grades
+from ..database import WriteConflict, count_ungraded, get_version
+from ..grades import CodingStyleGrades, add_config_categories, get_grades
+from ..grading_queue import claim_next_submission, peek_next_submission
+from ..metrics import record_validation_failure
 from ..mixins import AdminPageMixin, SubmissionMixin
-from ..utils import parse_form_data
+from ..submission import Submission
+from ..utils import is_htmx_request, parse_form_data
 from .base import BasePluginPage
 
+CONFLICT_MESSAGE = (
+    "The coding style grades of this submission were changed by someone else "
+    "while you were grading it. Their grades are shown alongside yours. "
+    "Submit again to overwrite them."
+)
+CHANGED_MESSAGE = (
+    "The coding style grades of this submission were changed by someone else. "
+    "Their grades are shown below."
+)
+
 
 class CodingStyleGradingPage(BasePluginPage, SubmissionMixin, AdminPageMixin):
     """Page that lets administrators grade the coding style of a submission."""
@@ -18,8 +35,51 @@ class CodingStyleGradingPage(BasePluginPage, SubmissionMixin, AdminPageMixin):
         course, task, submission = self.get_submission(submissionid)
         self.check_course_privileges(course)
 
+        # Check if page is displayed after updating submission grades
+        # Display alert denoting success of update:
+        # None = no msg, True = success msg, False = failure msg
+        success = request.args.get("success")
+
+        # Grading queue mode: prefetch the submission that is likely to be next
+        queue = request.args.get("queue") == "1"
+        next_submissionid = None
+        ungraded = None
+        if queue:
+            next_submissionid = peek_next_submission(
+                self.database,
+                submission.courseid,
+                submission.taskid,
+                exclude=[submission._id],
+            )
+            ungraded = count_ungraded(
+                self.database, submission.courseid, submission.taskid
+            )
+
+        return self.render_grading(
+            "grade_submission.html",
+            course,
+            task,
+            submission,
+            success=None if success is None else success == "1",
+            queue=queue,
+            next_submissionid=next_submissionid,
+            ungraded=ungraded,
+        )
+
+    def render_grading(
+        self,
+        template: str,
+        course: Course,
+        task: Task,
+        submission: Submission,
+        grades: Optional[CodingStyleGrades] = None,
+        **tpl_kwargs: Any,
+    ) -> str:
+        """Renders the grading page, or a part of it, for a submission.
+        Displays the grades of the submission, unless `grades` is given."""
         # get grades from submission (if exists) or create new from enabled config categories
-        grades = submission.custom.coding_style_grades
+        if grades is None:
+            grades = submission.custom.coding_style_grades
         if not grades:
             grades = get_grades(self.config.enabled)
         else:
@@ -29,25 +89,86 @@ class CodingStyleGradingPage(BasePluginPage, SubmissionMixin, AdminPageMixin):
 
         metadata = self.get_submission_metadata(submission)
 
-        # Check if page is displayed after updating submission grades
-        # Display alert denoting success of update:
-        # None = no msg, True = success msg, False = failure msg
-        success = request.args.get("success")
-
-        return self.template_helper.render(
-            "grade_submission.html",
-            template_folder=self.templates_path,
+        return self.render(
+            template,
             user_manager=self.user_manager,
             metadata=metadata,
+            username=submission.username[0],
+            user_realname=metadata.authors[0],
             course=course,
             task=task,
             submission=submission,
             grades=grades,
             config=self.config,
+            version=get_version(submission),
+            **tpl_kwargs,
+        )
+
+    def render_update(
+        self,
+        course: Course,
+        task: Task,
+        submission: Submission,
+        success: bool,
+        message: Optional[str] = None,
+    ) -> str:
+        """Renders the response to a grading action made with htmx: the grading
+        form and submission information, rendered from the submission in memory
+        instead of reloading the page."""
+        return self.render_grading(
+            "grading_update.html",
+            course,
+            task,
+            submission,
             success=success,
+            message=message,
+            queue=request.args.get("queue") == "1",
+            oob=True,
         )
 
-    def POST_AUTH(self, submissionid: str) -> Response:
+    def get_current_grades(
+        self, submission: Submission
+    ) -> Tuple[Submission, CodingStyleGrades]:
+        """Retrieves the currently stored version of a submission after a
+        `WriteConflict`, along with its coding style grades."""
+        current = self._fetch_submission(str(submission._id), user_check=False)
+        grades = add_config_categories(
+            current.custom.coding_style_grades or get_grades(self.config.enabled),
+            self.config,
+        )
+        return current, grades
+
+    def render_conflict(
+        self, course: Course, task: Task, submission: Submission
+    ) -> Union[str, Tuple[str, int]]:
+        """Renders the merge view of grades that conflicted with grades stored
+        by someone else: the grading form with the submitted grades, along
+        with the stored grades. The form is based on the stored version,
+        so submitting it again overwrites the stored grades."""
+        current, current_grades = self.get_current_grades(submission)
+        tpl_kwargs: Dict[str, Any] = dict(
+            grades=submission.custom.coding_style_grades,
+            current_grades=current_grades,
+            success=False,
+            message=CONFLICT_MESSAGE,
+            queue=request.args.get("queue") == "1",
+        )
+        if is_htmx_request() and not tpl_kwargs["queue"]:
+            return self.render_grading(
+                "grading_update.html", course, task, current, oob=True, **tpl_kwargs
+            )
+        page = self.render_grading(
+            "grade_submission.html",
+            course,
+            task,
+            current,
+            next_submissionid=None,
+            ungraded=None,
+            **tpl_kwargs,
+        )
+        return page, 409
+
+    def POST_AUTH(self, submissionid: str) -> Union[str, Tuple[str, int], Response]:
         """Adds or updates the coding style grades of a submission."""
         # Parse grades from grading form
         grades = parse_form_data(request.form)
@@ -56,19 +177,47 @@ class CodingStyleGradingPage(BasePluginPage, SubmissionMixin, AdminPageMixin):
 
         success = 1
         try:
-            self.update_submission_grades(submission, grades)
+            self.update_submission_grades(
+                submission, grades, request.form.get("version", type=int)
+            )
+        except WriteConflict:
+            return self.render_conflict(course, task, submission)
         except Exception as e:
+            if isinstance(e, ValidationError):
+                record_validation_failure()
             self._logger.exception(
                 f"Failed to validate request body for submission {submissionid}: {grades}",
                 exc_info=e,
             )
             success = 0
 
+        # Swap in the updated grading form, unless grading from the queue
+        if is_htmx_request() and request.args.get("queue") != "1":
+            return self.render_update(course, task, submission, bool(success))
+
+        # Grading queue mode: redirect straight to the next ungraded submission
+        if request.args.get("queue") == "1" and success:
+            next_submissionid = claim_next_submission(
+                self.database,
+                submission.courseid,
+                submission.taskid,
+                self.user_manager.session_username(),
+                self.config.grading_queue.claim_timeout,
+                exclude=[submission._id],
+            )
+            if next_submissionid is None:
+                return redirect(
+                    f"/admin/codingstyle/queue/{submission.courseid}/{submission.taskid}"
+                )
+            return redirect(
+                f"/admin/codingstyle/submission/{next_submissionid}?queue=1&success={success}"
+            )
+
         return redirect(
             f"/admin/codingstyle/submission/{submissionid}?success={success}"
         )
 
-    def patch(self, submissionid: str, *args, **kwargs) -> Union[str, Response]:
+    def patch(self, submissionid: str, *args, **kwargs) -> str:
         """Performs a partial update of a submission."""
         # We (ab)use the superclass `flask.views.MethodView` here to add a PUT rule for the view.
         #
@@ -76,25 +225,90 @@ class CodingStyleGradingPage(BasePluginPage, SubmissionMixin, AdminPageMixin):
         # so we use this method to add support for partial updates of Coding Style Grades,
         # such as updating only a single category or removing a category altogether.
         #
-        # Right now, the only supported operation is removing a grading category
-        # from a submission.
+        # Supported operations:
+        #   * `?remove=<category>`: removes a grading category from a submission
+        #   * `?category=<category>`: sets the grade and/or feedback of a single
+        #     grading category, given as `<category>_grade` and `<category>_feedback`
+        #     form fields (like the grading form)
 
         course, task, submission = self.get_submission(submissionid)
         self.check_course_privileges(course)
 
         # Check if a category should be removed
         if category := request.args.get("remove"):
-            self.remove_category_from_submission(submission, category)
-            return Response(
-                "ok",
-                # Use custom htmx HTTP header to prompt browser to refresh page
-                # Source: https://htmx.org/docs/#response-headers
-                headers={"HX-Refresh": "true"},
+            try:
+                self.remove_category_from_submission(submission, category)
+            except WriteConflict:
+                current, _ = self.get_current_grades(submission)
+                return self.render_update(
+                    course, task, current, False, CHANGED_MESSAGE
+                )
+            return self.render_update(
+                course, task, submission, True, "Removed grading category."
             )
-        # TODO: add other PUT operations
+
+        # Check if a single category should be updated
+        if category := request.args.get("category"):
+            return self.patch_category(course, task, submission, category)
+
         raise BadRequest("Unsupported operation")
 
-    def delete(self, submissionid: str, *args, **kwargs) -> Response:
+    def patch_category(
+        self, course: Course, task: Task, submission: Submission, category: str
+    ) -> str:
+        """Updates a single grading category of a submission, and renders the
+        updated category."""
+        if category not in self.config.enabled:
+            raise BadRequest(f"Grading category '{category}' is not enabled.")
+        category_data = parse_form_data(request.form).get(category)
+        if not category_data:
+            raise BadRequest(f"No grade or feedback for category '{category}'.")
+
+        success = True
+        try:
+            version = request.form.get("version", type=int)
+            self.update_submission_category(
+                submission, category, category_data, version
+            )
+        except WriteConflict:
+            # Merge view of the category
+            current, current_grades = self.get_current_grades(submission)
+            grades = current_grades.copy(deep=True)
+            grades.add_category(submission.custom.coding_style_grades[category])
+            return self.render_grading(
+                "grading_category_update.html",
+                course,
+                task,
+                current,
+                grades=grades,
+                current_grades=current_grades,
+                id=category,
+                category_success=False,
+                message="Changed by someone else. Save again to overwrite.",
+                queue=request.args.get("queue") == "1",
+                oob=True,
+            )
+        except ValidationError as e:
+            record_validation_failure()
+            self._logger.exception(
+                f"Failed to validate category '{category}' for submission "
+                f"{submission._id}: {category_data}",
+                exc_info=e,
+            )
+            success = False
+
+        return self.render_grading(
+            "grading_category_update.html",
+            course,
+            task,
+            submission,
+            id=category,
+            category_success=success,
+            queue=request.args.get("queue") == "1",
+            oob=True,
+        )
+
+    def delete(self, submissionid: str, *args, **kwargs) -> str:
         """Removes coding style grades from a submission."""
         course, task, submission = self.get_submission(submissionid)
         self.check_course_privileges(course)
@@ -102,10 +316,12 @@ class CodingStyleGradingPage(BasePluginPage, SubmissionMixin, AdminPageMixin):
             raise BadRequest("Submission has no coding style grades.")
 
         submission.delete_coding_style_grades()
-        self.update_submission(submission)
+        try:
+            self.update_submission(submission)
+        except WriteConflict:
+            current, _ = self.get_current_grades(submission)
+            return self.render_update(course, task, current, False, CHANGED_MESSAGE)
 
-        return Response(
-            "ok",
-            # https://htmx.org/docs/#response-headers
-            headers={"HX-Refresh": "true"},
+        return self.render_update(
+            course, task, submission, True, "Removed coding style grades."
         )
@@ -0,0 +1,57 @@
+from typing import Union
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from flask import redirect, request
+from inginious.frontend.courses import Course
+from werkzeug import Response
+from werkzeug.exceptions import BadRequest, NotFound
+
+from ..courses import get_course
+from ..grading_queue import claim_next_submission, skip_submission
+from ..mixins import AdminPageMixin
+from .base import BasePluginPage
+
+
+class GradingQueuePage(BasePluginPage, AdminPageMixin):
+    """Hands out the next ungraded best submission of a task to a tutor."""
+
+    def GET_AUTH(self, courseid: str, taskid: str) -> Union[str, Response]:
+        """Claims the next ungraded submission and redirects to its grading page.
+        Displays a message if all submissions for the task have been graded."""
+        course = self._fetch_course_by_id(courseid)
+        self.check_course_privileges(course)
+
+        username = self.user_manager.session_username()
+        exclude = []
+        if skip := request.args.get("skip"):
+            try:
+                exclude.append(ObjectId(skip))
+            except InvalidId:
+                raise BadRequest("Invalid ObjectId.")
+            # Lets other tutors grade the skipped submission
+            skip_submission(self.database, exclude[0], username)
+
+        submissionid = claim_next_submission(
+            self.database,
+            courseid,
+            taskid,
+            username,
+            self.config.grading_queue.claim_timeout,
+            exclude=exclude,
+        )
+        if submissionid is not None:
+            return redirect(f"/admin/codingstyle/submission/{submissionid}?queue=1")
+
+        return self.render(
+            "grading_queue_empty.html",
+            course=course,
+            taskid=taskid,
+            user_manager=self.user_manager,
+        )
+
+    def _fetch_course_by_id(self, courseid: str) -> Course:
+        try:
+            return get_course(self.course_factory, courseid)
+        except Exception:
+            raise NotFound(description=_("Course not found."))
@@ -0,0 +1,29 @@
+import hmac
+
+from flask import Response, request
+from werkzeug.exceptions import Forbidden
+
+from ..metrics import render_metrics
+from .base import BasePluginPage
+
+
+class MetricsEndpoint(BasePluginPage):
+    """Exposes hook and page metrics in the Prometheus text exposition format.
+
+    Accessible to superadmins, and to scrapers that send the configured
+    token in an `Authorization: Bearer <token>` header."""
+
+    def GET(self, *args, **kwargs) -> Response:
+        if not self._is_authorized():
+            raise Forbidden(description=_("You are not allowed to view metrics."))
+        return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
+
+    def _is_authorized(self) -> bool:
+        token = self.config.metrics.token
+        auth = request.headers.get("Authorization", "")
+        if token and auth.startswith("Bearer "):
+            return hmac.compare_digest(auth[len("Bearer ") :], token)
+        return (
+            self.user_manager.session_logged_in()
+            and self.user_manager.user_is_superadmin()
+        )
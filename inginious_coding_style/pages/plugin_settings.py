@@ -20,6 +20,7 @@ from werkzeug.exceptions import BadRequest
 
 from .._types import INGIniousUserTask
 from ..config import PluginConfig, SubmissionQuerySettings, TaskListBars
+from ..database import get_grading_status
 from ..fs import chmod_x, get_config_path, is_writable, update_config_file
 from ..grades import GradingCategory
 from ..mixins import AdminPageMixin, SubmissionMixin
@@ -194,9 +195,8 @@ class PluginSettingsPage(INGIniousAdminPage, BasePluginPage, SubmissionMixin):
         else:
             config_writable = False
 
-        return self.template_helper.render(
+        return self.render(
             "plugin_settings.html",
-            template_folder=self.templates_path,
             course=course,
             user_manager=self.user_manager,
             config=self.config,
@@ -226,16 +226,14 @@ class PluginSettingsPage(INGIniousAdminPage, BasePluginPage, SubmissionMixin):
             self._handle_update_settings(request.form)
         except Exception as e:
             self._logger.error(f"Failed to update configuration.", exc_info=e)
-            return self.template_helper.render(
+            return self.render(
                 "alert.html",
-                template_folder=self.templates_path,
                 message="Failed to update configuration.",
                 exception=e,
             )
         else:
-            return self.template_helper.render(
+            return self.render(
                 "alert.html",
-                template_folder=self.templates_path,
                 message="Successfully updated settings.",
                 success=True,
             )
@@ -309,9 +307,8 @@ class PluginSettingsPage(INGIniousAdminPage, BasePluginPage, SubmissionMixin):
                 exc_info=e,
             )
             exc = e
-        return self.template_helper.render(
+        return self.render(
             "recalculate_grades.html",
-            template_folder=self.templates_path,
             failed=failed,
             exc=exc,
         )
@@ -329,15 +326,18 @@ class PluginSettingsPage(INGIniousAdminPage, BasePluginPage, SubmissionMixin):
         failed: List[INGIniousUserTask] = []
         try:
             failed = self.swap_active_grade(self.config.weighted_mean.enabled)
+            failed.extend(
+                {"submissionid": submission["_id"]}  # type: ignore
+                for submission in self.sync_grading_status()
+            )
         except Exception as exc:
             self._logger.error(
                 "An exception occured when attempting to repair submission grades.",
                 exc_info=exc,
             )
 
-        return self.template_helper.render(
+        return self.render(
             "repair_submissions.html",
-            template_folder=self.templates_path,
             failed=failed,
             exc=exc,
         )
@@ -355,9 +355,8 @@ class FixConfigPermissionsEndpoint(INGIniousAdminPage, BasePluginPage):
         try:
             chmod_x(config_path)
         except OSError as e:
-            return self.template_helper.render(
+            return self.render(
                 "alert.html",
-                template_folder=self.templates_path,
                 message=(
                     f"Failed to change permissions of {config_path}."
                     f"You need to manually ensure the user running inginious-webapp has write permissions for {config_path}."
@@ -365,9 +364,8 @@ class FixConfigPermissionsEndpoint(INGIniousAdminPage, BasePluginPage):
                 exception=e,
             )
         else:
-            return self.template_helper.render(
+            return self.render(
                 "alert.html",
-                template_folder=self.templates_path,
                 message="Successfully changed permissions of config file.",
                 success=True,
             )
@@ -394,9 +392,8 @@ class SubmissionStatusDiagnoser(INGIniousAdminPage, BasePluginPage, AdminPageMix
 
         diagnosis = self.diagnose_grade_consistency()
 
-        return self.template_helper.render(
+        return self.render(
             "diagnosis.html",
-            template_folder=self.templates_path,
             config=self.config,
             diagnosis=diagnosis,
         )
@@ -432,6 +429,23 @@ class SubmissionStatusDiagnoser(INGIniousAdminPage, BasePluginPage, AdminPageMix
         return diag
 
 
+class GradingStatusEndpoint(INGIniousAdminPage, BasePluginPage):
+    """Displays the number of graded and ungraded submissions for each task in a course."""
+
+    def GET_AUTH(self, courseid: str, *args, **kwargs) -> str:
+        course, _ = self.get_course_and_check_rights(courseid)
+        status = get_grading_status(self.database, courseid)
+        tasks = course.get_tasks()
+        return self.render(
+            "grading_status.html",
+            course=course,
+            tasks=tasks,
+            status=status,
+            config=self.config,
+            user_manager=self.user_manager,
+        )
+
+
 class NewCategoryEndpoint(INGIniousAdminPage, BasePluginPage):
     def GET_AUTH(self, courseid: str, *args, **kwargs) -> str:
         self.get_course_and_check_rights(courseid)
@@ -439,8 +453,7 @@ class NewCategoryEndpoint(INGIniousAdminPage, BasePluginPage):
         id_n = session.setdefault("new_category_id", 0)
         session["new_category_id"] += 1
 
-        return self.template_helper.render(
+        return self.render(
             "newcategory.html",
-            template_folder=self.templates_path,
             id_n=id_n,
         )
@@ -0,0 +1,82 @@
+from typing import List, Set, Type, Union
+
+from flask import redirect, request, send_file
+from werkzeug import Response
+from werkzeug.exceptions import BadRequest, Forbidden, NotFound
+
+from ..profiling import PROFILE_MODES, get_profiler
+from .base import BasePluginPage
+
+
+def get_profilable_endpoints() -> List[str]:
+    """Names of all plugin pages that can be profiled."""
+    names: Set[str] = set()
+    classes: List[Type[BasePluginPage]] = [BasePluginPage]
+    while classes:
+        for subclass in classes.pop().__subclasses__():
+            classes.append(subclass)
+            if subclass not in (ProfilesPage, ProfileDownloadEndpoint):
+                names.add(subclass.__name__)
+    return sorted(names)
+
+
+class SuperadminPageMixin:
+    def check_superadmin(self) -> None:
+        if not self.user_manager.user_is_superadmin():  # type: ignore
+            raise Forbidden(description=_("You are not allowed to view profiles."))
+
+
+class ProfilesPage(BasePluginPage, SuperadminPageMixin):
+    """Lists stored profiles, and lets superadmins profile upcoming requests
+    to a plugin page."""
+
+    def GET_AUTH(self, *args, **kwargs) -> str:
+        self.check_superadmin()
+        profiler = get_profiler()
+        return self.render(
+            "profiles.html",
+            profiles=profiler.store.list(),
+            armed=profiler.armed,
+            endpoints=get_profilable_endpoints(),
+            modes=list(PROFILE_MODES),
+            settings=self.config.profiling,
+        )
+
+    def POST_AUTH(self, *args, **kwargs) -> Union[str, Response]:
+        """Arms or disarms the profiler for an endpoint."""
+        self.check_superadmin()
+        profiler = get_profiler()
+
+        endpoint = request.form.get("endpoint", "")
+        if endpoint not in get_profilable_endpoints():
+            raise BadRequest(description=_("Unknown endpoint."))
+
+        if request.form.get("action") == "disarm":
+            profiler.disarm(endpoint)
+        else:
+            try:
+                profiler.arm(
+                    endpoint,
+                    request.form.get("mode", ""),
+                    int(request.form.get("requests", 1)),
+                )
+            except ValueError as e:
+                raise BadRequest(description=str(e))
+        return redirect("/admin/codingstyle/profiles")
+
+
+class ProfileDownloadEndpoint(BasePluginPage, SuperadminPageMixin):
+    """Downloads a stored profile."""
+
+    def GET_AUTH(self, name: str, *args, **kwargs) -> Response:
+        self.check_superadmin()
+        try:
+            info, path = get_profiler().store.get(name)
+        except KeyError:
+            raise NotFound(description=_("Profile not found."))
+        return send_file(
+            path.absolute(),
+            mimetype="application/octet-stream",
+            as_attachment=True,
+            download_name=info.filename,
+        )
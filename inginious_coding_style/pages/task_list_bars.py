@@ -0,0 +1,26 @@
+from ..database import get_graded_best_submissions
+from .base import BasePluginPage
+
+
+class TaskListBarsEndpoint(BasePluginPage):
+    """Displays the coding style bars of every task in a course's task list.
+
+    Requested by the placeholders rendered by the `task_list_item` hook when
+    `task_list_bars.lazy` is enabled. Each task's bars are swapped into its
+    placeholder out of band."""
+
+    def GET_AUTH(self, courseid: str, *args, **kwargs) -> str:
+        submissions = get_graded_best_submissions(
+            self.database, courseid, self.user_manager.session_username()
+        )
+        return self.render(
+            "task_list_bars.html",
+            bars={
+                taskid: (
+                    submission,
+                    submission.custom.coding_style_grades.get_mean(self.config),
+                )
+                for taskid, submission in submissions.items()
+            },
+            config=self.config,
+        )
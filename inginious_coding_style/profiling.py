@@ -0,0 +1,341 @@
+"""Module for on-demand profiling of plugin pages.
+
+Superadmins can arm the profiler for the next N requests to a plugin page
+(see `pages/profiles.py`). Armed requests are profiled with either:
+
+- `sampling`: a background thread samples the stack of the request's thread
+  at a fixed interval. Low overhead, and the result is written in the
+  "folded stacks" format read by flame graph tools such as speedscope.
+- `cprofile`: deterministic profiling with `cProfile`. Exact call counts,
+  but slows down the request considerably. The result can be read with
+  `pstats` or snakeviz.
+
+Requests to the pages that run full-collection maintenance operations
+(recalculating, repairing and diagnosing grades) additionally record their
+peak memory usage with `tracemalloc`.
+
+Profiles are stored on disk, and only the most recent ones are kept. Unless a
+directory is configured, each worker stores its profiles in a private
+temporary directory, created the first time a profile is saved.
+
+NOTE: Profiling state is kept in memory, so the profiler is armed only in
+the worker that handled the request to arm it. Only one request is profiled
+at a time per worker, since `cProfile` and `tracemalloc` are process-wide.
+"""
+
+import json
+import marshal
+import os
+import re
+import stat
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import typing
+from collections import Counter
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .config import ProfilingSettings
+from .logger import get_logger
+
+# Profiling modes and the file extension of their profiles
+PROFILE_MODES = {
+    "sampling": "folded",
+    "cprofile": "prof",
+}
+
+# Pages that run full-collection maintenance operations
+MEMORY_TRACED_ENDPOINTS = frozenset(
+    ["PluginSettingsPage", "SubmissionStatusDiagnoser"]
+)
+
+# Profile names are generated by `ProfileStore.save()`. Validated before use in paths.
+PROFILE_NAME_RE = re.compile(r"^\d{8}T\d{12}-\w+-(sampling|cprofile)$")
+
+
+class SamplingProfiler:
+    """Samples the stack of a thread at a fixed interval."""
+
+    def __init__(self, interval: float) -> None:
+        self.interval = interval
+        self.samples: typing.Counter[str] = Counter()
+        self._thread_id = 0
+        self._stop = threading.Event()
+        self._sampler: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._thread_id = threading.get_ident()
+        self._sampler = threading.Thread(
+            target=self._run, name="coding-style-sampler", daemon=True
+        )
+        self._sampler.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._sampler is not None:
+            self._sampler.join()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._thread_id)
+            if frame is not None:
+                self.samples[_collapse_stack(frame)] += 1
+
+    def dump(self) -> bytes:
+        """Samples in the folded stacks format (`root;caller;callee count`)."""
+        lines = (f"{stack} {n}" for stack, n in self.samples.most_common())
+        return "\n".join(lines).encode()
+
+
+class DeterministicProfiler:
+    """Profiles all function calls in the current thread with `cProfile`."""
+
+    def __init__(self) -> None:
+        # Imported here, as `cProfile` also imports the pure-Python profiler
+        import cProfile
+
+        self._profile = cProfile.Profile()
+
+    def start(self) -> None:
+        self._profile.enable()
+
+    def stop(self) -> None:
+        self._profile.disable()
+
+    def dump(self) -> bytes:
+        """Stats in the format written by `cProfile.Profile.dump_stats()`."""
+        self._profile.create_stats()
+        return marshal.dumps(self._profile.stats)  # type: ignore
+
+
+def _collapse_stack(frame: Any) -> str:
+    stack: List[str] = []
+    while frame is not None:
+        stack.append(f"{frame.f_globals.get('__name__')}.{frame.f_code.co_name}")
+        frame = frame.f_back
+    return ";".join(reversed(stack))
+
+
+@dataclass
+class ProfileInfo:
+    """Metadata of a stored profile."""
+
+    name: str
+    endpoint: str
+    mode: str
+    url: str
+    created: str  # ISO 8601
+    duration: float  # seconds
+    size: int = 0  # bytes
+    error: Optional[str] = None  # exception raised by the request
+    peak_memory: Optional[int] = None  # bytes, only for memory traced endpoints
+
+    @property
+    def filename(self) -> str:
+        return f"{self.name}.{PROFILE_MODES[self.mode]}"
+
+
+def check_directory(directory: Path) -> None:
+    """Checks that a profile directory is owned by the current user,
+    and cannot be written to by other users.
+
+    Raises `PermissionError` otherwise."""
+    st = directory.stat()
+    if st.st_uid != os.getuid() or st.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+        raise PermissionError(
+            f"Profile directory {directory} must be owned by the current user "
+            "and must not be writable by other users."
+        )
+
+
+class ProfileStore:
+    """Stores profiles in a directory, keeping only the most recent ones.
+
+    Each profile is stored as a data file and a JSON file with its metadata.
+    If no directory is given, a private temporary directory is created
+    when the first profile is saved."""
+
+    def __init__(self, directory: Optional[Path], max_profiles: int) -> None:
+        self.directory = directory
+        self.max_profiles = max_profiles
+        self._checked = False
+
+    def _get_directory(self) -> Path:
+        """Returns the profile directory, creating it if needed."""
+        if self.directory is None:
+            self.directory = Path(
+                tempfile.mkdtemp(prefix="inginious-coding-style-profiles-")
+            )
+        elif not self._checked:
+            self.directory.mkdir(mode=0o700, parents=True, exist_ok=True)
+            check_directory(self.directory)
+        self._checked = True
+        return self.directory
+
+    def save(self, info: ProfileInfo, data: bytes) -> ProfileInfo:
+        directory = self._get_directory()
+        info.size = len(data)
+        (directory / info.filename).write_bytes(data)
+        # Metadata is written last, so only complete profiles are listed
+        (directory / f"{info.name}.json").write_text(json.dumps(asdict(info)))
+        self.prune()
+        return info
+
+    def list(self) -> List[ProfileInfo]:
+        """Lists stored profiles, newest first."""
+        if self.directory is None or not self.directory.exists():
+            return []
+        profiles = []
+        for path in sorted(self._get_directory().glob("*.json"), reverse=True):
+            try:
+                profiles.append(ProfileInfo(**json.loads(path.read_text())))
+            except (OSError, ValueError, TypeError) as e:
+                get_logger().warning(f"Unable to read profile {path}.", exc_info=e)
+        return profiles
+
+    def get(self, name: str) -> Tuple[ProfileInfo, Path]:
+        """Returns the metadata and data file path of a profile.
+
+        Raises `KeyError` if the profile does not exist."""
+        if not PROFILE_NAME_RE.match(name) or self.directory is None:
+            raise KeyError(name)
+        try:
+            directory = self._get_directory()
+            meta = json.loads((directory / f"{name}.json").read_text())
+        except OSError:
+            raise KeyError(name)
+        info = ProfileInfo(**meta)
+        return info, directory / info.filename
+
+    def prune(self) -> None:
+        """Deletes the oldest profiles beyond `max_profiles`."""
+        directory = self._get_directory()
+        names = sorted(
+            (p.stem for p in directory.glob("*.json")),
+            reverse=True,
+        )
+        for name in names[self.max_profiles :]:
+            for path in directory.glob(f"{name}.*"):
+                path.unlink(missing_ok=True)
+
+
+class Profiler:
+    """Profiles armed requests to plugin pages."""
+
+    def __init__(self, settings: ProfilingSettings) -> None:
+        self.settings = settings
+        self.store = ProfileStore(settings.directory, settings.max_profiles)
+        # (mode, remaining requests) keyed by endpoint
+        self._armed: Dict[str, Tuple[str, int]] = {}
+        self._lock = threading.Lock()
+        # Held while a request is being profiled
+        self._busy = threading.Lock()
+
+    @property
+    def armed(self) -> Dict[str, Tuple[str, int]]:
+        return dict(self._armed)
+
+    def is_armed(self, endpoint: str) -> bool:
+        # No locking, as this is called on every request
+        return endpoint in self._armed
+
+    def arm(self, endpoint: str, mode: str, requests: int) -> None:
+        """Profiles the next `requests` requests to an endpoint."""
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"Unknown profiling mode: {mode}")
+        if requests < 1:
+            raise ValueError("Number of requests must be positive.")
+        with self._lock:
+            self._armed[endpoint] = (mode, min(requests, self.settings.max_requests))
+
+    def disarm(self, endpoint: str) -> None:
+        with self._lock:
+            self._armed.pop(endpoint, None)
+
+    def _take(self, endpoint: str) -> Optional[str]:
+        """Claims a profiled request to an endpoint. Returns the profiling mode,
+        or `None` if the endpoint is not armed or another request is being profiled."""
+        with self._lock:
+            if endpoint not in self._armed or not self._busy.acquire(blocking=False):
+                return None
+            mode, remaining = self._armed[endpoint]
+            if remaining > 1:
+                self._armed[endpoint] = (mode, remaining - 1)
+            else:
+                del self._armed[endpoint]
+            return mode
+
+    def run(
+        self,
+        endpoint: str,
+        url: str,
+        func: Callable[..., Any],
+        *args: Any,
+        **kwargs: Any,
+    ) -> Any:
+        """Calls `func`, and profiles the call if the endpoint is armed."""
+        mode = self._take(endpoint)
+        if mode is None:
+            return func(*args, **kwargs)
+
+        try:
+            if mode == "cprofile":
+                profiler: Any = DeterministicProfiler()
+            else:
+                profiler = SamplingProfiler(self.settings.sampling_interval_ms / 1000)
+            trace_memory = (
+                endpoint in MEMORY_TRACED_ENDPOINTS and not tracemalloc.is_tracing()
+            )
+            info = ProfileInfo(
+                name=f"{datetime.now():%Y%m%dT%H%M%S%f}-{endpoint}-{mode}",
+                endpoint=endpoint,
+                mode=mode,
+                url=url,
+                created=datetime.now().isoformat(timespec="seconds"),
+                duration=0.0,
+            )
+
+            if trace_memory:
+                tracemalloc.start()
+            start = time.perf_counter()
+            profiler.start()
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                info.error = type(e).__name__
+                raise
+            finally:
+                profiler.stop()
+                info.duration = time.perf_counter() - start
+                if trace_memory:
+                    _, info.peak_memory = tracemalloc.get_traced_memory()
+                    tracemalloc.stop()
+                self._save(info, profiler)
+        finally:
+            self._busy.release()
+
+    def _save(self, info: ProfileInfo, profiler: Any) -> None:
+        try:
+            self.store.save(info, profiler.dump())
+        except Exception as e:
+            # Never fail the profiled request
+            get_logger().error(f"Failed to save profile {info.name}.", exc_info=e)
+
+
+# Set by `init_profiler()`
+PROFILER = Profiler(ProfilingSettings())
+
+
+def init_profiler(settings: ProfilingSettings) -> Profiler:
+    global PROFILER
+    PROFILER = Profiler(settings)
+    return PROFILER
+
+
+def get_profiler() -> Profiler:
+    return PROFILER
@@ -0,0 +1,139 @@
+"""Module for rendering the plugin's templates.
+
+Every plugin template is rendered through a single Jinja environment that
+is created when the plugin is initialized. This lets us compile all templates
+ahead of their first use, and persist the compiled bytecode between restarts
+of the webapp.
+"""
+
+import threading
+from collections import ChainMap
+from pathlib import Path
+from typing import Any, List, Optional
+
+import inginious
+from inginious.frontend.template_helper import TemplateHelper
+from jinja2 import (Environment, FileSystemBytecodeCache, FileSystemLoader,
+                    select_autoescape)
+
+from .config import TemplateSettings
+from .logger import get_logger
+
+# Templates provided by INGInious, which some plugin templates extend (layout.html)
+INGINIOUS_TEMPLATES_PATH = Path(inginious.get_root_path()) / "frontend" / "templates"
+
+# Makes the renderer available globally. Set by `init_renderer()`.
+RENDERER: "TemplateRenderer" = None  # type: ignore
+
+
+class TemplateRenderer:
+    """Renders plugin templates through a dedicated Jinja environment.
+
+    The environment mirrors the one INGInious creates in
+    `TemplateHelper._get_jinja_renderer()`, i.e. the same loader search path,
+    autoescaping and template globals, so templates render identically
+    to when they are rendered with `TemplateHelper.render()`.
+    """
+
+    def __init__(
+        self,
+        template_helper: TemplateHelper,
+        templates_path: Path,
+        settings: TemplateSettings,
+    ) -> None:
+        self.templates_path = templates_path
+        self.settings = settings
+        self.env = Environment(
+            loader=FileSystemLoader(
+                [str(INGINIOUS_TEMPLATES_PATH), str(templates_path)]
+            ),
+            autoescape=select_autoescape(["html", "htm", "xml"]),
+            bytecode_cache=self._get_bytecode_cache(settings),
+        )
+        # Globals can be added by other plugins after this plugin is loaded, so
+        # they are looked up in the template helper's globals at render time,
+        # which take precedence over Jinja's own globals as in INGInious
+        self.env.globals = ChainMap(  # type: ignore
+            template_helper._template_globals, self.env.globals
+        )
+
+    def _get_bytecode_cache(
+        self, settings: TemplateSettings
+    ) -> Optional[FileSystemBytecodeCache]:
+        if not settings.bytecode_cache:
+            return None
+        cache_dir = settings.cache_dir
+        try:
+            if cache_dir is None:
+                # Jinja creates a private directory for the current user in the
+                # system's temp dir, and refuses to use it if another user owns it
+                return FileSystemBytecodeCache()
+            cache_dir.mkdir(parents=True, exist_ok=True)
+        except (OSError, RuntimeError) as e:
+            get_logger().warning(
+                f"Unable to create template cache directory {cache_dir or ''}. "
+                "Compiled templates will not be cached between restarts.",
+                exc_info=e,
+            )
+            return None
+        return FileSystemBytecodeCache(str(cache_dir))
+
+    @property
+    def template_names(self) -> List[str]:
+        """Names of all templates shipped with the plugin."""
+        return sorted(
+            p.name for p in self.templates_path.iterdir() if p.suffix == ".html"
+        )
+
+    def render(self, path: str, **tpl_kwargs: Any) -> str:
+        """Renders a plugin template.
+        Equivalent to `TemplateHelper.render(path, template_folder=TEMPLATES_PATH, **tpl_kwargs)`."""
+        return self.env.get_template(path).render(**tpl_kwargs)
+
+    def warm_up(self) -> int:
+        """Compiles all plugin templates and stores them in the environment's cache.
+
+        Returns
+        -------
+        `int`
+            Number of templates that were compiled.
+        """
+        n = 0
+        for name in self.template_names:
+            try:
+                self.env.get_template(name)
+            except Exception as e:
+                get_logger().error(f"Failed to compile template {name}", exc_info=e)
+            else:
+                n += 1
+        get_logger().debug(f"Compiled {n} templates.")
+        return n
+
+    def start_warm_up(self) -> Optional[threading.Thread]:
+        """Compiles all templates according to the plugin's template settings.
+
+        Returns the warm-up thread if templates are compiled in the background."""
+        if not self.settings.precompile:
+            return None
+        if not self.settings.background:
+            self.warm_up()
+            return None
+        t = threading.Thread(
+            target=self.warm_up, name="inginious-coding-style-warm-up", daemon=True
+        )
+        t.start()
+        return t
+
+
+def init_renderer(
+    template_helper: TemplateHelper, templates_path: Path, settings: TemplateSettings
+) -> TemplateRenderer:
+    """Creates the plugin's template renderer and compiles its templates."""
+    global RENDERER
+    RENDERER = TemplateRenderer(template_helper, templates_path, settings)
+    RENDERER.start_warm_up()
+    return RENDERER
+
+
+def get_renderer() -> TemplateRenderer:
+    return RENDERER
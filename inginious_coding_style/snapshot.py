@@ -0,0 +1,348 @@
+"""Module for snapshotting and restoring the plugin's data.
+
+A snapshot contains the coding style grades, graders and grading status of
+submissions, as well as the grade fields the plugin writes to `user_tasks`.
+Nothing else is included, which makes snapshots much faster to create and
+restore than a full database dump.
+
+Restoring a snapshot replaces the plugin's data of each course in the
+snapshot: submissions and `user_tasks` of these courses that are not in the
+snapshot have their coding style grades and grading status removed.
+
+File format
+-----------
+A snapshot starts with `SNAPSHOT_MAGIC`, followed by a sequence of records.
+Each record holds a block of documents of a single kind from a single course:
+
+```
+kind (u8) | courseid length (u16) | payload length (u32) | courseid | payload
+```
+
+The payload is a zlib-compressed BSON document `{"docs": [...]}`. Because the
+record header is uncompressed, a restore limited to certain courses skips
+the records of all other courses without decompressing them.
+"""
+
+import mmap
+import struct
+import zlib
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import (Any, BinaryIO, Dict, Iterator, List, Optional, Set, Tuple,
+                    Union)
+
+import bson
+from pymongo import ASCENDING, UpdateOne
+from pymongo.collection import Collection
+from pymongo.database import Database
+
+from .database import (BULK_WRITE_BATCH_SIZE, GRADED_AT_FIELD, GRADED_FIELD,
+                       MEAN_FIELD, bulk_write, get_version_update)
+
+SNAPSHOT_MAGIC = b"ICSSNAP\x01"
+
+# kind, courseid length, payload length
+RECORD_HEADER = struct.Struct("<BHI")
+
+RECORD_SUBMISSIONS = 1
+RECORD_USER_TASKS = 2
+
+# Fields of each kind of document stored in a snapshot
+SUBMISSION_FIELDS = [
+    "custom.coding_style_grades",
+    "custom.graded_by",
+    GRADED_FIELD,
+    MEAN_FIELD,
+    GRADED_AT_FIELD,
+]
+USER_TASK_FIELDS = ["grade", "grade_mean", "grade_base"]
+
+# Documents holding the plugin's data
+SUBMISSIONS_QUERY = {
+    "$or": [
+        {"custom.coding_style_grades": {"$exists": True}},
+        {"custom.graded_by": {"$exists": True}},
+    ]
+}
+USER_TASKS_QUERY = {"grade_base": {"$exists": True}}  # only written by the plugin
+
+
+class SnapshotError(Exception):
+    """Raised when a snapshot file is malformed."""
+
+
+@dataclass
+class SnapshotSummary:
+    """Summary of a snapshot or restore."""
+
+    submissions: int = 0
+    user_tasks: int = 0
+    records: int = 0
+    failed: int = 0  # number of failed writes during a restore
+    cleared: int = 0  # number of documents not in the snapshot that were cleared
+    courses: Set[str] = field(default_factory=set)
+
+
+def _get_query(
+    courseids: Optional[List[str]], extra: Dict[str, Any]
+) -> Dict[str, Any]:
+    query = dict(extra)
+    if courseids:
+        query["courseid"] = {"$in": courseids}
+    return query
+
+
+def _iter_blocks(
+    collection: Collection,
+    query: Dict[str, Any],
+    fields: List[str],
+    batch_size: int,
+) -> Iterator[Tuple[str, List[Dict[str, Any]]]]:
+    """Yields blocks of at most `batch_size` documents from a single course.
+
+    The cursor is sorted by course ID, which is covered by the
+    (courseid, taskid) indexes on both `submissions` and `user_tasks`."""
+    cursor = collection.find(
+        query, {"courseid": 1, **{f: 1 for f in fields}}, batch_size=batch_size
+    ).sort("courseid", ASCENDING)
+    courseid: Optional[str] = None
+    block: List[Dict[str, Any]] = []
+    for doc in cursor:
+        doc_courseid = doc.pop("courseid")
+        if block and (doc_courseid != courseid or len(block) >= batch_size):
+            yield courseid, block  # type: ignore
+            block = []
+        courseid = doc_courseid
+        block.append(doc)
+    if block:
+        yield courseid, block  # type: ignore
+
+
+def _write_record(
+    f: BinaryIO, kind: int, courseid: str, docs: List[Dict[str, Any]], level: int
+) -> None:
+    cid = courseid.encode("utf-8")
+    payload = zlib.compress(bson.encode({"docs": docs}), level)
+    f.write(RECORD_HEADER.pack(kind, len(cid), len(payload)))
+    f.write(cid)
+    f.write(payload)
+
+
+def write_snapshot(
+    database: Database,
+    f: BinaryIO,
+    courseids: Optional[List[str]] = None,
+    batch_size: int = BULK_WRITE_BATCH_SIZE,
+    level: int = 6,
+) -> SnapshotSummary:
+    """Streams the plugin's data from the database into a snapshot file.
+
+    Parameters
+    ----------
+    database : `Database`
+        The INGInious database.
+    f : `BinaryIO`
+        File opened in binary write mode.
+    courseids : `Optional[List[str]]`, optional
+        Only snapshot these courses, by default all courses.
+    batch_size : `int`, optional
+        Max number of documents per record.
+    level : `int`, optional
+        zlib compression level.
+    """
+    summary = SnapshotSummary()
+    f.write(SNAPSHOT_MAGIC)
+
+    sources = [
+        (
+            RECORD_SUBMISSIONS,
+            database.submissions,
+            _get_query(courseids, SUBMISSIONS_QUERY),
+            SUBMISSION_FIELDS,
+        ),
+        (
+            RECORD_USER_TASKS,
+            database.user_tasks,
+            _get_query(courseids, USER_TASKS_QUERY),
+            USER_TASK_FIELDS,
+        ),
+    ]
+    for kind, collection, query, fields in sources:
+        for courseid, docs in _iter_blocks(collection, query, fields, batch_size):
+            _write_record(f, kind, courseid, docs, level)
+            _add_to_summary(summary, kind, courseid, len(docs))
+    return summary
+
+
+def _add_to_summary(
+    summary: SnapshotSummary, kind: int, courseid: str, n: int
+) -> None:
+    summary.records += 1
+    summary.courses.add(courseid)
+    if kind == RECORD_SUBMISSIONS:
+        summary.submissions += n
+    else:
+        summary.user_tasks += n
+
+
+def iter_snapshot(
+    path: Union[str, Path], courseids: Optional[List[str]] = None
+) -> Iterator[Tuple[int, str, List[Dict[str, Any]]]]:
+    """Reads the records of a snapshot file.
+
+    The file is memory-mapped, and records of courses not in `courseids`
+    are skipped without being decompressed.
+
+    Yields
+    ------
+    `Tuple[int, str, List[Dict[str, Any]]]`
+        Record kind, course ID and documents of each record.
+    """
+    wanted = set(courseids) if courseids else None
+    if Path(path).stat().st_size < len(SNAPSHOT_MAGIC):
+        # also guards against mmap failing on empty files
+        raise SnapshotError(f"{path} is not a coding style snapshot.")
+    with open(path, "rb") as f, mmap.mmap(
+        f.fileno(), 0, access=mmap.ACCESS_READ
+    ) as mm:
+        if mm[: len(SNAPSHOT_MAGIC)] != SNAPSHOT_MAGIC:
+            raise SnapshotError(f"{path} is not a coding style snapshot.")
+        offset = len(SNAPSHOT_MAGIC)
+        while offset < len(mm):
+            if offset + RECORD_HEADER.size > len(mm):
+                raise SnapshotError(f"Truncated record header at offset {offset}.")
+            kind, cid_len, payload_len = RECORD_HEADER.unpack_from(mm, offset)
+            start = offset + RECORD_HEADER.size
+            end = start + cid_len + payload_len
+            if end > len(mm):
+                raise SnapshotError(f"Truncated record at offset {offset}.")
+            courseid = mm[start : start + cid_len].decode("utf-8")
+            offset = end
+            if wanted is not None and courseid not in wanted:
+                continue
+            try:
+                payload = zlib.decompress(mm[start + cid_len : end])
+            except zlib.error as e:
+                raise SnapshotError(f"Corrupt record at offset {start}: {e}")
+            yield kind, courseid, bson.decode(payload)["docs"]
+
+
+def _get_restore_update(kind: int, doc: Dict[str, Any]) -> UpdateOne:
+    if kind == RECORD_SUBMISSIONS:
+        custom = doc.get("custom", {})
+        grades = custom.get("coding_style_grades", {})
+        fields = {
+            "custom.coding_style_grades": grades,
+            "custom.graded_by": custom.get("graded_by", []),
+            GRADED_FIELD: doc.get(GRADED_FIELD, bool(grades)),
+            MEAN_FIELD: doc.get(MEAN_FIELD),
+            GRADED_AT_FIELD: doc.get(GRADED_AT_FIELD),
+        }
+        return UpdateOne(
+            {"_id": doc["_id"]}, {"$set": fields, **get_version_update()}
+        )
+    fields = {f: doc.get(f) for f in USER_TASK_FIELDS}
+    return UpdateOne({"_id": doc["_id"]}, {"$set": fields})
+
+
+def _get_clear_update(kind: int, _id: Any) -> UpdateOne:
+    if kind == RECORD_SUBMISSIONS:
+        return UpdateOne(
+            {"_id": _id},
+            {"$unset": {f: "" for f in SUBMISSION_FIELDS}, **get_version_update()},
+        )
+    # The active grade falls back to the base grade of the submission
+    return UpdateOne(
+        {"_id": _id},
+        [{"$set": {"grade": "$grade_base"}}, {"$unset": ["grade_mean", "grade_base"]}],
+    )
+
+
+def _clear_missing(
+    database: Database,
+    kind: int,
+    courseid: str,
+    restored: Set[Any],
+    summary: SnapshotSummary,
+    dry_run: bool,
+) -> None:
+    """Clears the plugin's data from documents of a course that are
+    not in the snapshot."""
+    if kind == RECORD_SUBMISSIONS:
+        collection, query = database.submissions, SUBMISSIONS_QUERY
+    else:
+        collection, query = database.user_tasks, USER_TASKS_QUERY
+    ids = [
+        doc["_id"]
+        for doc in collection.find({**query, "courseid": courseid}, {"_id": 1})
+        if doc["_id"] not in restored
+    ]
+    summary.cleared += len(ids)
+    if dry_run:
+        return
+    failed = bulk_write(collection, [_get_clear_update(kind, i) for i in ids])
+    summary.failed += len(failed)
+
+
+def restore_snapshot(
+    database: Database,
+    path: Union[str, Path],
+    courseids: Optional[List[str]] = None,
+    dry_run: bool = False,
+) -> SnapshotSummary:
+    """Restores the plugin's data from a snapshot file.
+
+    Each record is restored with a single unordered bulk write, so
+    at most one record is held in memory at a time. Once all records of
+    a course have been restored, the plugin's data is cleared from the
+    documents of the course that are not in the snapshot, so that the
+    course is left exactly as it was when the snapshot was made.
+
+    Parameters
+    ----------
+    database : `Database`
+        The INGInious database.
+    path : `Union[str, Path]`
+        Path to the snapshot file.
+    courseids : `Optional[List[str]]`, optional
+        Only restore these courses, by default all courses in the snapshot.
+    dry_run : `bool`, optional
+        Read and validate the snapshot without writing to the database.
+    """
+    summary = SnapshotSummary()
+    done: Set[Tuple[int, str]] = set()
+    current: Optional[Tuple[int, str]] = None
+    restored: Set[Any] = set()  # IDs of the documents restored for `current`
+    for kind, courseid, docs in iter_snapshot(path, courseids):
+        if kind not in (RECORD_SUBMISSIONS, RECORD_USER_TASKS):
+            raise SnapshotError(f"Unknown record kind {kind}.")
+        if (kind, courseid) != current:
+            # Records of each kind and course are contiguous (see `write_snapshot()`)
+            if (kind, courseid) in done:
+                raise SnapshotError(
+                    f"Records of course {courseid!r} are not contiguous."
+                )
+            if current is not None:
+                _clear_missing(database, *current, restored, summary, dry_run)
+                done.add(current)
+            current, restored = (kind, courseid), set()
+        restored.update(doc["_id"] for doc in docs)
+        _add_to_summary(summary, kind, courseid, len(docs))
+        if dry_run:
+            continue
+        collection = (
+            database.submissions if kind == RECORD_SUBMISSIONS else database.user_tasks
+        )
+        failed = bulk_write(
+            collection, [_get_restore_update(kind, doc) for doc in docs]
+        )
+        summary.failed += len(failed)
+    if current is not None:
+        _clear_missing(database, *current, restored, summary, dry_run)
+        done.add(current)
+    # Courses of the snapshot without any documents of a kind
+    for courseid in sorted(summary.courses):
+        for kind in (RECORD_SUBMISSIONS, RECORD_USER_TASKS):
+            if (kind, courseid) not in done:
+                _clear_missing(database, kind, courseid, set(), summary, dry_run)
+    return summary
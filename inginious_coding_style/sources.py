@@ -0,0 +1,74 @@
+"""Module for retrieving the source code of submissions.
+
+The code of a submission is read from its input: the answers to code problems
+and uploaded files. Source code is normalized, so that identical code submitted
+from different systems has the same content hash, which the plugin uses as
+a cache key for analyses of the code.
+"""
+
+import hashlib
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Union
+
+from inginious.frontend.tasks import Task
+
+
+@dataclass
+class SourceFile:
+    name: str  # problem ID or filename
+    source: str  # normalized source code
+    language: Optional[str] = None  # language of a code problem
+
+    @property
+    def content_hash(self) -> str:
+        return get_content_hash(self.source)
+
+
+def normalize_source(source: Union[str, bytes]) -> str:
+    """Normalizes encoding, byte order marks and line endings, which differ
+    between otherwise identical files uploaded from different systems."""
+    if isinstance(source, bytes):
+        source = source.decode("utf-8", errors="replace")
+    return source.lstrip("\ufeff").replace("\r\n", "\n").replace("\r", "\n")
+
+
+def get_content_hash(source: str) -> str:
+    return hashlib.sha256(source.encode("utf-8")).hexdigest()
+
+
+def get_sources(
+    task: Optional[Task], inputdata: Dict[str, Any], max_size: int = 0
+) -> List[SourceFile]:
+    """Retrieves the code of a submission from its input.
+
+    Code problems are named after their problem ID and carry the language of
+    the problem, while uploaded files are named after their filename. Other
+    input, and files larger than `max_size` bytes (if not 0), is skipped."""
+    languages: Dict[str, Optional[str]] = {}
+    if task is not None:
+        for problem in task.get_problems():
+            languages[problem.get_id()] = getattr(problem, "_language", None)
+
+    sources = []
+    for key, value in inputdata.items():
+        if key.startswith("@"):  # @username, @lang, @random, ...
+            continue
+        if isinstance(value, str):
+            name, data, language = key, value, languages.get(key)
+        elif isinstance(value, dict) and "filename" in value and "value" in value:
+            name, data, language = value["filename"], value["value"], None
+        else:
+            continue
+        if not isinstance(data, (str, bytes)) or not data.strip():
+            continue
+        if max_size and len(data) > max_size:
+            continue
+        sources.append(SourceFile(name, normalize_source(data), language))
+    return sources
+
+
+def get_submission_input(submission_manager: Any, input_: Any) -> Dict[str, Any]:
+    """Retrieves the input of a submission, which is stored in GridFS."""
+    return submission_manager.get_input_from_submission(
+        {"input": input_}, only_input=True
+    )
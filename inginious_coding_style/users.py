@@ -0,0 +1,51 @@
+"""Module for resolving the real names of INGInious users.
+
+`UserManager.get_user_realname()` queries the database once per username.
+Pages that display the names of both the authors and the graders of
+submissions instead resolve every username they need with a single call to
+`UserManager.get_users_info()`, and cache the results in the worker's memory.
+"""
+
+from typing import Dict, Iterable, List, Optional
+
+from inginious.frontend.user_manager import UserManager
+
+from .cache import TTLCache
+from .config import CacheSettings
+
+# Real names keyed by username. `None` denotes unknown users.
+# Caching is disabled until `init_realname_cache()` is called.
+REALNAME_CACHE: TTLCache[str, Optional[str]] = TTLCache(maxsize=0, ttl=0)
+
+
+def init_realname_cache(settings: CacheSettings) -> TTLCache[str, Optional[str]]:
+    global REALNAME_CACHE
+    REALNAME_CACHE = TTLCache(
+        maxsize=settings.realnames_size, ttl=settings.realnames_ttl
+    )
+    return REALNAME_CACHE
+
+
+def get_realnames(
+    user_manager: UserManager, usernames: Iterable[str]
+) -> Dict[str, Optional[str]]:
+    """Resolves the real names of users.
+
+    Usernames that are not cached are fetched with a single call to
+    `UserManager.get_users_info()`.
+
+    Returns
+    -------
+    `Dict[str, Optional[str]]`
+        Real names keyed by username. Unknown users have the value `None`.
+    """
+    wanted = set(usernames)
+    realnames: Dict[str, Optional[str]] = REALNAME_CACHE.get_many(wanted)
+    missing: List[str] = [u for u in wanted if u not in realnames]
+    if missing:
+        fetched: Dict[str, Optional[str]] = dict.fromkeys(missing)
+        for username, info in user_manager.get_users_info(missing).items():
+            fetched[username] = info.realname if info is not None else None
+        REALNAME_CACHE.set_many(fetched)
+        realnames.update(fetched)
+    return realnames
@@ -1,31 +1,38 @@
 from typing import Dict, Optional
 
+from flask import request
 from inginious.frontend.tasks import Task
+from pymongo import DESCENDING
 from werkzeug.datastructures import ImmutableMultiDict
 
 from ._types import GradesIn, INGIniousSubmission
+from .database import GRADED_FIELD
+from .instrumentation import instrument_database
 from .submission import Submission, get_submission
 
 
 def get_best_submission(task: Task) -> Optional[Submission]:
     """Retrieves the best submission by a user for a specific task."""
     # HACK: we abuse the fact that a task object has access to the plugin manager here
-    # in order to retrieve the submission manager. If this is changed in a future
+    # in order to retrieve the database and user manager. If this is changed in a future
     # version of INGInious, we will have to find a different way to do this.
-
-    # Check if we can find any submissions at all
-    submission_manager = task._plugin_manager.get_submission_manager()
-    submissions = submission_manager.get_user_submissions(task)
-    if not submissions:
+    plugin_manager = task._plugin_manager
+    user_manager = plugin_manager.get_user_manager()
+    if not user_manager.session_logged_in():
         return None
 
-    # We have submissions, now find the best one
-    best = None
-    for submission in submissions:
-        if best is None or submission["grade"] > best["grade"]:
-            # NOTE: Prefer newest submission?
-            best = submission
-    return get_submission(best) if best else best
+    database = instrument_database(plugin_manager.get_database())
+    # Same query as `WebAppSubmissionManager.get_user_submissions()`, but only
+    # fetches the best submission. The newest submission wins ties.
+    best = database.submissions.find_one(
+        {
+            "username": user_manager.session_username(),
+            "taskid": task.get_id(),
+            "courseid": task.get_course_id(),
+        },
+        sort=[("grade", DESCENDING), ("submitted_on", DESCENDING)],
+    )
+    return get_submission(best) if best else None
 
 
 def has_coding_style_grades(submission: INGIniousSubmission) -> bool:
@@ -35,13 +42,25 @@ def has_coding_style_grades(submission: INGIniousSubmission) -> bool:
     We don't check the contents of the custom grades, we just verify that
     the submission has the correct "shape" by identifying whether or not
     `submission["custom"]["coding_style_grades"]` exists and is not empty.
+
+    Submissions that have been modified by the plugin carry an indexed
+    grading status field, which is checked first.
     """
+    graded = submission.get(GRADED_FIELD)
+    if graded is not None:
+        return bool(graded)
     try:
         return bool(submission["custom"]["coding_style_grades"])
     except:
         return False
 
 
+def is_htmx_request() -> bool:
+    """Checks if the current request was made by htmx.
+    Source: https://htmx.org/docs/#request-headers"""
+    return request.headers.get("HX-Request") == "true"
+
+
 def parse_form_data(form_data: ImmutableMultiDict) -> GradesIn:
     """Transforms flat form data into nested data that can be parsed
     by `CodingStyleGrades.parse_obj()`
@@ -66,14 +85,51 @@ def parse_form_data(form_data: ImmutableMultiDict) -> GradesIn:
             "feedback": "Needs more functions!",
         }
     }
+
+    Fields that are not named `<category>_<attribute>` (such as `version`)
+    are ignored.
     """
     form = form_data.to_dict()  # type: Dict[str, str]
 
     out: GradesIn = {}
     for (k, v) in form.items():
-        category, attr = k.split("_")
+        category, sep, attr = k.rpartition("_")
+        if not sep:
+            continue
         try:
             out[category][attr] = v
         except KeyError:
             out[category] = {attr: v}
     return out
+
+
+def parse_override_form_data(form_data: ImmutableMultiDict) -> Dict[str, GradesIn]:
+    """Collects per-submission grade data from fields named
+    `<submissionid>:<category>_<attribute>`, keyed by submission ID.
+    Blank fields are ignored, so the common grades are used instead.
+
+    ### Example:
+
+    >>> form_data.to_dict()
+    {
+        "comments_grade": "100",
+        "61b8b1f5d4c1b3f1c4e0e0a1:comments_grade": "50",
+        "61b8b1f5d4c1b3f1c4e0e0a1:comments_feedback": "",
+    }
+    >>> parse_override_form_data(form_data)
+    {
+        "61b8b1f5d4c1b3f1c4e0e0a1": {
+            "comments": {"grade": "50"},
+        }
+    }
+    """
+    out: Dict[str, GradesIn] = {}
+    for k, v in form_data.to_dict().items():
+        submissionid, sep, field = k.partition(":")
+        if not sep or not v.strip():
+            continue
+        category, sep, attr = field.rpartition("_")
+        if not sep:
+            continue
+        out.setdefault(submissionid, {}).setdefault(category, {})[attr] = v
+    return out
@@ -0,0 +1,76 @@
+"""Module for lazily built views of the plugin's pages.
+
+Importing the page classes imports most of the plugin, which is wasted in
+worker processes that never serve a plugin page. Pages are therefore
+registered with `lazy_view()`, which only imports the page classes and builds
+the view of a page when the page is first requested.
+
+Flask needs the HTTP methods of a view when it is registered, so the methods
+handled by each page class are listed in `PAGE_METHODS`.
+"""
+
+import importlib
+import threading
+from typing import Any, Callable, Dict, Optional, Tuple
+
+PAGES_MODULE = "inginious_coding_style.pages"
+
+_DEFAULT_METHODS = ("GET", "POST")
+
+# HTTP methods handled by each page class in `inginious_coding_style.pages`
+PAGE_METHODS: Dict[str, Tuple[str, ...]] = {
+    "BulkGradingEndpoint": _DEFAULT_METHODS,
+    "CodeMetricsPage": _DEFAULT_METHODS,
+    "CodingStyleGradingPage": ("GET", "POST", "PATCH", "DELETE"),
+    "FixConfigPermissionsEndpoint": _DEFAULT_METHODS,
+    "GradeExportEndpoint": _DEFAULT_METHODS,
+    "GradeImportEndpoint": _DEFAULT_METHODS,
+    "GradingQueuePage": _DEFAULT_METHODS,
+    "GradingStatusEndpoint": _DEFAULT_METHODS,
+    "MetricsEndpoint": _DEFAULT_METHODS,
+    "NewCategoryEndpoint": _DEFAULT_METHODS,
+    "PluginSettingsPage": ("GET", "POST", "PATCH"),
+    "ProfileDownloadEndpoint": _DEFAULT_METHODS,
+    "ProfilesPage": _DEFAULT_METHODS,
+    "StudentSubmissionCodingStylePage": _DEFAULT_METHODS,
+    "SubmissionAnalysisEndpoint": _DEFAULT_METHODS,
+    "SubmissionClustersPage": _DEFAULT_METHODS,
+    "SubmissionStatusDiagnoser": _DEFAULT_METHODS,
+    "TaskListBarsEndpoint": _DEFAULT_METHODS,
+}
+
+
+class LazyView:
+    """View function that builds the view of a page class on its first call.
+
+    Has the attributes Flask reads from a view function when it is
+    registered (`__name__` and `methods`)."""
+
+    def __init__(self, name: str, classname: str, *class_args: Any) -> None:
+        self.__name__ = name
+        self.classname = classname
+        self.methods = PAGE_METHODS[classname]
+        self._class_args = class_args
+        self._view: Optional[Callable[..., Any]] = None
+        self._lock = threading.Lock()
+
+    @property
+    def is_built(self) -> bool:
+        return self._view is not None
+
+    def get_view(self) -> Callable[..., Any]:
+        if self._view is None:
+            with self._lock:
+                if self._view is None:
+                    pages = importlib.import_module(PAGES_MODULE)
+                    page_cls = getattr(pages, self.classname)
+                    self._view = page_cls.as_view(self.__name__, *self._class_args)
+        return self._view
+
+    def __call__(self, **kwargs: Any) -> Any:
+        return self.get_view()(**kwargs)
+
+
+def lazy_view(name: str, classname: str, *class_args: Any) -> LazyView:
+    """Lazy equivalent of `<classname>.as_view(name, *class_args)`."""
+    return LazyView(name, classname, *class_args)
@@ -17,8 +17,10 @@ from inginious.frontend.template_helper import TemplateHelper
 from inginious.frontend.user_manager import UserManager
 from pymongo.database import Database
 
-from inginious_coding_style.config import get_config
+from inginious_coding_style.config import MetricsSettings, get_config
 from inginious_coding_style.grades import get_grades
+from inginious_coding_style.instrumentation import init_instrumentation
+from inginious_coding_style.logger import get_logger
 from inginious_coding_style.submission import get_submission
 
 
@@ -243,3 +245,22 @@ def template_helper(plugin_manager, mock_user_manager, get_homepath):
 @pytest.fixture
 def mock_inginious_page():
     yield Mock(spec=INGIniousPage)
+
+
+@pytest.fixture
+def metrics_enabled():
+    """Instruments databases, which is disabled by default."""
+    init_instrumentation(MetricsSettings(enabled=True))
+    yield
+    init_instrumentation(MetricsSettings())
+
+
+@pytest.fixture
+def plugin_caplog(caplog):
+    """`caplog` for the plugin logger, which does not propagate its records."""
+    logger = get_logger()
+    logger.addHandler(caplog.handler)
+    try:
+        yield caplog
+    finally:
+        logger.removeHandler(caplog.handler)
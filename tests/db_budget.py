@@ -0,0 +1,188 @@
+"""Database command budgets for tests.
+
+`CountingDatabase` wraps the database handle given to the plugin (a real
+`Database`, or a mock standing in for one), and logs every command issued
+through it. `db_budget()` counts the commands issued within a block, and fails
+if they exceed a budget:
+
+```python
+database = CountingDatabase(MagicMock())
+with db_budget(database, reads=1, writes=2):
+    page.POST_AUTH(submissionid)
+```
+
+Each collection operation counts as one command. Additional batches fetched
+from a cursor (`getMore`) are not counted, so budgets are stated in terms of
+the operations issued by the code under test.
+"""
+
+import sys
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Callable, Iterator, List, Optional
+
+from pymongo.database import Database
+
+from inginious_coding_style.instrumentation import COLLECTION_OPERATIONS
+
+# Operations that do not modify any documents
+READ_OPERATIONS = frozenset(
+    [
+        "aggregate",
+        "count_documents",
+        "distinct",
+        "estimated_document_count",
+        "find",
+        "find_one",
+    ]
+)
+
+WRITE_OPERATIONS = COLLECTION_OPERATIONS - READ_OPERATIONS
+
+# Attributes of `Database` that are not collections
+_DATABASE_ATTRIBUTES = frozenset(dir(Database))
+
+# Modules skipped when looking up the function that issued a command
+_PROXY_MODULES = frozenset([__name__, "inginious_coding_style.instrumentation"])
+
+
+@dataclass(frozen=True)
+class Command:
+    collection: str
+    operation: str
+    caller: str
+
+    @property
+    def is_read(self) -> bool:
+        return self.operation in READ_OPERATIONS
+
+    def __str__(self) -> str:
+        return f"{self.collection}.{self.operation} from {self.caller}"
+
+
+class CommandLog:
+    """Commands issued within a `db_budget()` block."""
+
+    def __init__(self) -> None:
+        self.commands: List[Command] = []
+
+    @property
+    def total(self) -> int:
+        return len(self.commands)
+
+    @property
+    def reads(self) -> int:
+        return sum(1 for c in self.commands if c.is_read)
+
+    @property
+    def writes(self) -> int:
+        return self.total - self.reads
+
+    def count(
+        self, collection: Optional[str] = None, operation: Optional[str] = None
+    ) -> int:
+        return sum(
+            1
+            for c in self.commands
+            if (collection is None or c.collection == collection)
+            and (operation is None or c.operation == operation)
+        )
+
+    def __str__(self) -> str:
+        return "\n".join(f"  {i}. {c}" for i, c in enumerate(self.commands, 1))
+
+
+def _get_caller() -> str:
+    frame = sys._getframe(1)
+    while frame is not None and frame.f_globals.get("__name__") in _PROXY_MODULES:
+        frame = frame.f_back  # type: ignore
+    if frame is None:
+        return "unknown"
+    return f"{frame.f_globals.get('__name__')}.{frame.f_code.co_name}"
+
+
+class CountingCollection:
+    """Proxy around a collection that logs the commands issued through it."""
+
+    def __init__(self, collection: Any, name: str, database: "CountingDatabase"):
+        self._collection = collection
+        self._name = name
+        self._database = database
+
+    def __getattr__(self, name: str) -> Any:
+        attr = getattr(self._collection, name)
+        if name in COLLECTION_OPERATIONS:
+            return self._wrap(name, attr)
+        return attr
+
+    def _wrap(self, operation: str, method: Callable[..., Any]) -> Callable[..., Any]:
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            self._database.log(Command(self._name, operation, _get_caller()))
+            return method(*args, **kwargs)
+
+        return wrapper
+
+
+class CountingDatabase:
+    """Proxy around a database that logs the commands issued through it."""
+
+    def __init__(self, database: Any) -> None:
+        self._database = database
+        self._logs: List[CommandLog] = []
+
+    def log(self, command: Command) -> None:
+        for log in self._logs:
+            log.commands.append(command)
+
+    def get_collection(self, name: str, *args: Any, **kwargs: Any) -> Any:
+        return CountingCollection(
+            self._database.get_collection(name, *args, **kwargs), name, self
+        )
+
+    def __getitem__(self, name: str) -> CountingCollection:
+        return CountingCollection(self._database[name], name, self)
+
+    def __getattr__(self, name: str) -> Any:
+        attr = getattr(self._database, name)
+        if name.startswith("_") or name in _DATABASE_ATTRIBUTES:
+            return attr
+        return CountingCollection(attr, name, self)  # database.<collection>
+
+    @contextmanager
+    def record(self) -> Iterator[CommandLog]:
+        """Logs the commands issued within the block. Blocks can be nested."""
+        log = CommandLog()
+        self._logs.append(log)
+        try:
+            yield log
+        finally:
+            self._logs.remove(log)
+
+
+class BudgetExceeded(AssertionError):
+    pass
+
+
+@contextmanager
+def db_budget(
+    database: CountingDatabase,
+    total: Optional[int] = None,
+    reads: Optional[int] = None,
+    writes: Optional[int] = None,
+) -> Iterator[CommandLog]:
+    """Fails if the block issues more commands than budgeted.
+
+    Budgets left as `None` are not checked. The commands issued are listed
+    along with the functions that issued them, which makes N+1 queries easy
+    to spot."""
+    with database.record() as log:
+        yield log
+    for kind, budget, actual in [
+        ("commands", total, log.total),
+        ("reads", reads, log.reads),
+        ("writes", writes, log.writes),
+    ]:
+        if budget is not None and actual > budget:
+            raise BudgetExceeded(
+                f"Expected at most {budget} {kind}, got {actual}:\n{log}"
+            )
@@ -0,0 +1,135 @@
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import MagicMock, Mock
+
+import pytest
+
+from inginious_coding_style.analysis import (ANALYSIS_COLLECTION, Analyzer,
+                                             FileAnalysis, Finding, LintResult,
+                                             get_cache_key, get_category,
+                                             get_linters, parse_output,
+                                             run_linter, suggest_grades)
+from inginious_coding_style.config import (DEFAULT_LINTER_PATTERN,
+                                           AnalysisSettings, LinterSettings,
+                                           get_config)
+from inginious_coding_style.sources import SourceFile
+
+PYCODESTYLE = LinterSettings(
+    name="pycodestyle",
+    command=["pycodestyle", "{path}"],
+    categories={"E": "structure", "E26": "comments"},
+)
+
+# Prints a finding for the file it is run on
+FAKE_LINTER = [
+    sys.executable,
+    "-c",
+    "import sys; print(sys.argv[1] + ':1:5: E261 at least two spaces')",
+    "{path}",
+]
+
+
+def test_get_linters():
+    linters = [PYCODESTYLE]
+    assert get_linters(SourceFile("main.py", ""), linters) == [PYCODESTYLE]
+    assert get_linters(SourceFile("main.c", ""), linters) == []
+    assert get_linters(SourceFile("q1", "", "python3"), linters) == [PYCODESTYLE]
+    assert get_linters(SourceFile("q1", "", "java"), linters) == []
+    assert get_linters(SourceFile("q1", ""), linters) == []
+
+
+def test_get_category():
+    assert get_category("E261", PYCODESTYLE) == "comments"
+    assert get_category("E501", PYCODESTYLE) == "structure"
+    assert get_category("W605", PYCODESTYLE) is None
+    assert get_category(None, PYCODESTYLE.copy(update={"default_category": "x"})) == "x"
+
+
+def test_parse_output():
+    output = "main.py:3:1: E302 expected 2 blank lines\nnot a finding\n"
+    assert parse_output(output, DEFAULT_LINTER_PATTERN, 10) == [
+        Finding(line=3, col=1, code="E302", message="expected 2 blank lines")
+    ]
+    # pyflakes-style output without column or code
+    output = "main.py:2: 'os' imported but unused\n" * 3
+    findings = parse_output(output, DEFAULT_LINTER_PATTERN, 2)
+    assert findings == [Finding(2, None, None, "'os' imported but unused")] * 2
+
+
+def test_run_linter():
+    result = run_linter(FAKE_LINTER, DEFAULT_LINTER_PATTERN, "main.py", "x=1", 10, 0)
+    assert result.error is None
+    assert result.findings == [Finding(1, 5, "E261", "at least two spaces")]
+
+
+def test_run_linter_errors():
+    result = run_linter(["no-such-linter"], DEFAULT_LINTER_PATTERN, "a.py", "", 10, 0)
+    assert result.error == "Command not found: no-such-linter"
+
+    command = [sys.executable, "-c", "import time; time.sleep(10)"]
+    result = run_linter(command, DEFAULT_LINTER_PATTERN, "a.py", "", 0.5, 0)
+    assert result.error == "Timed out after 0.5 seconds"
+
+
+def test_suggest_grades():
+    config = get_config({"analysis": {"penalty": 10}})
+    files = [
+        FileAnalysis("main.py", "pycodestyle", LintResult(), ["comments"] * 3),
+        FileAnalysis("q1", "pycodestyle", LintResult(), ["structure"] * 20 + [None]),
+    ]
+    suggestions = suggest_grades(files, [PYCODESTYLE], config)
+    # Categories no linter maps findings to get no suggestion
+    assert set(suggestions) == {"comments", "structure"}
+    assert suggestions["comments"].grade == 70
+    assert suggestions["structure"].grade == 0
+    assert suggestions["structure"].findings == 20
+
+
+@pytest.fixture
+def analyzer():
+    linter = PYCODESTYLE.copy(update={"command": FAKE_LINTER})
+    settings = AnalysisSettings(enabled=True, linters=[linter], workers=1)
+    executor = ThreadPoolExecutor(max_workers=1)
+    yield Analyzer(settings, executor=executor)
+    executor.shutdown()
+
+
+def test_analyzer(analyzer: Analyzer):
+    database = MagicMock()
+    database[ANALYSIS_COLLECTION].find.return_value = []
+    # Identical code is only analyzed once
+    sources = [SourceFile("a.py", "x=1\n"), SourceFile("b.py", "x=1\n")]
+    analysis = analyzer.analyze(database, sources, get_config({}))
+
+    assert analysis.pending == 0
+    assert analysis.n_findings == 2
+    assert [f.categories for f in analysis.files] == [["comments"], ["comments"]]
+    assert analysis.suggestions["comments"].grade == 90
+    assert analysis.suggestions["structure"].grade == 100
+    ((ops,), _) = database[ANALYSIS_COLLECTION].bulk_write.call_args
+    assert len(ops) == 1
+
+
+def test_analyzer_cached(analyzer: Analyzer):
+    source = SourceFile("a.py", "x=1\n")
+    key = get_cache_key(analyzer.settings.linters[0], source.content_hash)
+    database = MagicMock()
+    database[ANALYSIS_COLLECTION].find.return_value = [
+        {"_id": key, "findings": [{"line": 1, "col": 1, "code": "E501", "message": "m"}]}
+    ]
+    analyzer._submit = Mock()  # type: ignore
+    analysis = analyzer.analyze(database, [source], get_config({}))
+
+    analyzer._submit.assert_not_called()
+    database[ANALYSIS_COLLECTION].bulk_write.assert_not_called()
+    assert analysis.files[0].categories == ["structure"]
+    assert analyzer.precompute(database, [source]) == 0
+
+
+def test_analyzer_precompute(analyzer: Analyzer):
+    database = MagicMock()
+    database[ANALYSIS_COLLECTION].find.return_value = []
+    sources = [SourceFile("a.py", "x=1\n"), SourceFile("a.c", "int x;\n")]
+    assert analyzer.precompute(database, sources) == 1
+    analyzer.executor.shutdown(wait=True)
+    database[ANALYSIS_COLLECTION].bulk_write.assert_called_once()
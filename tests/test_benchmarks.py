@@ -0,0 +1,142 @@
+import pytest
+
+from benchmarks.common import Result, compare_results
+from benchmarks.dataset import DatasetGenerator, DatasetSpec
+from benchmarks.importtime import parse_importtime
+from benchmarks.loadtest import EndpointStats, Recorder, percentile
+from benchmarks.micro import get_benchmarks
+from inginious_coding_style.submission import get_submission
+from inginious_coding_style.utils import has_coding_style_grades
+
+
+def result(seconds: float) -> Result:
+    return Result(
+        median=seconds, min=seconds, mean=seconds, stdev=0.0, loops=1, repeat=1
+    )
+
+
+def test_compare_results():
+    baseline = {"a": result(1.0), "b": result(1.0), "removed": result(1.0)}
+    current = {"a": result(1.1), "b": result(1.3), "added": result(5.0)}
+    regressions = compare_results(baseline, current, threshold=0.2)
+    assert [r.name for r in regressions] == ["b"]
+    assert regressions[0].change == pytest.approx(0.3)
+
+
+def test_compare_results_by_extra_metric():
+    baseline = {"a": result(1.0)}
+    current = {"a": result(1.0)}
+    baseline["a"].extra["p95"] = 2.0
+    current["a"].extra["p95"] = 3.0
+    assert compare_results(baseline, current) == []
+    (regression,) = compare_results(baseline, current, metric="p95")
+    assert regression.change == pytest.approx(0.5)
+
+
+def test_micro_benchmarks_run():
+    """Makes sure the benchmarks keep up with changes to the plugin."""
+    names = set()
+    for name, func in get_benchmarks():
+        func()
+        names.add(name)
+    assert "get_submission[categories=30]" in names
+    assert "FormParser.parse[categories=4]" in names
+
+
+def test_dataset_generator():
+    spec = DatasetSpec(students=20, tasks=3, attempts=4, graded_share=0.5)
+    generator = DatasetGenerator(spec)
+    config = generator.config
+
+    submissions = {}
+    user_tasks = []
+    for collection, doc in generator.submissions():
+        if collection == "submissions":
+            submissions[doc["_id"]] = doc
+        else:
+            user_tasks.append(doc)
+    assert len(submissions) == spec.n_submissions == 240
+    assert len(user_tasks) == spec.n_user_tasks == 60
+
+    graded = 0
+    for user_task in user_tasks:
+        best = get_submission(submissions[user_task["submissionid"]])
+        assert best.username == [user_task["username"]]
+        assert best.grade == user_task["grade"]
+        if best.custom.coding_style_grades:
+            graded += 1
+            assert has_coding_style_grades(submissions[best._id])
+            # Same grades as the plugin would have stored
+            assert user_task["grade_mean"] == best.get_weighted_mean(config)
+            assert user_task["grade_base"] == best.grade
+        else:
+            assert "grade_mean" not in user_task
+    assert 0 < graded < len(user_tasks)
+
+
+def test_dataset_spec_for_size():
+    spec = DatasetSpec.for_size(100_000, tasks=10, attempts=5)
+    assert spec.students == 2000
+    assert spec.n_submissions == 100_000
+
+
+def test_percentile():
+    values = [float(i) for i in range(1, 101)]
+    assert percentile(values, 50) == 50.0
+    assert percentile(values, 95) == 95.0
+    assert percentile(values, 99) == 99.0
+    assert percentile(values, 100) == 100.0
+    assert percentile([1.0], 99) == 1.0
+    with pytest.raises(ValueError):
+        percentile([], 50)
+
+
+def test_load_test_results():
+    recorder = Recorder()
+    for i in range(1, 101):
+        recorder.record("grading_page[GET]", i / 1000, ok=True)
+    for _ in range(25):
+        recorder.record("grading_page[GET]", 0.5, ok=False)
+    results = recorder.get_results(duration=10.0)
+
+    r = results["grading_page[GET]"]
+    assert r.median == pytest.approx(0.05)
+    assert r.extra["p95"] == pytest.approx(0.095)
+    assert r.extra["p99"] == pytest.approx(0.099)
+    assert r.loops == 125
+    assert r.extra["throughput"] == 12.5
+    assert r.extra["error_rate"] == 0.2
+
+
+def test_load_test_only_errors():
+    stats = EndpointStats(errors=3)
+    r = stats.get_result(duration=1.0)
+    assert r.extra["error_rate"] == 1.0
+    assert r.median == 0.0
+
+
+def test_parse_importtime():
+    output = "\n".join(
+        [
+            "import time: self [us] | cumulative | imported package",
+            "import time:       100 |        100 | inginious",
+            "import time:        30 |         30 |     pydantic.types",
+            "import time:        20 |         50 |   pydantic",
+            "import time:        40 |         90 | inginious_coding_style",
+            "import time:         5 |          5 | inginious_coding_style.pages",
+        ]
+    )
+    groups = parse_importtime(output)
+    assert list(groups) == [
+        "inginious",
+        "inginious_coding_style",
+        "inginious_coding_style.pages",
+    ]
+    plugin = groups["inginious_coding_style"]
+    assert [e.module for e in plugin] == [
+        "pydantic.types",
+        "pydantic",
+        "inginious_coding_style",
+    ]
+    assert [e.depth for e in plugin] == [2, 1, 0]
+    assert plugin[-1].cumulative_us == 90
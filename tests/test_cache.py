@@ -0,0 +1,52 @@
+import time
+from unittest.mock import MagicMock, Mock
+
+from inginious_coding_style.cache import TTLCache
+from inginious_coding_style.config import CacheSettings
+from inginious_coding_style.users import get_realnames, init_realname_cache
+
+
+def test_ttl_cache_lru():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1  # "b" is now least recently used
+    cache.set("c", 3)
+    assert cache.get_many(["a", "b", "c"]) == {"a": 1, "c": 3}
+
+
+def test_ttl_cache_expiry():
+    cache = TTLCache(maxsize=2, ttl=0.01)
+    cache.set("a", None)
+    assert cache.get_many(["a"]) == {"a": None}
+    time.sleep(0.02)
+    assert cache.get_many(["a"]) == {}
+    assert len(cache) == 0
+
+
+def test_ttl_cache_disabled():
+    cache = TTLCache(maxsize=10, ttl=0)
+    cache.set("a", 1)
+    assert cache.get("a") is None
+
+
+def test_get_realnames():
+    user_manager = MagicMock()
+    user_manager.get_users_info.side_effect = lambda usernames: {
+        u: Mock(realname="User 1") if u == "user1" else None for u in usernames
+    }
+    init_realname_cache(CacheSettings())
+    try:
+        assert get_realnames(user_manager, ["user1", "unknown", "user1"]) == {
+            "user1": "User 1",
+            "unknown": None,
+        }
+        user_manager.get_users_info.assert_called_once()
+        (usernames,), _ = user_manager.get_users_info.call_args
+        assert sorted(usernames) == ["unknown", "user1"]
+
+        # Known and unknown users are served from the cache
+        get_realnames(user_manager, ["user1", "unknown"])
+        user_manager.get_users_info.assert_called_once()
+    finally:
+        init_realname_cache(CacheSettings(realnames_size=0, realnames_ttl=0))
@@ -0,0 +1,292 @@
+import random
+import time
+from unittest.mock import MagicMock, Mock
+
+import pytest
+from bson import ObjectId
+
+from inginious_coding_style.clustering import (MAX_BUCKET_CANDIDATES, NUM_BINS,
+                                               ROWS, SIGNATURE_VERSION,
+                                               SIGNATURES_COLLECTION,
+                                               SignatureIndex,
+                                               estimate_similarity,
+                                               find_clusters, get_shingles,
+                                               get_signature,
+                                               get_submission_signature,
+                                               get_tokens, index_submission)
+from inginious_coding_style.config import get_config
+from inginious_coding_style.sources import SourceFile
+
+SOURCE = '''\
+def total(values):
+    """Returns the sum."""
+    s = 0
+    for i in range(len(values)):  # index loop
+        if values[i] > 10:
+            s += values[i]
+    return s
+'''
+
+# Same code with other names, literals and comments
+RENAMED = '''\
+def add_all(xs):
+    """Adds everything."""
+    acc = 0
+    for n in range(len(xs)):
+        if xs[n] > 42:
+            acc += xs[n]
+    return acc
+'''
+
+OTHER = '''\
+class Stack:
+    def __init__(self):
+        self.items = []
+
+    def push(self, item):
+        self.items.append(item)
+
+    def pop(self):
+        return self.items.pop()
+'''
+
+STATEMENTS = [
+    "x = a + 1\n",
+    "for i in range(n):\n    s += i\n",
+    "if a > b:\n    return a\n",
+    "while n:\n    n -= 1\n",
+    "print(len(a))\n",
+    "lst.append(sorted(a))\n",
+    "try:\n    f()\nexcept ValueError:\n    pass\n",
+    "d = {k: v for k, v in a.items()}\n",
+    "return max(a, key=abs)\n",
+    "with open(p) as fh:\n    t = fh.read()\n",
+]
+
+
+def signature(code: str, name: str = "main.py"):
+    return get_submission_signature([SourceFile(name, code)], 5)
+
+
+def test_get_tokens():
+    tokens = get_tokens(SourceFile("main.py", "x = len('a')  # c\n"))
+    assert tokens == ["N", "=", "len", "(", "S", ")", ";"]
+    assert get_tokens(SourceFile("main.py", RENAMED)) == get_tokens(
+        SourceFile("main.py", SOURCE)
+    )
+    # Not Python, or not valid Python
+    assert get_tokens(SourceFile("main.c", "int x=1;")) == ["int", "x", "=", "1", ";"]
+    assert get_tokens(SourceFile("main.py", "x = (\n")) == ["x", "=", "("]
+
+
+def test_get_shingles():
+    assert len(get_shingles(["a", "b", "c", "a", "b"], 2)) == 3
+    # Fewer tokens than the shingle size
+    assert len(get_shingles(["a", "b"], 5)) == 1
+    assert get_shingles([], 5) == set()
+
+
+def test_get_signature():
+    sig = get_signature(set(range(100)))
+    assert len(sig) == NUM_BINS
+    # Values of densified bins still fit in a BSON int64
+    assert all(0 <= v < 2**63 for v in get_signature({1}))
+    assert get_signature(set()) is None
+    assert signature("") is None
+
+
+def test_estimate_similarity():
+    a = set(range(1000))
+    b = set(range(200, 1200))  # Jaccard similarity 2/3
+    estimate = estimate_similarity(get_signature(a), get_signature(b))
+    assert estimate == pytest.approx(2 / 3, abs=0.15)
+    assert estimate_similarity(signature(SOURCE), signature(RENAMED)) == 1
+    assert estimate_similarity(signature(SOURCE), signature(OTHER)) < 0.2
+
+
+def test_find_clusters():
+    signatures = {
+        "a": signature(SOURCE),
+        "b": signature(RENAMED),
+        "c": signature(SOURCE + "\n\nx = 1\n"),
+        "d": signature(OTHER),
+        "e": signature(OTHER),
+        "f": signature("import os\nprint(os.getcwd())\n"),
+    }
+    clusters = find_clusters(signatures, 0.8)
+    assert [sorted(c) for c in clusters] == [["a", "b", "c"], ["d", "e"]]
+    assert find_clusters(signatures, 1.0) == [["a", "b"], ["d", "e"]]
+    assert find_clusters({}, 0.8) == []
+
+
+def test_find_clusters_shared_bucket(monkeypatch):
+    # Dissimilar signatures that are identical in one band, e.g. template code
+    rng = random.Random(0)
+    shared = [rng.randrange(2**63) for _ in range(ROWS)]
+    signatures = {
+        i: shared + [rng.randrange(2**63) for _ in range(NUM_BINS - ROWS)]
+        for i in range(2000)
+    }
+    comparisons = []
+
+    def estimate(a, b):
+        comparisons.append((a, b))
+        return estimate_similarity(a, b)
+
+    monkeypatch.setattr(
+        "inginious_coding_style.clustering.estimate_similarity", estimate
+    )
+    assert find_clusters(signatures, 0.8) == []
+    # Not compared pairwise
+    assert len(comparisons) <= len(signatures) * MAX_BUCKET_CANDIDATES
+
+
+def make_submissions(n: int, n_templates: int):
+    """Makes `n` submissions, each a slightly modified copy of a template."""
+    rng = random.Random(0)
+    templates = [
+        [rng.choice(STATEMENTS) for _ in range(40)] for _ in range(n_templates)
+    ]
+    submissions = []
+    for _ in range(n):
+        template = rng.randrange(n_templates)
+        lines = list(templates[template])
+        for _ in range(2):
+            lines[rng.randrange(len(lines))] = rng.choice(STATEMENTS)
+        body = "".join(line.replace("\n", "\n    ") for line in lines)
+        submissions.append((template, f"def f(a, b, n):\n    {body}"))
+    return submissions
+
+
+def test_find_clusters_1000_submissions():
+    submissions = make_submissions(1000, 30)
+    start = time.perf_counter()
+    signatures = {i: signature(code) for i, (_, code) in enumerate(submissions)}
+    clusters = find_clusters(signatures, 0.8)
+    assert time.perf_counter() - start < 10
+    # Most submissions are clustered with copies of the same template
+    clustered = [i for cluster in clusters for i in cluster]
+    assert len(clustered) > 900
+    same_template = sum(
+        1
+        for cluster in clusters
+        for i in cluster
+        if submissions[i][0] == submissions[cluster[0]][0]
+    )
+    assert same_template / len(clustered) > 0.9
+
+
+@pytest.fixture
+def submissions():
+    return [
+        {"_id": ObjectId(), "username": ["a"], "input": {"q1": SOURCE}},
+        {
+            "_id": ObjectId(),
+            "username": ["b"],
+            "input": {"q1": RENAMED},
+            "custom": {
+                "coding_style_grades": {
+                    "comments": {
+                        "id": "comments",
+                        "name": "Comments",
+                        "description": "",
+                        "grade": 80,
+                    }
+                }
+            },
+            "coding_style_graded": True,
+            "coding_style_mean": 80.0,
+            "coding_style_version": 3,
+        },
+        {"_id": ObjectId(), "username": ["c"], "input": {"q1": OTHER}},
+        {"_id": ObjectId(), "username": ["d"], "input": {"q1": ""}},
+    ]
+
+
+@pytest.fixture
+def index_database(submissions) -> MagicMock:
+    database = MagicMock()
+    database.user_tasks.find.return_value = [
+        {"submissionid": s["_id"]} for s in submissions
+    ]
+    database.submissions.find.side_effect = lambda query, projection: [
+        s for s in submissions if s["_id"] in query["_id"]["$in"]
+    ]
+    database[SIGNATURES_COLLECTION].find.return_value = []
+    return database
+
+
+def make_task() -> Mock:
+    problem = Mock()
+    problem.get_id.return_value = "q1"
+    problem._language = "python"
+    task = Mock()
+    task.get_problems.return_value = [problem]
+    return task
+
+
+def make_index(database: MagicMock, batch_size: int = 10) -> SignatureIndex:
+    config = get_config({"clustering": {"batch_size": batch_size}})
+    submission_manager = Mock()
+    submission_manager.get_input_from_submission.side_effect = (
+        lambda submission, only_input: submission["input"]
+    )
+    return SignatureIndex(
+        database, submission_manager, config, "course", "task", make_task()
+    )
+
+
+def test_signature_index(index_database: MagicMock, submissions):
+    result = make_index(index_database).clusters()
+
+    assert result.submissions == 3  # the empty submission has no signature
+    assert result.indexed == 4
+    (cluster,) = result.clusters
+    assert [m.username for m in cluster.members] == [["a"], ["b"]]
+    assert cluster.graded == 1
+    assert cluster.grades["comments"].grade == 80
+    assert [m.version for m in cluster.members] == [0, 3]
+    # All signatures of the batch are stored in a single write
+    ((ops,), _) = index_database[SIGNATURES_COLLECTION].bulk_write.call_args
+    assert len(ops) == 4
+    assert ops[0]._doc["$set"]["version"] == SIGNATURE_VERSION
+
+
+def test_signature_index_cached(index_database: MagicMock, submissions):
+    # Stored signatures are not computed again
+    index_database[SIGNATURES_COLLECTION].find.return_value = [
+        {"_id": s["_id"], "signature": signature(OTHER)} for s in submissions
+    ]
+    result = make_index(index_database, batch_size=2).clusters()
+    assert result.indexed == 0
+    assert len(result.clusters[0].members) == 4
+    index_database[SIGNATURES_COLLECTION].bulk_write.assert_not_called()
+    assert index_database.submissions.find.call_count == 2
+
+
+def test_index_submission(monkeypatch, submissions):
+    database = MagicMock()
+    plugin_manager = Mock()
+    plugin_manager.get_database.return_value = database
+    submission_manager = plugin_manager.get_submission_manager.return_value
+    submission_manager.get_input_from_submission.side_effect = (
+        lambda submission, only_input: submission["input"]
+    )
+    monkeypatch.setattr("inginious_coding_style.courses.get_course", Mock())
+    # Operations on mock collections are not recorded in the plugin's metrics
+    monkeypatch.setattr(
+        "inginious_coding_style.instrumentation.instrument_database", lambda db: db
+    )
+    monkeypatch.setattr(
+        "inginious_coding_style.courses.get_task", Mock(return_value=make_task())
+    )
+    submission = {**submissions[0], "courseid": "course", "taskid": "task"}
+    index_submission(plugin_manager, Mock(), get_config({}), submission)
+    ((query, update), kwargs) = database[SIGNATURES_COLLECTION].update_one.call_args
+    assert query == {"_id": submission["_id"]}
+    assert update["$set"]["signature"] == signature(SOURCE, name="q1.py")
+    assert kwargs == {"upsert": True}
+
+    # Errors are logged, not raised
+    plugin_manager.get_submission_manager.side_effect = Exception("boom")
+    index_submission(plugin_manager, Mock(), get_config({}), submission)
@@ -0,0 +1,215 @@
+from unittest.mock import MagicMock, Mock
+
+import pytest
+from bson import ObjectId
+from pymongo import DESCENDING
+
+from inginious_coding_style.code_metrics import (CODE_METRICS_COLLECTION,
+                                                 SUBMISSION_METRICS_COLLECTION,
+                                                 CodeMetrics, CodeMetricsJob,
+                                                 SubmissionMetrics,
+                                                 combine_metrics,
+                                                 compute_metrics,
+                                                 get_cache_key, is_python,
+                                                 sort_metrics)
+from inginious_coding_style.config import get_config
+from inginious_coding_style.sources import SourceFile
+
+SOURCE = '''\
+"""Module docstring."""
+# Sums the truthy values
+def total(values):
+    """Returns the sum."""
+    s = 0
+    for i in range(len(values)):  # index loop
+        if values[i]:
+            s += values[i]
+        elif i:
+            while False:
+                pass
+    return s
+
+
+class Counter:
+    def count(self, items):
+        return {item: n for n, item in enumerate(items)}
+'''
+
+
+def test_compute_metrics():
+    m = compute_metrics(SOURCE)
+    assert m.files == 1
+    assert m.lines == 15
+    assert m.comment_lines == 2
+    assert (m.functions, m.classes, m.docstrings) == (2, 1, 1)
+    assert m.max_function_length == 10
+    assert m.mean_function_length == 6
+    assert m.docstring_coverage == pytest.approx(1 / 3)
+    # for > if/elif > while; elif is not nested in the if
+    assert m.max_nesting == 3
+    # total, values, s, i, Counter, count, items, item, n ("self" is excluded)
+    assert m.identifiers == 9
+    assert m.short_identifiers == 3
+    assert (m.comprehensions, m.enumerate_calls, m.range_len_loops) == (1, 1, 1)
+    assert m.syntax_errors == 0
+
+
+def test_compute_metrics_syntax_error():
+    m = compute_metrics("# comment\ndef f(:\n")
+    assert m.syntax_errors == 1
+    assert m.comment_lines == 1
+    assert m.functions == 0
+    assert m.mean_function_length is None
+
+
+def test_combine_metrics():
+    a = CodeMetrics(files=1, lines=10, functions=1, function_lines=4, max_nesting=3)
+    b = CodeMetrics(files=1, lines=5, functions=2, function_lines=2, max_nesting=1)
+    m = combine_metrics([a, b])
+    assert (m.files, m.lines, m.functions, m.max_nesting) == (2, 15, 3, 3)
+    assert m.mean_function_length == 2
+    assert combine_metrics([]) == CodeMetrics()
+
+
+def test_is_python():
+    assert is_python(SourceFile("main.py", ""))
+    assert not is_python(SourceFile("main.java", ""))
+    assert is_python(SourceFile("q1", "", "python3"))
+    assert not is_python(SourceFile("q1", "", "c"))
+    assert not is_python(SourceFile("q1", ""))
+
+
+def test_sort_metrics():
+    rows = [
+        SubmissionMetrics(str(i), [f"s{i}"], False, None, m)
+        for i, m in enumerate(
+            [
+                CodeMetrics(lines=5, functions=1, function_lines=10),
+                CodeMetrics(lines=20),
+                CodeMetrics(lines=1, functions=2, function_lines=2),
+            ]
+        )
+    ]
+    assert [r.submissionid for r in sort_metrics(rows, "lines")] == ["2", "0", "1"]
+    # Submissions without functions are sorted last
+    by_length = sort_metrics(rows, "mean_function_length", descending=True)
+    assert [r.submissionid for r in by_length] == ["0", "2", "1"]
+    with pytest.raises(ValueError):
+        sort_metrics(rows, "input")
+
+
+@pytest.fixture
+def submissions():
+    return [
+        {"_id": ObjectId(), "username": ["a"], "input": {"q1": SOURCE}},
+        {
+            "_id": ObjectId(),
+            "username": ["b"],
+            "input": {"q1": SOURCE.replace("\n", "\r\n")},
+        },
+        {
+            "_id": ObjectId(),
+            "username": ["c"],
+            "input": {"f": {"filename": "main.py", "value": b"x = [\n"}},
+            "coding_style_graded": True,
+            "coding_style_mean": 80.0,
+        },
+    ]
+
+
+@pytest.fixture
+def job_database(submissions) -> MagicMock:
+    database = MagicMock()
+    database.user_tasks.find.return_value = [
+        {"submissionid": s["_id"]} for s in submissions
+    ] + [{"submissionid": None}]
+    database.submissions.find.side_effect = lambda query, projection: [
+        s for s in submissions if s["_id"] in query["_id"]["$in"]
+    ]
+    database[CODE_METRICS_COLLECTION].find.return_value = []
+    return database
+
+
+def make_job(database: MagicMock, batch_size: int = 2) -> CodeMetricsJob:
+    config = get_config({"code_metrics": {"batch_size": batch_size}})
+    submission_manager = Mock()
+    submission_manager.get_input_from_submission.side_effect = (
+        lambda submission, only_input: submission["input"]
+    )
+    problem = Mock()
+    problem.get_id.return_value = "q1"
+    problem._language = "python"
+    task = Mock()
+    task.get_problems.return_value = [problem]
+    return CodeMetricsJob(database, submission_manager, config, "course", "task", task)
+
+
+def test_code_metrics_job(job_database: MagicMock, submissions):
+    rows = list(make_job(job_database).rows())
+
+    assert [r.username for r in rows] == [["a"], ["b"], ["c"]]
+    # Identical code after normalization has the same hash
+    assert rows[0].content_hash == rows[1].content_hash
+    assert rows[0].metrics == compute_metrics(SOURCE)
+    assert rows[2].graded and rows[2].style_mean == 80.0
+    assert rows[2].metrics.syntax_errors == 1
+    # One batch of 2 submissions and one of 1, each cached in a single write
+    assert job_database.submissions.find.call_count == 2
+    calls = job_database[CODE_METRICS_COLLECTION].bulk_write.call_args_list
+    assert [len(ops) for (ops,), _ in calls] == [1, 1]
+
+
+def test_code_metrics_job_cached(job_database: MagicMock, submissions):
+    cached = CodeMetrics(files=1, lines=99)
+    key = get_cache_key(SourceFile("q1", SOURCE).content_hash)
+    job_database[CODE_METRICS_COLLECTION].find.return_value = [
+        {"_id": key, **cached.__dict__}
+    ]
+    rows = list(make_job(job_database, batch_size=10).rows())
+    assert rows[0].metrics == cached
+    ((ops,), _) = job_database[CODE_METRICS_COLLECTION].bulk_write.call_args
+    assert len(ops) == 1  # only main.py is computed
+
+
+def test_code_metrics_job_page(job_database: MagicMock, submissions):
+    summaries = MagicMock()
+    collections = {
+        CODE_METRICS_COLLECTION: job_database[CODE_METRICS_COLLECTION],
+        SUBMISSION_METRICS_COLLECTION: summaries,
+    }
+    job_database.__getitem__.side_effect = collections.__getitem__
+    # The first submission is already stored
+    summaries.find.return_value = [{"_id": submissions[0]["_id"]}]
+
+    def aggregate(pipeline):
+        ((ops,), _) = summaries.bulk_write.call_args
+        return [{"_id": op._filter["_id"], **op._doc["$set"]} for op in ops]
+
+    summaries.aggregate.side_effect = aggregate
+    total, rows = make_job(job_database).page("comment_density", True, 0, 2)
+
+    assert total == 3
+    # Only the submissions that are not stored are analyzed, in a single batch
+    ((ops,), _) = summaries.bulk_write.call_args
+    assert [op._filter["_id"] for op in ops] == [s["_id"] for s in submissions[1:]]
+    assert ops[0]._doc["$set"]["comment_density"] == compute_metrics(
+        SOURCE
+    ).comment_density
+    assert ops[1]._doc["$set"]["mean_function_length"] is None
+    # Rows are created from the stored metrics, with the current grading status
+    assert [r.username for r in rows] == [["b"], ["c"]]
+    assert rows[0].metrics == compute_metrics(SOURCE)
+    assert rows[1].graded and rows[1].style_mean == 80.0
+    ((pipeline,), _) = summaries.aggregate.call_args
+    assert pipeline[-3]["$sort"]["comment_density"] == DESCENDING
+    assert pipeline[-2:] == [{"$skip": 0}, {"$limit": 2}]
+    with pytest.raises(ValueError):
+        make_job(job_database).page("input", True, 0, 2)
+
+
+def test_code_metrics_job_stream(job_database: MagicMock):
+    lines = "".join(make_job(job_database).stream("csv")).splitlines()
+    assert lines[0].startswith("submissionid,username,graded,style_mean,content_hash")
+    assert len(lines) == 4
+    with pytest.raises(ValueError):
+        list(make_job(job_database).stream("xml"))
@@ -0,0 +1,79 @@
+from unittest.mock import MagicMock
+
+import pytest
+
+from inginious_coding_style import courses
+from inginious_coding_style.config import CacheSettings
+
+
+@pytest.fixture
+def course_factory():
+    courses.init_course_cache(CacheSettings())
+    factory = MagicMock()
+    factory._get_course_descriptor_path.return_value = "mycourse/course.yaml"
+    factory.get_fs.return_value.get_last_modification_time.return_value = 1.0
+    task_factory = factory.get_task_factory.return_value
+    task_factory._get_task_descriptor_info.return_value = ("task.yaml", None)
+    task_factory.get_task_fs.return_value.get_last_modification_time.return_value = 1.0
+    yield factory
+    courses.init_course_cache(CacheSettings(courses_ttl=0))
+
+
+def test_get_course_cached(course_factory: MagicMock):
+    course = courses.get_course(course_factory, "mycourse")
+    assert courses.get_course(course_factory, "mycourse") is course
+    course_factory.get_course.assert_called_once_with("mycourse")
+
+
+def test_get_course_modified(course_factory: MagicMock):
+    courses.get_course(course_factory, "mycourse")
+    course_factory.get_fs.return_value.get_last_modification_time.return_value = 2.0
+    courses.get_course(course_factory, "mycourse")
+    courses.get_course(course_factory, "mycourse")
+    assert course_factory.get_course.call_count == 2
+
+
+def test_get_course_translations_modified(course_factory: MagicMock):
+    mtimes = {"mycourse/course.yaml": 1.0, "mycourse/$i18n": 1.0}
+    mtimes["mycourse/$i18n/fr.mo"] = 1.0
+    fs = course_factory.get_fs.return_value
+    fs.get_last_modification_time.side_effect = lambda path: mtimes[path]
+    translations_fs = course_factory.get_course_fs.return_value.from_subfolder.return_value
+    translations_fs.list.return_value = ["fr.mo", "fr.po"]
+
+    courses.get_course(course_factory, "mycourse")
+    courses.get_course(course_factory, "mycourse")
+    assert course_factory.get_course.call_count == 1
+    # Translation file is modified
+    mtimes["mycourse/$i18n/fr.mo"] = 2.0
+    courses.get_course(course_factory, "mycourse")
+    assert course_factory.get_course.call_count == 2
+    # Translation file is added
+    mtimes["mycourse/$i18n"] = 2.0
+    courses.get_course(course_factory, "mycourse")
+    assert course_factory.get_course.call_count == 3
+
+
+def test_get_task_cached(course_factory: MagicMock):
+    course = courses.get_course(course_factory, "mycourse")
+    course.get_id.return_value = "mycourse"
+    task = courses.get_task(course_factory, course, "mytask")
+    assert courses.get_task(course_factory, course, "mytask") is task
+    course.get_task.assert_called_once_with("mytask")
+
+
+def test_get_task_invalidated(course_factory: MagicMock):
+    course = courses.get_course(course_factory, "mycourse")
+    course.get_id.return_value = "mycourse"
+    courses.get_task(course_factory, course, "mytask")
+    courses.on_task_editor_submit(course=course, taskid="mytask", task_data={})
+    courses.get_task(course_factory, course, "mytask")
+    assert course.get_task.call_count == 2
+
+
+def test_get_course_not_found(course_factory: MagicMock):
+    course_factory._get_course_descriptor_path.side_effect = Exception
+    course_factory.get_course.side_effect = Exception
+    with pytest.raises(Exception):
+        courses.get_course(course_factory, "mycourse")
+    assert len(courses.COURSE_CACHE) == 0
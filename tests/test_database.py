@@ -0,0 +1,195 @@
+from datetime import datetime
+from unittest.mock import MagicMock, Mock
+
+import pytest
+from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from inginious_coding_style.config import PluginConfig
+from inginious_coding_style.database import (GRADED_AT_FIELD, GRADED_FIELD,
+                                             MEAN_FIELD, MIGRATIONS_COLLECTION,
+                                             STATUS_INDEX_NAME, VERSION_FIELD,
+                                             WRITE_ID_FIELD, bulk_write,
+                                             bulk_write_versioned,
+                                             count_ungraded,
+                                             get_category_update,
+                                             get_status_fields,
+                                             get_status_update_pipeline,
+                                             get_user_tasks_mean_update,
+                                             get_version, graded_filter,
+                                             migrate_grading_status,
+                                             set_version, versioned_filter)
+from inginious_coding_style.submission import Submission
+
+
+def test_get_status_fields_graded(
+    submission_pydantic_grades: Submission, config_pydantic_full: PluginConfig
+):
+    graded_at = datetime(year=2021, month=12, day=24)
+    fields = get_status_fields(
+        submission_pydantic_grades, config_pydantic_full, graded_at=graded_at
+    )
+    assert fields[GRADED_FIELD] is True
+    assert fields[MEAN_FIELD] == 25.0
+    assert fields[GRADED_AT_FIELD] == graded_at
+
+
+def test_get_status_fields_ungraded(
+    submission_pydantic_grades: Submission, config_pydantic_full: PluginConfig
+):
+    submission_pydantic_grades.delete_coding_style_grades()
+    fields = get_status_fields(submission_pydantic_grades, config_pydantic_full)
+    assert fields == {GRADED_FIELD: False, MEAN_FIELD: None, GRADED_AT_FIELD: None}
+
+
+def test_get_category_update(
+    submission_pydantic_grades: Submission, config_pydantic_full: PluginConfig
+):
+    submission_pydantic_grades.custom.coding_style_grades["comments"].grade = 50
+    update = get_category_update(
+        submission_pydantic_grades, "comments", config_pydantic_full, "tutor"
+    )
+    assert update["$set"]["custom.coding_style_grades.comments"]["grade"] == 50
+    assert update["$set"][MEAN_FIELD] == 35.0
+    assert "custom.coding_style_grades" not in update["$set"]
+    assert update["$addToSet"] == {"custom.graded_by": "tutor"}
+    assert update["$inc"] == {VERSION_FIELD: 1}
+    # The grader is not added without a session username
+    update = get_category_update(
+        submission_pydantic_grades, "comments", config_pydantic_full
+    )
+    assert "$addToSet" not in update
+
+
+def test_get_category_update_invalid_id(
+    submission_pydantic_grades: Submission, config_pydantic_full: PluginConfig
+):
+    with pytest.raises(ValueError):
+        get_category_update(submission_pydantic_grades, "a.b", config_pydantic_full)
+
+
+def test_get_user_tasks_mean_update(
+    submission_pydantic_grades: Submission, config_pydantic_full: PluginConfig
+):
+    update = get_user_tasks_mean_update(
+        submission_pydantic_grades, config_pydantic_full
+    )
+    assert set(update["$set"]) == {"grade_mean"}
+    config_pydantic_full.weighted_mean.enabled = True
+    update = get_user_tasks_mean_update(
+        submission_pydantic_grades, config_pydantic_full
+    )
+    assert update["$set"]["grade"] == update["$set"]["grade_mean"]
+
+
+def test_versioned_filter(submission_pydantic_grades: Submission):
+    # Submissions written before versioning do not have the field
+    assert get_version(submission_pydantic_grades) == 0
+    _id = submission_pydantic_grades._id
+    assert versioned_filter(_id, 0) == {"_id": _id, VERSION_FIELD: None}
+    set_version(submission_pydantic_grades, 3)
+    assert get_version(submission_pydantic_grades) == 3
+    assert versioned_filter(_id, 3) == {"_id": _id, VERSION_FIELD: 3}
+
+
+def test_graded_filter():
+    assert graded_filter(True) == {GRADED_FIELD: True}
+    # Submissions without the field are treated as ungraded
+    assert graded_filter(False) == {GRADED_FIELD: {"$in": [False, None]}}
+
+
+def test_migrate_grading_status(config_pydantic_full: PluginConfig):
+    database = MagicMock()
+    database[MIGRATIONS_COLLECTION].find_one.return_value = None
+    migrate_grading_status(database, config_pydantic_full)
+    ((query, update), _) = database.submissions.update_many.call_args
+    # Only graded submissions without the status fields are modified
+    assert query == {
+        GRADED_FIELD: {"$exists": False},
+        "custom.coding_style_grades": {"$exists": True, "$ne": {}},
+    }
+    assert update == get_status_update_pipeline(config_pydantic_full)
+    database[MIGRATIONS_COLLECTION].update_one.assert_called_once()
+
+    # The migration is only applied once
+    database = MagicMock()
+    database[MIGRATIONS_COLLECTION].find_one.return_value = {"_id": "grading_status"}
+    migrate_grading_status(database, config_pydantic_full)
+    database.submissions.update_many.assert_not_called()
+
+
+def test_get_status_update_pipeline(config_pydantic_full: PluginConfig):
+    (stage,) = get_status_update_pipeline(config_pydantic_full)
+    assert stage["$set"][GRADED_FIELD] is True
+    assert stage["$set"][GRADED_AT_FIELD] is None
+    # The mean is computed from the enabled categories only
+    mean = stage["$set"][MEAN_FIELD]["$round"][0]["$ifNull"][0]
+    categories = mean["$avg"]["$map"]["input"]["$filter"]["cond"]["$in"][1]
+    assert categories == list(config_pydantic_full.enabled)
+
+
+def test_count_ungraded():
+    database = MagicMock()
+    database.user_tasks.find.return_value = [
+        {"submissionid": i} for i in range(5)
+    ] + [{"submissionid": None}]
+    database.submissions.count_documents.return_value = 2
+    assert count_ungraded(database, "course", "task") == 3
+    # Graded submissions of the task are counted through the status index
+    ((query,), kwargs) = database.submissions.count_documents.call_args
+    assert query == {
+        "courseid": "course",
+        "taskid": "task",
+        GRADED_FIELD: True,
+        "_id": {"$in": list(range(5))},
+    }
+    assert kwargs == {"hint": STATUS_INDEX_NAME}
+
+
+def test_bulk_write_batches_and_failures():
+    collection = MagicMock()
+
+    def _bulk_write(batch, ordered):
+        assert not ordered
+        if len(batch) == 2:  # fail the 2nd operation of the last batch
+            raise BulkWriteError({"writeErrors": [{"index": 1}]})
+        return Mock(matched_count=len(batch))
+
+    collection.bulk_write.side_effect = _bulk_write
+    operations = [UpdateOne({"_id": i}, {"$set": {"n": i}}) for i in range(5)]
+    failed = bulk_write(collection, operations, batch_size=3)
+    assert collection.bulk_write.call_count == 2
+    assert failed == {4}
+
+
+def test_bulk_write_versioned():
+    collection = MagicMock()
+    update = {"$set": {"n": 1}, "$inc": {VERSION_FIELD: 1}}
+    writes = [(1, 0, update), (2, 3, update), (3, 1, update)]
+    collection.bulk_write.return_value = Mock(matched_count=3)
+    assert bulk_write_versioned(collection, writes) == (set(), set())
+    (ops,), _ = collection.bulk_write.call_args
+    assert [op._filter for op in ops] == [
+        versioned_filter(_id, version) for _id, version, _ in writes
+    ]
+    assert ops[0]._doc["$inc"] == {VERSION_FIELD: 1}
+    collection.find.assert_not_called()  # every write was applied
+
+    # Submission 2 was modified after version 3
+    collection.bulk_write.return_value = Mock(matched_count=2)
+
+    def find(query, projection):
+        (ops,), _ = collection.bulk_write.call_args
+        write_id = ops[0]._doc["$set"][WRITE_ID_FIELD]
+        return [
+            {"_id": 1, WRITE_ID_FIELD: write_id},
+            {"_id": 2, WRITE_ID_FIELD: ObjectId()},
+            {"_id": 3, WRITE_ID_FIELD: write_id},
+        ]
+
+    collection.find.side_effect = find
+    assert bulk_write_versioned(collection, writes) == (set(), {1})
+    # Only one of two writes to the same submission is applied
+    collection.bulk_write.return_value = Mock(matched_count=1)
+    assert bulk_write_versioned(collection, [writes[0], writes[0]]) == (set(), {1})
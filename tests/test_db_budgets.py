@@ -0,0 +1,902 @@
+"""Database command budgets of every hook and page of the plugin.
+
+Pages are called directly within a request context, with INGInious's
+`WebAppSubmissionManager` and the plugin sharing a `CountingDatabase`.
+Templates are not rendered."""
+
+import copy
+import io
+from pathlib import Path
+from typing import Any, Dict, List
+from unittest.mock import MagicMock, Mock
+
+import pytest
+from bson import ObjectId
+from flask import Flask
+from inginious.common.base import write_json_or_yaml
+from inginious.frontend.course_factory import CourseFactory
+from inginious.frontend.submission_manager import WebAppSubmissionManager
+from inginious.frontend.template_helper import TemplateHelper
+from inginious.frontend.user_manager import UserManager
+from pymongo import ASCENDING
+
+import inginious_coding_style
+from inginious_coding_style import (TEMPLATES_PATH, analysis,
+                                    course_admin_menu, exceptions,
+                                    submission_admin_menu,
+                                    submission_query_button,
+                                    submission_query_cell,
+                                    submission_query_header,
+                                    task_list_bar_label, task_list_item,
+                                    task_menu)
+from inginious_coding_style.config import (AnalysisSettings, CacheSettings,
+                                           PluginConfig, ProfilingSettings,
+                                           get_config)
+from inginious_coding_style.courses import on_task_editor_submit
+from inginious_coding_style.database import (GRADES_PROJECTION, VERSION_FIELD,
+                                             WRITE_ID_FIELD)
+from inginious_coding_style.pages import (BulkGradingEndpoint, CodeMetricsPage,
+                                          CodingStyleGradingPage,
+                                          FixConfigPermissionsEndpoint,
+                                          GradeExportEndpoint,
+                                          GradeImportEndpoint,
+                                          GradingQueuePage,
+                                          GradingStatusEndpoint,
+                                          MetricsEndpoint, NewCategoryEndpoint,
+                                          PluginSettingsPage,
+                                          ProfileDownloadEndpoint,
+                                          ProfilesPage,
+                                          StudentSubmissionCodingStylePage,
+                                          SubmissionAnalysisEndpoint,
+                                          SubmissionClustersPage,
+                                          SubmissionStatusDiagnoser,
+                                          TaskListBarsEndpoint)
+from inginious_coding_style.pages.base import BasePluginPage
+from inginious_coding_style.profiling import ProfileInfo, init_profiler
+from inginious_coding_style.users import init_realname_cache
+
+from .db_budget import BudgetExceeded, CountingDatabase, db_budget
+
+N_TASKS = 50
+N_SUBMISSIONS = 100
+
+
+@pytest.fixture
+def mongo() -> MagicMock:
+    """The database behind the `CountingDatabase`. Return values of
+    collection operations are set by each test."""
+    mongo = MagicMock()
+    mongo.__getitem__.side_effect = lambda name: getattr(mongo, name)
+    for name in [
+        "submissions",
+        "user_tasks",
+        "users",
+        "coding_style_analysis",
+        "coding_style_code_metrics",
+        "coding_style_signatures",
+    ]:
+        getattr(mongo, name).name = name
+    mongo.users.find.return_value = []
+    mongo.user_tasks.find.return_value = []
+    mongo.submissions.find.return_value = []
+    # Every write matches its document
+    mongo.submissions.bulk_write.side_effect = lambda ops, ordered: Mock(
+        matched_count=len(ops)
+    )
+    return mongo
+
+
+@pytest.fixture
+def database(mongo: MagicMock) -> CountingDatabase:
+    return CountingDatabase(mongo)
+
+
+@pytest.fixture
+def config() -> PluginConfig:
+    config = get_config({"weighted_mean": {"enabled": False, "weighting": 0.25}})
+    inginious_coding_style.PLUGIN_CONFIG = config
+    return config
+
+
+@pytest.fixture(autouse=True)
+def no_rendering(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(BasePluginPage, "render", lambda self, path, **kwargs: path)
+    monkeypatch.setattr(
+        inginious_coding_style, "render", lambda helper, path, **kwargs: path
+    )
+
+
+@pytest.fixture(autouse=True)
+def realname_cache():
+    """Realnames are looked up once per page, unless cached."""
+    init_realname_cache(CacheSettings(realnames_ttl=0))
+    yield
+    init_realname_cache(CacheSettings(realnames_size=0, realnames_ttl=0))
+
+
+@pytest.fixture
+def user_manager(database: CountingDatabase) -> Mock:
+    user_manager = Mock(spec=UserManager)
+    # Like `UserManager.get_users_info()`, users are fetched with a single query
+    user_manager.get_users_info.side_effect = lambda usernames: {
+        **dict.fromkeys(usernames),
+        **{
+            user["username"]: Mock(realname=user["realname"])
+            for user in database.users.find({"username": {"$in": usernames}})
+        },
+    }
+    user_manager.session_logged_in.return_value = True
+    user_manager.session_username.return_value = "tutor"
+    user_manager.has_staff_rights_on_course.return_value = True
+    user_manager.has_admin_rights_on_course.return_value = True
+    user_manager.user_is_superadmin.return_value = True
+    return user_manager
+
+
+@pytest.fixture
+def app(
+    database: CountingDatabase, user_manager: Mock, monkeypatch: pytest.MonkeyPatch
+):
+    # Pages register their exception handlers with this app
+    monkeypatch.setattr(exceptions, "TEMPLATE_HELPER", None)
+    app = Flask(__name__)
+    app.secret_key = "test"
+    app.database = database
+    app.user_manager = user_manager
+    app.submission_manager = WebAppSubmissionManager(
+        None, user_manager, database, None, None, None
+    )
+    app.course_factory = Mock(spec=CourseFactory)
+    app.template_helper = Mock(spec=TemplateHelper)
+    with app.app_context():
+        yield app
+
+
+def call(
+    app: Flask,
+    config: PluginConfig,
+    page_cls: Any,
+    method: str,
+    *args: Any,
+    path: str = "/",
+    **request_kwargs: Any,
+) -> Any:
+    """Calls the handler of a page for a request, as INGInious does after
+    authenticating the user."""
+    http_method = method.upper()
+    with app.test_request_context(path, method=http_method, **request_kwargs):
+        page = page_cls(config, TEMPLATES_PATH)
+        if method.islower():  # `flask.views.MethodView` methods
+            handler = getattr(page, method)
+        else:
+            handler = getattr(page, f"{method}_AUTH")
+        response = handler(*args)
+        # Streamed responses query the database while being sent
+        if hasattr(response, "response") and not isinstance(response.response, list):
+            b"".join(response.response)
+        return response
+
+
+def make_submissions(doc: Dict[str, Any], n: int) -> List[Dict[str, Any]]:
+    docs = []
+    for i in range(n):
+        d = copy.deepcopy(doc)
+        d["_id"] = ObjectId()
+        d["username"] = [f"student{i}"]
+        docs.append(d)
+    return docs
+
+
+def make_user_tasks(submissions: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return [
+        {
+            "_id": ObjectId(),
+            "courseid": s["courseid"],
+            "taskid": s["taskid"],
+            "username": s["username"][0],
+            "submissionid": s["_id"],
+            "tried": 1,
+            "grade": s["grade"],
+            "grade_base": s["grade"],
+            "grade_mean": s["grade"],
+        }
+        for s in submissions
+    ]
+
+
+def grading_form(config: PluginConfig) -> Dict[str, str]:
+    form = {}
+    for category in config.enabled.values():
+        form[f"{category.id}_grade"] = "80"
+        form[f"{category.id}_feedback"] = "Good."
+    return form
+
+
+def test_budget_exceeded(database: CountingDatabase):
+    with pytest.raises(BudgetExceeded, match="submissions.find_one from"):
+        with db_budget(database, reads=1):
+            database.submissions.find_one({})
+            database["submissions"].find_one({})
+    with db_budget(database, total=1, writes=0) as log:
+        database.submissions.find({})
+    assert log.count("submissions", "find") == 1
+
+
+#############################
+#                           #
+#           HOOKS           #
+#                           #
+#############################
+
+
+@pytest.fixture
+def tasks(database: CountingDatabase, user_manager: Mock) -> List[Mock]:
+    plugin_manager = Mock()
+    plugin_manager.get_database.return_value = database
+    plugin_manager.get_user_manager.return_value = user_manager
+    tasks = []
+    for t in range(N_TASKS):
+        task = Mock()
+        task._plugin_manager = plugin_manager
+        task.get_id.return_value = f"task{t}"
+        task.get_course_id.return_value = "mycourse"
+        tasks.append(task)
+    return tasks
+
+
+def test_task_list_budget(
+    database, mongo, config, tasks, course, template_helper, submission_grades
+):
+    mongo.submissions.find_one.return_value = submission_grades
+    # One query for the best submission of each task
+    with db_budget(database, reads=N_TASKS, writes=0):
+        for task in tasks:
+            task_list_item(course, task, None, template_helper)
+    with db_budget(database, reads=N_TASKS, writes=0):
+        for task in tasks:
+            task_menu(course, task, template_helper)
+
+
+def test_task_list_logged_out_budget(
+    database, config, tasks, user_manager, course, template_helper
+):
+    user_manager.session_logged_in.return_value = False
+    with db_budget(database, total=0):
+        for task in tasks:
+            task_list_item(course, task, None, template_helper)
+            task_menu(course, task, template_helper)
+
+
+def test_lazy_task_list_budget(
+    app, database, config, tasks, course, template_helper, monkeypatch
+):
+    config.task_list_bars.lazy = True
+    rendered = []
+    monkeypatch.setattr(
+        inginious_coding_style,
+        "render",
+        lambda helper, path, **kwargs: rendered.append(kwargs["load"]) or path,
+    )
+    # Placeholders are rendered without querying the database
+    with app.test_request_context("/course/mycourse"):
+        with db_budget(database, total=0):
+            for task in tasks:
+                task_list_item(course, task, None, template_helper)
+    # Only the first placeholder loads the bars
+    assert rendered == [True] + [False] * (N_TASKS - 1)
+
+
+def test_static_hooks_budget(
+    database, config, course, task, template_helper, submission_grades
+):
+    with db_budget(database, total=0):
+        submission_admin_menu(course, task, submission_grades, template_helper)
+        submission_query_header(course, template_helper)
+        submission_query_cell(course, submission_grades, template_helper)
+        submission_query_button(course, submission_grades, template_helper)
+        task_list_bar_label(course, template_helper)
+        course_admin_menu(course)
+        on_task_editor_submit(course, "mytask")
+
+
+#############################
+#                           #
+#           PAGES           #
+#                           #
+#############################
+
+
+def test_grading_page_get_budget(app, database, mongo, config, submission_grades):
+    mongo.submissions.find_one.return_value = submission_grades
+    submissionid = str(submission_grades["_id"])
+    # Submission and realnames of its authors and graders
+    with db_budget(database, reads=2, writes=0):
+        call(app, config, CodingStyleGradingPage, "GET", submissionid)
+    # Next submission in the queue, and number of ungraded submissions
+    mongo.user_tasks.find.return_value = make_user_tasks(
+        make_submissions(submission_grades, N_SUBMISSIONS)
+    )
+    with db_budget(database, reads=6, writes=0):
+        call(
+            app,
+            config,
+            CodingStyleGradingPage,
+            "GET",
+            submissionid,
+            path="/?queue=1",
+        )
+
+
+def test_grading_page_post_budget(app, database, mongo, config, submission_grades):
+    mongo.submissions.find_one.return_value = submission_grades
+    submissionid = str(submission_grades["_id"])
+    # Submission, then `user_tasks` and `submissions` writes
+    with db_budget(database, reads=1, writes=2):
+        response = call(
+            app,
+            config,
+            CodingStyleGradingPage,
+            "POST",
+            submissionid,
+            data=grading_form(config),
+        )
+    assert "success=1" in response.location
+    # Claiming the next submission in the queue
+    mongo.user_tasks.find.return_value = make_user_tasks(
+        make_submissions(submission_grades, N_SUBMISSIONS)
+    )
+    with db_budget(database, reads=2, writes=3):
+        call(
+            app,
+            config,
+            CodingStyleGradingPage,
+            "POST",
+            submissionid,
+            path="/?queue=1",
+            data=grading_form(config),
+        )
+
+
+def test_grading_page_htmx_post_budget(
+    app, database, mongo, config, submission_grades
+):
+    mongo.submissions.find_one.return_value = submission_grades
+    # Submission, writes, then realnames for the updated grading form.
+    # The page is not reloaded.
+    with db_budget(database, reads=2, writes=2):
+        response = call(
+            app,
+            config,
+            CodingStyleGradingPage,
+            "POST",
+            str(submission_grades["_id"]),
+            data=grading_form(config),
+            headers={"HX-Request": "true"},
+        )
+    assert response == "grading_update.html"
+
+
+def test_grading_page_conflict_budget(
+    app, database, mongo, config, submission_grades
+):
+    mongo.submissions.find_one.return_value = submission_grades
+    # The grades were written by someone else after version 2
+    mongo.submissions.update_one.return_value.matched_count = 0
+    form = {**grading_form(config), "version": "2"}
+    # Submission, failed conditional write, then the current submission
+    # and realnames for the merge view. `user_tasks` is not written.
+    with db_budget(database, reads=3, writes=1) as log:
+        response = call(
+            app,
+            config,
+            CodingStyleGradingPage,
+            "POST",
+            str(submission_grades["_id"]),
+            data=form,
+            headers={"HX-Request": "true"},
+        )
+    assert response == "grading_update.html"
+    assert log.count("user_tasks", "find_one_and_update") == 0
+    (query, _), _ = mongo.submissions.update_one.call_args
+    assert query == {"_id": submission_grades["_id"], VERSION_FIELD: 2}
+    # Without htmx, the merge view is rendered as a full page
+    response = call(
+        app,
+        config,
+        CodingStyleGradingPage,
+        "POST",
+        str(submission_grades["_id"]),
+        data=form,
+    )
+    assert response == ("grade_submission.html", 409)
+
+
+def test_grading_page_patch_category_conflict_budget(
+    app, database, mongo, config, submission_grades
+):
+    mongo.submissions.find_one.return_value = submission_grades
+    mongo.submissions.update_one.return_value.matched_count = 0
+    with db_budget(database, reads=3, writes=1) as log:
+        response = call(
+            app,
+            config,
+            CodingStyleGradingPage,
+            "patch",
+            str(submission_grades["_id"]),
+            path="/?category=comments",
+            data={"comments_grade": "50"},
+        )
+    assert response == "grading_category_update.html"
+    assert log.count("user_tasks", "update_one") == 0
+    # Submissions graded before versioning are at version 0
+    (query, _), _ = mongo.submissions.update_one.call_args
+    assert query == {"_id": submission_grades["_id"], VERSION_FIELD: None}
+
+
+def test_submission_analysis_budget(
+    app, database, mongo, config, submission_grades, monkeypatch
+):
+    analyzer = analysis.init_analyzer(AnalysisSettings(enabled=True))
+    sources = [analysis.SourceFile(f"file{i}.py", f"x = {i}\n") for i in range(10)]
+    page_module = "inginious_coding_style.pages.analysis"
+    monkeypatch.setattr(f"{page_module}.get_submission_input", lambda *args: {})
+    monkeypatch.setattr(f"{page_module}.get_sources", lambda *args: sources)
+    monkeypatch.setattr(analyzer, "_submit", Mock())
+    mongo.submissions.find_one.return_value = submission_grades
+    mongo.coding_style_analysis.find.return_value = [
+        {"_id": key, "findings": []} for _, _, key in analyzer._jobs(sources)
+    ]
+    # Submission, then cached results of all files (input is read from GridFS)
+    with db_budget(database, reads=2, writes=0):
+        response = call(
+            app, config, SubmissionAnalysisEndpoint, "GET", str(submission_grades["_id"])
+        )
+    assert response == "grading_analysis.html"
+    analyzer._submit.assert_not_called()
+    analysis.init_analyzer(AnalysisSettings())
+
+
+def test_code_metrics_budget(
+    app, database, mongo, config, submission_nogrades, monkeypatch
+):
+    submissions = make_submissions(submission_nogrades, N_SUBMISSIONS)
+    mongo.user_tasks.find.return_value = [
+        {"submissionid": s["_id"]} for s in submissions
+    ]
+    mongo.submissions.find.side_effect = lambda query, projection: [
+        s for s in submissions if s["_id"] in query["_id"]["$in"]
+    ]
+    mongo.coding_style_code_metrics.find.return_value = []
+    inputdata = {"main": {"filename": "main.py", "value": "x = 1"}}
+    monkeypatch.setattr(
+        "inginious_coding_style.code_metrics.get_submission_input",
+        lambda submission_manager, input_: inputdata,
+    )
+    task = Mock()
+    task.get_problems.return_value = []
+    page_module = "inginious_coding_style.pages.code_metrics"
+    monkeypatch.setattr(f"{page_module}.get_course", Mock())
+    monkeypatch.setattr(f"{page_module}.get_task", Mock(return_value=task))
+    config.code_metrics.batch_size = 50
+    config.code_metrics.page_size = 20
+    # User tasks and stored submission metrics, then submissions, cached
+    # metrics and writes of new metrics per batch of submissions that are not
+    # stored yet (submission input is read from GridFS), then a page of sorted
+    # metrics and the grading status of its submissions
+    with db_budget(database, reads=8, writes=4) as log:
+        response = call(
+            app,
+            config,
+            CodeMetricsPage,
+            "GET",
+            "mycourse",
+            "mytask",
+            path="/?sort=comment_density&order=asc&page=2",
+        )
+    assert response == "code_metrics.html"
+    assert log.count("submissions", "find") == 3
+    # Sorted and paginated in the database
+    ((pipeline,), _) = mongo.coding_style_submission_metrics.aggregate.call_args
+    assert pipeline[-3]["$sort"]["comment_density"] == ASCENDING
+    assert pipeline[-2:] == [{"$skip": 20}, {"$limit": 20}]
+
+
+@pytest.fixture
+def clusters_page(mongo, submission_nogrades, monkeypatch) -> List[Dict[str, Any]]:
+    submissions = make_submissions(submission_nogrades, N_SUBMISSIONS)
+    mongo.user_tasks.find.return_value = [
+        {"submissionid": s["_id"]} for s in submissions
+    ]
+    mongo.submissions.find.side_effect = lambda query, projection=None: [
+        s for s in submissions if s["_id"] in query["_id"]["$in"]
+    ]
+    mongo.coding_style_signatures.find.return_value = []
+    inputdata = {"main": {"filename": "main.py", "value": "x = 1"}}
+    monkeypatch.setattr(
+        "inginious_coding_style.clustering.get_submission_input",
+        lambda submission_manager, input_: inputdata,
+    )
+    task = Mock()
+    task.get_id.return_value = "mytask"
+    task.get_problems.return_value = []
+    page_module = "inginious_coding_style.pages.clusters"
+    course = Mock()
+    course.get_id.return_value = "mycourse"
+    monkeypatch.setattr(f"{page_module}.get_course", Mock(return_value=course))
+    monkeypatch.setattr(f"{page_module}.get_task", Mock(return_value=task))
+    return submissions
+
+
+def test_clusters_page_budget(app, database, config, clusters_page):
+    config.clustering.batch_size = 50
+    # User tasks, then submissions, stored signatures and a write of new
+    # signatures per batch (submission input is read from GridFS)
+    with db_budget(database, reads=5, writes=2) as log:
+        response = call(app, config, SubmissionClustersPage, "GET", "mycourse", "mytask")
+    assert response == "submission_clusters.html"
+    assert log.count("submissions", "find") == 2
+
+
+def test_clusters_page_post_budget(app, database, mongo, config, clusters_page):
+    form = {
+        "submissions": [str(s["_id"]) for s in clusters_page],
+        "comments_grade": "80",
+        f"{clusters_page[0]['_id']}:comments_grade": "20",
+        # The page was rendered after the first submission was graded twice
+        f"{clusters_page[0]['_id']}:version": "2",
+    }
+    mongo.coding_style_signatures.find.return_value = [
+        {"_id": s["_id"], "signature": [0] * 64} for s in clusters_page
+    ]
+    # Submissions, then a single bulk write of all grades (and user tasks),
+    # then the clusters of the task for the updated page
+    with db_budget(database, reads=4, writes=2) as log:
+        response = call(
+            app,
+            config,
+            SubmissionClustersPage,
+            "POST",
+            "mycourse",
+            "mytask",
+            data=form,
+        )
+    assert response == "submission_clusters.html"
+    assert log.count("submissions", "bulk_write") == 1
+    ((ops,), _) = mongo.submissions.bulk_write.call_args
+    assert len(ops) == N_SUBMISSIONS
+    grades = [op._doc["$set"]["custom.coding_style_grades"] for op in ops]
+    assert grades[0]["comments"]["grade"] == 20
+    assert grades[1]["comments"]["grade"] == 80
+    # Each write is conditional on the version the page was rendered with
+    assert ops[0]._filter == {"_id": clusters_page[0]["_id"], VERSION_FIELD: 2}
+    assert ops[1]._filter == {"_id": clusters_page[1]["_id"], VERSION_FIELD: None}
+
+
+def test_grading_page_patch_budget(app, database, mongo, config, submission_grades):
+    mongo.submissions.find_one.return_value = submission_grades
+    # Submission, writes, then realnames for the updated grading form
+    with db_budget(database, reads=2, writes=2):
+        response = call(
+            app,
+            config,
+            CodingStyleGradingPage,
+            "patch",
+            str(submission_grades["_id"]),
+            path="/?remove=comments",
+        )
+    assert response == "grading_update.html"
+
+
+def test_grading_page_patch_category_budget(
+    app, database, mongo, config, submission_grades
+):
+    mongo.submissions.find_one.return_value = submission_grades
+    # Submission, targeted writes, then realnames for the updated category
+    with db_budget(database, reads=2, writes=2):
+        response = call(
+            app,
+            config,
+            CodingStyleGradingPage,
+            "patch",
+            str(submission_grades["_id"]),
+            path="/?category=comments",
+            data={"comments_feedback": "Nice comments."},
+        )
+    assert response == "grading_category_update.html"
+    # Only the category is written to the submission
+    (_, update), _ = mongo.submissions.update_one.call_args
+    assert set(update["$set"]) == {
+        "custom.coding_style_grades.comments",
+        "coding_style_graded",
+        "coding_style_mean",
+        "coding_style_graded_at",
+    }
+    assert update["$set"]["custom.coding_style_grades.comments"]["feedback"] == (
+        "Nice comments."
+    )
+    assert update["$addToSet"] == {"custom.graded_by": "tutor"}
+    # The base grade of the user task is left as is
+    (_, user_task_update), _ = mongo.user_tasks.update_one.call_args
+    assert set(user_task_update["$set"]) == {"grade_mean"}
+
+
+def test_grading_page_delete_budget(app, database, mongo, config, submission_grades):
+    mongo.submissions.find_one.return_value = submission_grades
+    with db_budget(database, reads=2, writes=2):
+        response = call(
+            app,
+            config,
+            CodingStyleGradingPage,
+            "delete",
+            str(submission_grades["_id"]),
+        )
+    assert response == "grading_update.html"
+
+
+def test_bulk_grading_budget(app, database, mongo, config, submission_nogrades):
+    docs = make_submissions(submission_nogrades, N_SUBMISSIONS)
+    mongo.submissions.find.return_value = docs
+    body = {
+        "submissions": [
+            {"submissionid": str(d["_id"]), "grades": {"comments": {"grade": 80}}}
+            for d in docs
+        ]
+    }
+    # Independent of the number of submissions
+    with db_budget(database, reads=1, writes=2):
+        response = call(app, config, BulkGradingEndpoint, "POST", json=body)
+    assert response.json["updated"] == N_SUBMISSIONS
+    # Only the grades of the submissions are read and written
+    ((_, projection), _) = mongo.submissions.find.call_args
+    assert projection == GRADES_PROJECTION
+    ((ops,), _) = mongo.submissions.bulk_write.call_args
+    assert "custom.coding_style_grades" in ops[0]._doc["$set"]
+    assert "input" not in ops[0]._doc["$set"]
+
+
+def test_bulk_grading_invalid_items(
+    app, database, mongo, config, submission_nogrades
+):
+    doc = make_submissions(submission_nogrades, 1)[0]
+    mongo.submissions.find.return_value = [doc]
+    body = {
+        "submissions": [
+            {"submissionid": str(doc["_id"]), "grades": {"comments": {"grade": 80}}},
+            {"submissionid": str(doc["_id"]), "grades": {"comments": 80}},
+            {"submissionid": str(doc["_id"]), "grades": {"comments": [1]}},
+            {"submissionid": str(doc["_id"]), "grades": [1]},
+            "not an object",
+        ]
+    }
+    response = call(app, config, BulkGradingEndpoint, "POST", json=body)
+    # Malformed items only fail themselves
+    assert response.json["updated"] == 1
+    errors = [r.get("error") for r in response.json["results"]]
+    assert errors[0] is None
+    assert errors[1] == "Grades of category 'comments' must be a JSON object."
+    assert errors[2] == "Grades of category 'comments' must be a JSON object."
+    assert errors[3] == "'grades' must be a JSON object."
+    assert errors[4] == "Submission must be a JSON object."
+
+
+def test_bulk_grading_conflict(app, database, mongo, config, submission_nogrades):
+    docs = make_submissions(submission_nogrades, 2)
+
+    def find(query, projection):
+        if projection == GRADES_PROJECTION:
+            return docs
+        # Write IDs read back after the write. The first submission was
+        # graded by someone else before it was written.
+        ((ops,), _) = mongo.submissions.bulk_write.call_args
+        write_id = ops[1]._doc["$set"][WRITE_ID_FIELD]
+        return [
+            {"_id": docs[0]["_id"]},
+            {"_id": docs[1]["_id"], WRITE_ID_FIELD: write_id},
+        ]
+
+    mongo.submissions.find.side_effect = find
+    mongo.submissions.bulk_write.side_effect = lambda ops, ordered: Mock(
+        matched_count=1
+    )
+    body = {
+        "submissions": [
+            {"submissionid": str(d["_id"]), "grades": {"comments": {"grade": 80}}}
+            for d in docs
+        ]
+    }
+    with db_budget(database, reads=2, writes=2):
+        response = call(app, config, BulkGradingEndpoint, "POST", json=body)
+    assert response.json["updated"] == 1
+    errors = [r.get("error") for r in response.json["results"]]
+    assert errors == [
+        "The grades of this submission were modified by someone else.",
+        None,
+    ]
+    # Only the written submission's grading status is updated
+    ((ops,), _) = mongo.user_tasks.bulk_write.call_args
+    assert [op._filter for op in ops] == [{"submissionid": docs[1]["_id"]}]
+
+
+def test_grading_queue_budget(app, database, mongo, config, submission_nogrades):
+    mongo.user_tasks.find.return_value = make_user_tasks(
+        make_submissions(submission_nogrades, N_SUBMISSIONS)
+    )
+    with db_budget(database, reads=1, writes=1):
+        call(app, config, GradingQueuePage, "GET", "mycourse", "mytask")
+
+
+def test_task_list_bars_budget(
+    app, database, mongo, config, user_manager, submission_grades
+):
+    user_manager.session_username.return_value = "testuser"
+    mongo.submissions.aggregate.return_value = [
+        {"_id": f"task{t}", "submission": submission_grades} for t in range(N_TASKS)
+    ]
+    # One query for the bars of every task in the course
+    with db_budget(database, reads=1, writes=0):
+        call(app, config, TaskListBarsEndpoint, "GET", "mycourse")
+
+
+def test_student_page_budget(
+    app, database, mongo, config, user_manager, submission_grades
+):
+    user_manager.session_username.return_value = "testuser"
+    mongo.submissions.find_one.return_value = submission_grades
+    with db_budget(database, reads=2, writes=0):
+        call(
+            app,
+            config,
+            StudentSubmissionCodingStylePage,
+            "GET",
+            str(submission_grades["_id"]),
+        )
+
+
+@pytest.fixture
+def config_file(tmp_path: Path) -> Path:
+    path = tmp_path / "configuration.yaml"
+    write_json_or_yaml(
+        str(path),
+        {
+            "plugins": [
+                {
+                    "plugin_module": "inginious_coding_style",
+                    "weighted_mean": {"enabled": False, "weighting": 0.25},
+                }
+            ]
+        },
+    )
+    return path
+
+
+def test_plugin_settings_budget(
+    app, database, mongo, config, config_file, submission_grades
+):
+    submissions = make_submissions(submission_grades, N_SUBMISSIONS)
+    mongo.user_tasks.find.return_value = make_user_tasks(submissions)
+    mongo.submissions.find_one.return_value = submission_grades
+
+    with db_budget(database, total=0):
+        call(app, config, PluginSettingsPage, "GET", "mycourse")
+
+    form = {
+        "config_path": str(config_file),
+        "weighting": "0.5",  # recalculates weighted mean grades
+        "weighted_mean": "on",  # swaps active grades
+        "submissionquery_header": "CSG",
+        "submissionquery_priority": "3000",
+    }
+    for category in config.enabled.values():
+        form[f"category_name_{category.id}"] = category.name
+        form[f"category_description_{category.id}"] = category.description
+    # Recalculating fetches the submission of each user task
+    with db_budget(
+        database, reads=2 + N_SUBMISSIONS, writes=2 * N_SUBMISSIONS
+    ) as log:
+        call(app, config, PluginSettingsPage, "POST", "mycourse", data=form)
+    assert log.count("user_tasks", "find") == 2
+
+
+def test_plugin_settings_patch_budget(
+    app, database, mongo, config, submission_grades
+):
+    submissions = make_submissions(submission_grades, N_SUBMISSIONS)
+    mongo.user_tasks.find.return_value = make_user_tasks(submissions)
+    mongo.submissions.find.return_value = submissions
+    mongo.submissions.find_one.return_value = submission_grades
+
+    with db_budget(database, reads=1 + N_SUBMISSIONS, writes=N_SUBMISSIONS):
+        call(
+            app,
+            config,
+            PluginSettingsPage,
+            "patch",
+            "mycourse",
+            path="/?recalculate=1",
+        )
+    # Active grades of user tasks, and grading status of submissions
+    with db_budget(database, reads=2, writes=2 * N_SUBMISSIONS):
+        call(app, config, PluginSettingsPage, "patch", "mycourse", path="/?repair=1")
+
+
+def test_diagnoser_budget(app, database, mongo, config, submission_grades):
+    mongo.user_tasks.find.return_value = make_user_tasks(
+        make_submissions(submission_grades, N_SUBMISSIONS)
+    )
+    with db_budget(database, reads=1, writes=0):
+        call(app, config, SubmissionStatusDiagnoser, "GET", "mycourse")
+
+
+def test_grading_status_budget(app, database, mongo, config):
+    mongo.user_tasks.aggregate.return_value = [
+        {"_id": f"task{t}", "graded": 1, "total": 2} for t in range(N_TASKS)
+    ]
+    # Independent of the number of tasks
+    with db_budget(database, reads=1, writes=0):
+        call(app, config, GradingStatusEndpoint, "GET", "mycourse")
+
+
+def test_grade_export_budget(app, database, mongo, config):
+    with db_budget(database, reads=1, writes=0):
+        call(app, config, GradeExportEndpoint, "GET", "mycourse", path="/?format=csv")
+
+
+def test_grade_import_budget(app, database, mongo, config, submission_nogrades):
+    submissions = make_submissions(submission_nogrades, N_SUBMISSIONS)
+    mongo.user_tasks.find.return_value = make_user_tasks(submissions)
+    mongo.submissions.find.return_value = submissions
+    rows = ["submissionid,username,taskid,category,grade,feedback"]
+    rows += [f",student{i},mytask,comments,80,Good." for i in range(N_SUBMISSIONS)]
+    file = (io.BytesIO("\n".join(rows).encode()), "grades.csv")
+    # Resolving best submissions, fetching them, and two bulk writes per batch
+    with db_budget(database, reads=2, writes=2):
+        call(
+            app,
+            config,
+            GradeImportEndpoint,
+            "POST",
+            "mycourse",
+            data={"file": file},
+            content_type="multipart/form-data",
+        )
+
+
+def test_settings_endpoints_budget(app, database, config, tmp_path):
+    config_path = tmp_path / "configuration.yaml"
+    config_path.touch()
+    with db_budget(database, total=0):
+        call(app, config, NewCategoryEndpoint, "GET", "mycourse")
+        call(
+            app,
+            config,
+            FixConfigPermissionsEndpoint,
+            "POST",
+            "mycourse",
+            data={"config_path": str(config_path)},
+        )
+
+
+def test_admin_pages_budget(app, database, config, tmp_path):
+    profiler = init_profiler(ProfilingSettings(directory=tmp_path))
+    info = ProfileInfo(
+        name="20260101T000000000000-PluginSettingsPage-sampling",
+        endpoint="PluginSettingsPage",
+        mode="sampling",
+        url="/",
+        created="",
+        duration=0.0,
+    )
+    profiler.store.save(info, b"a;b 1")
+    with db_budget(database, total=0):
+        with app.test_request_context("/"):
+            MetricsEndpoint(config, TEMPLATES_PATH).GET()
+        call(app, config, ProfilesPage, "GET")
+        call(
+            app,
+            config,
+            ProfilesPage,
+            "POST",
+            data={"endpoint": "PluginSettingsPage", "mode": "sampling"},
+        )
+        call(app, config, ProfileDownloadEndpoint, "GET", info.name)
+    init_profiler(ProfilingSettings())
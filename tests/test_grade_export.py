@@ -0,0 +1,75 @@
+import csv
+import io
+import json
+from unittest.mock import MagicMock
+
+import pytest
+
+from inginious_coding_style.config import PluginConfig
+from inginious_coding_style.grade_export import GradeExporter
+
+
+@pytest.fixture
+def export_database(submission_grades: dict, submission_nogrades: dict):
+    graded = {
+        **submission_grades,
+        "custom": {**submission_grades["custom"], "graded_by": ["tutor"]},
+    }
+    database = MagicMock()
+    database.user_tasks.aggregate.return_value = [
+        {
+            "username": "testuser",
+            "taskid": "mytask",
+            "submissionid": graded["_id"],
+            "submission": graded,
+        },
+        {
+            "username": "otheruser",
+            "taskid": "mytask",
+            "submissionid": submission_nogrades["_id"],
+            "submission": {**submission_nogrades, "grade": 50.0},
+        },
+    ]
+    yield database
+
+
+def test_export_csv(export_database: MagicMock, config_pydantic_full: PluginConfig):
+    exporter = GradeExporter(
+        export_database, config_pydantic_full, "mycourse", batch_size=1
+    )
+    chunks = list(exporter.stream("csv"))
+    # header + one chunk per batch
+    assert len(chunks) == 3
+    rows = list(csv.DictReader(io.StringIO("".join(chunks))))
+    assert rows[0]["username"] == "testuser"
+    assert rows[0]["style_mean"] == "25.0"
+    assert rows[0]["comments"] == "10"
+    assert rows[0]["graded_by"] == "tutor"
+    assert rows[1]["style_mean"] == ""
+    assert rows[1]["weighted_mean"] == "50.0"
+    assert rows[1]["comments"] == ""
+    # Single cursor for the whole export
+    export_database.user_tasks.aggregate.assert_called_once()
+    export_database.submissions.find.assert_not_called()
+
+
+def test_export_jsonl(export_database: MagicMock, config_pydantic_full: PluginConfig):
+    exporter = GradeExporter(export_database, config_pydantic_full, "mycourse")
+    output = "".join(exporter.stream("jsonl"))
+    rows = [json.loads(line) for line in output.splitlines()]
+    assert len(rows) == 2
+    assert rows[0]["grades"] == {
+        "comments": 10,
+        "modularity": 20,
+        "structure": 30,
+        "idiomaticity": 40,
+    }
+    assert rows[1]["grades"] == {}
+
+
+def test_export_invalid_format(
+    export_database: MagicMock, config_pydantic_full: PluginConfig
+):
+    exporter = GradeExporter(export_database, config_pydantic_full, "mycourse")
+    with pytest.raises(ValueError):
+        list(exporter.stream("xml"))
@@ -0,0 +1,199 @@
+import copy
+import io
+from unittest.mock import MagicMock
+
+from bson import ObjectId
+from pymongo.errors import BulkWriteError
+
+from inginious_coding_style.config import PluginConfig
+from inginious_coding_style.database import versioned_filter
+from inginious_coding_style.grade_import import (GradeImporter, GradeRow,
+                                                 RowError, get_import_format,
+                                                 read_rows)
+
+
+def test_get_import_format():
+    assert get_import_format("grades.csv") == "csv"
+    assert get_import_format("grades.JSONL") == "jsonl"
+    assert get_import_format("grades.ndjson") == "jsonl"
+    assert get_import_format("grades") == "csv"
+
+
+def test_read_rows_csv():
+    stream = io.StringIO(
+        "submissionid,username,taskid,category,grade,feedback\n"
+        ",student1,helloworld,comments,80,Good\n"
+        "123456789abc123456789abc,,,modularity,,\n"
+        ",student2,,comments,50,\n"
+    )
+    rows = list(read_rows(stream, "csv"))
+    assert isinstance(rows[0], GradeRow)
+    assert rows[0].line == 2
+    assert rows[0].username == "student1"
+    assert rows[0].submissionid is None
+    assert rows[0].grade == 80
+    assert isinstance(rows[1], GradeRow)
+    assert rows[1].grade is None
+    assert rows[1].feedback is None
+    # Missing task ID
+    assert isinstance(rows[2], RowError)
+    assert rows[2].line == 4
+
+
+def test_read_rows_jsonl():
+    stream = io.StringIO(
+        '{"username": "student1", "taskid": "helloworld", "category": "comments", "grade": 80}\n'
+        "\n"
+        "not json\n"
+        '["a list"]\n'
+        '{"submissionid": "123456789abc123456789abc", "category": "comments", "grade": "a"}\n'
+    )
+    rows = list(read_rows(stream, "jsonl"))
+    assert len(rows) == 4
+    assert isinstance(rows[0], GradeRow)
+    assert all(isinstance(row, RowError) for row in rows[1:])
+    assert [row.line for row in rows] == [1, 3, 4, 5]
+
+
+def test_grade_importer_dry_run(
+    submission_nogrades: dict, config_pydantic_full: PluginConfig
+):
+    database = MagicMock()
+    database.user_tasks.find.return_value = [
+        {
+            "username": "testuser",
+            "taskid": "mytask",
+            "submissionid": submission_nogrades["_id"],
+        }
+    ]
+    database.submissions.find.return_value = [submission_nogrades]
+    stream = io.StringIO(
+        "submissionid,username,taskid,category,grade,feedback\n"
+        ",testuser,mytask,comments,80,Good\n"
+        ",testuser,mytask,modularity,60,\n"
+        ",testuser,mytask,notacategory,60,\n"
+        ",testuser,othertask,comments,60,\n"
+        ",testuser,mytask,comments,101,\n"
+    )
+    importer = GradeImporter(
+        database, config_pydantic_full, "mycourse", grader="tutor", dry_run=True
+    )
+    report = importer.run(read_rows(stream, "csv"))
+
+    assert report.rows == 5
+    assert report.applied == 2
+    assert report.submissions == 1
+    assert sorted(error.line for error in report.errors) == [4, 5, 6]
+    # Submissions are resolved with a single query per batch
+    database.user_tasks.find.assert_called_once()
+    database.submissions.find.assert_called_once()
+    database.submissions.bulk_write.assert_not_called()
+    database.user_tasks.bulk_write.assert_not_called()
+
+
+def test_grade_importer_writes(
+    submission_nogrades: dict, config_pydantic_full: PluginConfig
+):
+    database = MagicMock()
+    database.submissions.find.return_value = [submission_nogrades]
+    database.submissions.bulk_write.return_value.matched_count = 1
+    rows = [
+        GradeRow(
+            line=1,
+            submissionid=str(submission_nogrades["_id"]),
+            category="comments",
+            grade=80,
+        )
+    ]
+    report = GradeImporter(database, config_pydantic_full, "mycourse").run(rows)
+
+    assert report.n_errors == 0
+    assert report.applied == 1
+    assert report.submissions == 1
+    (ops,), _ = database.submissions.bulk_write.call_args
+    # Grades are only written if they were not modified since they were read
+    assert ops[0]._filter == versioned_filter(submission_nogrades["_id"], 0)
+    update = ops[0]._doc["$set"]
+    assert update["custom.coding_style_grades"]["comments"]["grade"] == 80
+    # Categories that are not imported are not given default grades
+    assert list(update["custom.coding_style_grades"]) == ["comments"]
+    database.user_tasks.bulk_write.assert_called_once()
+
+
+def test_grade_importer_user_tasks_failure(
+    submission_nogrades: dict, config_pydantic_full: PluginConfig
+):
+    database = MagicMock()
+    database.submissions.find.return_value = [submission_nogrades]
+    database.submissions.bulk_write.return_value.matched_count = 1
+    database.user_tasks.bulk_write.side_effect = BulkWriteError(
+        {"writeErrors": [{"index": 0}]}
+    )
+    rows = [
+        GradeRow(
+            line=1,
+            submissionid=str(submission_nogrades["_id"]),
+            category="comments",
+            grade=80,
+        )
+    ]
+    report = GradeImporter(database, config_pydantic_full, "mycourse").run(rows)
+
+    assert report.submissions == 0
+    assert [e.message for e in report.errors] == [
+        f"Failed to update grading status of submission {submission_nogrades['_id']}."
+    ]
+
+
+def test_grade_importer_conflict(
+    submission_nogrades: dict, config_pydantic_full: PluginConfig
+):
+    database = MagicMock()
+    # The submission is still at version 0 after the write
+    database.submissions.find.return_value = [submission_nogrades]
+    database.submissions.bulk_write.return_value.matched_count = 0
+    rows = [
+        GradeRow(
+            line=line,
+            submissionid=str(submission_nogrades["_id"]),
+            category=category,
+            grade=80,
+        )
+        for line, category in [(1, "comments"), (2, "modularity")]
+    ]
+    report = GradeImporter(database, config_pydantic_full, "mycourse").run(rows)
+
+    assert report.applied == 0
+    assert report.submissions == 0
+    # Reported for each row of the submission
+    message = f"Grades of submission {submission_nogrades['_id']} were modified during the import."
+    assert [(e.line, e.message) for e in report.errors] == [(1, message), (2, message)]
+    database.user_tasks.bulk_write.assert_not_called()
+
+
+def test_grade_importer_invalid_stored_grades(
+    submission_nogrades: dict, config_pydantic_full: PluginConfig
+):
+    invalid = copy.deepcopy(submission_nogrades)
+    invalid["_id"] = ObjectId()
+    invalid["custom"]["coding_style_grades"] = {"comments": {"grade": 200}}
+    database = MagicMock()
+    database.submissions.find.return_value = [invalid, submission_nogrades]
+    database.submissions.bulk_write.return_value.matched_count = 1
+    rows = [
+        GradeRow(line=1, submissionid=str(invalid["_id"]), category="comments", grade=80),
+        GradeRow(
+            line=2,
+            submissionid=str(submission_nogrades["_id"]),
+            category="comments",
+            grade=80,
+        ),
+    ]
+    report = GradeImporter(database, config_pydantic_full, "mycourse").run(rows)
+
+    # Other submissions of the batch are still imported
+    assert report.applied == 1
+    assert report.submissions == 1
+    assert [(e.line, e.message) for e in report.errors] == [
+        (1, f"Stored grades of submission {invalid['_id']} are invalid.")
+    ]
@@ -4,7 +4,8 @@ from hypothesis import strategies as st
 from pydantic import ValidationError
 
 from inginious_coding_style.grades import (CodingStyleGrades, GradingCategory,
-                                           get_grades)
+                                           get_grades, merge_category,
+                                           merge_grades, merge_grades_data)
 
 
 def test_get_grades(grades):
@@ -93,3 +94,68 @@ def test_grades_contains(grades_pydantic):
 
     # test invalid type
     assert 2 not in grades_pydantic
+
+
+def test_merge_grades(config_pydantic_full):
+    grades = merge_grades(
+        {
+            "comments": {"grade": "50", "feedback": "Needs more comments."},
+            "disabled_category": {"grade": "10"},
+        },
+        config_pydantic_full,
+    )
+    assert grades["comments"].grade == 50
+    assert grades["comments"].feedback == "Needs more comments."
+    # Categories without grade data get default grades
+    assert grades["modularity"].grade == 100
+    # Disabled categories are ignored
+    assert "disabled_category" not in grades
+    # Only grades and feedback can be set
+    grades = merge_grades(
+        {"comments": {"name": "Renamed", "id": "other", "grade": "10"}},
+        config_pydantic_full,
+    )
+    assert grades["comments"].name == config_pydantic_full.enabled["comments"].name
+    assert grades["comments"].id == "comments"
+    assert len(grades) == len(config_pydantic_full.enabled)
+
+
+def test_merge_grades_data():
+    grades_data = {"comments": {"grade": "50", "feedback": "Ok."}}
+    merged = merge_grades_data(
+        grades_data, {"comments": {"grade": "20"}, "modularity": {"grade": "10"}}
+    )
+    assert merged == {
+        "comments": {"grade": "20", "feedback": "Ok."},
+        "modularity": {"grade": "10"},
+    }
+    assert grades_data["comments"]["grade"] == "50"
+
+
+def test_merge_grades_invalid(config_pydantic_full):
+    with pytest.raises(ValidationError):
+        merge_grades({"comments": {"grade": "101"}}, config_pydantic_full)
+
+
+def test_merge_category(config_pydantic_full, grades_pydantic):
+    # Attributes missing from the grade data are kept from the existing grade
+    grades_pydantic["comments"].grade = 40
+    category = merge_category(
+        "comments", {"feedback": "Better."}, config_pydantic_full, grades_pydantic
+    )
+    assert category.grade == 40
+    assert category.feedback == "Better."
+    assert category.name == config_pydantic_full.enabled["comments"].name
+    # Other attributes cannot be set
+    category = merge_category(
+        "comments", {"grade": "75", "name": "Renamed"}, config_pydantic_full
+    )
+    assert category.grade == 75
+    assert category.name == config_pydantic_full.enabled["comments"].name
+
+
+def test_merge_category_invalid(config_pydantic_full):
+    with pytest.raises(ValidationError):
+        merge_category("comments", {"grade": "101"}, config_pydantic_full)
+    with pytest.raises(KeyError):
+        merge_category("disabled_category", {"grade": "10"}, config_pydantic_full)
@@ -0,0 +1,155 @@
+from datetime import datetime, timedelta
+from typing import Any, Dict, List
+from unittest.mock import MagicMock
+
+from bson import ObjectId
+
+from inginious_coding_style.database import (CLAIM_EXPIRES_FIELD,
+                                             CLAIMED_BY_FIELD, GRADED_FIELD)
+from inginious_coding_style.grading_queue import (claim_next_submission,
+                                                  peek_next_submission,
+                                                  skip_submission)
+
+
+def make_database(submissionids):
+    database = MagicMock()
+    database.user_tasks.find.return_value = [
+        {"submissionid": submissionid} for submissionid in submissionids
+    ]
+    return database
+
+
+def test_claim_next_submission():
+    ids = [ObjectId(), ObjectId()]
+    database = make_database(ids)
+    database.submissions.find_one_and_update.return_value = {"_id": ids[1]}
+
+    claimed = claim_next_submission(
+        database, "mycourse", "mytask", "tutor", 600, exclude=[ids[0]]
+    )
+    assert claimed == ids[1]
+
+    query, update = database.submissions.find_one_and_update.call_args.args
+    assert query["_id"] == {"$in": ids, "$nin": [ids[0]]}
+    assert query["courseid"] == "mycourse" and query["taskid"] == "mytask"
+    assert query[GRADED_FIELD] == {"$in": [False, None]}
+    assert query["custom.coding_style_grades"] == {"$in": [None, {}]}
+    assert {CLAIMED_BY_FIELD: "tutor"} not in query["$or"]
+    assert update["$set"][CLAIMED_BY_FIELD] == "tutor"
+
+
+def test_claim_next_submission_no_submissions():
+    database = make_database([])
+    assert claim_next_submission(database, "mycourse", "mytask", "tutor", 600) is None
+    database.submissions.find_one_and_update.assert_not_called()
+
+
+def test_peek_next_submission_does_not_claim():
+    ids = [ObjectId()]
+    database = make_database(ids)
+    database.submissions.find_one.return_value = {"_id": ids[0]}
+    assert peek_next_submission(database, "mycourse", "mytask") == ids[0]
+    database.submissions.find_one_and_update.assert_not_called()
+
+
+def _matches(doc: Dict[str, Any], query: Dict[str, Any]) -> bool:
+    """Evaluates the query operators used by the grading queue."""
+    for key, cond in query.items():
+        if key == "$or":
+            if not any(_matches(doc, q) for q in cond):
+                return False
+            continue
+        value = doc.get(key)
+        if not isinstance(cond, dict):
+            if value != cond:
+                return False
+            continue
+        for op, arg in cond.items():
+            if op == "$in" and value not in arg:
+                return False
+            if op == "$nin" and value in arg:
+                return False
+            if op == "$lt" and (value is None or not value < arg):
+                return False
+    return True
+
+
+class FakeSubmissions:
+    """In-memory `submissions` collection supporting the queue's operations."""
+
+    def __init__(self, docs: List[Dict[str, Any]]) -> None:
+        self.docs = docs
+
+    def _find(self, query: Dict[str, Any], sort: Any = None) -> Any:
+        docs = [d for d in self.docs if _matches(d, query)]
+        for key, _ in reversed(sort or []):
+            # Missing fields sort first, as in MongoDB
+            docs.sort(key=lambda d: (d.get(key) is not None, d.get(key) or 0))
+        return docs[0] if docs else None
+
+    def find_one(self, query, projection=None, sort=None):
+        return self._find(query, sort)
+
+    def find_one_and_update(self, query, update, sort=None, **kwargs):
+        doc = self._find(query, sort)
+        if doc is not None:
+            doc.update(update["$set"])
+        return doc
+
+    def update_one(self, query, update):
+        doc = self._find(query)
+        if doc is not None:
+            doc.update(update["$set"])
+
+
+def test_skip_sequence():
+    start = datetime(2021, 1, 1)
+    docs = [
+        {
+            "_id": ObjectId(),
+            "courseid": "mycourse",
+            "taskid": "mytask",
+            "submitted_on": start + timedelta(minutes=i),
+        }
+        for i in range(3)
+    ]
+    a, b, c = (d["_id"] for d in docs)
+    database = make_database([a, b, c])
+    database.submissions = FakeSubmissions(docs)
+
+    def skip(submissionid: Any, username: str = "tutor") -> Any:
+        skip_submission(database, submissionid, username)
+        return claim_next_submission(
+            database, "mycourse", "mytask", username, 600, exclude=[submissionid]
+        )
+
+    assert claim_next_submission(database, "mycourse", "mytask", "tutor", 600) == a
+    assert skip(a) == b
+    # A was released when skipped, so other tutors can claim it
+    assert docs[0][CLAIMED_BY_FIELD] is None and docs[0][CLAIM_EXPIRES_FIELD] is None
+    # Skipped submissions are handed out after the others
+    assert skip(b) == c
+    assert skip(c) == a
+    assert skip(a) == b
+
+    # Tutors cannot skip submissions claimed by other tutors
+    assert claim_next_submission(database, "mycourse", "mytask", "other", 600) == c
+    skip_submission(database, c, "tutor")
+    assert docs[2][CLAIMED_BY_FIELD] == "other"
+    assert skip(b) == a
+
+
+def test_claim_next_submission_graded_without_status():
+    # Graded by an earlier version of the plugin, not yet migrated
+    graded = {
+        "_id": ObjectId(),
+        "courseid": "mycourse",
+        "taskid": "mytask",
+        "custom.coding_style_grades": {"comments": {"grade": 80}},
+    }
+    ungraded = {"_id": ObjectId(), "courseid": "mycourse", "taskid": "mytask"}
+    database = make_database([graded["_id"], ungraded["_id"]])
+    database.submissions = FakeSubmissions([graded, ungraded])
+    claimed = claim_next_submission(database, "mycourse", "mytask", "tutor", 600)
+    assert claimed == ungraded["_id"]
+    assert claim_next_submission(database, "mycourse", "mytask", "tutor", 600) is None
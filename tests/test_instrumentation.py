@@ -0,0 +1,95 @@
+import logging
+from unittest.mock import MagicMock
+
+import pytest
+
+from inginious_coding_style.config import MetricsSettings
+from inginious_coding_style.instrumentation import (InstrumentedCursor,
+                                                    get_filter_shape,
+                                                    init_instrumentation,
+                                                    instrument_database)
+from inginious_coding_style.metrics import REGISTRY, instrument
+
+
+@pytest.fixture
+def slow_settings():
+    """Treats every operation as slow."""
+    init_instrumentation(MetricsSettings(enabled=True, slow_operation_ms=0))
+    yield
+    init_instrumentation(MetricsSettings())
+
+
+def test_get_filter_shape():
+    assert get_filter_shape(
+        {"courseid": "tdt4100", "_id": {"$in": [1, 2, 3]}, "grade": 100.0}
+    ) == {"courseid": "str", "_id": {"$in": "list[int]"}, "grade": "float"}
+    assert get_filter_shape([{"$match": {"taskid": "a"}}, {"$limit": 1}]) == [
+        {"$match": {"taskid": "str"}},
+        {"$limit": "int"},
+    ]
+    assert get_filter_shape({"$in": []}) == {"$in": "list[]"}
+
+
+def test_instrumented_cursor_counts_documents(metrics_enabled):
+    collection = MagicMock()
+    collection.name = "submissions"
+    cursor = collection.find.return_value
+    cursor.sort.return_value = cursor
+    cursor.__iter__.return_value = iter([{}, {}, {}])
+    database = MagicMock()
+    database.__getitem__.return_value = collection
+
+    @instrument("hook", "test_instrumented_cursor")
+    def hook():
+        result = instrument_database(database).submissions.find({"taskid": "a"})
+        # Chained cursor methods return the instrumented cursor
+        assert isinstance(result.sort("submitted_on"), InstrumentedCursor)
+        return list(result)
+
+    REGISTRY.reset()
+    assert len(hook()) == 3
+    stats = REGISTRY.collect_db()
+    key = (
+        "hook",
+        "test_instrumented_cursor",
+        "submissions",
+        "find",
+        "tests.test_instrumentation.hook",
+    )
+    assert stats[key].operations == 1
+    assert stats[key].returned == 3
+
+
+def test_slow_operation_logged(slow_settings, plugin_caplog):
+    collection = MagicMock()
+    collection.name = "submissions"
+    collection.find_one.return_value = {"_id": 1}
+    database = MagicMock()
+    database.__getitem__.return_value = collection
+
+    with plugin_caplog.at_level(logging.WARNING):
+        with REGISTRY.track("page", "test_slow_operation_logged"):
+            instrument_database(database).submissions.find_one(
+                {"courseid": "tdt4100", "taskid": "a"}
+            )
+
+    assert "Slow database operation" in plugin_caplog.text
+    assert "submissions.find_one" in plugin_caplog.text
+    assert "test_slow_operation_logged" in plugin_caplog.text
+    assert "{'courseid': 'str', 'taskid': 'str'}" in plugin_caplog.text
+    assert "tdt4100" not in plugin_caplog.text  # values are never logged
+
+    key = (
+        "page",
+        "test_slow_operation_logged",
+        "submissions",
+        "find_one",
+        "tests.test_instrumentation.test_slow_operation_logged",
+    )
+    assert REGISTRY.collect_db()[key].slow == 1
+
+
+def test_instrumentation_disabled():
+    # Disabled by default
+    database = MagicMock()
+    assert instrument_database(database) is database
@@ -0,0 +1,238 @@
+import io
+import logging
+import queue
+import threading
+from logging.handlers import QueueListener
+
+import pytest
+
+from inginious_coding_style import logger as logger_module
+from inginious_coding_style.config import LoggingSettings
+from inginious_coding_style.logger import (LOG_FORMAT, PluginQueueHandler,
+                                           PluginStreamHandler, RateLimiter,
+                                           StructuredFormatter, get_log_fields,
+                                           get_logger, init_logging,
+                                           log_context, logged_operation)
+
+
+def make_record(msg="Failed to modify submission", level=logging.ERROR, **extra):
+    record = logging.LogRecord(
+        "test", level, "mixins.py", 42, msg, None, None, func="swap_active_grade"
+    )
+    record.__dict__.update(extra)
+    return record
+
+
+@pytest.fixture
+def stream():
+    yield io.StringIO()
+
+
+@pytest.fixture
+def logger(stream):
+    """Plugin logger with a synchronous handler allowing 2 records per key."""
+    init_logging(LoggingSettings(queue=False, rate_limit=2))
+    handler = logger_module._HANDLER
+    assert isinstance(handler, PluginStreamHandler)
+    handler.setStream(stream)
+    handler.setFormatter(StructuredFormatter("%(levelname)s - %(message)s"))
+    try:
+        yield get_logger()
+    finally:
+        init_logging(LoggingSettings())
+
+
+def test_rate_limiter_suppresses_above_limit():
+    limiter = RateLimiter(2, 60)
+    allowed = [limiter.check(make_record()) for _ in range(5)]
+    assert [len(records) for records in allowed] == [1, 1, 0, 0, 0]
+
+    summaries = limiter.flush()
+    assert len(summaries) == 1
+    assert summaries[0].getMessage() == "3 similar errors suppressed (mixins.py:42)"
+    assert summaries[0].levelno == logging.ERROR
+    assert limiter.flush() == []  # counts are reset
+
+
+def test_rate_limiter_summary_thousands_separator():
+    limiter = RateLimiter(1, 60)
+    for _ in range(12_346):
+        limiter.check(make_record(key="failed_update"))
+    (summary,) = limiter.flush()
+    assert summary.getMessage() == "12,345 similar errors suppressed (failed_update)"
+
+
+def test_rate_limiter_keys():
+    limiter = RateLimiter(1, 60)
+    assert limiter.check(make_record(key="a"))
+    assert limiter.check(make_record(key="b"))
+    assert not limiter.check(make_record(key="a"))
+
+
+def test_rate_limiter_new_interval(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(logger_module.time, "monotonic", lambda: now[0])
+    limiter = RateLimiter(1, 60)
+    limiter.check(make_record())
+    assert limiter.check(make_record(level=logging.WARNING)) == []
+
+    now[0] = 60.0
+    record = make_record()
+    summary, allowed = limiter.check(record)
+    assert summary.getMessage() == "1 similar warnings suppressed (mixins.py:42)"
+    assert allowed is record
+
+
+def test_rate_limiter_disabled():
+    limiter = RateLimiter(0, 60)
+    assert all(limiter.check(make_record()) for _ in range(100))
+    assert limiter.flush() == []
+
+
+def test_structured_formatter():
+    formatter = StructuredFormatter("%(message)s")
+    record = make_record(submissionid="abc", operation="repair", courseid=None)
+    assert formatter.format(record) == (
+        "Failed to modify submission [operation=repair submissionid=abc]"
+    )
+    assert formatter.format(make_record()) == "Failed to modify submission"
+
+
+def test_log_context(logger, stream):
+    with log_context(operation="repair"):
+        with log_context(courseid="tdt4100"):
+            logger.error("a")
+        logger.error("b", extra={"submissionid": "abc"})
+    logger.warning("c")
+    assert stream.getvalue().splitlines() == [
+        "ERROR - a [operation=repair courseid=tdt4100]",
+        "ERROR - b [operation=repair submissionid=abc]",
+        "WARNING - c",
+    ]
+
+
+def test_logged_operation(logger, stream):
+    @logged_operation
+    def repair():
+        for i in range(10):
+            logger.error("Failed to modify submission", extra={"submissionid": i})
+
+    repair()
+    lines = stream.getvalue().splitlines()
+    assert lines[:2] == [
+        "ERROR - Failed to modify submission [operation=repair submissionid=0]",
+        "ERROR - Failed to modify submission [operation=repair submissionid=1]",
+    ]
+    assert len(lines) == 3
+    assert lines[2].startswith("ERROR - 8 similar errors suppressed (")
+
+
+def test_logged_operation_flushes_on_exception(logger, stream):
+    @logged_operation
+    def repair():
+        for _ in range(3):
+            logger.error("Failed to modify submission")
+        raise ValueError
+
+    with pytest.raises(ValueError):
+        repair()
+    assert "1 similar errors suppressed" in stream.getvalue()
+
+
+def test_get_log_fields():
+    submission = {
+        "_id": "abc",
+        "courseid": "tdt4100",
+        "taskid": "a",
+        "username": ["alice", "bob"],
+    }
+    assert get_log_fields(submission) == {
+        "courseid": "tdt4100",
+        "taskid": "a",
+        "submissionid": "abc",
+        "username": "alice,bob",
+    }
+    user_task = {"_id": "def", "submissionid": None, "username": "alice"}
+    assert get_log_fields(user_task)["submissionid"] is None
+    assert get_log_fields(user_task)["username"] == "alice"
+
+
+def test_queue_handler_formats_in_listener(stream):
+    q = queue.Queue()
+    target = logging.StreamHandler(stream)
+    target.setFormatter(StructuredFormatter(LOG_FORMAT))
+    listener = QueueListener(q, target)
+    handler = PluginQueueHandler(q, RateLimiter(1, 60))
+    logger = logging.getLogger("tests.test_logger.queue")
+    logger.propagate = False
+    logger.addHandler(handler)
+    listener.start()
+    try:
+        with log_context(operation="recalculate_weighted_mean"):
+            try:
+                raise ValueError("boom")
+            except ValueError:
+                logger.exception("Failed %s", "submission", extra={"key": "k"})
+            logger.error("dropped", extra={"key": "k"})
+        handler.flush()
+    finally:
+        listener.stop()
+        logger.removeHandler(handler)
+
+    output = stream.getvalue()
+    assert "Failed submission [operation=recalculate_weighted_mean]" in output
+    assert "ValueError: boom" in output  # traceback formatted by the listener
+    assert "dropped" not in output
+    assert "1 similar errors suppressed (k)" in output
+
+
+def test_records_propagated(stream):
+    parent = logging.getLogger("inginious")
+    handler = logging.StreamHandler(stream)
+    parent.addHandler(handler)
+    try:
+        init_logging(LoggingSettings(queue=False, propagate=True, rate_limit=1))
+        get_logger().error("propagated", extra={"key": "k"})
+        get_logger().error("rate limited", extra={"key": "k"})
+        init_logging(LoggingSettings(queue=False))
+        get_logger().error("not propagated")
+    finally:
+        parent.removeHandler(handler)
+        init_logging(LoggingSettings())
+    assert stream.getvalue().splitlines() == [
+        "propagated",
+        "1 similar errors suppressed (k)",
+    ]
+    assert not get_logger().propagate
+
+
+def test_records_propagated_by_listener(stream):
+    parent = logging.getLogger("inginious")
+    handler = logging.StreamHandler(stream)
+    parent.addHandler(handler)
+    threads = []
+    handler.emit = lambda record: threads.append(threading.current_thread())
+    try:
+        init_logging(LoggingSettings(propagate=True))
+        get_logger().error("propagated")
+        init_logging(LoggingSettings())  # waits for queued records
+    finally:
+        parent.removeHandler(handler)
+    assert len(threads) == 1
+    assert threads[0] is not threading.current_thread()
+
+
+def test_queue_handler_ignores_debug_records():
+    init_logging(LoggingSettings(rate_limit=1))
+    logger = get_logger()
+    logger.setLevel(logging.DEBUG)
+    try:
+        handler = logger_module._HANDLER
+        assert isinstance(handler, PluginQueueHandler)
+        for _ in range(3):
+            logger.debug("Debug message", extra={"key": "k"})
+        # Debug records do not use up the limit of their key
+        assert handler.rate_limiter.check(make_record(key="k"))
+    finally:
+        logger.setLevel(logging.NOTSET)
+        init_logging(LoggingSettings())
@@ -0,0 +1,90 @@
+import threading
+from unittest.mock import MagicMock
+
+import pytest
+from pydantic import ValidationError
+
+from inginious_coding_style.grades import GradingCategory
+from inginious_coding_style.instrumentation import instrument_database
+from inginious_coding_style.metrics import (MetricsRegistry, instrument,
+                                            record_db_operation,
+                                            render_metrics)
+
+
+def test_registry_track():
+    registry = MetricsRegistry()
+    with registry.track("hook", "task_menu"):
+        registry.record_db_operation(2)
+    with pytest.raises(ValidationError):
+        with registry.track("hook", "task_menu"):
+            GradingCategory(id="comments", name="Comments", description="", grade=101)
+
+    stats = registry.collect()[("hook", "task_menu")]
+    assert stats.calls == 2
+    assert stats.errors == 1
+    assert stats.validation_failures == 1
+    assert stats.db_operations == 2
+    assert sum(stats.buckets) == 2
+
+
+def test_registry_merges_threads():
+    registry = MetricsRegistry()
+
+    def work():
+        for _ in range(100):
+            with registry.track("page", "CodingStyleGradingPage"):
+                pass
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # Record from the main thread too, which is still alive
+    with registry.track("page", "CodingStyleGradingPage"):
+        pass
+
+    assert registry.collect()[("page", "CodingStyleGradingPage")].calls == 401
+
+
+def test_db_operations_outside_call_ignored():
+    registry = MetricsRegistry()
+    registry.record_db_operation()
+    assert registry.collect() == {}
+
+
+def test_instrumented_database(metrics_enabled):
+    @instrument("hook", "test_instrumented_database")
+    def hook(database):
+        database.submissions.find_one({})
+        database["user_tasks"].update_one({}, {})
+        database.submissions.name  # not an operation
+
+    hook(instrument_database(MagicMock()))
+    output = render_metrics()
+    assert (
+        'coding_style_db_operations_total{kind="hook",name="test_instrumented_database"} 2'
+        in output
+    )
+
+
+def test_render_metrics():
+    registry = MetricsRegistry()
+    with registry.track("hook", "task_menu"):
+        pass
+    output = render_metrics(registry.collect())
+    assert "# TYPE coding_style_calls_total counter" in output
+    assert 'coding_style_calls_total{kind="hook",name="task_menu"} 1' in output
+    assert (
+        'coding_style_call_duration_seconds_bucket{kind="hook",name="task_menu",le="+Inf"} 1'
+        in output
+    )
+    assert 'coding_style_call_duration_seconds_count{kind="hook",name="task_menu"} 1' in output
+
+
+def test_render_metrics_escapes_labels():
+    registry = MetricsRegistry()
+    with registry.track("page", 'a\\b"c\nd'):
+        pass
+    output = render_metrics(registry.collect())
+    assert 'coding_style_calls_total{kind="page",name="a\\\\b\\"c\\nd"} 1' in output
@@ -0,0 +1,149 @@
+import copy
+from typing import Any, Dict, List
+from unittest.mock import Mock
+
+import pytest
+
+from inginious_coding_style.config import PluginConfig
+from inginious_coding_style.database import VERSION_FIELD, WriteConflict
+from inginious_coding_style.mixins import SubmissionMixin
+from inginious_coding_style.submission import Submission, get_submission
+
+
+class FakeCollection:
+    """In-memory collection supporting the operations used to write
+    submissions and their `user_tasks` documents."""
+
+    def __init__(self, docs: List[Dict[str, Any]]) -> None:
+        self.docs = docs
+
+    def _find(self, query: Dict[str, Any]) -> List[Dict[str, Any]]:
+        def matches(doc: Dict[str, Any]) -> bool:
+            for key, cond in query.items():
+                if isinstance(cond, dict):
+                    if doc.get(key) not in cond["$in"]:
+                        return False
+                elif doc.get(key) != cond:  # `None` also matches missing fields
+                    return False
+            return True
+
+        return [d for d in self.docs if matches(d)]
+
+    def find(self, query, projection=None):
+        return copy.deepcopy(self._find(query))
+
+    def update_one(self, query, update):
+        docs = self._find(query)
+        for doc in docs[:1]:
+            doc.update(update.get("$set", {}))
+            for key, n in update.get("$inc", {}).items():
+                doc[key] = (doc.get(key) or 0) + n
+        return Mock(matched_count=len(docs[:1]))
+
+    def find_one_and_update(self, query, update):
+        self.update_one(query, update)
+
+    def bulk_write(self, operations, ordered):
+        matched = sum(
+            self.update_one(op._filter, op._doc).matched_count for op in operations
+        )
+        return Mock(matched_count=matched)
+
+
+class Page(SubmissionMixin):
+    def __init__(self, database: Mock, config: PluginConfig) -> None:
+        self._database = database
+        self.config = config
+
+    @property
+    def database(self) -> Mock:
+        return self._database
+
+    @property
+    def user_manager(self) -> Mock:
+        return Mock(**{"session_username.return_value": "tutor"})
+
+
+@pytest.fixture
+def stored(submission_nogrades: dict) -> Dict[str, Any]:
+    """Stored submission, graded once since it was submitted."""
+    return {**copy.deepcopy(submission_nogrades), VERSION_FIELD: 1}
+
+
+@pytest.fixture
+def page(stored: Dict[str, Any], config_pydantic_full: PluginConfig) -> Page:
+    database = Mock()
+    database.submissions = FakeCollection([stored])
+    database.user_tasks = FakeCollection(
+        [{"submissionid": stored["_id"], "grade": stored["grade"]}]
+    )
+    return Page(database, config_pydantic_full)
+
+
+def read(page: Page, stored: Dict[str, Any]) -> Submission:
+    (doc,) = page.database.submissions.find({"_id": stored["_id"]})
+    return get_submission(doc)
+
+
+def test_update_submission(page: Page, stored: Dict[str, Any]):
+    submission = read(page, stored)
+    page.update_submission_grades(submission, {"comments": {"grade": 80}})
+    assert stored[VERSION_FIELD] == 2
+    assert stored["custom"]["coding_style_grades"]["comments"]["grade"] == 80
+    assert getattr(submission, VERSION_FIELD) == 2
+    (user_task,) = page.database.user_tasks.docs
+    assert user_task["grade_base"] == stored["grade"]
+
+    # The submission can be written again at its new version
+    page.update_submission_grades(submission, {"comments": {"grade": 90}})
+    assert stored[VERSION_FIELD] == 3
+
+
+def test_update_submission_stale_version(page: Page, stored: Dict[str, Any]):
+    # Two tutors open the grading form of the same submission
+    first, second = read(page, stored), read(page, stored)
+    page.update_submission_grades(first, {"comments": {"grade": 80}})
+
+    # The second tutor's grades are based on grades that were since modified
+    with pytest.raises(WriteConflict) as exc_info:
+        page.update_submission_grades(second, {"comments": {"grade": 20}})
+    assert exc_info.value.version == 1
+    assert stored[VERSION_FIELD] == 2
+    assert stored["custom"]["coding_style_grades"]["comments"]["grade"] == 80
+    # `user_tasks` is left as written by the first tutor
+    (user_task,) = page.database.user_tasks.docs
+    assert user_task["grade_mean"] == first.get_weighted_mean(page.config)
+
+
+def test_update_submission_stale_form_version(page: Page, stored: Dict[str, Any]):
+    # The grading form was opened at version 0, before the submission was graded
+    submission = read(page, stored)
+    with pytest.raises(WriteConflict):
+        page.update_submission_grades(submission, {"comments": {"grade": 20}}, 0)
+    assert stored[VERSION_FIELD] == 1
+    assert "grade_mean" not in page.database.user_tasks.docs[0]
+
+
+def test_bulk_update_submissions_conflicts(page: Page, stored: Dict[str, Any]):
+    first, second = read(page, stored), read(page, stored)
+    page.update_submission_grades(first, {"comments": {"grade": 80}})
+
+    failed, conflicts = page.bulk_update_submissions([second])
+    assert (failed, conflicts) == (set(), {0})
+    assert stored[VERSION_FIELD] == 2
+    assert getattr(second, VERSION_FIELD) == 1
+
+
+def test_bulk_update_grades_conflicts(page: Page, stored: Dict[str, Any]):
+    submission = read(page, stored)
+    # The form was rendered before the submission was graded
+    failed, conflicts = page.bulk_update_grades([submission], [0])
+    assert (failed, conflicts) == (set(), {0})
+    assert stored[VERSION_FIELD] == 1
+
+    failed, conflicts = page.bulk_update_grades([submission], [1])
+    assert (failed, conflicts) == (set(), set())
+    assert stored[VERSION_FIELD] == 2
+    assert getattr(submission, VERSION_FIELD) == 2
+    (user_task,) = page.database.user_tasks.docs
+    assert user_task["grade_mean"] == submission.get_weighted_mean(page.config)
@@ -0,0 +1,160 @@
+import marshal
+import os
+import stat
+import tempfile
+import time
+from pathlib import Path
+
+import pytest
+
+from inginious_coding_style.config import ProfilingSettings
+from inginious_coding_style.pages.profiles import get_profilable_endpoints
+from inginious_coding_style.profiling import (ProfileInfo, Profiler,
+                                              ProfileStore)
+
+
+@pytest.fixture
+def profiler(tmp_path: Path) -> Profiler:
+    return Profiler(ProfilingSettings(directory=tmp_path, sampling_interval_ms=1))
+
+
+def busy_work(seconds: float = 0.05) -> int:
+    end = time.perf_counter() + seconds
+    n = 0
+    while time.perf_counter() < end:
+        n += 1
+    return n
+
+
+def test_arm_profiles_next_requests(profiler: Profiler):
+    profiler.arm("CodingStyleGradingPage", "sampling", 2)
+    assert profiler.is_armed("CodingStyleGradingPage")
+    assert not profiler.is_armed("GradingQueuePage")
+
+    for _ in range(3):
+        assert profiler.run("CodingStyleGradingPage", "/", busy_work) > 0
+    assert not profiler.is_armed("CodingStyleGradingPage")
+
+    profiles = profiler.store.list()
+    assert len(profiles) == 2
+    assert all(p.endpoint == "CodingStyleGradingPage" for p in profiles)
+    _, path = profiler.store.get(profiles[0].name)
+    folded = path.read_text()
+    assert "tests.test_profiling.busy_work" in folded
+    assert profiles[0].peak_memory is None
+
+
+def test_arm_invalid(profiler: Profiler):
+    with pytest.raises(ValueError):
+        profiler.arm("CodingStyleGradingPage", "strace", 1)
+    with pytest.raises(ValueError):
+        profiler.arm("CodingStyleGradingPage", "sampling", 0)
+    profiler.arm("CodingStyleGradingPage", "sampling", 10_000)
+    assert profiler.armed["CodingStyleGradingPage"] == ("sampling", 100)
+    profiler.disarm("CodingStyleGradingPage")
+    assert not profiler.armed
+
+
+def test_cprofile_memory_traced(profiler: Profiler):
+    profiler.arm("SubmissionStatusDiagnoser", "cprofile", 1)
+    profiler.run("SubmissionStatusDiagnoser", "/", lambda: [0] * 100_000)
+
+    (info,) = profiler.store.list()
+    assert info.mode == "cprofile"
+    assert info.peak_memory is not None and info.peak_memory >= 800_000
+    _, path = profiler.store.get(info.name)
+    stats = marshal.loads(path.read_bytes())  # format read by pstats
+    assert any(func[2] == "<lambda>" for func in stats)
+
+
+def test_profile_error_recorded(profiler: Profiler):
+    def fail():
+        raise KeyError("nope")
+
+    profiler.arm("CodingStyleGradingPage", "sampling", 1)
+    with pytest.raises(KeyError):
+        profiler.run("CodingStyleGradingPage", "/", fail)
+    assert profiler.store.list()[0].error == "KeyError"
+
+
+def test_one_profiled_request_at_a_time(profiler: Profiler):
+    profiler.arm("CodingStyleGradingPage", "cprofile", 2)
+    # The nested request is not profiled, and does not consume an armed request
+    profiler.run(
+        "CodingStyleGradingPage",
+        "/",
+        profiler.run,
+        "CodingStyleGradingPage",
+        "/",
+        busy_work,
+    )
+    assert len(profiler.store.list()) == 1
+    assert profiler.armed["CodingStyleGradingPage"] == ("cprofile", 1)
+
+
+def test_store_retention(tmp_path: Path):
+    store = ProfileStore(tmp_path, max_profiles=3)
+    for i in range(5):
+        info = ProfileInfo(
+            name=f"2026010{i}T000000000000-PluginSettingsPage-sampling",
+            endpoint="PluginSettingsPage",
+            mode="sampling",
+            url="/",
+            created="",
+            duration=0.0,
+        )
+        store.save(info, b"a;b 1")
+    names = [p.name for p in store.list()]
+    assert names == [
+        f"2026010{i}T000000000000-PluginSettingsPage-sampling" for i in (4, 3, 2)
+    ]
+    assert len(list(tmp_path.iterdir())) == 6
+
+
+def test_store_default_directory_is_private(monkeypatch, tmp_path: Path):
+    monkeypatch.setattr(tempfile, "tempdir", str(tmp_path))
+    store = Profiler(ProfilingSettings()).store
+    assert store.list() == []
+    assert not list(tmp_path.iterdir())  # created when the first profile is saved
+    info = ProfileInfo(
+        name="20260101T000000000000-PluginSettingsPage-sampling",
+        endpoint="PluginSettingsPage",
+        mode="sampling",
+        url="/",
+        created="",
+        duration=0.0,
+    )
+    store.save(info, b"a;b 1")
+    (directory,) = tmp_path.iterdir()
+    assert store.directory == directory
+    st = directory.stat()
+    assert stat.S_IMODE(st.st_mode) == 0o700
+    assert st.st_uid == os.getuid()
+    assert [p.name for p in store.list()] == [info.name]
+
+
+def test_store_rejects_shared_directory(tmp_path: Path):
+    directory = tmp_path / "profiles"
+    directory.mkdir()
+    directory.chmod(0o777)
+    store = ProfileStore(directory, max_profiles=3)
+    with pytest.raises(PermissionError):
+        store.list()
+
+
+def test_profiling_disabled_by_default():
+    assert not ProfilingSettings().enabled
+
+
+def test_store_get_rejects_invalid_names(tmp_path: Path):
+    store = ProfileStore(tmp_path, max_profiles=3)
+    for name in ["../../etc/passwd", "missing", "20260101T000000000000-x-sampling"]:
+        with pytest.raises(KeyError):
+            store.get(name)
+
+
+def test_get_profilable_endpoints():
+    endpoints = get_profilable_endpoints()
+    assert "CodingStyleGradingPage" in endpoints
+    assert "SubmissionStatusDiagnoser" in endpoints
+    assert "ProfilesPage" not in endpoints
@@ -0,0 +1,277 @@
+import os
+import stat
+import tempfile
+from pathlib import Path
+from unittest.mock import Mock
+
+from inginious_coding_style import TEMPLATES_PATH
+from inginious_coding_style.config import TemplateSettings, get_config
+from inginious_coding_style.grades import merge_grades
+from inginious_coding_style.mixins import SubmissionMetadata
+from inginious_coding_style.rendering import TemplateRenderer
+from inginious_coding_style.submission import get_submission
+
+
+def test_warm_up_compiles_all_templates(template_helper, tmp_path: Path):
+    settings = TemplateSettings(cache_dir=tmp_path)
+    renderer = TemplateRenderer(template_helper, TEMPLATES_PATH, settings)
+    n = renderer.warm_up()
+    assert n == len(list(TEMPLATES_PATH.glob("*.html")))
+    # Compiled bytecode is persisted in the cache directory
+    assert len(list(tmp_path.iterdir())) == n
+
+
+def test_default_cache_dir_is_private(template_helper, tmp_path: Path, monkeypatch):
+    monkeypatch.setattr(tempfile, "tempdir", str(tmp_path))
+    renderer = TemplateRenderer(template_helper, TEMPLATES_PATH, TemplateSettings())
+    cache_dir = Path(renderer.env.bytecode_cache.directory)
+    assert cache_dir.parent == tmp_path
+    assert cache_dir.stat().st_uid == os.getuid()
+    assert stat.S_IMODE(cache_dir.stat().st_mode) == 0o700
+
+
+def test_render_same_as_template_helper(template_helper, tmp_path: Path):
+    settings = TemplateSettings(bytecode_cache=False)
+    renderer = TemplateRenderer(template_helper, TEMPLATES_PATH, settings)
+    kwargs = dict(message="Updated!", success=True)
+    assert renderer.render("alert.html", **kwargs) == template_helper.render(
+        "alert.html", template_folder=TEMPLATES_PATH, **kwargs
+    )
+
+
+def test_render_globals_added_later(template_helper, tmp_path: Path):
+    (tmp_path / "late.html").write_text("{{ late_global }}")
+    settings = TemplateSettings(bytecode_cache=False)
+    renderer = TemplateRenderer(template_helper, tmp_path, settings)
+    assert renderer.warm_up() == 1
+    # E.g. added by a plugin loaded after this one
+    template_helper.add_to_template_globals("late_global", "late")
+    assert renderer.render("late.html") == "late"
+
+
+def test_start_warm_up_background(template_helper, tmp_path: Path):
+    settings = TemplateSettings(background=True, cache_dir=tmp_path)
+    renderer = TemplateRenderer(template_helper, TEMPLATES_PATH, settings)
+    thread = renderer.start_warm_up()
+    assert thread is not None
+    thread.join()
+    assert len(list(tmp_path.iterdir())) == len(renderer.template_names)
+
+
+def test_start_warm_up_disabled(template_helper, tmp_path: Path):
+    settings = TemplateSettings(precompile=False, cache_dir=tmp_path)
+    renderer = TemplateRenderer(template_helper, TEMPLATES_PATH, settings)
+    assert renderer.start_warm_up() is None
+    assert not list(tmp_path.iterdir())
+
+
+def test_render_task_list_bars(template_helper, submission_grades):
+    settings = TemplateSettings(bytecode_cache=False)
+    renderer = TemplateRenderer(template_helper, TEMPLATES_PATH, settings)
+    submission = get_submission(submission_grades)
+    rendered = renderer.render(
+        "task_list_bars.html",
+        bars={"task1": (submission, 72.5), "task2": (submission, 40.0)},
+        config=get_config({}),
+    )
+    # Each task's bars replace its placeholder
+    assert rendered.count('hx-swap-oob="true"') == 2
+    assert 'id="coding-style-bars-task1"' in rendered
+    assert "72.5 %" in rendered
+
+
+def test_render_grading_update(template_helper, submission_grades, course, task):
+    settings = TemplateSettings(bytecode_cache=False)
+    renderer = TemplateRenderer(template_helper, TEMPLATES_PATH, settings)
+    submission = get_submission(submission_grades)
+    config = get_config({})
+    user_manager = Mock()
+    user_manager.session_language.return_value = "en"
+    rendered = renderer.render(
+        "grading_update.html",
+        user_manager=user_manager,
+        metadata=SubmissionMetadata(["Test User"], ["Tutor"], "2021-11-23"),
+        course=course,
+        task=task,
+        submission=submission,
+        grades=submission.custom.coding_style_grades,
+        config=config,
+        success=True,
+        message="Removed grading category.",
+        queue=False,
+        oob=True,
+    )
+    # The form replaces the current form, and the information is swapped out of band
+    assert '<div id="grading-form">' in rendered
+    assert '<div id="grading-info" hx-swap-oob="true">' in rendered
+    assert "Removed grading category." in rendered
+    assert 'hx-post="/admin/codingstyle/submission/' in rendered
+    # The mean is part of the form, and must not be swapped out of band
+    assert '<div id="grading-mean">' in rendered
+    assert 'hx-patch="/admin/codingstyle/submission/' in rendered
+
+
+def test_render_grading_category_update(
+    template_helper, submission_grades, course, task
+):
+    settings = TemplateSettings(bytecode_cache=False)
+    renderer = TemplateRenderer(template_helper, TEMPLATES_PATH, settings)
+    submission = get_submission(submission_grades)
+    config = get_config({})
+    user_manager = Mock()
+    user_manager.session_language.return_value = "en"
+    rendered = renderer.render(
+        "grading_category_update.html",
+        user_manager=user_manager,
+        metadata=SubmissionMetadata(["Test User"], ["Tutor"], "2021-11-23"),
+        course=course,
+        task=task,
+        submission=submission,
+        grades=submission.custom.coding_style_grades,
+        config=config,
+        id="comments",
+        category_success=True,
+        queue=False,
+        oob=True,
+    )
+    # Only the category replaces its current card
+    assert '<div id="grading-category-comments"' in rendered
+    assert rendered.count('id="grading-category-') == 1
+    assert "Saved." in rendered
+    assert '<div id="grading-mean" hx-swap-oob="true">' in rendered
+    assert '<div id="grading-info" hx-swap-oob="true">' in rendered
+
+
+def test_render_grading_conflict(template_helper, submission_grades, course, task):
+    settings = TemplateSettings(bytecode_cache=False)
+    renderer = TemplateRenderer(template_helper, TEMPLATES_PATH, settings)
+    submission = get_submission(submission_grades)
+    current_grades = submission.custom.coding_style_grades.copy(deep=True)
+    current_grades["comments"].grade = 99
+    current_grades["comments"].feedback = "Stored by someone else."
+    config = get_config({})
+    user_manager = Mock()
+    user_manager.session_language.return_value = "en"
+    rendered = renderer.render(
+        "grading_update.html",
+        user_manager=user_manager,
+        metadata=SubmissionMetadata(["Test User"], ["Tutor"], "2021-11-23"),
+        course=course,
+        task=task,
+        submission=submission,
+        grades=submission.custom.coding_style_grades,
+        current_grades=current_grades,
+        config=config,
+        version=4,
+        success=False,
+        message="Changed by someone else.",
+        queue=False,
+        oob=True,
+    )
+    assert "Changed by someone else." in rendered
+    # Only the category that differs is shown with the stored grade
+    assert rendered.count("Saved by another grader:") == 1
+    assert "Stored by someone else." in rendered
+    assert 'name="version" value="4"' in rendered
+
+
+def test_render_grading_analysis(template_helper):
+    from inginious_coding_style.analysis import (FileAnalysis, Finding,
+                                                 LintResult,
+                                                 SubmissionAnalysis,
+                                                 Suggestion)
+
+    settings = TemplateSettings(bytecode_cache=False)
+    renderer = TemplateRenderer(template_helper, TEMPLATES_PATH, settings)
+    result = LintResult([Finding(3, 1, "E261", "at least two spaces")])
+    analysis = SubmissionAnalysis(
+        files=[
+            FileAnalysis("main.py", "pycodestyle", result, ["comments"]),
+            FileAnalysis("q1", "pyflakes", LintResult(error="Timed out")),
+        ],
+        suggestions={"comments": Suggestion(grade=95, findings=1)},
+        pending=1,
+    )
+    rendered = renderer.render(
+        "grading_analysis.html", analysis=analysis, config=get_config({})
+    )
+    assert '<div id="grading-analysis"' in rendered
+    assert "<td>95</td>" in rendered
+    assert "<code>E261</code>" in rendered
+    assert '<span class="badge badge-secondary">Comments</span>' in rendered
+    assert "Timed out" in rendered
+    assert "1 linter(s) did not finish in time" in rendered
+
+
+def test_render_code_metrics(template_helper, course, task):
+    from inginious_coding_style.code_metrics import (CATEGORY_METRICS,
+                                                     SubmissionMetrics,
+                                                     compute_metrics)
+
+    settings = TemplateSettings(bytecode_cache=False)
+    renderer = TemplateRenderer(template_helper, TEMPLATES_PATH, settings)
+    user_manager = Mock()
+    user_manager.session_language.return_value = "en"
+    rows = [
+        SubmissionMetrics("abc", ["student1"], True, 80.0, compute_metrics("x = 1\n")),
+        SubmissionMetrics("def", ["student2"], False, None, compute_metrics("(\n")),
+    ]
+    rendered = renderer.render(
+        "code_metrics.html",
+        course=course,
+        task=task,
+        rows=rows,
+        total=250,
+        page=2,
+        pages=3,
+        categories=CATEGORY_METRICS,
+        sort="max_nesting",
+        descending=True,
+        config=get_config({}),
+        user_manager=user_manager,
+        get_homepath=lambda *args: "",
+    )
+    assert '"/admin/codingstyle/submission/abc">student1</a>' in rendered
+    assert "Syntax error" in rendered
+    # Sorting by the current key again reverses the order
+    assert '<a href="?sort=max_nesting&order=asc">Max nesting</a>' in rendered
+    assert '<a href="?sort=lines&order=desc">Lines</a>' in rendered
+    # Pages keep the sort order
+    assert "(250 submissions)" in rendered
+    assert 'href="?sort=max_nesting&order=desc&page=3">Next</a>' in rendered
+
+
+def test_render_submission_clusters(template_helper, course, task):
+    from inginious_coding_style.clustering import (Cluster, ClusterMember,
+                                                   TaskClusters)
+
+    settings = TemplateSettings(bytecode_cache=False)
+    renderer = TemplateRenderer(template_helper, TEMPLATES_PATH, settings)
+    user_manager = Mock()
+    user_manager.session_language.return_value = "en"
+    config = get_config({})
+    grades = merge_grades({"comments": {"grade": 70, "feedback": "Few comments."}}, config)
+    cluster = Cluster(
+        [
+            ClusterMember("abc", ["student1"], True, 70.0, grades),
+            ClusterMember("def", ["student2"], False, None, similarity=0.9),
+        ]
+    )
+    rendered = renderer.render(
+        "submission_clusters.html",
+        course=course,
+        task=task,
+        result=TaskClusters([cluster], submissions=3, indexed=0),
+        message="Graded 2 of 2 submissions.",
+        success=True,
+        config=config,
+        user_manager=user_manager,
+        get_homepath=lambda *args: "",
+    )
+    assert "Graded 2 of 2 submissions." in rendered
+    assert '<input type="checkbox" name="submissions" value="def" checked>' in rendered
+    assert 'name="def:comments_grade"' in rendered
+    assert "90%" in rendered
+    # The grades of the graded submission are the cluster's default grades
+    assert 'name="comments_grade" value="70"' in rendered
+    assert "Few comments.</textarea>" in rendered
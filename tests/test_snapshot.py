@@ -0,0 +1,140 @@
+from pathlib import Path
+from unittest.mock import MagicMock
+
+import pytest
+from bson import ObjectId
+
+from inginious_coding_style.database import GRADED_FIELD, VERSION_FIELD
+from inginious_coding_style.snapshot import (RECORD_SUBMISSIONS,
+                                             RECORD_USER_TASKS, SnapshotError,
+                                             iter_snapshot, restore_snapshot,
+                                             write_snapshot)
+
+
+@pytest.fixture
+def snapshot_database(coding_style_grades_dict: dict):
+    def submission(courseid: str):
+        return {
+            "_id": ObjectId(),
+            "courseid": courseid,
+            "custom": {**coding_style_grades_dict, "graded_by": ["tutor"]},
+            GRADED_FIELD: True,
+        }
+
+    def user_task(courseid: str):
+        return {
+            "_id": ObjectId(),
+            "courseid": courseid,
+            "grade": 50.0,
+            "grade_mean": 50.0,
+            "grade_base": 100.0,
+        }
+
+    database = MagicMock()
+    # Cursors are sorted by course ID
+    database.submissions.find.return_value.sort.return_value = [
+        submission("course1"),
+        submission("course1"),
+        submission("course1"),
+        submission("course2"),
+    ]
+    database.user_tasks.find.return_value.sort.return_value = [
+        user_task("course1"),
+        user_task("course2"),
+    ]
+    yield database
+
+
+@pytest.fixture
+def snapshot_file(snapshot_database: MagicMock, tmp_path: Path) -> Path:
+    path = tmp_path / "snapshot.bin"
+    with open(path, "wb") as f:
+        summary = write_snapshot(snapshot_database, f, batch_size=2)
+    assert summary.submissions == 4
+    assert summary.user_tasks == 2
+    assert summary.courses == {"course1", "course2"}
+    # course1 submissions are split into two records
+    assert summary.records == 5
+    return path
+
+
+def test_iter_snapshot(snapshot_file: Path):
+    records = list(iter_snapshot(snapshot_file))
+    assert [(kind, courseid, len(docs)) for kind, courseid, docs in records] == [
+        (RECORD_SUBMISSIONS, "course1", 2),
+        (RECORD_SUBMISSIONS, "course1", 1),
+        (RECORD_SUBMISSIONS, "course2", 1),
+        (RECORD_USER_TASKS, "course1", 1),
+        (RECORD_USER_TASKS, "course2", 1),
+    ]
+    docs = records[0][2]
+    assert docs[0]["custom"]["graded_by"] == ["tutor"]
+    assert "courseid" not in docs[0]
+
+
+def test_iter_snapshot_course(snapshot_file: Path):
+    records = list(iter_snapshot(snapshot_file, courseids=["course2"]))
+    assert {courseid for _, courseid, _ in records} == {"course2"}
+    assert len(records) == 2
+
+
+def test_iter_snapshot_invalid(tmp_path: Path):
+    path = tmp_path / "empty.bin"
+    path.write_bytes(b"")
+    with pytest.raises(SnapshotError):
+        list(iter_snapshot(path))
+
+
+def test_iter_snapshot_truncated(snapshot_file: Path):
+    snapshot_file.write_bytes(snapshot_file.read_bytes()[:-1])
+    with pytest.raises(SnapshotError):
+        list(iter_snapshot(snapshot_file))
+
+
+def test_restore_snapshot(snapshot_file: Path):
+    database = MagicMock()
+    summary = restore_snapshot(database, snapshot_file, courseids=["course1"])
+    assert summary.submissions == 3
+    assert summary.user_tasks == 1
+    assert summary.failed == 0
+    assert database.submissions.bulk_write.call_count == 2
+    assert database.user_tasks.bulk_write.call_count == 1
+    (ops,), _ = database.submissions.bulk_write.call_args
+    update = ops[0]._doc["$set"]
+    assert update["custom.graded_by"] == ["tutor"]
+    assert update[GRADED_FIELD] is True
+    # Restoring grades conflicts with grading forms opened before the restore
+    assert ops[0]._doc["$inc"] == {VERSION_FIELD: 1}
+
+
+def test_restore_snapshot_dry_run(snapshot_file: Path):
+    database = MagicMock()
+    summary = restore_snapshot(database, snapshot_file, dry_run=True)
+    assert summary.submissions == 4
+    database.submissions.bulk_write.assert_not_called()
+
+
+def test_restore_snapshot_clears_missing(snapshot_file: Path):
+    (_, _, docs), *_ = iter_snapshot(snapshot_file, courseids=["course2"])
+    restored, graded_since = docs[0]["_id"], ObjectId()
+    database = MagicMock()
+    database.submissions.find.return_value = [{"_id": restored}, {"_id": graded_since}]
+    summary = restore_snapshot(database, snapshot_file, courseids=["course2"])
+    assert summary.cleared == 1
+    query, projection = database.submissions.find.call_args[0]
+    assert query["courseid"] == "course2"
+    assert projection == {"_id": 1}
+    # Only the submission that is not in the snapshot is cleared
+    (restore_ops,), _ = database.submissions.bulk_write.call_args_list[0]
+    (clear_ops,), _ = database.submissions.bulk_write.call_args_list[1]
+    assert [op._filter for op in restore_ops] == [{"_id": restored}]
+    assert [op._filter for op in clear_ops] == [{"_id": graded_since}]
+    assert GRADED_FIELD in clear_ops[0]._doc["$unset"]
+    assert clear_ops[0]._doc["$inc"] == {VERSION_FIELD: 1}
+
+    database.reset_mock()
+    summary = restore_snapshot(
+        database, snapshot_file, courseids=["course2"], dry_run=True
+    )
+    assert summary.cleared == 1
+    database.submissions.bulk_write.assert_not_called()
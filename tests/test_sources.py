@@ -0,0 +1,30 @@
+from unittest.mock import Mock
+
+from inginious_coding_style.sources import (SourceFile, get_content_hash,
+                                            get_sources, normalize_source)
+
+
+def test_normalize_source():
+    assert normalize_source(b"\xef\xbb\xbfa = 1\r\nb = 2\r") == "a = 1\nb = 2\n"
+    assert get_content_hash(normalize_source("x\r\n")) == get_content_hash("x\n")
+
+
+def test_get_sources():
+    problem = Mock()
+    problem.get_id.return_value = "q1"
+    problem._language = "python"
+    task = Mock()
+    task.get_problems.return_value = [problem]
+    inputdata = {
+        "@username": "student",
+        "q1": "print(1)\r\n",
+        "q2": "  ",
+        "upload": {"filename": "main.py", "value": b"x = 1\n"},
+        "choice": ["a", "b"],
+        "big": {"filename": "big.py", "value": b"#" * 100},
+    }
+    sources = get_sources(task, inputdata, max_size=50)
+    assert sources == [
+        SourceFile("q1", "print(1)\n", "python"),
+        SourceFile("main.py", "x = 1\n"),
+    ]
@@ -1,10 +1,19 @@
+from datetime import datetime
+from unittest.mock import Mock
+
 import pytest
+from bson import ObjectId
 from hypothesis import given
 from hypothesis import strategies as st
+from inginious.frontend.submission_manager import WebAppSubmissionManager
+from pymongo import DESCENDING
 from werkzeug.datastructures import ImmutableMultiDict
 
-from inginious_coding_style.utils import (has_coding_style_grades,
-                                          parse_form_data)
+from inginious_coding_style.database import GRADED_FIELD
+from inginious_coding_style.utils import (get_best_submission,
+                                          has_coding_style_grades,
+                                          parse_form_data,
+                                          parse_override_form_data)
 
 
 @pytest.mark.skip("Needs a proper strategy for custom dict")
@@ -18,6 +27,71 @@ def test_has_coding_style_grades_fuzz(submission_nogrades, custom):
     assert not has_coding_style_grades(submission_nogrades)
 
 
+class FakeCursor(list):
+    def sort(self, keys):  # type: ignore
+        for key, direction in reversed(keys):
+            super().sort(key=lambda doc: doc[key], reverse=direction == DESCENDING)
+        return self
+
+
+class FakeSubmissions:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def find(self, query):
+        # Like MongoDB, a value matches arrays that contain it
+        return FakeCursor(
+            d
+            for d in self.docs
+            if all(d[k] == v or v in d[k] for k, v in query.items())
+        )
+
+    def find_one(self, query, sort):
+        docs = self.find(query).sort(sort)
+        return docs[0] if docs else None
+
+
+@pytest.mark.parametrize("grades", [[50, 80, 80], [80, 80, 50], [80, 50, 80]])
+def test_get_best_submission_ties(monkeypatch, submission_nogrades, grades):
+    monkeypatch.setattr(
+        "inginious_coding_style.utils.instrument_database", lambda db: db
+    )
+    database = Mock()
+    database.submissions = FakeSubmissions(
+        [
+            {
+                **submission_nogrades,
+                "_id": ObjectId(),
+                "username": ["user1"],
+                "courseid": "course",
+                "taskid": "task",
+                "submitted_on": datetime(2022, 1, day),
+                "grade": grade,
+            }
+            for day, grade in enumerate(grades, start=1)
+        ]
+    )
+    user_manager = Mock()
+    user_manager.session_username.return_value = "user1"
+    task = Mock()
+    task.get_id.return_value = "task"
+    task.get_course_id.return_value = "course"
+    task._plugin_manager.get_database.return_value = database
+    task._plugin_manager.get_user_manager.return_value = user_manager
+
+    # Best submission as picked from the submission manager, which
+    # returns the newest submissions first
+    submission_manager = WebAppSubmissionManager(
+        None, user_manager, database, None, None, None
+    )
+    expected = None
+    for submission in submission_manager.get_user_submissions(task):
+        if expected is None or submission["grade"] > expected["grade"]:
+            expected = submission
+
+    assert get_best_submission(task)._id == expected["_id"]
+
+
 def test_has_coding_style_grades(submission_nogrades, submission_grades):
     assert not has_coding_style_grades(submission_nogrades)
     assert has_coding_style_grades(submission_grades)
@@ -25,6 +99,14 @@ def test_has_coding_style_grades(submission_nogrades, submission_grades):
     assert not has_coding_style_grades(s)
 
 
+def test_has_coding_style_grades_status_field(submission_grades):
+    # The indexed grading status field takes precedence over the custom grades
+    submission_grades[GRADED_FIELD] = False
+    assert not has_coding_style_grades(submission_grades)
+    submission_grades[GRADED_FIELD] = True
+    assert has_coding_style_grades(submission_grades)
+
+
 def test_parse_form_data():
     form_data = ImmutableMultiDict(
         [
@@ -47,3 +129,30 @@ def test_parse_form_data():
     assert form["structure"]["feedback"] == "Better."
     assert form["idiomaticity"]["grade"] == "44"
     assert form["idiomaticity"]["feedback"] == "Good!"
+
+
+def test_parse_form_data_other_fields():
+    form_data = ImmutableMultiDict(
+        [
+            ("version", "3"),
+            ("custom_category_grade", "55"),
+        ]
+    )
+    assert parse_form_data(form_data) == {"custom_category": {"grade": "55"}}
+
+
+def test_parse_override_form_data():
+    form_data = ImmutableMultiDict(
+        [
+            ("comments_grade", "100"),
+            ("submissions", "abc"),
+            ("abc:comments_grade", "50"),
+            ("abc:comments_feedback", " "),
+            ("def:modularity_feedback", "Split it up."),
+            ("def:version", "3"),
+        ]
+    )
+    assert parse_override_form_data(form_data) == {
+        "abc": {"comments": {"grade": "50"}},
+        "def": {"modularity": {"feedback": "Split it up."}},
+    }
@@ -0,0 +1,55 @@
+import subprocess
+import sys
+
+from flask import Flask
+
+from inginious_coding_style import pages
+from inginious_coding_style.pages.base import BasePluginPage
+from inginious_coding_style.views import PAGE_METHODS, LazyView, lazy_view
+
+
+def test_page_methods():
+    page_classes = {
+        name: cls
+        for name, cls in vars(pages).items()
+        if isinstance(cls, type) and issubclass(cls, BasePluginPage)
+    }
+    assert set(PAGE_METHODS) == set(page_classes)
+    for name, cls in page_classes.items():
+        assert set(PAGE_METHODS[name]) == set(cls.methods), name
+
+
+def test_lazy_view_registration():
+    app = Flask(__name__)
+    view = lazy_view("codingstyle_grading", "CodingStyleGradingPage", None, None)
+    app.add_url_rule("/admin/codingstyle/submission/<submissionid>", view_func=view)
+
+    (rule,) = app.url_map.iter_rules("codingstyle_grading")
+    assert {"GET", "POST", "PATCH", "DELETE"} <= rule.methods
+    assert app.view_functions["codingstyle_grading"] is view
+    assert not view.is_built
+
+
+def test_lazy_view_built_once(monkeypatch):
+    built = []
+
+    class Page:
+        @classmethod
+        def as_view(cls, name, *class_args):
+            built.append((name, class_args))
+            return lambda **kwargs: kwargs
+
+    monkeypatch.setattr(pages, "MetricsEndpoint", Page)
+    view = LazyView("codingstyle_metrics", "MetricsEndpoint", "config", "path")
+    assert view(a=1) == {"a": 1}
+    assert view(b=2) == {"b": 2}
+    assert view.is_built
+    assert built == [("codingstyle_metrics", ("config", "path"))]
+
+
+def test_plugin_import_does_not_import_pages():
+    code = (
+        "import sys, inginious_coding_style; "
+        "assert 'inginious_coding_style.pages' not in sys.modules"
+    )
+    subprocess.run([sys.executable, "-c", code], check=True)